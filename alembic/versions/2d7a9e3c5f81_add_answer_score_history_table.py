@@ -0,0 +1,36 @@
+"""Add answer score history table
+
+Revision ID: 2d7a9e3c5f81
+Revises: 4c8e1f7a2b6d
+Create Date: 2026-10-17 21:12:40.518326
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2d7a9e3c5f81'
+down_revision = '4c8e1f7a2b6d'
+
+from alembic import op
+import sqlalchemy as sa
+
+def upgrade():
+    op.create_table('answer_score_history',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('assignment_id', sa.Integer(), nullable=False),
+        sa.Column('answer_id', sa.Integer(), nullable=False),
+        sa.Column('comparison_count', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('rounds', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['answer_id'], ['answer.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['assignment_id'], ['assignment.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        mysql_charset='utf8mb4',
+        mysql_collate='utf8mb4_unicode_ci',
+        mysql_engine='InnoDB'
+    )
+    op.create_index('ix_answer_score_history_assignment_id_comparison_count', 'answer_score_history',
+        ['assignment_id', 'comparison_count'], unique=False)
+
+def downgrade():
+    op.drop_index('ix_answer_score_history_assignment_id_comparison_count', table_name='answer_score_history')
+    op.drop_table('answer_score_history')
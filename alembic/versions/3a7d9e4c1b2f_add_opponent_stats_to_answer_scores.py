@@ -0,0 +1,31 @@
+"""Add opponent stats to answer score tables
+
+Revision ID: 3a7d9e4c1b2f
+Revises: 8c2d4e7f9a1b
+Create Date: 2026-10-17 14:22:09.518734
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3a7d9e4c1b2f'
+down_revision = '8c2d4e7f9a1b'
+
+from alembic import op
+import sqlalchemy as sa
+
+from compair.models import convention
+
+def upgrade():
+    # existing scores keep null opponent stats and are recounted on their next comparison
+    with op.batch_alter_table('answer_score', naming_convention=convention) as batch_op:
+        batch_op.add_column(sa.Column('_opponent_stats', sa.Text, nullable=True))
+
+    with op.batch_alter_table('answer_criterion_score', naming_convention=convention) as batch_op:
+        batch_op.add_column(sa.Column('_opponent_stats', sa.Text, nullable=True))
+
+def downgrade():
+    with op.batch_alter_table('answer_criterion_score', naming_convention=convention) as batch_op:
+        batch_op.drop_column('_opponent_stats')
+
+    with op.batch_alter_table('answer_score', naming_convention=convention) as batch_op:
+        batch_op.drop_column('_opponent_stats')
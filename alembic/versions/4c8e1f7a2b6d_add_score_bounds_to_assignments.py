@@ -0,0 +1,96 @@
+"""Add lowest and highest scores to assignments and assignment criteria
+
+Revision ID: 4c8e1f7a2b6d
+Revises: 9b4f6c2d8e1a
+Create Date: 2026-10-17 19:27:53.104861
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4c8e1f7a2b6d'
+down_revision = '9b4f6c2d8e1a'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import bindparam
+
+from compair.models import convention
+
+def upgrade():
+    for table_name in ['assignment', 'assignment_criterion']:
+        with op.batch_alter_table(table_name, naming_convention=convention) as batch_op:
+            batch_op.add_column(sa.Column('lowest_score', sa.Float(), nullable=True))
+            batch_op.add_column(sa.Column('highest_score', sa.Float(), nullable=True))
+
+    connection = op.get_bind()
+    answer_table = sa.table('answer',
+        sa.column('id', sa.Integer),
+        sa.column('active', sa.Boolean)
+    )
+    answer_score_table = sa.table('answer_score',
+        sa.column('assignment_id', sa.Integer),
+        sa.column('answer_id', sa.Integer),
+        sa.column('score', sa.Float)
+    )
+    answer_criterion_score_table = sa.table('answer_criterion_score',
+        sa.column('assignment_id', sa.Integer),
+        sa.column('criterion_id', sa.Integer),
+        sa.column('score', sa.Float)
+    )
+    assignment_table = sa.table('assignment',
+        sa.column('id', sa.Integer),
+        sa.column('lowest_score', sa.Float),
+        sa.column('highest_score', sa.Float)
+    )
+    assignment_criterion_table = sa.table('assignment_criterion',
+        sa.column('assignment_id', sa.Integer),
+        sa.column('criterion_id', sa.Integer),
+        sa.column('lowest_score', sa.Float),
+        sa.column('highest_score', sa.Float)
+    )
+
+    # answer scores are normalized by the scores of active answers in the assignment
+    query = sa.select([answer_score_table.c.assignment_id,
+            sa.func.min(answer_score_table.c.score), sa.func.max(answer_score_table.c.score)]) \
+        .select_from(answer_score_table.join(answer_table, answer_table.c.id == answer_score_table.c.answer_id)) \
+        .where(answer_table.c.active == True) \
+        .group_by(answer_score_table.c.assignment_id)
+    bounds = [{
+        'bound_assignment_id': assignment_id,
+        'bound_lowest_score': lowest,
+        'bound_highest_score': highest
+    } for (assignment_id, lowest, highest) in connection.execute(query)]
+    if bounds:
+        connection.execute(
+            assignment_table.update() \
+                .where(assignment_table.c.id == bindparam('bound_assignment_id')) \
+                .values(lowest_score=bindparam('bound_lowest_score'), highest_score=bindparam('bound_highest_score')),
+            bounds
+        )
+
+    # answer criterion scores are normalized by all scores of the criterion in the assignment
+    query = sa.select([answer_criterion_score_table.c.assignment_id, answer_criterion_score_table.c.criterion_id,
+            sa.func.min(answer_criterion_score_table.c.score), sa.func.max(answer_criterion_score_table.c.score)]) \
+        .group_by(answer_criterion_score_table.c.assignment_id, answer_criterion_score_table.c.criterion_id)
+    bounds = [{
+        'bound_assignment_id': assignment_id,
+        'bound_criterion_id': criterion_id,
+        'bound_lowest_score': lowest,
+        'bound_highest_score': highest
+    } for (assignment_id, criterion_id, lowest, highest) in connection.execute(query)]
+    if bounds:
+        connection.execute(
+            assignment_criterion_table.update() \
+                .where(sa.and_(
+                    assignment_criterion_table.c.assignment_id == bindparam('bound_assignment_id'),
+                    assignment_criterion_table.c.criterion_id == bindparam('bound_criterion_id')
+                )) \
+                .values(lowest_score=bindparam('bound_lowest_score'), highest_score=bindparam('bound_highest_score')),
+            bounds
+        )
+
+def downgrade():
+    for table_name in ['assignment_criterion', 'assignment']:
+        with op.batch_alter_table(table_name, naming_convention=convention) as batch_op:
+            batch_op.drop_column('highest_score')
+            batch_op.drop_column('lowest_score')
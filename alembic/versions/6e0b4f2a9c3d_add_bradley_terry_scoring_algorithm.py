@@ -0,0 +1,71 @@
+"""add bradley terry scoring algorithm
+
+Revision ID: 6e0b4f2a9c3d
+Revises: 3a7d9e4c1b2f
+Create Date: 2026-10-17 16:05:31.842277
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6e0b4f2a9c3d'
+down_revision = '3a7d9e4c1b2f'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy_enum34 import EnumType
+
+from enum import Enum
+from sqlalchemy import bindparam
+from sqlalchemy.sql.expression import null, update
+
+from compair.models import convention
+
+# In order to handle both upgrade and downgrade scenarios, we are not depending
+# on definitions in compair.models.ScoringAlgorithm.  Define our own here
+class _OldScoringAlgorithm(Enum):
+    comparative_judgement = "comparative_judgement"
+    elo = "elo_rating"
+    true_skill = "true_skill_rating"
+
+class _NewScoringAlgorithm(Enum):
+    comparative_judgement = "comparative_judgement"
+    elo = "elo_rating"
+    true_skill = "true_skill_rating"
+    bradley_terry = "bradley_terry"
+
+_table_names = ['assignment', 'answer_score', 'answer_criterion_score']
+
+def upgrade():
+    # Refer http://alembic.zzzcomputing.com/en/latest/ops.html#alembic.operations.Operations.alter_column
+    # MySQL can't ALTER a column without a full spec.
+    # So including existing_type, existing_server_default, and existing_nullable
+    for table_name in _table_names:
+        with op.batch_alter_table(table_name, naming_convention=convention) as batch_op:
+            batch_op.alter_column('scoring_algorithm',
+                type_=EnumType(_NewScoringAlgorithm),
+                existing_type=EnumType(_OldScoringAlgorithm),
+                existing_server_default=null(),
+                existing_nullable=True)
+
+def downgrade():
+    connection = op.get_bind()
+    for table_name in _table_names:
+        # first update the bradley_terry algo to elo algo
+        # (scores need to be recalculated after the downgrade)
+        table = sa.table(table_name,
+            sa.Column('id', sa.Integer()),
+            sa.Column('scoring_algorithm', EnumType(_NewScoringAlgorithm)))
+        stmt = update(table).\
+            where(table.c.scoring_algorithm == bindparam('from_algo')).\
+            values(scoring_algorithm = bindparam('to_algo'))
+        connection.execute(stmt, [{
+            'from_algo': _NewScoringAlgorithm.bradley_terry,
+            'to_algo': _NewScoringAlgorithm.elo}])
+
+        # then modify the enum type
+        with op.batch_alter_table(table_name, naming_convention=convention) as batch_op:
+            batch_op.alter_column('scoring_algorithm',
+                type_=EnumType(_OldScoringAlgorithm),
+                existing_type=EnumType(_NewScoringAlgorithm),
+                existing_server_default=null(),
+                existing_nullable=True)
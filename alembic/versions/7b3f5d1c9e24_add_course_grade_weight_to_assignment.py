@@ -0,0 +1,23 @@
+"""Add course grade weight to assignment
+
+Revision ID: 7b3f5d1c9e24
+Revises: 2d7a9e3c5f81
+Create Date: 2026-10-17 23:05:12.284915
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7b3f5d1c9e24'
+down_revision = '2d7a9e3c5f81'
+
+from alembic import op
+import sqlalchemy as sa
+
+from compair.models import convention
+
+def upgrade():
+    op.add_column('assignment', sa.Column('course_grade_weight', sa.Integer(), server_default='1', nullable=False))
+
+def downgrade():
+    with op.batch_alter_table('assignment', naming_convention=convention) as batch_op:
+        batch_op.drop_column('course_grade_weight')
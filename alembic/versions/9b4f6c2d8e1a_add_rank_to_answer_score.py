@@ -0,0 +1,65 @@
+"""Add rank to answer score table
+
+Revision ID: 9b4f6c2d8e1a
+Revises: 6e0b4f2a9c3d
+Create Date: 2026-10-17 18:41:27.365208
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9b4f6c2d8e1a'
+down_revision = '6e0b4f2a9c3d'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import bindparam
+
+from compair.models import convention
+
+def upgrade():
+    with op.batch_alter_table('answer_score', naming_convention=convention) as batch_op:
+        batch_op.add_column(sa.Column('rank', sa.Integer(), nullable=True))
+
+    # rank existing scores among the active answers of their assignment (ties share the best rank)
+    connection = op.get_bind()
+    answer_score_table = sa.table('answer_score',
+        sa.column('id', sa.Integer),
+        sa.column('assignment_id', sa.Integer),
+        sa.column('answer_id', sa.Integer),
+        sa.column('score', sa.Float),
+        sa.column('rank', sa.Integer)
+    )
+    answer_table = sa.table('answer',
+        sa.column('id', sa.Integer),
+        sa.column('active', sa.Boolean)
+    )
+
+    query = sa.select([answer_score_table.c.id, answer_score_table.c.assignment_id, answer_score_table.c.score]) \
+        .select_from(answer_score_table.join(answer_table, answer_table.c.id == answer_score_table.c.answer_id)) \
+        .where(answer_table.c.active == True) \
+        .order_by(answer_score_table.c.assignment_id, answer_score_table.c.score.desc())
+
+    ranks = []
+    assignment_id = None
+    for record in connection.execute(query):
+        if record[answer_score_table.c.assignment_id] != assignment_id:
+            assignment_id = record[answer_score_table.c.assignment_id]
+            position = 0
+            previous_score = None
+        position += 1
+        if record[answer_score_table.c.score] != previous_score:
+            rank = position
+            previous_score = record[answer_score_table.c.score]
+        ranks.append({'answer_score_id': record[answer_score_table.c.id], 'answer_score_rank': rank})
+
+    if ranks:
+        connection.execute(
+            answer_score_table.update() \
+                .where(answer_score_table.c.id == bindparam('answer_score_id')) \
+                .values(rank=bindparam('answer_score_rank')),
+            ranks
+        )
+
+def downgrade():
+    with op.batch_alter_table('answer_score', naming_convention=convention) as batch_op:
+        batch_op.drop_column('rank')
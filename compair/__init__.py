@@ -15,7 +15,7 @@ from lxml.html.clean import clean_html
 from celery.schedules import crontab
 
 from .authorization import define_authorization
-from .core import login_manager, bouncer, db, celery, abort, mail, impersonation
+from .core import login_manager, bouncer, db, celery, abort, mail, impersonation, cache
 from .configuration import config
 from .models import User, File
 from .activity import log
@@ -95,6 +95,10 @@ def is_allowed_during_impersonation(request):
             return True
     return False
 
+QUEUE_SETTINGS = [
+    'COMPARISON_PAIR_QUEUE_ENABLED', 'SCORE_UPDATE_QUEUE_ENABLED', 'GRADE_UPDATE_QUEUE_ENABLED'
+]
+
 def create_app(conf=config, settings_override=None, skip_endpoints=False, skip_assets=False):
     """Return a :class:`Flask` application instance
 
@@ -107,6 +111,17 @@ def create_app(conf=config, settings_override=None, skip_endpoints=False, skip_a
     app.config.update(conf)
     app.config.update(settings_override)
 
+    # the queues are shared by the web processes and the celery workers through the cache.
+    # With the local cache backend only tasks executed in the web process see them
+    if app.config.get('CACHE_BACKEND', 'local') != 'redis' and not app.config.get('CELERY_ALWAYS_EAGER', False):
+        for setting in QUEUE_SETTINGS:
+            if app.config.get(setting, False):
+                raise RuntimeError(setting + ' requires CACHE_BACKEND redis or CELERY_ALWAYS_EAGER.')
+
+    # popped pairs are checked against the pairing snapshot, which would be built on every request without the cache
+    if app.config.get('COMPARISON_PAIR_QUEUE_ENABLED', False) and not app.config.get('PAIRING_SNAPSHOT_CACHE_ENABLED', False):
+        raise RuntimeError('COMPARISON_PAIR_QUEUE_ENABLED requires PAIRING_SNAPSHOT_CACHE_ENABLED.')
+
     if not app.config.get('ENFORCE_SSL', True):
         try:
             _create_unverified_https_context = ssl._create_unverified_context
@@ -149,6 +164,8 @@ def create_app(conf=config, settings_override=None, skip_endpoints=False, skip_a
 
     mail.init_app(app)
 
+    cache.init_app(app)
+
     create_persistent_dirs(app.config, app.logger)
 
     # add include_raw to jinja templates
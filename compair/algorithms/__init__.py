@@ -1,6 +1,7 @@
 from .comparison_pair import ComparisonPair
 from .comparison_winner import ComparisonWinner
 from .scored_object import ScoredObject
+from .opponent_stats import OpponentStats
 from .exceptions import InsufficientObjectsForPairException, \
     UserComparedAllObjectsException, UnknownPairGeneratorException, \
     InvalidWinnerException
\ No newline at end of file
@@ -0,0 +1,61 @@
+import json
+from collections import namedtuple
+
+from .comparison_winner import ComparisonWinner
+
+OpponentStats = namedtuple('OpponentStats', ['wins', 'loses'])
+
+def add_opponent_result(opponent_stats, opponent_key, did_win, did_lose):
+    """
+    Records one comparison result against opponent_key
+    :param opponent_stats: dictionary opponent key -> OpponentStats (updated in place)
+    :return: the updated opponent_stats
+    """
+    stats = opponent_stats.get(opponent_key, OpponentStats(0, 0))
+    opponent_stats[opponent_key] = OpponentStats(
+        wins=stats.wins + 1 if did_win else stats.wins,
+        loses=stats.loses + 1 if did_lose else stats.loses
+    )
+    return opponent_stats
+
+def tally_opponent_stats(comparison_pairs, keys=None):
+    """
+    Counts the wins/loses of every key against each of its opponents (incomplete comparisons are skipped)
+    :param comparison_pairs: array of comparison_pairs
+    :param keys: only tally these keys (all keys if None)
+    :return: dictionary key -> dictionary opponent key -> OpponentStats
+    """
+    tallies = {}
+    for comparison_pair in comparison_pairs:
+        if comparison_pair.winner is None:
+            continue
+
+        key1_winner = comparison_pair.winner == ComparisonWinner.key1
+        key2_winner = comparison_pair.winner == ComparisonWinner.key2
+
+        for (key, opponent_key, did_win, did_lose) in [
+                (comparison_pair.key1, comparison_pair.key2, key1_winner, key2_winner),
+                (comparison_pair.key2, comparison_pair.key1, key2_winner, key1_winner)]:
+            if keys != None and key not in keys:
+                continue
+            add_opponent_result(tallies.setdefault(key, {}), opponent_key, did_win, did_lose)
+
+    return tallies
+
+def dump_opponent_stats(opponent_stats):
+    """
+    Serializes opponent stats as json of opponent key -> [wins, loses]
+    """
+    return json.dumps(dict(
+        (opponent_key, [stats.wins, stats.loses])
+        for opponent_key, stats in opponent_stats.items()
+    ))
+
+def load_opponent_stats(data):
+    """
+    Deserializes opponent stats from dump_opponent_stats (opponent keys must be integers)
+    """
+    return dict(
+        (int(opponent_key), OpponentStats(wins=stats[0], loses=stats[1]))
+        for opponent_key, stats in json.loads(data).items()
+    )
@@ -1 +1,2 @@
-from .core import generate_pair
\ No newline at end of file
+from .core import generate_pair
+from .pair_scheduler import schedule_pairs
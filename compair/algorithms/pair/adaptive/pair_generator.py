@@ -1,5 +1,4 @@
 import random
-import math
 
 from compair.algorithms.pair.pair_generator import PairGenerator
 from compair.algorithms.comparison_pair import ComparisonPair
@@ -43,11 +42,8 @@ class AdaptivePairGenerator(PairGenerator):
         for round in self.rounds:
             scored_objects = self.round_objects.get(round, [])
 
-            # place objects in round in random order
-            random.shuffle(scored_objects)
-
-            # find a scored_object that has a valid opponent
-            for index, scored_object in enumerate(scored_objects):
+            # find a scored_object that has a valid opponent (taking objects in random order)
+            for scored_object in self._random_order(scored_objects):
                 if self._has_valid_opponent(scored_object.key):
                     score_object_1 = scored_object
                     break
@@ -58,8 +54,10 @@ class AdaptivePairGenerator(PairGenerator):
         if score_object_1 == None:
             raise UserComparedAllObjectsException
 
-        # step 2: remove invalid opponents
-        self._remove_invalid_opponents(score_object_1.key)
+        # step 2: skip invalid opponents (the first element and the objects
+        # the current user has already compared it with)
+        invalid_keys = set(self.opponents.get(score_object_1.key, ()))
+        invalid_keys.add(score_object_1.key)
 
         # step 3: select valid second element in pair
         """
@@ -71,20 +69,12 @@ class AdaptivePairGenerator(PairGenerator):
         """
         score = score_object_1.score
         for round in self.rounds:
-            scored_objects = self.round_objects.get(round, [])
+            (sorted_scores, sorted_objects) = self._get_sorted_round(round)
 
-            # sort by absolute difference between first element's score
-            # and order similar scored objects randomly
-            scored_objects = sorted(scored_objects,
-                key=lambda scored_object: (
-                    math.fabs(score - scored_object.score),
-                    random.random()
-                )
-            )
-
-            # take the first score object
-            if len(scored_objects) > 0:
-                score_object_2 = scored_objects[0]
+            # take the score object with the closest score to the first element's score
+            # (similar scored objects are selected randomly)
+            score_object_2 = self._find_closest_by_score(sorted_scores, sorted_objects, score, invalid_keys)
+            if score_object_2 != None:
                 break
 
         if score_object_2 == None:
@@ -97,8 +87,9 @@ class AdaptivePairGenerator(PairGenerator):
         )
 
     def _setup_rounds(self, comparison_pairs, scored_objects):
-        # change None value scores to zero
-        for (index, scored_object) in enumerate(scored_objects):
-            if scored_object.score == None:
-                scored_objects[index] = scored_object._replace(score=0)
+        # change None value scores to zero (without modifying the caller's list)
+        scored_objects = [
+            scored_object._replace(score=0) if scored_object.score == None else scored_object
+            for scored_object in scored_objects
+        ]
         PairGenerator._setup_rounds(self, comparison_pairs, scored_objects)
\ No newline at end of file
@@ -0,0 +1 @@
+from .core import generate_pair, generate_rounds, match_round
\ No newline at end of file
@@ -0,0 +1,16 @@
+from .pair_generator import AdaptiveMatchingPairGenerator
+
+def generate_pair(scored_objects=[], comparison_pairs=[], round_matchings=None, log=None):
+    pair_algorithm = AdaptiveMatchingPairGenerator()
+    pair_algorithm.log = log
+    return pair_algorithm.generate_pair(scored_objects, comparison_pairs, round_matchings)
+
+def match_round(scored_objects=[], log=None):
+    pair_algorithm = AdaptiveMatchingPairGenerator()
+    pair_algorithm.log = log
+    return pair_algorithm.match_round(scored_objects)
+
+def generate_rounds(scored_objects=[], number_of_pairs=0, comparison_pairs=[], log=None):
+    pair_algorithm = AdaptiveMatchingPairGenerator()
+    pair_algorithm.log = log
+    return pair_algorithm.generate_rounds(scored_objects, number_of_pairs, comparison_pairs)
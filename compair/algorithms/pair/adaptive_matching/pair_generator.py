@@ -0,0 +1,197 @@
+import random
+
+from compair.algorithms.pair.pair_generator import PairGenerator
+from compair.algorithms.comparison_pair import ComparisonPair
+from compair.algorithms.exceptions import InsufficientObjectsForPairException, \
+    UserComparedAllObjectsException, UnknownPairGeneratorException
+
+class AdaptiveMatchingPairGenerator(PairGenerator):
+    # objects sorted by score can only be matched with one of their next MATCHING_WINDOW - 1 neighbours
+    MATCHING_WINDOW = 4
+
+    def __init__(self):
+        PairGenerator.__init__(self)
+
+    def generate_pair(self, scored_objects, comparison_pairs, round_matchings=None):
+        """
+        Returns a pair to be compared by the current user.
+        If no valid pair can be found, an error is raised
+        param scored_objects: list of all scored objects that can be compared
+        param comparison_pairs: list of all comparisons completed by the current user.
+        param round_matchings: matchings shared by every user (round -> list of (key1, key2) matching
+            the objects in the round and the lower ones, see match_round). get(round) returns None
+            for rounds not matched yet and pop(round) discards a matching that is out of date
+        """
+
+        self._setup_rounds(comparison_pairs, scored_objects)
+        comparison_pair = self._find_pair(round_matchings)
+
+        if comparison_pair == None:
+            raise UnknownPairGeneratorException
+
+        return comparison_pair
+
+    def generate_rounds(self, scored_objects, number_of_pairs, comparison_pairs=[]):
+        """
+        Returns up to number_of_pairs pairs taken from consecutive rounds of disjoint pairs
+        over all scored objects. Pairs are never repeated in later rounds.
+        Within a round, pairs of objects with the fewest rounds come first
+        param scored_objects: list of all scored objects that can be compared
+        param number_of_pairs: maximum number of pairs to return
+        param comparison_pairs: list of pairs that should not be generated
+        """
+        if len(scored_objects) < 2:
+            raise InsufficientObjectsForPairException
+
+        self._setup_opponents(comparison_pairs)
+
+        generated_pairs = []
+        while len(generated_pairs) < number_of_pairs:
+            round_pairs = self._match(scored_objects)
+            if len(round_pairs) == 0:
+                # every possible pair has been generated
+                break
+
+            round_pairs = self._sort_by_rounds(round_pairs)
+            for (scored_object_1, scored_object_2) in round_pairs[:number_of_pairs - len(generated_pairs)]:
+                self.opponents.setdefault(scored_object_1.key, set()).add(scored_object_2.key)
+                self.opponents.setdefault(scored_object_2.key, set()).add(scored_object_1.key)
+                generated_pairs.append(ComparisonPair(
+                    key1=scored_object_1.key,
+                    key2=scored_object_2.key,
+                    winner=None
+                ))
+
+        return generated_pairs
+
+    def match_round(self, scored_objects):
+        """
+        Returns disjoint pairs (key1, key2) matching the scored objects by score
+        (the matching shared by every user in round_matchings)
+        """
+        self._setup_opponents([])
+        return [(scored_object_1.key, scored_object_2.key)
+            for (scored_object_1, scored_object_2) in self._match(scored_objects)]
+
+    def _find_pair(self, round_matchings=None):
+        """
+        Returns a comparison pair from a round of disjoint pairs.
+        - The round is made of the objects in the lowest rounds possible
+          (higher rounds are added until at least one valid pair exists)
+        - The round's pairs are taken from the shared round matching if it has pairs the current
+          user can compare. Otherwise the round is matched so that as many objects as possible are
+          paired with the smallest total score distance, excluding pairs already compared by the current user
+        - The pair with the fewest rounds is selected (randomly if tied)
+        """
+        round_objects = []
+        round_pairs = []
+        for round in self.rounds:
+            round_objects += self.round_objects.get(round, [])
+            if round_matchings != None:
+                round_pairs = self._shared_round_pairs(round_matchings, round, round_objects)
+            if len(round_pairs) == 0:
+                round_pairs = self._match(round_objects)
+            if len(round_pairs) > 0:
+                break
+
+        if len(round_pairs) == 0:
+            raise UserComparedAllObjectsException
+
+        (scored_object_1, scored_object_2) = self._sort_by_rounds(round_pairs)[0]
+
+        return ComparisonPair(
+            key1=scored_object_1.key,
+            key2=scored_object_2.key,
+            winner=None
+        )
+
+    def _shared_round_pairs(self, round_matchings, round, round_objects):
+        """
+        Returns the pairs of the shared round matching that the current user can compare
+        """
+        matching = round_matchings.get(round)
+        if matching == None:
+            return []
+
+        objects = dict((scored_object.key, scored_object) for scored_object in round_objects)
+        round_pairs = [(objects[key1], objects[key2]) for (key1, key2) in matching
+            if key1 in objects and key2 in objects]
+        if len(round_pairs) == 0:
+            # every matched object has moved to a higher round since the round was matched
+            round_matchings.pop(round, None)
+            return []
+
+        return [(scored_object_1, scored_object_2) for (scored_object_1, scored_object_2) in round_pairs
+            if self._can_match(scored_object_1.key, scored_object_2.key)]
+
+    def _sort_by_rounds(self, round_pairs):
+        # place pairs in random order so pairs with the same rounds are selected fairly
+        round_pairs = list(round_pairs)
+        random.shuffle(round_pairs)
+        round_pairs.sort(key=lambda pair: pair[0].rounds + pair[1].rounds)
+        return round_pairs
+
+    def _can_match(self, key1, key2):
+        return key2 not in self.opponents.get(key1, ())
+
+    def _match(self, scored_objects):
+        """
+        Returns disjoint pairs of scored objects that pair as many objects as possible with
+        the smallest total score distance (pairs in opponents are excluded).
+
+        Objects are sorted by score and only matched with one of their next MATCHING_WINDOW - 1
+        neighbours. The matching is found with dynamic programming over the sorted objects where
+        the state is a bit mask of the upcoming neighbours that are already matched, which takes
+        linear time in the number of objects.
+        """
+        # place objects in random order so objects with the same score are matched fairly
+        sorted_objects = list(scored_objects)
+        random.shuffle(sorted_objects)
+        sorted_objects.sort(key=lambda scored_object: scored_object.score if scored_object.score != None else 0)
+        scores = [scored_object.score if scored_object.score != None else 0 for scored_object in sorted_objects]
+        keys = [scored_object.key for scored_object in sorted_objects]
+        count = len(sorted_objects)
+
+        # mask -> (unmatched objects, total score distance) for the best matching so far
+        costs = {0: (0, 0)}
+        # for every object: next mask -> (previous mask, index of matched neighbour or None)
+        choices = []
+
+        for index in range(count):
+            next_costs = {}
+            next_choices = {}
+
+            for mask, (unmatched, distance) in costs.items():
+                if mask & 1:
+                    # already matched with a previous object
+                    options = [(mask >> 1, (unmatched, distance), None)]
+                else:
+                    options = [(mask >> 1, (unmatched + 1, distance), None)]
+                    for offset in range(1, min(self.MATCHING_WINDOW, count - index)):
+                        neighbour = index + offset
+                        if mask & (1 << offset) or not self._can_match(keys[index], keys[neighbour]):
+                            continue
+                        options.append((
+                            (mask | (1 << offset)) >> 1,
+                            (unmatched, distance + abs(scores[index] - scores[neighbour])),
+                            neighbour
+                        ))
+
+                for (next_mask, cost, neighbour) in options:
+                    if next_mask not in next_costs or cost < next_costs[next_mask]:
+                        next_costs[next_mask] = cost
+                        next_choices[next_mask] = (mask, neighbour)
+
+            costs = next_costs
+            choices.append(next_choices)
+
+        # every neighbour is within the objects so the final mask is always empty
+        round_pairs = []
+        mask = 0
+        for index in range(count - 1, -1, -1):
+            (mask, neighbour) = choices[index][mask]
+            if neighbour != None:
+                round_pairs.append((sorted_objects[index], sorted_objects[neighbour]))
+        round_pairs.reverse()
+
+        return round_pairs
@@ -1,5 +1,5 @@
 import random
-import math
+import numpy
 
 from compair.algorithms.pair.pair_generator import PairGenerator
 from compair.algorithms.comparison_pair import ComparisonPair
@@ -13,7 +13,9 @@ class AdaptiveMinDeltaPairGenerator(PairGenerator):
         PairGenerator.__init__(self)
 
         self.criterion_scores = {}
-        self.criterion_weights = {}
+        # weighted criteria keys and their weights in the same order
+        self.criterion_keys = []
+        self.criterion_weight_vector = numpy.zeros(0)
 
     def generate_pair(self, scored_objects, comparison_pairs, criterion_scores={}, criterion_weights={}):
         """
@@ -25,15 +27,8 @@ class AdaptiveMinDeltaPairGenerator(PairGenerator):
         param criterion_weights: dictionary of criterion key to weight
         """
 
-        self.criterion_scores = criterion_scores
-        self.criterion_weights = criterion_weights
-
-        for key, criterion_score in criterion_scores.items():
-            for criterion_key, score in criterion_score.items():
-                if score == None:
-                    criterion_scores[key][criterion_key] = 0
-
         self._setup_rounds(comparison_pairs, scored_objects)
+        self._setup_criterion_scores(criterion_scores, criterion_weights)
         comparison_pair = self._find_pair()
 
         if comparison_pair == None:
@@ -84,23 +79,22 @@ class AdaptiveMinDeltaPairGenerator(PairGenerator):
         for round in self.rounds:
             scored_objects = self.round_objects.get(round, [])
 
+            if len(scored_objects) == 0:
+                continue
+
             """
-            sort by followings, in order:
-            (1) sum of weighted criterion scores delta;
-            (2) absolute diff between the scores;
-            (3) a random number
+            select by followings, in order:
+            (1) minimum sum of weighted criterion scores delta;
+            (2) closest score (using the score sorted candidates);
+            (3) randomly
             """
-            scored_objects = sorted(scored_objects,
-                key=lambda scored_object: (
-                    self._criterion_score_delta_sum(score_object_1.key, scored_object.key),
-                    math.fabs(score - scored_object.score),
-                    random.random()
-                )
-            )
-
-            # take the first score object
-            if len(scored_objects) > 0:
-                score_object_2 = scored_objects[0]
+            deltas = self._criterion_score_deltas(score_object_1.key, scored_objects)
+            min_delta = deltas.min()
+            candidates = [scored_objects[index] for index in numpy.flatnonzero(deltas == min_delta)]
+
+            (sorted_scores, sorted_objects) = self._sort_by_score(candidates)
+            score_object_2 = self._find_closest_by_score(sorted_scores, sorted_objects, score)
+            if score_object_2 != None:
                 break
 
         if score_object_2 == None:
@@ -113,26 +107,39 @@ class AdaptiveMinDeltaPairGenerator(PairGenerator):
         )
 
     def _setup_rounds(self, comparison_pairs, scored_objects):
-        # change None value scores to zero
-        for (index, scored_object) in enumerate(scored_objects):
-            if scored_object.score == None:
-                scored_objects[index] = scored_object._replace(score=0)
+        # change None value scores to zero (without modifying the caller's list)
+        scored_objects = [
+            scored_object._replace(score=0) if scored_object.score == None else scored_object
+            for scored_object in scored_objects
+        ]
         PairGenerator._setup_rounds(self, comparison_pairs, scored_objects)
 
-    def _criterion_score_delta_sum(self, scored_object_key1, scored_object_key2):
+    def _setup_criterion_scores(self, criterion_scores, criterion_weights):
         """
-        Returns the sum of delta of criterion scores between the the scored obj
+        keeps a reference to the criterion scores (the caller's dictionaries aren't modified)
+        and the weights of the criteria in a fixed order
         """
-        theSum = 0
-        criterion_scores_1 = self.criterion_scores.setdefault(scored_object_key1, {})
-        criterion_scores_2 = self.criterion_scores.setdefault(scored_object_key2, {})
-        criterion_key_list = set(criterion_scores_1.keys()) | set(criterion_scores_2.keys())
+        self.criterion_scores = criterion_scores
+        self.criterion_keys = list(criterion_weights.keys())
+        self.criterion_weight_vector = numpy.array(
+            [criterion_weights[criterion_key] for criterion_key in self.criterion_keys], dtype=float)
 
-        for criterion_key in criterion_key_list:
-            score1 = criterion_scores_1.get(criterion_key, 0)
-            score2 = criterion_scores_2.get(criterion_key, 0)
-            weight = self.criterion_weights.get(criterion_key, 0)
+    def _criterion_score_row(self, scored_object_key):
+        """
+        Returns the weighted criterion scores of the scored object in criterion key order.
+        Missing or None criterion scores are treated as zero
+        """
+        scores = self.criterion_scores.get(scored_object_key, {})
+        return [scores.get(criterion_key) or 0 for criterion_key in self.criterion_keys]
 
-            theSum += math.fabs(score1 - score2) * weight
+    def _criterion_score_deltas(self, scored_object_key, scored_objects):
+        """
+        Returns an array with the sum of weighted delta of criterion scores between
+        the scored object and each of the scored objects.
+        Only the rows of the scored objects searched are built
+        """
+        rows = numpy.array([self._criterion_score_row(scored_object.key) for scored_object in scored_objects],
+            dtype=float).reshape(len(scored_objects), len(self.criterion_keys))
+        scores = numpy.array(self._criterion_score_row(scored_object_key), dtype=float)
 
-        return theSum
+        return numpy.abs(rows - scores).dot(self.criterion_weight_vector)
@@ -0,0 +1 @@
+from .core import generate_pair
\ No newline at end of file
@@ -0,0 +1,6 @@
+from .pair_generator import AdaptiveUncertaintyPairGenerator
+
+def generate_pair(scored_objects=[], comparison_pairs=[], log=None):
+    pair_algorithm = AdaptiveUncertaintyPairGenerator()
+    pair_algorithm.log = log
+    return pair_algorithm.generate_pair(scored_objects, comparison_pairs)
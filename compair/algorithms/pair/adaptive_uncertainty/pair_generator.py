@@ -0,0 +1,146 @@
+import math
+import random
+
+import numpy
+
+from compair.algorithms.pair.pair_generator import PairGenerator
+from compair.algorithms.comparison_pair import ComparisonPair
+from compair.algorithms.score.true_skill_rating.environment import TrueSkillEnvironment
+from compair.algorithms.exceptions import InsufficientObjectsForPairException, \
+    UserComparedAllObjectsException, UnknownPairGeneratorException
+
+class AdaptiveUncertaintyPairGenerator(PairGenerator):
+    """
+    Pairs objects using their TrueSkill ratings (mu in variable1 and sigma in variable2,
+    as stored by the true_skill scoring algorithm) so that the comparisons are the ones
+    expected to reduce the uncertainty (variance) of the ratings the most. Objects without
+    a rating use the TrueSkill default rating.
+    """
+    def __init__(self):
+        PairGenerator.__init__(self)
+
+    def generate_pair(self, scored_objects, comparison_pairs):
+        """
+        Returns a pair to be compared by the current user.
+        If no valid pair can be found, an error is raised
+        param scored_objects: list of all scored objects that can be compared
+        param comparison_pairs: list of all comparisons completed by the current user.
+        """
+
+        self._setup_rounds(comparison_pairs, scored_objects)
+        comparison_pair = self._find_pair()
+
+        if comparison_pair == None:
+            raise UnknownPairGeneratorException
+
+        return comparison_pair
+
+    def _find_pair(self):
+        """
+        Returns a comparison pair by matching them up by expected rating variance reduction.
+        - First key is selected by highest sigma (randomly if tied) within the lowest round possible
+        - First key must have a valid opponent with the current user or else its skipped
+        - Second key candidates are filters by previous opponents to first key
+        - Second key is selected by highest expected variance reduction (randomly if tied)
+          in the lowest round possible
+        """
+        score_object_1 = None
+        score_object_2 = None
+
+        # step 1: select valid first element in pair
+        for round in self.rounds:
+            scored_objects = self.round_objects.get(round, [])
+            if len(scored_objects) == 0:
+                continue
+
+            # place objects in round in random order so ties are broken randomly
+            random.shuffle(scored_objects)
+
+            # find the most uncertain scored_object that has a valid opponent
+            (mus, sigmas) = self._ratings(scored_objects)
+            for index in numpy.argsort(-sigmas, kind='stable'):
+                if self._has_valid_opponent(scored_objects[index].key):
+                    score_object_1 = scored_objects[index]
+                    break
+
+            if score_object_1 != None:
+                break
+
+        if score_object_1 == None:
+            raise UserComparedAllObjectsException
+
+        # step 2: remove invalid opponents
+        self._remove_invalid_opponents(score_object_1.key)
+
+        # step 3: select valid second element in pair
+        """
+        select second element in pair
+        second object must be in same round unless:
+            - there are no other objects in that round
+            - or there are no objects that haven't been compared
+              to it by current user already
+        """
+        for round in self.rounds:
+            scored_objects = self.round_objects.get(round, [])
+            if len(scored_objects) == 0:
+                continue
+
+            # place objects in round in random order so ties are broken randomly
+            random.shuffle(scored_objects)
+
+            variance_reductions = self._variance_reductions(score_object_1, scored_objects)
+            score_object_2 = scored_objects[int(numpy.argmax(variance_reductions))]
+            break
+
+        if score_object_2 == None:
+            raise UnknownPairGeneratorException
+
+        return ComparisonPair(
+            key1=score_object_1.key,
+            key2=score_object_2.key,
+            winner=None
+        )
+
+    def _ratings(self, scored_objects):
+        """
+        Returns arrays of (mu, sigma) for the scored objects
+        """
+        mus = numpy.array([
+            scored_object.variable1 if scored_object.variable1 != None and scored_object.variable2 != None \
+                else TrueSkillEnvironment.MU
+            for scored_object in scored_objects
+        ], dtype=float)
+        sigmas = numpy.array([
+            scored_object.variable2 if scored_object.variable1 != None and scored_object.variable2 != None \
+                else TrueSkillEnvironment.SIGMA
+            for scored_object in scored_objects
+        ], dtype=float)
+        return (mus, sigmas)
+
+    def _variance_reductions(self, scored_object, opponents):
+        """
+        Returns the expected reduction of the sum of the variances (sigma squared) of the
+        two ratings after comparing scored_object against every opponent (ignoring draws).
+
+        The TrueSkill update of a player's variance after a comparison is
+        sigma^2 * (1 - sigma^2 / c^2 * w(t)) where c^2 = 2 * beta^2 + sigma1^2 + sigma2^2 and
+        t = (mu1 - mu2) / c. Averaged over the outcomes (player 1 wins with probability cdf(t))
+        w(t) becomes pdf(t)^2 / (cdf(t) * cdf(-t)), so the expected reduction is
+        (sigma1^4 + sigma2^4) / c^2 * pdf(t)^2 / (cdf(t) * cdf(-t)).
+        It is the highest for uncertain ratings with close means
+        """
+        (mus, sigmas) = self._ratings([scored_object])
+        (opponent_mus, opponent_sigmas) = self._ratings(opponents)
+
+        c_squared = 2 * TrueSkillEnvironment.BETA ** 2 + sigmas[0] ** 2 + opponent_sigmas ** 2
+        t = (mus[0] - opponent_mus) / numpy.sqrt(c_squared)
+
+        # standard normal cdf and pdf of t
+        win_probabilities = numpy.array([math.erfc(-value / math.sqrt(2)) / 2 for value in t], dtype=float)
+        outcome_variances = win_probabilities * (1.0 - win_probabilities)
+        densities = numpy.exp(-(t ** 2) / 2) / math.sqrt(2 * math.pi)
+        # comparisons with a certain outcome don't reduce the variances
+        expected_w = numpy.divide(densities ** 2, outcome_variances,
+            out=numpy.zeros(len(opponents)), where=outcome_variances > 0)
+
+        return (sigmas[0] ** 4 + opponent_sigmas ** 4) / c_squared * expected_w
@@ -1,3 +1,5 @@
+import bisect
+import random
 from abc import ABCMeta, abstractmethod
 from compair.algorithms.exceptions import InsufficientObjectsForPairException, \
     UserComparedAllObjectsException, UnknownPairGeneratorException
@@ -15,6 +17,14 @@ class PairGenerator:
         self.rounds = []
         self.round_objects = {}
 
+        # key -> set of keys the current user has already compared it with
+        self.opponents = {}
+        # keys of scored objects still available for pairing
+        self.candidate_keys = set()
+
+        # round -> (sorted scores, scored objects sorted by score) of the rounds searched so far
+        self.round_sorted_objects = {}
+
     def _debug(self, message):
         if self.log != None:
             self.log.debug(message)
@@ -39,17 +49,37 @@ class PairGenerator:
         if len(self.scored_objects) < 2:
             raise InsufficientObjectsForPairException
 
+        self._setup_opponents(self.comparison_pairs)
+
         # check if there are any scored objects that haven't been previously used
         all_keys = set([a.key for a in self.scored_objects])
-        used_keys = set([cp.key1 for cp in self.comparison_pairs]) | set([cp.key2 for cp in self.comparison_pairs])
+        used_keys = set(self.opponents.keys())
         unused_keys = all_keys - used_keys
         if len(unused_keys) >= 2:
             # set rounds using only unused scored objects (available for up to n/2 comparsions)
             self.scored_objects = [a for a in self.scored_objects if a.key in unused_keys]
+            all_keys = unused_keys
 
+        self.candidate_keys = all_keys
+
+        self._setup_round_objects()
+
+    def _setup_opponents(self, comparison_pairs):
+        """
+        build the opponent index once so candidates can be checked without
+        rescanning comparison_pairs
+        """
+        self.opponents = {}
+        for comparison_pair in comparison_pairs:
+            self.opponents.setdefault(comparison_pair.key1, set()).add(comparison_pair.key2)
+            self.opponents.setdefault(comparison_pair.key2, set()).add(comparison_pair.key1)
+
+    def _setup_round_objects(self):
         self.rounds = list(set([a.rounds for a in self.scored_objects]))
         self.rounds.sort()
 
+        self.round_objects = {}
+        self.round_sorted_objects = {}
         for scored_object in self.scored_objects:
             round = self.round_objects.setdefault(scored_object.rounds, [])
             round.append(scored_object)
@@ -59,40 +89,85 @@ class PairGenerator:
         Returns True if scored object has at least one other scored object it
         hasn't been compared to by the current user, False otherwise.
         """
-        compared_keys = set()
-        compared_keys.add(key)
-        for comparison_pair in self.comparison_pairs:
-            # add opponents of key to compared_keys set
-            if comparison_pair.key1 == key:
-                compared_keys.add(comparison_pair.key2)
-            elif comparison_pair.key2 == key:
-                compared_keys.add(comparison_pair.key1)
-
-        all_keys = set([scored_object.key for scored_object in self.scored_objects])
-
-        # some comparison keys may have been soft deleted hence we need to use
-        # the set subtraction operation instead of comparing sizes
-        all_keys -= compared_keys
+        # some comparison keys may have been soft deleted hence we need to only
+        # count opponents that are still candidates instead of comparing sizes
+        compared_count = len(self.candidate_keys.intersection(self.opponents.get(key, ())))
+        if key in self.candidate_keys:
+            compared_count += 1
 
-        return all_keys
+        return len(self.candidate_keys) > compared_count
 
     def _remove_invalid_opponents(self, key):
         """
         removes key and all opponents of key from score objects lists
         """
-        filter_keys = set()
+        filter_keys = set(self.opponents.get(key, ()))
         filter_keys.add(key)
-        for comparison_pair in self.comparison_pairs:
-            # add opponents of key to compared_keys set
-            if comparison_pair.key1 == key:
-                filter_keys.add(comparison_pair.key2)
-            elif comparison_pair.key2 == key:
-                filter_keys.add(comparison_pair.key1)
 
         self.scored_objects = [so for so in self.scored_objects if so.key not in filter_keys]
+        self.candidate_keys = self.candidate_keys - filter_keys
 
         # reinit round_objects
-        self.round_objects = {}
-        for scored_object in self.scored_objects:
-            round = self.round_objects.setdefault(scored_object.rounds, [])
-            round.append(scored_object)
\ No newline at end of file
+        self._setup_round_objects()
+
+    def _get_sorted_round(self, round):
+        """
+        Returns the objects of the round sorted by score so the closest opponent can be found
+        with a binary search. Only the rounds searched are sorted (once per request)
+        """
+        sorted_round = self.round_sorted_objects.get(round)
+        if sorted_round == None:
+            sorted_round = self._sort_by_score(self.round_objects.get(round, []))
+            self.round_sorted_objects[round] = sorted_round
+        return sorted_round
+
+    def _sort_by_score(self, scored_objects):
+        sorted_objects = sorted(scored_objects, key=lambda scored_object: scored_object.score)
+        sorted_scores = [scored_object.score for scored_object in sorted_objects]
+        return (sorted_scores, sorted_objects)
+
+    def _random_order(self, scored_objects):
+        """
+        Yields the scored objects in random order without shuffling the whole list
+        (only the objects taken are drawn)
+        """
+        # lazy Fisher-Yates shuffle: position -> index of the object swapped into it
+        swapped = {}
+        length = len(scored_objects)
+        for position in range(length):
+            other = random.randint(position, length - 1)
+            index = swapped.get(other, other)
+            swapped[other] = swapped.get(position, position)
+            yield scored_objects[index]
+
+    def _find_closest_by_score(self, sorted_scores, sorted_objects, score, exclude_keys=None):
+        """
+        Returns the scored object with the closest score (randomly if tied)
+        from lists sorted by score, or None if the lists are empty.
+        Objects with a key in exclude_keys are skipped
+        """
+        exclude_keys = exclude_keys or ()
+        index = bisect.bisect_left(sorted_scores, score)
+
+        # the closest scores are the nearest (not excluded) neighbours of the insertion point
+        left = index - 1
+        while left >= 0 and sorted_objects[left].key in exclude_keys:
+            left -= 1
+        right = index
+        while right < len(sorted_objects) and sorted_objects[right].key in exclude_keys:
+            right += 1
+
+        neighbour_scores = [sorted_scores[i] for i in (left, right) if 0 <= i < len(sorted_scores)]
+        if len(neighbour_scores) == 0:
+            return None
+        delta = min([abs(score - neighbour_score) for neighbour_score in neighbour_scores])
+        closest_scores = [s for s in neighbour_scores if abs(score - s) == delta]
+
+        # every object sharing one of the closest scores is equally distant
+        start = bisect.bisect_left(sorted_scores, closest_scores[0])
+        end = bisect.bisect_right(sorted_scores, closest_scores[-1])
+        closest_objects = [scored_object for scored_object in sorted_objects[start:end]
+            if scored_object.key not in exclude_keys]
+
+        random.shuffle(closest_objects)
+        return closest_objects[0]
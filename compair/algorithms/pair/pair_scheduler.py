@@ -0,0 +1,78 @@
+import random
+
+from compair.algorithms.comparison_pair import ComparisonPair
+from compair.algorithms.exceptions import InsufficientObjectsForPairException
+
+def schedule_pairs(scored_objects, number_of_pairs, by_score=True):
+    """
+    Returns up to number_of_pairs comparison pairs generated in bulk.
+    Pairs are generated in passes where every scored object is matched with at most one opponent:
+    - by_score: objects are sorted by score and matched with their closest unmatched neighbour
+    - otherwise: objects are matched randomly
+    Within a pass, pairs containing objects with the fewest rounds are scheduled first.
+    The same pair is never scheduled twice.
+    param scored_objects: list of all scored objects that can be compared
+    param number_of_pairs: maximum number of pairs to return
+    param by_score: match objects with similar scores instead of randomly
+    """
+    if len(scored_objects) < 2:
+        raise InsufficientObjectsForPairException
+
+    rounds = dict([(scored_object.key, scored_object.rounds) for scored_object in scored_objects])
+    keys = [scored_object.key for scored_object in scored_objects]
+    if by_score:
+        scores = dict([
+            (scored_object.key, scored_object.score if scored_object.score != None else 0)
+            for scored_object in scored_objects
+        ])
+        random.shuffle(keys)
+        keys.sort(key=lambda key: scores[key])
+
+    scheduled = set()
+    comparison_pairs = []
+    reverse = False
+
+    while len(comparison_pairs) < number_of_pairs:
+        if not by_score:
+            random.shuffle(keys)
+        ordered_keys = keys[::-1] if reverse else keys
+        reverse = not reverse
+
+        pass_pairs = _match_neighbours(ordered_keys, scheduled)
+        if len(pass_pairs) == 0:
+            # every possible pair has been scheduled
+            break
+
+        # random tie break so objects with the same rounds are scheduled fairly
+        random.shuffle(pass_pairs)
+        pass_pairs.sort(key=lambda pair: rounds[pair[0]] + rounds[pair[1]])
+
+        for (key1, key2) in pass_pairs[:number_of_pairs - len(comparison_pairs)]:
+            scheduled.add((key1, key2))
+            scheduled.add((key2, key1))
+            rounds[key1] += 1
+            rounds[key2] += 1
+            comparison_pairs.append(ComparisonPair(key1=key1, key2=key2, winner=None))
+
+    return comparison_pairs
+
+def _match_neighbours(ordered_keys, scheduled):
+    """
+    Greedily matches every key with the next unmatched key in order that it hasn't been scheduled with
+    """
+    matched = set()
+    pairs = []
+
+    for index, key1 in enumerate(ordered_keys):
+        if key1 in matched:
+            continue
+        for next_index in range(index+1, len(ordered_keys)):
+            key2 = ordered_keys[next_index]
+            if key2 in matched or (key1, key2) in scheduled:
+                continue
+            matched.add(key1)
+            matched.add(key2)
+            pairs.append((key1, key2))
+            break
+
+    return pairs
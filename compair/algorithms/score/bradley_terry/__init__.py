@@ -0,0 +1 @@
+from .core import calculate_score, calculate_score_1vs1
\ No newline at end of file
@@ -0,0 +1,13 @@
+from .score_algorithm import BradleyTerryScoreAlgorithm
+
+def calculate_score(comparison_pairs=[], scored_objects=[], log=None):
+    score_algorithm = BradleyTerryScoreAlgorithm()
+    score_algorithm.log = log
+    return score_algorithm.calculate_score(comparison_pairs, scored_objects)
+
+def calculate_score_1vs1(key1_scored_object, key2_scored_object, winner, other_comparison_pairs=[],
+        opponent_stats=None, log=None):
+    score_algorithm = BradleyTerryScoreAlgorithm()
+    score_algorithm.log = log
+    return score_algorithm.calculate_score_1vs1(key1_scored_object, key2_scored_object, winner, other_comparison_pairs,
+        opponent_stats)
\ No newline at end of file
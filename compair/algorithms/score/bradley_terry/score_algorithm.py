@@ -0,0 +1,304 @@
+import math
+
+import numpy
+
+from compair.algorithms.score.score_algorithm_base import ScoreAlgorithmBase
+from compair.algorithms.comparison_pair import ComparisonPair
+from compair.algorithms.comparison_winner import ComparisonWinner
+from compair.algorithms.scored_object import ScoredObject
+
+from compair.algorithms.exceptions import InvalidWinnerException
+
+class BradleyTerryScoreAlgorithm(ScoreAlgorithmBase):
+    """
+    Bradley-Terry (Rasch) model where the probability of key1 winning against key2 is
+    1 / (1 + exp(ability2 - ability1)). Draws count as half a win for both keys.
+
+    Abilities are fit all at once as the maximum a posteriori estimate under a normal prior
+    (mean 0 and PRIOR_PRECISION) which keeps the abilities of keys that won or lost all of
+    their comparisons finite.
+
+    score = ability
+    variable1 = ability
+    variable2 = standard error of the ability
+    """
+    PRIOR_PRECISION = 0.25
+    MAX_ITERATIONS = 50
+    # stop once no ability changes by more than this
+    TOLERANCE = 1e-8
+    # limit Newton steps (in logits) when warm-starting far from the solution
+    MAX_STEP = 4.0
+    # standard errors are taken from the full inverse Hessian up to this many keys
+    # (and from its diagonal only for larger assignments)
+    MAX_KEYS_EXACT_STANDARD_ERROR = 1000
+
+    def __init__(self):
+        ScoreAlgorithmBase.__init__(self)
+
+        # storage[key] = ScoredObject
+        self.storage = {}
+        # storage[key] = set() of opponent keys
+        self.opponents = {}
+
+    def calculate_score_1vs1(self, key1_scored_object, key2_scored_object, winner, other_comparison_pairs,
+            opponent_stats=None):
+        """
+        Calculates the scores for a new 1vs1 comparison without re-calculating all previous scores.
+        The abilities are updated with one Newton step using their standard errors as prior precision
+        :param key1_scored_object: Contains score parameters for key1
+        :param key2_scored_object: Contains score parameters for key2
+        :param winner: indicates comparison winner
+        :param other_comparison_pairs: Contains all previous comparison_pairs that the 2 keys took part in.
+            This is a subset of all comparison pairs and is used to calculate round, wins, loses, and opponent counts
+        :param opponent_stats: If set, dictionary key -> dictionary opponent key -> OpponentStats of the previous
+            comparisons of the 2 keys. Round, wins, loses, and opponent counts are then counted up from the
+            scored objects and other_comparison_pairs is not used
+        :return: tuple of ScoredObject (key1, key2)
+        """
+        self.storage = {}
+        self.opponents = {}
+
+        key1 = key1_scored_object.key
+        key2 = key2_scored_object.key
+
+        if winner == ComparisonWinner.key1:
+            key1_result = 1.0
+        elif winner == ComparisonWinner.key2:
+            key1_result = 0.0
+        elif winner == ComparisonWinner.draw:
+            key1_result = 0.5
+        else:
+            raise InvalidWinnerException
+
+        (ability1, information1) = self._get_ability(key1_scored_object)
+        (ability2, information2) = self._get_ability(key2_scored_object)
+
+        probability = 1.0 / (1.0 + math.exp(ability2 - ability1))
+        information1 += probability * (1.0 - probability)
+        information2 += probability * (1.0 - probability)
+        ability1 += (key1_result - probability) / information1
+        ability2 -= (key1_result - probability) / information2
+
+        for (key, ability, information) in [(key1, ability1, information1), (key2, ability2, information2)]:
+            self.opponents[key] = set()
+            self.storage[key] = ScoredObject(
+                key=key,
+                score=ability,
+                variable1=ability,
+                variable2=1.0 / math.sqrt(information),
+                rounds=0,
+                opponents=0,
+                wins=0,
+                loses=0
+            )
+
+        key1_winner = winner == ComparisonWinner.key1
+        key2_winner = winner == ComparisonWinner.key2
+
+        if opponent_stats != None:
+            self.storage[key1] = self._add_comparison_counts(self.storage[key1], key1_scored_object,
+                key2, opponent_stats, key1_winner, key2_winner)
+            self.storage[key2] = self._add_comparison_counts(self.storage[key2], key2_scored_object,
+                key1, opponent_stats, key2_winner, key1_winner)
+            return (self.storage[key1], self.storage[key2])
+
+        # calculate opponents, wins, loses, rounds for every match for key1 and key2
+        for comparison_pair in (other_comparison_pairs + [ComparisonPair(key1, key2, winner)]):
+            cp_key1 = comparison_pair.key1
+            cp_key2 = comparison_pair.key2
+            cp_winner = comparison_pair.winner
+            cp_key1_winner = cp_winner == ComparisonWinner.key1
+            cp_key2_winner = cp_winner == ComparisonWinner.key2
+
+            if cp_key1 == key1 or cp_key1 == key2:
+                self._update_result_stats(cp_key1, cp_key2, cp_winner, cp_key1_winner, cp_key2_winner)
+
+            if cp_key2 == key1 or cp_key2 == key2:
+                self._update_result_stats(cp_key2, cp_key1, cp_winner, cp_key2_winner, cp_key1_winner)
+
+        return (self.storage[key1], self.storage[key2])
+
+    def calculate_score(self, comparison_pairs, scored_objects=[]):
+        """
+        Calculate scores for a set of comparison_pairs
+        :param comparison_pairs: array of comparison_pairs
+        :param scored_objects: array of previous ScoredObjects. Their abilities (variable1) are used
+            as the starting point of the fit so that recalculations converge in fewer iterations
+        :return: dictionary key -> ScoredObject
+        """
+        keys = list(self.get_keys_from_comparison_pairs(comparison_pairs))
+        indexes = dict((key, index) for index, key in enumerate(keys))
+        count = len(keys)
+
+        first = numpy.empty(len(comparison_pairs), dtype=numpy.int64)
+        second = numpy.empty(len(comparison_pairs), dtype=numpy.int64)
+        # result of first (1 for a win, 0.5 for a draw, 0 for a loss, and -1 if incomplete)
+        results = numpy.empty(len(comparison_pairs), dtype=float)
+        for index, comparison_pair in enumerate(comparison_pairs):
+            first[index] = indexes[comparison_pair.key1]
+            second[index] = indexes[comparison_pair.key2]
+            winner = comparison_pair.winner
+
+            if winner is None:
+                results[index] = -1.0
+            elif winner == ComparisonWinner.key1:
+                results[index] = 1.0
+            elif winner == ComparisonWinner.key2:
+                results[index] = 0.0
+            elif winner == ComparisonWinner.draw:
+                results[index] = 0.5
+            else:
+                raise InvalidWinnerException
+
+        rounds = numpy.bincount(first, minlength=count) + numpy.bincount(second, minlength=count)
+
+        # skip incomplete comparisons
+        completed = results >= 0
+        first = first[completed]
+        second = second[completed]
+        results = results[completed]
+
+        wins = numpy.bincount(first, weights=results == 1.0, minlength=count) + \
+            numpy.bincount(second, weights=results == 0.0, minlength=count)
+        loses = numpy.bincount(first, weights=results == 0.0, minlength=count) + \
+            numpy.bincount(second, weights=results == 1.0, minlength=count)
+        edges = numpy.unique(numpy.minimum(first, second) * count + numpy.maximum(first, second))
+        opponents = numpy.bincount(edges // count, minlength=count) + \
+            numpy.bincount(edges % count, minlength=count)
+
+        abilities = numpy.zeros(count)
+        for scored_object in scored_objects:
+            index = indexes.get(scored_object.key)
+            if index != None and scored_object.variable1 != None:
+                abilities[index] = scored_object.variable1
+
+        abilities = self._fit(first, second, results, abilities)
+        standard_errors = self._standard_errors(first, second, abilities)
+
+        comparison_results = {}
+        for index, key in enumerate(keys):
+            comparison_results[key] = ScoredObject(
+                key=key,
+                score=float(abilities[index]),
+                variable1=float(abilities[index]),
+                variable2=float(standard_errors[index]),
+                rounds=int(rounds[index]),
+                opponents=int(opponents[index]),
+                wins=int(wins[index]),
+                loses=int(loses[index])
+            )
+
+        return comparison_results
+
+    def _get_ability(self, scored_object):
+        """
+        Returns (ability, information) of a scored object (the prior if it has no ability yet)
+        """
+        if scored_object.variable1 == None or not scored_object.variable2:
+            return (0.0, self.PRIOR_PRECISION)
+        return (scored_object.variable1, 1.0 / (scored_object.variable2 ** 2))
+
+    def _update_result_stats(self, key, opponent_key, winner, did_win, did_lose):
+        storage = self.storage[key]
+        # winner == None should only increase rounds
+        if winner is None:
+            self.storage[key] = storage._replace(rounds=storage.rounds+1)
+            return
+
+        self.opponents[key].add(opponent_key)
+        self.storage[key] = storage._replace(
+            rounds=storage.rounds+1,
+            opponents=len(self.opponents[key]),
+            wins=storage.wins+1 if did_win else storage.wins,
+            loses=storage.loses+1 if did_lose else storage.loses
+        )
+
+    def _probabilities(self, first, second, abilities):
+        return 1.0 / (1.0 + numpy.exp(abilities[second] - abilities[first]))
+
+    def _fit(self, first, second, results, abilities):
+        """
+        Newton's method on the log posterior. The Hessian is the Laplacian of the comparison graph
+        (weighted by p * (1 - p) for every comparison) plus the prior precision, so each step is
+        solved without building the matrix
+        """
+        count = len(abilities)
+
+        for iteration in range(self.MAX_ITERATIONS):
+            probabilities = self._probabilities(first, second, abilities)
+            residuals = results - probabilities
+            gradient = numpy.bincount(first, weights=residuals, minlength=count) - \
+                numpy.bincount(second, weights=residuals, minlength=count) - \
+                self.PRIOR_PRECISION * abilities
+
+            step = self._solve(first, second, probabilities * (1.0 - probabilities), gradient)
+            max_step = numpy.abs(step).max() if count > 0 else 0.0
+            if max_step > self.MAX_STEP:
+                step *= self.MAX_STEP / max_step
+            abilities = abilities + step
+
+            if max_step < self.TOLERANCE:
+                break
+
+        self._debug("Bradley-Terry fit of {} keys took {} iterations".format(count, iteration + 1))
+
+        return abilities
+
+    def _solve(self, first, second, weights, vector):
+        """
+        Solves (L + prior precision * I) x = vector with the Jacobi preconditioned conjugate gradient
+        method where L is the Laplacian of the comparison graph weighted by weights
+        """
+        count = len(vector)
+        diagonal = numpy.bincount(first, weights=weights, minlength=count) + \
+            numpy.bincount(second, weights=weights, minlength=count) + \
+            self.PRIOR_PRECISION
+
+        def multiply(x):
+            differences = weights * (x[first] - x[second])
+            return numpy.bincount(first, weights=differences, minlength=count) - \
+                numpy.bincount(second, weights=differences, minlength=count) + \
+                self.PRIOR_PRECISION * x
+
+        solution = numpy.zeros(count)
+        residual = vector.copy()
+        preconditioned = residual / diagonal
+        direction = preconditioned.copy()
+        residual_dot = residual.dot(preconditioned)
+        tolerance = (self.TOLERANCE * 1e-2) ** 2 * max(vector.dot(vector), 1.0)
+
+        for _ in range(count):
+            if residual.dot(residual) <= tolerance:
+                break
+            product = multiply(direction)
+            alpha = residual_dot / direction.dot(product)
+            solution += alpha * direction
+            residual -= alpha * product
+            preconditioned = residual / diagonal
+            next_residual_dot = residual.dot(preconditioned)
+            direction = preconditioned + (next_residual_dot / residual_dot) * direction
+            residual_dot = next_residual_dot
+
+        return solution
+
+    def _standard_errors(self, first, second, abilities):
+        """
+        Standard errors from the inverse of the Hessian of the log posterior at the fitted abilities.
+        Large assignments only use the diagonal of the Hessian, which ignores the uncertainty of
+        the opponents' abilities (and slightly underestimates the standard errors)
+        """
+        count = len(abilities)
+        probabilities = self._probabilities(first, second, abilities)
+        weights = probabilities * (1.0 - probabilities)
+
+        diagonal = numpy.bincount(first, weights=weights, minlength=count) + \
+            numpy.bincount(second, weights=weights, minlength=count) + \
+            self.PRIOR_PRECISION
+
+        if count > self.MAX_KEYS_EXACT_STANDARD_ERROR:
+            return 1.0 / numpy.sqrt(diagonal)
+
+        hessian = numpy.diag(diagonal)
+        numpy.add.at(hessian, (first, second), -weights)
+        numpy.add.at(hessian, (second, first), -weights)
+        return numpy.sqrt(numpy.diag(numpy.linalg.inv(hessian)))
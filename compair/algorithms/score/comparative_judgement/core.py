@@ -5,7 +5,9 @@ def calculate_score(comparison_pairs=[], log=None):
     score_algorithm.log = log
     return score_algorithm.calculate_score(comparison_pairs)
 
-def calculate_score_1vs1(key1_scored_object, key2_scored_object, winner, other_comparison_pairs=[], log=None):
+def calculate_score_1vs1(key1_scored_object, key2_scored_object, winner, other_comparison_pairs=[],
+        opponent_stats=None, log=None):
     score_algorithm = ComparativeJudgementScoreAlgorithm()
     score_algorithm.log = log
-    return score_algorithm.calculate_score_1vs1(key1_scored_object, key2_scored_object, winner, other_comparison_pairs)
\ No newline at end of file
+    return score_algorithm.calculate_score_1vs1(key1_scored_object, key2_scored_object, winner, other_comparison_pairs,
+        opponent_stats)
\ No newline at end of file
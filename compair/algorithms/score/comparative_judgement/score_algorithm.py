@@ -1,15 +1,13 @@
 import math
-from collections import namedtuple
 
 from compair.algorithms.score.score_algorithm_base import ScoreAlgorithmBase
 from compair.algorithms.comparison_pair import ComparisonPair
 from compair.algorithms.comparison_winner import ComparisonWinner
 from compair.algorithms.scored_object import ScoredObject
+from compair.algorithms.opponent_stats import OpponentStats
 
 from compair.algorithms.exceptions import InvalidWinnerException
 
-OpponentStats = namedtuple('OpponentStats', ['wins', 'loses'])
-
 class ComparativeJudgementScoreAlgorithm(ScoreAlgorithmBase):
     def __init__(self):
         ScoreAlgorithmBase.__init__(self)
@@ -20,7 +18,8 @@ class ComparativeJudgementScoreAlgorithm(ScoreAlgorithmBase):
         self.rounds = {}
 
 
-    def calculate_score_1vs1(self, key1_scored_object, key2_scored_object, winner, other_comparison_pairs):
+    def calculate_score_1vs1(self, key1_scored_object, key2_scored_object, winner, other_comparison_pairs,
+            opponent_stats=None):
         """
         Calculates the scores for a new 1vs1 comparison without re-calculating all previous scores
         :param key1_scored_object: Contains score parameters for key1
@@ -28,6 +27,9 @@ class ComparativeJudgementScoreAlgorithm(ScoreAlgorithmBase):
         :param winner: indicates comparison winner
         :param other_comparison_pairs: Contains all previous comparison_pairs that the 2 keys took part in.
             This is a subset of all comparison pairs and is used to calculate score, round, wins, loses, and opponent counts
+        :param opponent_stats: If set, dictionary key -> dictionary opponent key -> OpponentStats of the previous
+            comparisons of the 2 keys. The expected scores (variable1) and counts are then updated from the
+            scored objects and other_comparison_pairs is not used
         :return: tuple of ScoredObjects (key1, key2)
         """
         self.storage = {}
@@ -39,6 +41,14 @@ class ComparativeJudgementScoreAlgorithm(ScoreAlgorithmBase):
         if winner not in [ComparisonWinner.draw, ComparisonWinner.key1, ComparisonWinner.key2]:
             raise InvalidWinnerException
 
+        if opponent_stats != None:
+            key1_winner = winner == ComparisonWinner.key1
+            key2_winner = winner == ComparisonWinner.key2
+            return (
+                self._update_expected_score(key1_scored_object, key2, opponent_stats, key1_winner, key2_winner),
+                self._update_expected_score(key2_scored_object, key1, opponent_stats, key2_winner, key1_winner)
+            )
+
         for key in [key1, key2]:
             self.rounds[key] = 0
             self.storage[key] = {}
@@ -170,6 +180,40 @@ class ComparativeJudgementScoreAlgorithm(ScoreAlgorithmBase):
 
         return comparison_results
 
+    def _update_expected_score(self, scored_object, opponent_key, opponent_stats, did_win, did_lose):
+        """
+        Update the expected score of a key for one more comparison against opponent_key.
+        Only the term of opponent_key in the expected score changes so it is swapped out of the
+        stored expected score instead of summing over every opponent again
+        :param scored_object: Contains score parameters for the key
+        :param opponent_key: Key of the opponent
+        :param opponent_stats: dictionary key -> dictionary opponent key -> OpponentStats of previous comparisons
+        :return: ScoredObject for the key
+        """
+        key = scored_object.key
+        previous_stats = opponent_stats.get(key, {}).get(opponent_key)
+        stats = previous_stats if previous_stats != None else OpponentStats(0, 0)
+        stats = OpponentStats(
+            wins=stats.wins + 1 if did_win else stats.wins,
+            loses=stats.loses + 1 if did_lose else stats.loses
+        )
+
+        expected_score = scored_object.variable1 if scored_object.variable1 != None else 0.0
+        if previous_stats != None:
+            expected_score -= self._get_win_probability(previous_stats)
+        expected_score += self._get_win_probability(stats)
+
+        result = self._add_comparison_counts(scored_object, scored_object, opponent_key,
+            opponent_stats, did_win, did_lose)
+        opponents = result.opponents
+
+        # an estimate of actual value can be gotten from excepted score / number of opponents
+        return result._replace(
+            score=expected_score / (opponents if opponents > 0 else 1),
+            variable1=expected_score,
+            variable2=None
+        )
+
     def _update_win_lose(self, key, opponent_key, did_win, did_lose):
         """
         Update number of wins/loses against an opponent
@@ -203,11 +247,17 @@ class ComparativeJudgementScoreAlgorithm(ScoreAlgorithmBase):
             # skip comparing to self
             if opponent_key == key:
                 continue
-            wins = opponent_stats.wins
-            loses = opponent_stats.loses
-            prob_answer_wins = \
-                (math.exp(wins - loses)) / \
-                (1 + math.exp(wins - loses))
-            expected_score += prob_answer_wins
+            expected_score += self._get_win_probability(opponent_stats)
         return expected_score
 
+    def _get_win_probability(self, opponent_stats):
+        """
+        Calculate the probability of winning against an opponent
+        :param opponent_stats: OpponentStats against the opponent
+        :return: probability of winning
+        """
+        wins = opponent_stats.wins
+        loses = opponent_stats.loses
+        return \
+            (math.exp(wins - loses)) / \
+            (1 + math.exp(wins - loses))
@@ -0,0 +1,40 @@
+class EloEnvironment(object):
+    """
+    Elo rating system with its own constants (same defaults and results as the elo package).
+
+    Environments are immutable and ratings are plain floats, so one environment can be shared
+    by every calculation (including ones running in other threads).
+    """
+    # actual score of a win, draw, and loss
+    WIN = 1.0
+    DRAW = 0.5
+    LOSS = 0.0
+
+    K_FACTOR = 10
+    INITIAL = 1200
+    BETA = 200
+
+    def __init__(self, k_factor=K_FACTOR, initial=INITIAL, beta=BETA):
+        self.k_factor = k_factor
+        self.initial = initial
+        self.beta = beta
+
+    def create_rating(self, value=None):
+        return float(self.initial if value is None else value)
+
+    def expect(self, rating, other_rating):
+        """
+        Expected score of rating against other_rating
+        """
+        diff = float(other_rating) - float(rating)
+        return 1.0 / (1 + 10 ** (diff / (2 * self.beta)))
+
+    def rate_1vs1(self, rating1, rating2, drawn=False):
+        """
+        Returns the new (rating1, rating2) after rating1 won against rating2 (or they drew)
+        """
+        (score1, score2) = (self.DRAW, self.DRAW) if drawn else (self.WIN, self.LOSS)
+        return (
+            rating1 + self.k_factor * (score1 - self.expect(rating1, rating2)),
+            rating2 + self.k_factor * (score2 - self.expect(rating2, rating1))
+        )
@@ -1,5 +1,3 @@
-import elo
-
 from compair.algorithms.score.score_algorithm_base import ScoreAlgorithmBase
 from compair.algorithms.comparison_pair import ComparisonPair
 from compair.algorithms.comparison_winner import ComparisonWinner
@@ -7,7 +5,12 @@ from compair.algorithms.scored_object import ScoredObject
 
 from compair.algorithms.exceptions import InvalidWinnerException
 
+from .environment import EloEnvironment
+
 class EloAlgorithmWrapper(ScoreAlgorithmBase):
+    # shared by every calculation (environments are immutable)
+    environment = EloEnvironment()
+
     def __init__(self):
         ScoreAlgorithmBase.__init__(self)
 
@@ -18,7 +21,8 @@ class EloAlgorithmWrapper(ScoreAlgorithmBase):
         # storage[key] = # of rounds
         self.rounds = {}
 
-    def calculate_score_1vs1(self, key1_scored_object, key2_scored_object, winner, other_comparison_pairs):
+    def calculate_score_1vs1(self, key1_scored_object, key2_scored_object, winner, other_comparison_pairs,
+            opponent_stats=None):
         """
         Calculates the scores for a new 1vs1 comparison without re-calculating all previous scores
         :param key1_scored_object: Contains score parameters for key1
@@ -26,29 +30,27 @@ class EloAlgorithmWrapper(ScoreAlgorithmBase):
         :param winner: indicates the comparison winner
         :param other_comparison_pairs: Contains all previous comparison_pairs that the 2 keys took part in.
             This is a subset of all comparison pairs and is used to calculate round, wins, loses, and opponent counts
+        :param opponent_stats: If set, dictionary key -> dictionary opponent key -> OpponentStats of the previous
+            comparisons of the 2 keys. Round, wins, loses, and opponent counts are then counted up from the
+            scored objects and other_comparison_pairs is not used
         :return: tuple of ScoredObject (key1, key2)
         """
         self.storage = {}
         self.opponents = {}
-        elo.setup()
 
         key1 = key1_scored_object.key
         key2 = key2_scored_object.key
 
-        # Note: if value are None, elo.Rating will use default rating 1400
-        r1 = elo.Rating(
-            value=key1_scored_object.variable1
-        )
-        r2 = elo.Rating(
-            value=key2_scored_object.variable1
-        )
+        # Note: if value are None, the environment's initial rating 1200 is used
+        r1 = self.environment.create_rating(key1_scored_object.variable1)
+        r2 = self.environment.create_rating(key2_scored_object.variable1)
 
         if winner == ComparisonWinner.key1:
-            r1, r2 = elo.rate_1vs1(r1, r2)
+            r1, r2 = self.environment.rate_1vs1(r1, r2)
         elif winner == ComparisonWinner.key2:
-            r2, r1 = elo.rate_1vs1(r2, r1)
+            r2, r1 = self.environment.rate_1vs1(r2, r1)
         elif winner == ComparisonWinner.draw:
-            r1, r2 = elo.rate_1vs1(r1, r2, drawn=True)
+            r1, r2 = self.environment.rate_1vs1(r1, r2, drawn=True)
         else:
             raise InvalidWinnerException
 
@@ -65,6 +67,15 @@ class EloAlgorithmWrapper(ScoreAlgorithmBase):
                 loses=0
             )
 
+        if opponent_stats != None:
+            key1_winner = winner == ComparisonWinner.key1
+            key2_winner = winner == ComparisonWinner.key2
+            self.storage[key1] = self._add_comparison_counts(self.storage[key1], key1_scored_object,
+                key2, opponent_stats, key1_winner, key2_winner)
+            self.storage[key2] = self._add_comparison_counts(self.storage[key2], key2_scored_object,
+                key1, opponent_stats, key2_winner, key1_winner)
+            return (self.storage[key1], self.storage[key2])
+
         # calculate opponents, wins, loses, rounds for every match for key1 and key2
         for comparison_pair in (other_comparison_pairs + [ComparisonPair(key1, key2, winner)]):
             cp_key1 = comparison_pair.key1
@@ -95,22 +106,14 @@ class EloAlgorithmWrapper(ScoreAlgorithmBase):
         """
         self.storage = {}
         self.opponents = {}
-        elo.setup()
 
+        # ratings and counts are kept as plain values and only turned into ScoredObjects at the end
         keys = self.get_keys_from_comparison_pairs(comparison_pairs)
-        # create default ratings for every available key
-        for key in keys:
-            self.storage[key] = ScoredObject(
-                key=key,
-                score=elo.Rating(),
-                variable1=elo.Rating(),
-                variable2=None,
-                rounds=0,
-                opponents=0,
-                wins=0,
-                loses=0
-            )
-            self.opponents[key] = set()
+        ratings = dict((key, self.environment.create_rating()) for key in keys)
+        rounds = dict.fromkeys(keys, 0)
+        wins = dict.fromkeys(keys, 0)
+        loses = dict.fromkeys(keys, 0)
+        self.opponents = dict((key, set()) for key in keys)
 
         # calculate rating for every match
         for comparison_pair in comparison_pairs:
@@ -118,29 +121,40 @@ class EloAlgorithmWrapper(ScoreAlgorithmBase):
             key2 = comparison_pair.key2
             winner = comparison_pair.winner
 
+            rounds[key1] += 1
+            rounds[key2] += 1
+
             # skip incomplete comparisosns
             if winner is None:
-                self._update_rounds_only(key1)
-                self._update_rounds_only(key2)
                 continue
 
-            r1 = self.storage[key1].score
-            r2 = self.storage[key2].score
-
-            winner_key1 = winner == ComparisonWinner.key1
-            winner_key2 = winner == ComparisonWinner.key2
-
-            if winner_key1:
-                r1, r2 = elo.rate_1vs1(r1, r2)
-            elif winner_key2:
-                r2, r1 = elo.rate_1vs1(r2, r1)
+            if winner == ComparisonWinner.key1:
+                ratings[key1], ratings[key2] = self.environment.rate_1vs1(ratings[key1], ratings[key2])
+                wins[key1] += 1
+                loses[key2] += 1
+            elif winner == ComparisonWinner.key2:
+                ratings[key2], ratings[key1] = self.environment.rate_1vs1(ratings[key2], ratings[key1])
+                wins[key2] += 1
+                loses[key1] += 1
             elif winner == ComparisonWinner.draw:
-                r1, r2 = elo.rate_1vs1(r1, r2, drawn=True)
+                ratings[key1], ratings[key2] = self.environment.rate_1vs1(ratings[key1], ratings[key2], drawn=True)
             else:
                 raise InvalidWinnerException
 
-            self._update_rating(key1, r1, key2, winner_key1, winner_key2)
-            self._update_rating(key2, r2, key1, winner_key2, winner_key1)
+            self.opponents[key1].add(key2)
+            self.opponents[key2].add(key1)
+
+        for key in keys:
+            self.storage[key] = ScoredObject(
+                key=key,
+                score=ratings[key],
+                variable1=ratings[key],
+                variable2=None,
+                rounds=rounds[key],
+                opponents=len(self.opponents[key]),
+                wins=wins[key],
+                loses=loses[key]
+            )
 
         # return comparison results
         return self.storage
@@ -165,21 +179,3 @@ class EloAlgorithmWrapper(ScoreAlgorithmBase):
             wins=wins+1 if did_win else wins,
             loses=loses+1 if did_lose else loses,
         )
-
-    def _update_rating(self, key, new_rating, opponent_key, did_win, did_lose):
-        self.opponents[key].add(opponent_key)
-        wins = self.storage[key].wins
-        loses = self.storage[key].loses
-
-        # winner == None should not increase total wins or loses
-        self.storage[key] = ScoredObject(
-            key=key,
-            score=new_rating,
-            variable1=new_rating,
-            variable2=None,
-            rounds=self.storage[key].rounds+1,
-            opponents=len(self.opponents[key]),
-            wins=wins+1 if did_win else wins,
-            loses=loses+1 if did_lose else loses,
-        )
-
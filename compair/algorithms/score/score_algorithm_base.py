@@ -20,11 +20,25 @@ class ScoreAlgorithmBase:
 
         return keys
 
+    def _add_comparison_counts(self, result, scored_object, opponent_key, opponent_stats, did_win, did_lose):
+        """
+        Returns result with rounds, opponents, wins, and loses of scored_object counted up for one
+        more comparison against opponent_key (instead of recounting every previous comparison)
+        :param opponent_stats: dictionary key -> dictionary opponent key -> OpponentStats of previous comparisons
+        """
+        previous_stats = opponent_stats.get(scored_object.key, {}).get(opponent_key)
+        return result._replace(
+            rounds=(scored_object.rounds or 0) + 1,
+            opponents=(scored_object.opponents or 0) + (1 if previous_stats == None else 0),
+            wins=(scored_object.wins or 0) + (1 if did_win else 0),
+            loses=(scored_object.loses or 0) + (1 if did_lose else 0)
+        )
 
     @abstractmethod
     def calculate_score(self, comparison_pairs):
         pass
 
     @abstractmethod
-    def calculate_score_1vs1(self, key1_score_parameters, key2_score_parameters, winner, other_comparison_pairs):
+    def calculate_score_1vs1(self, key1_score_parameters, key2_score_parameters, winner, other_comparison_pairs,
+            opponent_stats=None):
         pass
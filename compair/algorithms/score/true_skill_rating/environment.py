@@ -0,0 +1,148 @@
+import math
+
+class TrueSkillEnvironment(object):
+    """
+    TrueSkill rating system for 1 vs 1 comparisons with its own constants (same defaults and
+    results as the trueskill package with its default backend).
+
+    With only two players the factor graph has a single truncation, so the message passing
+    converges in one pass and the updates are calculated in closed form. Environments are
+    immutable and ratings are plain (mu, sigma) floats, so one environment can be shared by
+    every calculation (including ones running in other threads).
+    """
+    MU = 25.0
+    SIGMA = MU / 3
+    BETA = SIGMA / 2
+    TAU = SIGMA / 100
+    DRAW_PROBABILITY = 0.10
+
+    def __init__(self, mu=MU, sigma=SIGMA, beta=BETA, tau=TAU, draw_probability=DRAW_PROBABILITY):
+        self.mu = mu
+        self.sigma = sigma
+        self.beta = beta
+        self.tau = tau
+        self.draw_probability = draw_probability
+        # draw margin of two teams with one player each
+        self.draw_margin = ppf((draw_probability + 1) / 2.0) * math.sqrt(2) * beta
+
+    def create_rating(self, mu=None, sigma=None):
+        """
+        Returns (mu, sigma) using the environment's defaults for missing values
+        """
+        return (
+            self.mu if mu is None else mu,
+            self.sigma if sigma is None else sigma
+        )
+
+    def expose(self, mu, sigma):
+        """
+        Conservative rating estimate (mu - 3 * sigma with the default constants)
+        """
+        return mu - (self.mu / self.sigma) * sigma
+
+    def rate_1vs1(self, mu1, sigma1, mu2, sigma2, drawn=False):
+        """
+        Returns the new (mu1, sigma1, mu2, sigma2) after player 1 won against player 2 (or they drew)
+        """
+        # ratings drift between comparisons
+        variance1 = sigma1 ** 2 + self.tau ** 2
+        variance2 = sigma2 ** 2 + self.tau ** 2
+
+        # performance difference of the two players
+        c_squared = variance1 + variance2 + 2 * self.beta ** 2
+        c = math.sqrt(c_squared)
+        t = (mu1 - mu2) / c
+        epsilon = self.draw_margin / c
+
+        if drawn:
+            (v, w) = (v_draw(t, epsilon), w_draw(t, epsilon))
+        else:
+            (v, w) = (v_win(t, epsilon), w_win(t, epsilon))
+
+        return (
+            mu1 + variance1 / c * v,
+            math.sqrt(variance1 * (1 - variance1 / c_squared * w)),
+            mu2 - variance2 / c * v,
+            math.sqrt(variance2 * (1 - variance2 / c_squared * w))
+        )
+
+def erfc(x):
+    """
+    Complementary error function (same approximation as the trueskill package)
+    """
+    z = abs(x)
+    t = 1. / (1. + z / 2.)
+    r = t * math.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (
+        0.37409196 + t * (0.09678418 + t * (-0.18628806 + t * (
+            0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+                -0.82215223 + t * 0.17087277
+            )))
+        )))
+    )))
+    return 2. - r if x < 0 else r
+
+def erfcinv(y):
+    """
+    Inverse of erfc (two Newton steps from an initial approximation)
+    """
+    if y >= 2:
+        return -100.
+    elif y <= 0:
+        return 100.
+    zero_point = y < 1
+    if not zero_point:
+        y = 2 - y
+    t = math.sqrt(-2 * math.log(y / 2.))
+    x = -0.70711 * \
+        ((2.30753 + t * 0.27061) / (1. + t * (0.99229 + t * 0.04481)) - t)
+    for _ in range(2):
+        err = erfc(x) - y
+        x += err / (1.12837916709551257 * math.exp(-(x ** 2)) - x * err)
+    return x if zero_point else -x
+
+def cdf(x):
+    """
+    Cumulative distribution function of the standard normal distribution
+    """
+    return 0.5 * erfc(-x / math.sqrt(2))
+
+def pdf(x):
+    """
+    Probability density function of the standard normal distribution
+    """
+    return 1 / math.sqrt(2 * math.pi) * math.exp(-(x ** 2 / 2))
+
+def ppf(x):
+    """
+    Inverse of cdf
+    """
+    return -math.sqrt(2) * erfcinv(2 * x)
+
+def v_win(diff, draw_margin):
+    x = diff - draw_margin
+    denom = cdf(x)
+    return (pdf(x) / denom) if denom else -x
+
+def w_win(diff, draw_margin):
+    x = diff - draw_margin
+    v = v_win(diff, draw_margin)
+    w = v * (v + x)
+    if 0 < w < 1:
+        return w
+    raise FloatingPointError('Cannot calculate the TrueSkill rating update correctly')
+
+def v_draw(diff, draw_margin):
+    abs_diff = abs(diff)
+    a, b = draw_margin - abs_diff, -draw_margin - abs_diff
+    denom = cdf(a) - cdf(b)
+    numer = pdf(b) - pdf(a)
+    return ((numer / denom) if denom else a) * (-1 if diff < 0 else +1)
+
+def w_draw(diff, draw_margin):
+    abs_diff = abs(diff)
+    a, b = draw_margin - abs_diff, -draw_margin - abs_diff
+    denom = cdf(a) - cdf(b)
+    if not denom:
+        raise FloatingPointError('Cannot calculate the TrueSkill rating update correctly')
+    v = v_draw(abs_diff, draw_margin)
+    return (v ** 2) + (a * pdf(a) - b * pdf(b)) / denom
@@ -1,5 +1,3 @@
-import trueskill
-
 from compair.algorithms.score.score_algorithm_base import ScoreAlgorithmBase
 from compair.algorithms.comparison_pair import ComparisonPair
 from compair.algorithms.comparison_winner import ComparisonWinner
@@ -7,7 +5,12 @@ from compair.algorithms.scored_object import ScoredObject
 
 from compair.algorithms.exceptions import InvalidWinnerException
 
+from .environment import TrueSkillEnvironment
+
 class TrueSkillAlgorithmWrapper(ScoreAlgorithmBase):
+    # shared by every calculation (environments are immutable)
+    environment = TrueSkillEnvironment()
+
     def __init__(self):
         ScoreAlgorithmBase.__init__(self)
 
@@ -15,10 +18,11 @@ class TrueSkillAlgorithmWrapper(ScoreAlgorithmBase):
         self.storage = {}
         # storage[key] = set() of opponent keys
         self.opponents = {}
-        # storage[key] = true skill rating object
+        # storage[key] = true skill rating (mu, sigma)
         self.ratings = {}
 
-    def calculate_score_1vs1(self, key1_scored_object, key2_scored_object, winner, other_comparison_pairs):
+    def calculate_score_1vs1(self, key1_scored_object, key2_scored_object, winner, other_comparison_pairs,
+            opponent_stats=None):
         """
         Calculates the scores for a new 1vs1 comparison without re-calculating all previous scores
         :param key1_scored_object: Contains score parameters for key1
@@ -26,52 +30,59 @@ class TrueSkillAlgorithmWrapper(ScoreAlgorithmBase):
         :param winner: indicates comparison winner
         :param other_comparison_pairs: Contains all previous comparison_pairs that the 2 keys took part in.
             This is a subset of all comparison pairs and is used to calculate round, wins, loses, and opponent counts
+        :param opponent_stats: If set, dictionary key -> dictionary opponent key -> OpponentStats of the previous
+            comparisons of the 2 keys. Round, wins, loses, and opponent counts are then counted up from the
+            scored objects and other_comparison_pairs is not used
         :return: tuple of ScoredObject (key1, key2)
         """
         self.storage = {}
         self.opponents = {}
         self.ratings = {}
-        trueskill.setup()
 
         key1 = key1_scored_object.key
         key2 = key2_scored_object.key
 
-        # Note: if value are None, trueskill.Rating will use default mu 25 and sigma 8.333
-        r1 = trueskill.Rating(
-            mu=key1_scored_object.variable1,
-            sigma=key1_scored_object.variable2
-        )
-
-        r2 = trueskill.Rating(
-            mu=key2_scored_object.variable1,
-            sigma=key2_scored_object.variable2
-        )
+        # Note: if value are None, the environment's default mu 25 and sigma 8.333 are used
+        (mu1, sigma1) = self.environment.create_rating(
+            key1_scored_object.variable1, key1_scored_object.variable2)
+        (mu2, sigma2) = self.environment.create_rating(
+            key2_scored_object.variable1, key2_scored_object.variable2)
 
         if winner == ComparisonWinner.key1:
-            r1, r2 = trueskill.rate_1vs1(r1, r2)
+            (mu1, sigma1, mu2, sigma2) = self.environment.rate_1vs1(mu1, sigma1, mu2, sigma2)
         elif winner == ComparisonWinner.key2:
-            r2, r1 = trueskill.rate_1vs1(r2, r1)
+            (mu2, sigma2, mu1, sigma1) = self.environment.rate_1vs1(mu2, sigma2, mu1, sigma1)
         elif winner == ComparisonWinner.draw:
-            r1, r2 = trueskill.rate_1vs1(r1, r2, drawn=True)
+            (mu1, sigma1, mu2, sigma2) = self.environment.rate_1vs1(mu1, sigma1, mu2, sigma2, drawn=True)
         else:
             raise InvalidWinnerException
 
-        self.ratings[key1] = r1
-        self.ratings[key2] = r2
+        self.ratings[key1] = (mu1, sigma1)
+        self.ratings[key2] = (mu2, sigma2)
 
         for key in [key1, key2]:
+            (mu, sigma) = self.ratings[key]
             self.opponents[key] = set()
             self.storage[key] = ScoredObject(
                 key=key,
-                score=trueskill.expose(self.ratings[key]),
-                variable1=self.ratings[key].mu,
-                variable2=self.ratings[key].sigma,
+                score=self.environment.expose(mu, sigma),
+                variable1=mu,
+                variable2=sigma,
                 rounds=0,
                 opponents=0,
                 wins=0,
                 loses=0
             )
 
+        if opponent_stats != None:
+            key1_winner = winner == ComparisonWinner.key1
+            key2_winner = winner == ComparisonWinner.key2
+            self.storage[key1] = self._add_comparison_counts(self.storage[key1], key1_scored_object,
+                key2, opponent_stats, key1_winner, key2_winner)
+            self.storage[key2] = self._add_comparison_counts(self.storage[key2], key2_scored_object,
+                key1, opponent_stats, key2_winner, key1_winner)
+            return (self.storage[key1], self.storage[key2])
+
         # calculate opponents, wins, loses, rounds for every match for key1 and key2
         for comparison_pair in (other_comparison_pairs + [ComparisonPair(key1, key2, winner)]):
             cp_key1 = comparison_pair.key1
@@ -102,26 +113,14 @@ class TrueSkillAlgorithmWrapper(ScoreAlgorithmBase):
         """
         self.storage = {}
         self.opponents = {}
-        self.ratings = {}
-        trueskill.setup()
 
+        # ratings and counts are kept as plain values and only turned into ScoredObjects at the end
         keys = self.get_keys_from_comparison_pairs(comparison_pairs)
-        # create default ratings for every available key
-        for key in keys:
-            rating = trueskill.Rating()
-            self.ratings[key] = rating
-            self.opponents[key] = set()
-
-            self.storage[key] = ScoredObject(
-                key=key,
-                score=trueskill.expose(rating),
-                variable1=rating.mu,
-                variable2=rating.sigma,
-                rounds=0,
-                opponents=0,
-                wins=0,
-                loses=0
-            )
+        self.ratings = dict((key, self.environment.create_rating()) for key in keys)
+        rounds = dict.fromkeys(keys, 0)
+        wins = dict.fromkeys(keys, 0)
+        loses = dict.fromkeys(keys, 0)
+        self.opponents = dict((key, set()) for key in keys)
 
         # calculate rating by for every match
         for comparison_pair in comparison_pairs:
@@ -129,29 +128,46 @@ class TrueSkillAlgorithmWrapper(ScoreAlgorithmBase):
             key2 = comparison_pair.key2
             winner = comparison_pair.winner
 
+            rounds[key1] += 1
+            rounds[key2] += 1
+
             # skip incomplete comparisosns
             if winner is None:
-                self._update_rounds_only(key1)
-                self._update_rounds_only(key2)
                 continue
 
-            r1 = self.ratings[key1]
-            r2 = self.ratings[key2]
-
-            key1_winner = winner == ComparisonWinner.key1
-            key2_winner = winner == ComparisonWinner.key2
-
-            if key1_winner:
-                r1, r2 = trueskill.rate_1vs1(r1, r2)
-            elif key2_winner:
-                r2, r1 = trueskill.rate_1vs1(r2, r1)
+            (mu1, sigma1) = self.ratings[key1]
+            (mu2, sigma2) = self.ratings[key2]
+
+            if winner == ComparisonWinner.key1:
+                (mu1, sigma1, mu2, sigma2) = self.environment.rate_1vs1(mu1, sigma1, mu2, sigma2)
+                wins[key1] += 1
+                loses[key2] += 1
+            elif winner == ComparisonWinner.key2:
+                (mu2, sigma2, mu1, sigma1) = self.environment.rate_1vs1(mu2, sigma2, mu1, sigma1)
+                wins[key2] += 1
+                loses[key1] += 1
             elif winner == ComparisonWinner.draw:
-                r1, r2 = trueskill.rate_1vs1(r1, r2, drawn=True)
+                (mu1, sigma1, mu2, sigma2) = self.environment.rate_1vs1(mu1, sigma1, mu2, sigma2, drawn=True)
             else:
                 raise InvalidWinnerException
 
-            self._update_rating(key1, r1, key2, key1_winner, key2_winner)
-            self._update_rating(key2, r2, key1, key2_winner, key1_winner)
+            self.ratings[key1] = (mu1, sigma1)
+            self.ratings[key2] = (mu2, sigma2)
+            self.opponents[key1].add(key2)
+            self.opponents[key2].add(key1)
+
+        for key in keys:
+            (mu, sigma) = self.ratings[key]
+            self.storage[key] = ScoredObject(
+                key=key,
+                score=self.environment.expose(mu, sigma),
+                variable1=mu,
+                variable2=sigma,
+                rounds=rounds[key],
+                opponents=len(self.opponents[key]),
+                wins=wins[key],
+                loses=loses[key]
+            )
 
         # return comparison results
         return self.storage
@@ -169,29 +185,10 @@ class TrueSkillAlgorithmWrapper(ScoreAlgorithmBase):
         self.storage[key] = ScoredObject(
             key=key,
             score=self.storage[key].score,
-            variable1=self.ratings[key].mu,
-            variable2=self.ratings[key].sigma,
-            rounds=self.storage[key].rounds+1,
-            opponents=len(self.opponents[key]),
-            wins=wins+1 if did_win else wins,
-            loses=loses+1 if did_lose else loses,
-        )
-
-    def _update_rating(self, key, new_rating, opponent_key, did_win, did_lose):
-        self.ratings[key] = new_rating
-        self.opponents[key].add(opponent_key)
-        wins = self.storage[key].wins
-        loses = self.storage[key].loses
-
-        # winner == None should not increase total wins or loses
-        self.storage[key] = ScoredObject(
-            key=key,
-            score=trueskill.expose(new_rating),
-            variable1=new_rating.mu,
-            variable2=new_rating.sigma,
+            variable1=self.ratings[key][0],
+            variable2=self.ratings[key][1],
             rounds=self.storage[key].rounds+1,
             opponents=len(self.opponents[key]),
             wins=wins+1 if did_win else wins,
             loses=loses+1 if did_lose else loses,
         )
-
@@ -0,0 +1,275 @@
+"""
+Simulation of students comparing answers with known actual grades.
+
+Every repetition draws the actual grades of the answers, lets students compare pairs generated
+by a pairing package (the judge decides the winners) and scores every comparison with a scoring
+package the same way ComPAIR does (incremental 1vs1 updates with opponent stats). After every
+round the correlations between the actual grades and the current scores are recorded.
+
+The judge's random draws for a whole repetition are generated at once. Its decisions are
+vectorized but still made one comparison at a time since every pair depends on the scores of
+the previous comparisons.
+Repetitions are independent and run in a process pool.
+"""
+import math
+import os
+import random
+from enum import Enum
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from .comparison_winner import ComparisonWinner
+from .exceptions import UserComparedAllObjectsException
+from .opponent_stats import add_opponent_result
+from .scored_object import ScoredObject
+from .pair import generate_pair
+from .score import calculate_score_1vs1
+
+REPETITIONS = 100
+NUMBER_OF_ANSWERS = 100
+NUMBER_OF_STUDENTS = 100
+COMPARISONS_PER_STUDENT = 10
+GRADE_MEAN = 0.78
+GRADE_STANDARD_DEVIATION = 0.1
+
+# correlations between the actual grades and the scores after every round
+CORRELATION_DTYPE = numpy.dtype([('pearson', 'f8'), ('spearman', 'f8'), ('kendall', 'f8')])
+
+class JudgeModel(Enum):
+    always_correct = "always_correct"
+    correct_with_error = "correct_with_error"
+    guessing = "guessing"
+    closely_matched_errors = "closely_matched_errors"
+
+class Judge(object):
+    """
+    Decides comparison winners from the actual grades of the answers
+
+    - always_correct: the answer with the highest grade wins
+    - correct_with_error: the answer with the highest grade wins with probability parameter
+    - guessing: either answer wins with the same probability
+    - closely_matched_errors: the answer with the highest perceived grade wins. Perceived grades
+      are the actual grades with normally distributed errors (standard deviation parameter)
+      so answers with close grades are more likely to be judged incorrectly
+
+    Ties are guessed.
+    """
+    def __init__(self, model, parameter=None):
+        self.model = model
+        self.parameter = parameter
+
+    def __repr__(self):
+        return "Judge({}, {})".format(self.model.value, self.parameter)
+
+    def draw(self, size, random_state):
+        """
+        Returns the random draws needed to decide size comparisons as a (size, 4) array
+        (perception error of key1 and key2, uniform value for errors, uniform value for guesses)
+        """
+        draws = numpy.empty((size, 4))
+        if self.model == JudgeModel.closely_matched_errors:
+            draws[:, 0:2] = random_state.normal(0.0, self.parameter, (size, 2))
+        else:
+            draws[:, 0:2] = 0.0
+        draws[:, 2:4] = random_state.random((size, 2))
+        return draws
+
+    def decide(self, grades1, grades2, draws):
+        """
+        Returns whether key1 wins for every comparison (arrays of grades and the rows of draw)
+        """
+        grades1 = numpy.asarray(grades1, dtype='f8')
+        grades2 = numpy.asarray(grades2, dtype='f8')
+        draws = numpy.asarray(draws, dtype='f8')
+
+        guesses = draws[..., 3] < 0.5
+        if self.model == JudgeModel.guessing:
+            return guesses
+
+        perceived1 = grades1 + draws[..., 0]
+        perceived2 = grades2 + draws[..., 1]
+        key1_wins = numpy.where(perceived1 == perceived2, guesses, perceived1 > perceived2)
+
+        if self.model == JudgeModel.correct_with_error:
+            # answers judged incorrectly swap the winner
+            key1_wins = key1_wins != (draws[..., 2] > self.parameter)
+        return key1_wins
+
+def pearson(values1, values2):
+    """
+    Pearson correlation coefficient (NaN if either set of values is constant)
+    """
+    values1 = numpy.asarray(values1, dtype='f8') - numpy.mean(values1)
+    values2 = numpy.asarray(values2, dtype='f8') - numpy.mean(values2)
+    denominator = math.sqrt(numpy.dot(values1, values1) * numpy.dot(values2, values2))
+    return float(numpy.dot(values1, values2) / denominator) if denominator > 0 else float('nan')
+
+def rank(values):
+    """
+    Ranks starting at 1 (tied values get the average of their ranks)
+    """
+    (unique_values, inverse, counts) = numpy.unique(values, return_inverse=True, return_counts=True)
+    # average of the positions spanned by each distinct value
+    upper = numpy.cumsum(counts)
+    return ((upper - counts + 1 + upper) / 2.0)[inverse]
+
+def spearman(values1, values2):
+    """
+    Spearman rank correlation coefficient (NaN if either set of values is constant)
+    """
+    return pearson(rank(values1), rank(values2))
+
+def kendall(values1, values2):
+    """
+    Kendall tau-b rank correlation coefficient (NaN if either set of values is constant)
+    """
+    values1 = numpy.asarray(values1, dtype='f8')
+    values2 = numpy.asarray(values2, dtype='f8')
+    (rows, columns) = numpy.triu_indices(len(values1), k=1)
+    signs1 = numpy.sign(values1[rows] - values1[columns])
+    signs2 = numpy.sign(values2[rows] - values2[columns])
+    # number of pairs that are not tied in each set of values
+    denominator = math.sqrt(numpy.count_nonzero(signs1) * numpy.count_nonzero(signs2))
+    return float(numpy.dot(signs1, signs2) / denominator) if denominator > 0 else float('nan')
+
+def number_of_rounds(comparisons_per_student=COMPARISONS_PER_STUDENT):
+    return comparisons_per_student * 2
+
+def run_repetition(pairing_package_name, scoring_package_name, judge, grades,
+        number_of_students=NUMBER_OF_STUDENTS, comparisons_per_student=COMPARISONS_PER_STUDENT, seed=None,
+        reference_grades=None):
+    """
+    Simulates the students comparing answers with the given actual grades.
+    Rounds are half as many comparisons as there are answers.
+    Scores are correlated with reference_grades if set (grades otherwise)
+    Returns (array of CORRELATION_DTYPE for every round, array of the final scores)
+    """
+    random_state = numpy.random.default_rng(seed)
+    # pairing packages use the random module
+    random.seed(int(random_state.integers(2 ** 32)))
+
+    grades = numpy.asarray(grades, dtype='f8')
+    reference_grades = grades if reference_grades is None else numpy.asarray(reference_grades, dtype='f8')
+    number_of_answers = len(grades)
+    rounds = number_of_rounds(comparisons_per_student)
+    round_length = max(number_of_answers // 2, 1)
+
+    # answer keys start at 1 and are the index of the answer + 1
+    answers = [
+        ScoredObject(key=index + 1, score=0, variable1=None, variable2=None,
+            rounds=0, opponents=0, wins=0, loses=0)
+        for index in range(number_of_answers)
+    ]
+    opponent_stats = dict((answer.key, {}) for answer in answers)
+
+    students = [(key, []) for key in range(number_of_students)]
+    draws = judge.draw(number_of_students * comparisons_per_student, random_state).tolist()
+    student_choices = random_state.random(number_of_students * comparisons_per_student).tolist()
+    comparison_count = 0
+
+    correlations = numpy.full(rounds, numpy.nan, dtype=CORRELATION_DTYPE)
+    scores = numpy.zeros(number_of_answers, dtype='f8')
+    for round_index in range(rounds):
+        for _ in range(round_length):
+            if len(students) == 0:
+                break
+
+            student_index = int(student_choices[comparison_count] * len(students))
+            (student_key, student_comparisons) = students[student_index]
+
+            try:
+                comparison_pair = generate_pair(
+                    package_name=pairing_package_name,
+                    scored_objects=answers,
+                    comparison_pairs=student_comparisons
+                )
+            except UserComparedAllObjectsException:
+                del students[student_index]
+                continue
+
+            (key1, key2) = (comparison_pair.key1, comparison_pair.key2)
+            key1_wins = bool(judge.decide(grades[key1 - 1], grades[key2 - 1], draws[comparison_count]))
+            winner = ComparisonWinner.key1 if key1_wins else ComparisonWinner.key2
+            comparison_pair = comparison_pair._replace(winner=winner)
+            comparison_count += 1
+
+            student_comparisons.append(comparison_pair)
+            if len(student_comparisons) >= comparisons_per_student:
+                del students[student_index]
+
+            (result1, result2) = calculate_score_1vs1(
+                package_name=scoring_package_name,
+                key1_scored_object=answers[key1 - 1],
+                key2_scored_object=answers[key2 - 1],
+                winner=winner,
+                other_comparison_pairs=[],
+                opponent_stats={key1: opponent_stats[key1], key2: opponent_stats[key2]}
+            )
+            answers[key1 - 1] = result1
+            answers[key2 - 1] = result2
+            add_opponent_result(opponent_stats[key1], key2, key1_wins, not key1_wins)
+            add_opponent_result(opponent_stats[key2], key1, not key1_wins, key1_wins)
+
+        scores = numpy.array([answer.score for answer in answers], dtype='f8')
+        correlations[round_index] = (pearson(reference_grades, scores), spearman(reference_grades, scores),
+            kendall(reference_grades, scores))
+
+    return (correlations, scores)
+
+def _run_repetition(arguments):
+    (pairing_package_name, scoring_package_name, judge, number_of_answers, number_of_students,
+        comparisons_per_student, seed_sequence) = arguments
+    random_state = numpy.random.default_rng(seed_sequence)
+    grades = random_state.normal(GRADE_MEAN, GRADE_STANDARD_DEVIATION, number_of_answers)
+    (correlations, _) = run_repetition(pairing_package_name, scoring_package_name, judge, grades,
+        number_of_students, comparisons_per_student, seed=random_state.integers(2 ** 32))
+    return correlations
+
+def simulate(pairing_package_name, scoring_package_name, judge, repetitions=REPETITIONS,
+        number_of_answers=NUMBER_OF_ANSWERS, number_of_students=NUMBER_OF_STUDENTS,
+        comparisons_per_student=COMPARISONS_PER_STUDENT, processes=None, seed=None):
+    """
+    Runs independent repetitions with normally distributed actual grades (in parallel processes).
+    Results only depend on the seed (not on the number of processes).
+    Returns a (repetitions, rounds) array of CORRELATION_DTYPE
+    """
+    arguments = [
+        (pairing_package_name, scoring_package_name, judge, number_of_answers, number_of_students,
+            comparisons_per_student, seed_sequence)
+        for seed_sequence in numpy.random.SeedSequence(seed).spawn(repetitions)
+    ]
+
+    processes = min(processes or os.cpu_count() or 1, repetitions)
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_run_repetition, arguments))
+    else:
+        results = [_run_repetition(argument) for argument in arguments]
+
+    if len(results) == 0:
+        return numpy.empty((0, number_of_rounds(comparisons_per_student)), dtype=CORRELATION_DTYPE)
+    return numpy.stack(results)
+
+def summarize(results, round_index=-1):
+    """
+    Summarizes the correlations of a round (the last one by default) over all repetitions
+    Returns a dictionary correlation -> dictionary of statistics (repetitions with a NaN correlation are ignored)
+    """
+    summary = {}
+    for field in CORRELATION_DTYPE.names:
+        values = results[field][:, round_index]
+        values = values[~numpy.isnan(values)]
+        if len(values) == 0:
+            summary[field] = None
+            continue
+        summary[field] = {
+            'mean': float(numpy.mean(values)),
+            'std': float(numpy.std(values)),
+            'min': float(numpy.min(values)),
+            'p5': float(numpy.percentile(values, 5)),
+            'median': float(numpy.median(values)),
+            'p95': float(numpy.percentile(values, 95)),
+            'max': float(numpy.max(values))
+        }
+    return summary
@@ -360,7 +360,7 @@ def log_events(log):
 
     # answer events
     from .answer import on_answer_modified, on_answer_get, on_answer_list_get, on_answer_create, \
-        on_set_top_answer, on_answer_delete, on_user_answer_get
+        on_set_top_answer, on_answer_delete, on_user_answer_get, on_answer_score_history_get
     on_answer_modified.connect(log)
     on_answer_get.connect(log)
     on_answer_list_get.connect(log)
@@ -368,6 +368,7 @@ def log_events(log):
     on_set_top_answer.connect(log)
     on_answer_delete.connect(log)
     on_user_answer_get.connect(log)
+    on_answer_score_history_get.connect(log)
 
     # answer comment events
     from .answer_comment import on_answer_comment_modified, on_answer_comment_get, on_answer_comment_list_get, \
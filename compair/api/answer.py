@@ -14,8 +14,8 @@ from . import dataformat
 from compair.core import db, event, abort
 from compair.authorization import require, allow, is_user_access_restricted
 from compair.models import Answer, Assignment, Course, User, Comparison, Criterion, \
-    AnswerScore, UserCourse, SystemRole, CourseRole, AnswerComment, AnswerCommentType, \
-    File, Group
+    AnswerScore, AnswerScoreHistory, UserCourse, SystemRole, CourseRole, AnswerComment, AnswerCommentType, \
+    File, Group, GradeUpdateQueue
 
 from .util import new_restful_api, get_model_changes, pagination_parser
 
@@ -52,6 +52,9 @@ top_answer_parser.add_argument(
     help="Expected boolean value 'top_answer' is missing."
 )
 
+score_history_parser = RequestParser()
+score_history_parser.add_argument('comparisons', type=int, required=False, default=None)
+
 
 # events
 on_answer_modified = event.signal('ANSWER_MODIFIED')
@@ -61,6 +64,7 @@ on_answer_create = event.signal('ANSWER_CREATE')
 on_answer_delete = event.signal('ANSWER_DELETE')
 on_set_top_answer = event.signal('SET_TOP_ANSWER')
 on_user_answer_get = event.signal('USER_ANSWER_GET')
+on_answer_score_history_get = event.signal('ANSWER_SCORE_HISTORY_GET')
 
 from compair.api.file import on_attach_file, on_detach_file
 
@@ -336,9 +340,13 @@ class AnswerRootAPI(Resource):
 
         # update course & assignment grade for user if answer is fully submitted
         if not answer.draft:
-            if answer.user:
+            if GradeUpdateQueue.enabled():
+                if answer.user:
+                    GradeUpdateQueue.push(course.id, assignment.id, [answer.user_id])
+                elif answer.group:
+                    GradeUpdateQueue.push_group(course.id, assignment.id, answer.group)
+            elif answer.user:
                 assignment.calculate_grade(answer.user)
-                course.calculate_grade(answer.user)
             elif answer.group:
                 assignment.calculate_group_grade(answer.group)
                 course.calculate_group_grade(answer.group)
@@ -536,9 +544,13 @@ class AnswerIdAPI(Resource):
 
         # update course & assignment grade for user if answer is fully submitted
         if not answer.draft:
-            if answer.user:
+            if GradeUpdateQueue.enabled():
+                if answer.user:
+                    GradeUpdateQueue.push(course.id, assignment.id, [answer.user_id])
+                elif answer.group:
+                    GradeUpdateQueue.push_group(course.id, assignment.id, answer.group)
+            elif answer.user:
                 assignment.calculate_grade(answer.user)
-                course.calculate_grade(answer.user)
             elif answer.group:
                 assignment.calculate_group_grade(answer.group)
                 course.calculate_group_grade(answer.group)
@@ -564,9 +576,13 @@ class AnswerIdAPI(Resource):
 
         # update course & assignment grade for user if answer was fully submitted
         if not answer.draft:
-            if answer.user:
+            if GradeUpdateQueue.enabled():
+                if answer.user:
+                    GradeUpdateQueue.push(course.id, assignment.id, [answer.user_id])
+                elif answer.group:
+                    GradeUpdateQueue.push_group(course.id, assignment.id, answer.group)
+            elif answer.user:
                 assignment.calculate_grade(answer.user)
-                course.calculate_grade(answer.user)
             elif answer.group:
                 assignment.calculate_group_grade(answer.group)
                 course.calculate_group_grade(answer.group)
@@ -679,4 +695,58 @@ class TopAnswerAPI(Resource):
 
         return marshal(answer, dataformat.get_answer(restrict_user=False))
 
-api.add_resource(TopAnswerAPI, '/<answer_uuid>/top')
\ No newline at end of file
+api.add_resource(TopAnswerAPI, '/<answer_uuid>/top')
+
+# /scores/history
+class AnswerScoreHistoryAPI(Resource):
+    @login_required
+    def get(self, course_uuid, assignment_uuid):
+        """
+        Get the ranking of the answers as of a number of completed comparisons
+
+        :param course_uuid:
+        :param assignment_uuid:
+        :return: ranked answer scores
+        """
+        course = Course.get_active_by_uuid_or_404(course_uuid)
+        assignment = Assignment.get_active_by_uuid_or_404(assignment_uuid)
+
+        require(MANAGE, assignment,
+            title="Score History Unavailable",
+            message="Sorry, your role in this course does not allow you to view the score history for this assignment.")
+
+        params = score_history_parser.parse_args()
+        comparison_count = params.get('comparisons')
+        if comparison_count != None and comparison_count < 0:
+            abort(400, title="Score History Unavailable",
+                message="The number of comparisons cannot be negative.")
+
+        latest_comparison_count = AnswerScoreHistory.get_comparison_count(assignment.id)
+        ranking = AnswerScoreHistory.get_ranking(assignment.id, comparison_count)
+
+        answer_uuids = {}
+        if len(ranking) > 0:
+            answer_uuids = dict(Answer.query \
+                .with_entities(Answer.id, Answer.uuid) \
+                .filter(Answer.id.in_([answer_id for (answer_id, score, rounds, rank) in ranking])) \
+                .all())
+
+        on_answer_score_history_get.send(
+            self,
+            event_name=on_answer_score_history_get.name,
+            user=current_user,
+            course_id=course.id,
+            data={'assignment_id': assignment.id, 'comparisons': comparison_count})
+
+        return {
+            'comparisons': comparison_count if comparison_count != None else latest_comparison_count,
+            'latest_comparisons': latest_comparison_count,
+            'objects': [{
+                'answer_id': answer_uuids.get(answer_id),
+                'score': score,
+                'rounds': rounds,
+                'rank': rank
+            } for (answer_id, score, rounds, rank) in ranking]
+        }
+
+api.add_resource(AnswerScoreHistoryAPI, '/scores/history')
@@ -9,7 +9,7 @@ from . import dataformat
 from compair.core import db, event, abort
 from compair.authorization import require, allow
 from compair.models import User, Answer, Assignment, Course, AnswerComment, \
-    CourseRole, SystemRole, AnswerCommentType
+    CourseRole, SystemRole, AnswerCommentType, GradeUpdateQueue
 from .util import new_restful_api, get_model_changes, pagination_parser
 
 answer_comment_api = Blueprint('answer_comment_api', __name__)
@@ -235,8 +235,10 @@ class AnswerCommentListAPI(Resource):
 
         # update course & assignment grade for user if self-evaluation is completed
         if not answer_comment.draft and answer_comment.comment_type == AnswerCommentType.self_evaluation:
-            assignment.calculate_grade(answer_comment.user)
-            course.calculate_grade(answer_comment.user)
+            if GradeUpdateQueue.enabled():
+                GradeUpdateQueue.push(course.id, assignment.id, [answer_comment.user_id])
+            else:
+                assignment.calculate_grade(answer_comment.user)
 
         on_answer_comment_create.send(
             self,
@@ -364,8 +366,10 @@ class AnswerCommentAPI(Resource):
 
         # update course & assignment grade for user if self-evaluation is completed
         if not answer_comment.draft and answer_comment.comment_type == AnswerCommentType.self_evaluation:
-            assignment.calculate_grade(answer_comment.user)
-            course.calculate_grade(answer_comment.user)
+            if GradeUpdateQueue.enabled():
+                GradeUpdateQueue.push(course.id, assignment.id, [answer_comment.user_id])
+            else:
+                assignment.calculate_grade(answer_comment.user)
 
         return marshal(answer_comment, dataformat.get_answer_comment(restrict_user))
 
@@ -387,8 +391,10 @@ class AnswerCommentAPI(Resource):
 
         # update course & assignment grade for user if self-evaluation is completed
         if not answer_comment.draft and answer_comment.comment_type == AnswerCommentType.self_evaluation:
-            assignment.calculate_grade(answer_comment.user)
-            course.calculate_grade(answer_comment.user)
+            if GradeUpdateQueue.enabled():
+                GradeUpdateQueue.push(course.id, assignment.id, [answer_comment.user_id])
+            else:
+                assignment.calculate_grade(answer_comment.user)
 
         on_answer_comment_delete.send(
             self,
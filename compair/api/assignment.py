@@ -15,7 +15,7 @@ from compair.core import db, event, abort
 from compair.authorization import allow, require, is_user_access_restricted
 from compair.models import Assignment, Course, Criterion, AssignmentCriterion, Answer, Comparison, \
     AnswerComment, AnswerCommentType, PairingAlgorithm, Criterion, File, User, UserCourse, \
-    CourseRole, Group
+    CourseRole, Group, ScoringAlgorithm
 from .util import new_restful_api, get_model_changes, pagination_parser
 
 assignment_api = Blueprint('assignment_api', __name__)
@@ -44,6 +44,7 @@ new_assignment_parser.add_argument('number_of_comparisons', type=int, required=T
 new_assignment_parser.add_argument('enable_self_evaluation', type=bool, default=False)
 new_assignment_parser.add_argument('enable_group_answers', type=bool, default=False)
 new_assignment_parser.add_argument('pairing_algorithm', default=None)
+new_assignment_parser.add_argument('scoring_algorithm', default=None)
 new_assignment_parser.add_argument('rank_display_limit', type=int, default=None)
 new_assignment_parser.add_argument('educators_can_compare', type=bool, default=False)
 # has to add location parameter, otherwise MultiDict will screw up the list
@@ -51,6 +52,7 @@ new_assignment_parser.add_argument('criteria', type=list, default=[], location='
 new_assignment_parser.add_argument('answer_grade_weight', type=int, default=1)
 new_assignment_parser.add_argument('comparison_grade_weight', type=int, default=1)
 new_assignment_parser.add_argument('self_evaluation_grade_weight', type=int, default=1)
+new_assignment_parser.add_argument('course_grade_weight', type=int, default=1)
 
 existing_assignment_parser = new_assignment_parser.copy()
 existing_assignment_parser.add_argument('id', required=True, nullable=False, help="Assignment id is required.")
@@ -76,11 +78,38 @@ def check_valid_pairing_algorithm(pairing_algorithm):
     pairing_algorithms = [
         PairingAlgorithm.adaptive.value,
         PairingAlgorithm.random.value,
-        PairingAlgorithm.adaptive_min_delta.value
+        PairingAlgorithm.adaptive_min_delta.value,
+        PairingAlgorithm.adaptive_matching.value,
+        PairingAlgorithm.adaptive_uncertainty.value
     ]
     if pairing_algorithm not in pairing_algorithms:
         abort(400, title="Assignment Not Saved", message="'"+pairing_algorithm+"' is not a valid answer pairing algorithm. Please select one of the pairing algorithm options listed.")
 
+# pairing algorithms that can only be used with one scoring algorithm
+PAIRING_SCORING_ALGORITHMS = {
+    # uncertainty pairing uses the TrueSkill ratings (mu & sigma) of answers
+    PairingAlgorithm.adaptive_uncertainty: ScoringAlgorithm.true_skill
+}
+
+def set_scoring_algorithm(assignment, scoring_algorithm):
+    """
+    Sets the requested scoring algorithm (if any) or the one the pairing algorithm requires.
+    Requesting a scoring algorithm the pairing algorithm can't use is rejected
+    """
+    if scoring_algorithm != None:
+        scoring_algorithms = [algorithm.value for algorithm in ScoringAlgorithm]
+        if scoring_algorithm not in scoring_algorithms:
+            abort(400, title="Assignment Not Saved", message="'"+scoring_algorithm+"' is not a valid answer scoring algorithm. Please select one of the scoring algorithm options listed.")
+        scoring_algorithm = ScoringAlgorithm(scoring_algorithm)
+
+    required_scoring_algorithm = PAIRING_SCORING_ALGORITHMS.get(assignment.pairing_algorithm)
+    if required_scoring_algorithm != None:
+        if scoring_algorithm != None and scoring_algorithm != required_scoring_algorithm:
+            abort(400, title="Assignment Not Saved", message="The '"+assignment.pairing_algorithm.value+"' answer pairing algorithm can only be used with the '"+required_scoring_algorithm.value+"' scoring algorithm. Please select that scoring algorithm or another pairing algorithm.")
+        assignment.scoring_algorithm = required_scoring_algorithm
+    elif scoring_algorithm != None:
+        assignment.scoring_algorithm = scoring_algorithm
+
 # /id
 class AssignmentIdAPI(Resource):
     @login_required
@@ -194,14 +223,22 @@ class AssignmentIdAPI(Resource):
             'comparison_grade_weight', assignment.comparison_grade_weight)
         assignment.self_evaluation_grade_weight = params.get(
             'self_evaluation_grade_weight', assignment.self_evaluation_grade_weight)
+        assignment.course_grade_weight = params.get(
+            'course_grade_weight', assignment.course_grade_weight)
 
         pairing_algorithm = params.get("pairing_algorithm")
         check_valid_pairing_algorithm(pairing_algorithm)
+        scoring_algorithm = params.get("scoring_algorithm")
         if not assignment.compared:
             assignment.pairing_algorithm = PairingAlgorithm(pairing_algorithm)
+            set_scoring_algorithm(assignment, scoring_algorithm)
         elif assignment.pairing_algorithm != PairingAlgorithm(pairing_algorithm):
             abort(400, title="Assignment Not Saved",
                 message='The answer pair selection algorithm cannot be changed for this assignment because it has already been used in one or more comparisons.')
+        elif scoring_algorithm != None and assignment.scoring_algorithm != None and \
+                assignment.scoring_algorithm.value != scoring_algorithm:
+            abort(400, title="Assignment Not Saved",
+                message='The answer scoring algorithm cannot be changed for this assignment because it has already been used in one or more comparisons.')
 
         assignment.educators_can_compare = params.get("educators_can_compare")
 
@@ -302,6 +339,8 @@ class AssignmentIdAPI(Resource):
                 model_changes.get('enable_group_answers')):
             assignment.calculate_grades()
             course.calculate_grades()
+        elif model_changes and model_changes.get('course_grade_weight'):
+            course.calculate_grades()
 
         return marshal(assignment, dataformat.get_assignment())
 
@@ -447,10 +486,12 @@ class AssignmentRootAPI(Resource):
         new_assignment.answer_grade_weight = params.get('answer_grade_weight')
         new_assignment.comparison_grade_weight = params.get('comparison_grade_weight')
         new_assignment.self_evaluation_grade_weight = params.get('self_evaluation_grade_weight')
+        new_assignment.course_grade_weight = params.get('course_grade_weight')
 
         pairing_algorithm = params.get("pairing_algorithm", PairingAlgorithm.random)
         check_valid_pairing_algorithm(pairing_algorithm)
         new_assignment.pairing_algorithm = PairingAlgorithm(pairing_algorithm)
+        set_scoring_algorithm(new_assignment, params.get("scoring_algorithm"))
 
         criterion_uuids = [c.get('id') for c in params.criteria]
         criterion_data = {c.get('id'): c.get('weight', 1) for c in params.criteria}
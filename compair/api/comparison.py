@@ -16,7 +16,7 @@ from compair.core import db, event, abort
 from compair.authorization import require, allow
 from compair.models import Answer, Comparison, Course, WinningAnswer, \
     Assignment, UserCourse, CourseRole, AssignmentCriterion, \
-    AnswerComment, AnswerCommentType
+    AnswerComment, AnswerCommentType, ScoreUpdateQueue, GradeUpdateQueue
 from .util import new_restful_api
 
 from compair.algorithms import InsufficientObjectsForPairException, \
@@ -254,14 +254,20 @@ class CompareRootAPI(Resource):
 
         # update answer scores
         if completed and not is_comparison_example:
-            current_app.logger.debug("Doing scoring")
-            Comparison.update_scores_1vs1(comparison)
+            if ScoreUpdateQueue.enabled():
+                # scored in the background so the comparison is returned right away
+                ScoreUpdateQueue.push(assignment.id, comparison.id)
+            else:
+                current_app.logger.debug("Doing scoring")
+                Comparison.update_scores_1vs1(comparison)
             #Comparison.calculate_scores(assignment.id)
 
         # update course & assignment grade for user if comparison is completed
         if completed:
-            assignment.calculate_grade(current_user)
-            course.calculate_grade(current_user)
+            if GradeUpdateQueue.enabled():
+                GradeUpdateQueue.push(course.id, assignment.id, [current_user.id])
+            else:
+                assignment.calculate_grade(current_user)
 
         on_comparison_update.send(
             self,
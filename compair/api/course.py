@@ -326,6 +326,7 @@ class CourseDuplicateAPI(Resource):
                 answer_grade_weight=assignment.answer_grade_weight,
                 comparison_grade_weight=assignment.comparison_grade_weight,
                 self_evaluation_grade_weight=assignment.self_evaluation_grade_weight,
+                course_grade_weight=assignment.course_grade_weight,
 
                 number_of_comparisons=assignment.number_of_comparisons,
                 students_can_reply=assignment.students_can_reply,
@@ -205,6 +205,7 @@ def get_assignment(restrict_user=True):
         'enable_self_evaluation': fields.Boolean,
         'enable_group_answers': fields.Boolean,
         'pairing_algorithm': UnwrapEnum(attribute='pairing_algorithm'),
+        'scoring_algorithm': UnwrapEnum(attribute='scoring_algorithm'),
         'educators_can_compare': fields.Boolean,
         'rank_display_limit': fields.Integer(default=None),
 
@@ -226,6 +227,7 @@ def get_assignment(restrict_user=True):
         'answer_grade_weight': fields.Integer,
         'comparison_grade_weight': fields.Integer,
         'self_evaluation_grade_weight': fields.Integer,
+        'course_grade_weight': fields.Integer,
 
         'modified': fields.DateTime(dt_format='iso8601', attribute=lambda x: replace_tzinfo(x.modified)),
         'created': fields.DateTime(dt_format='iso8601', attribute=lambda x: replace_tzinfo(x.created))
@@ -82,7 +82,7 @@ class GradebookAPI(Resource):
 
         # find out the scores that students get
         answer_scores = Answer.query \
-            .with_entities(Answer.user_id, Answer.group_id, File, AnswerScore.normalized_score) \
+            .with_entities(Answer.user_id, Answer.group_id, File, AnswerScore.score) \
             .outerjoin(File, and_(
                  Answer.file_id == File.id
             )) \
@@ -107,6 +107,7 @@ class GradebookAPI(Resource):
         file_by_user_id = {}
 
         for (user_id, group_id, file_attachment, score) in answer_scores:
+            normalized_score = assignment.normalize_score(score)
             user_ids = []
             if user_id != None:
                 user_ids = [user_id]
@@ -116,7 +117,7 @@ class GradebookAPI(Resource):
             for user_id in user_ids:
                 num_answers_per_student[user_id] = 1
                 if include_scores:
-                    scores_by_user_id[user_id] = round(score, 3) if score != None else 'Not Evaluated'
+                    scores_by_user_id[user_id] = round(normalized_score, 3) if normalized_score != None else 'Not Evaluated'
                 if file_attachment != None:
                     file_by_user_id[user_id] = file_attachment
 
@@ -0,0 +1,239 @@
+"""
+    Shared cache used for pairing snapshots and other per-assignment data.
+
+    Two backends are available (selected with the CACHE_BACKEND setting):
+
+    * local: in-process dictionary. Only safe when a single process serves the application
+    * redis: shared Redis server at CACHE_REDIS_URL. Required when running multiple workers
+
+    Values stored with get/set are pickled. Hash values (hget/hset/hincrby) and list values
+    (rpush/lpop) are limited to JSON serializable values so they can be updated atomically
+    by the Redis backend.
+"""
+import json
+import pickle
+import threading
+import time
+from collections import deque
+
+
+class LocalCacheBackend:
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.RLock()
+
+    def _expired(self, key):
+        expires = self._expires.get(key)
+        if expires != None and expires <= time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+            return True
+        return False
+
+    def _set_timeout(self, key, timeout):
+        if timeout:
+            self._expires[key] = time.time() + timeout
+        else:
+            self._expires.pop(key, None)
+
+    def get(self, key):
+        with self._lock:
+            if self._expired(key):
+                return None
+            value = self._data.get(key)
+            return pickle.loads(value) if value != None else None
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._data[key] = pickle.dumps(value)
+            self._set_timeout(key, timeout)
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if not self._expired(key) and key in self._data:
+                return False
+            self.set(key, value, timeout)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+
+    def hgetall(self, key):
+        with self._lock:
+            if self._expired(key):
+                return {}
+            return dict(self._data.get(key, {}))
+
+    def hset(self, key, field, value, timeout=None):
+        with self._lock:
+            self._expired(key)
+            self._data.setdefault(key, {})[str(field)] = value
+            self._set_timeout(key, timeout)
+
+    def hincrby(self, key, field, amount=1, timeout=None):
+        with self._lock:
+            self._expired(key)
+            values = self._data.setdefault(key, {})
+            values[str(field)] = values.get(str(field), 0) + amount
+            self._set_timeout(key, timeout)
+            return values[str(field)]
+
+    def rpush(self, key, *values, timeout=None):
+        with self._lock:
+            self._expired(key)
+            items = self._data.setdefault(key, deque())
+            items.extend([json.loads(json.dumps(value)) for value in values])
+            self._set_timeout(key, timeout)
+            return len(items)
+
+    def lpop(self, key):
+        with self._lock:
+            if self._expired(key):
+                return None
+            items = self._data.get(key)
+            return items.popleft() if items else None
+
+    def llen(self, key):
+        with self._lock:
+            if self._expired(key):
+                return 0
+            return len(self._data.get(key, []))
+
+    def clear(self):
+        with self._lock:
+            self._data = {}
+            self._expires = {}
+
+
+class RedisCacheBackend:
+    def __init__(self, client):
+        self._client = client
+
+    @classmethod
+    def from_url(cls, url):
+        import redis
+        return cls(redis.StrictRedis.from_url(url))
+
+    def get(self, key):
+        value = self._client.get(key)
+        return pickle.loads(value) if value != None else None
+
+    def set(self, key, value, timeout=None):
+        self._client.set(key, pickle.dumps(value), ex=timeout)
+
+    def add(self, key, value, timeout=None):
+        return bool(self._client.set(key, pickle.dumps(value), ex=timeout, nx=True))
+
+    def delete(self, *keys):
+        if len(keys) > 0:
+            self._client.delete(*keys)
+
+    def hgetall(self, key):
+        values = {}
+        for field, value in self._client.hgetall(key).items():
+            if isinstance(field, bytes):
+                field = field.decode('utf-8')
+            if isinstance(value, bytes):
+                value = value.decode('utf-8')
+            values[field] = json.loads(value)
+        return values
+
+    def hset(self, key, field, value, timeout=None):
+        pipe = self._client.pipeline()
+        pipe.hset(key, str(field), json.dumps(value))
+        if timeout:
+            pipe.expire(key, timeout)
+        pipe.execute()
+
+    def hincrby(self, key, field, amount=1, timeout=None):
+        pipe = self._client.pipeline()
+        pipe.hincrby(key, str(field), amount)
+        if timeout:
+            pipe.expire(key, timeout)
+        return pipe.execute()[0]
+
+    def rpush(self, key, *values, timeout=None):
+        pipe = self._client.pipeline()
+        pipe.rpush(key, *[json.dumps(value) for value in values])
+        if timeout:
+            pipe.expire(key, timeout)
+        return pipe.execute()[0]
+
+    def lpop(self, key):
+        value = self._client.lpop(key)
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return json.loads(value) if value != None else None
+
+    def llen(self, key):
+        return self._client.llen(key)
+
+    def clear(self):
+        self._client.flushdb()
+
+
+class Cache:
+    def __init__(self):
+        self.backend = LocalCacheBackend()
+        self.key_prefix = 'compair:'
+
+    def init_app(self, app):
+        backend = app.config.get('CACHE_BACKEND', 'local')
+        if backend == 'redis':
+            self.backend = RedisCacheBackend.from_url(app.config.get('CACHE_REDIS_URL'))
+        elif backend == 'local':
+            self.backend = LocalCacheBackend()
+        else:
+            raise RuntimeError('Invalid CACHE_BACKEND value ' + str(backend) + '.')
+        self.key_prefix = app.config.get('CACHE_KEY_PREFIX', 'compair:')
+
+    def _key(self, key):
+        return self.key_prefix + key
+
+    def get(self, key):
+        return self.backend.get(self._key(key))
+
+    def set(self, key, value, timeout=None):
+        self.backend.set(self._key(key), value, timeout)
+
+    def add(self, key, value, timeout=None):
+        """
+        Sets the value only if the key does not exist. Returns True if the value was set
+        """
+        return self.backend.add(self._key(key), value, timeout)
+
+    def delete(self, *keys):
+        self.backend.delete(*[self._key(key) for key in keys])
+
+    def hgetall(self, key):
+        return self.backend.hgetall(self._key(key))
+
+    def hset(self, key, field, value, timeout=None):
+        self.backend.hset(self._key(key), field, value, timeout)
+
+    def hincrby(self, key, field, amount=1, timeout=None):
+        return self.backend.hincrby(self._key(key), field, amount, timeout)
+
+    def rpush(self, key, *values, timeout=None):
+        """
+        Appends values to the end of the list. Returns the new length of the list
+        """
+        if len(values) == 0:
+            return self.llen(key)
+        return self.backend.rpush(self._key(key), *values, timeout=timeout)
+
+    def lpop(self, key):
+        """
+        Removes and returns the first value of the list (None if the list is empty)
+        """
+        return self.backend.lpop(self._key(key))
+
+    def llen(self, key):
+        return self.backend.llen(self._key(key))
+
+    def clear(self):
+        self.backend.clear()
@@ -83,6 +83,7 @@ env_overridables = [
     'SECRET_KEY', 'REPORT_FOLDER', 'UPLOAD_FOLDER',
     'ATTACHMENT_UPLOAD_FOLDER', 'ASSET_LOCATION', 'ASSET_CLOUD_URI_PREFIX',
     'CELERY_RESULT_BACKEND', 'CELERY_BROKER_URL', 'CELERY_TIMEZONE',
+    'CACHE_BACKEND', 'CACHE_REDIS_URL', 'CACHE_KEY_PREFIX',
     'LRS_APP_BASE_URL',
     'LRS_XAPI_STATEMENT_ENDPOINT', 'LRS_XAPI_AUTH', 'LRS_XAPI_USERNAME', 'LRS_XAPI_PASSWORD',
     'LRS_CALIPER_HOST', 'LRS_CALIPER_API_KEY',
@@ -104,12 +105,19 @@ env_bool_overridables = [
     'ALLOW_STUDENT_CHANGE_NAME', 'ALLOW_STUDENT_CHANGE_DISPLAY_NAME',
     'ALLOW_STUDENT_CHANGE_STUDENT_NUMBER', 'ALLOW_STUDENT_CHANGE_EMAIL',
     'MAIL_NOTIFICATION_ENABLED', 'MAIL_USE_TLS', 'MAIL_USE_SSL', 'MAIL_ASCII_ATTACHMENTS',
-    'ENFORCE_SSL', 'IMPERSONATION_ENABLED'
+    'ENFORCE_SSL', 'IMPERSONATION_ENABLED', 'PAIRING_SNAPSHOT_CACHE_ENABLED',
+    'COMPARISON_PAIR_QUEUE_ENABLED', 'SCORE_UPDATE_QUEUE_ENABLED', 'RANK_THRESHOLD_CACHE_ENABLED',
+    'GRADE_UPDATE_QUEUE_ENABLED'
 ]
 
 env_int_overridables = [
     'ATTACHMENT_UPLOAD_LIMIT', 'LRS_USER_INPUT_FIELD_SIZE_LIMIT',
-    'MAIL_PORT', 'MAIL_MAX_EMAILS'
+    'MAIL_PORT', 'MAIL_MAX_EMAILS', 'PAIRING_SNAPSHOT_TIMEOUT',
+    'COMPARISON_PAIR_QUEUE_SIZE', 'COMPARISON_PAIR_QUEUE_TIMEOUT',
+    'SCORE_RECALCULATION_PROCESSES', 'SCORE_RECALCULATION_PARALLEL_MIN_COMPARISONS',
+    'SCORE_UPDATE_QUEUE_MAX_INCREMENTAL', 'RANK_THRESHOLD_CACHE_TIMEOUT', 'GRADE_UPDATE_QUEUE_DELAY',
+    'LTI_OUTCOME_MAX_CONCURRENCY', 'LTI_OUTCOME_RATE_LIMIT', 'LTI_OUTCOME_MAX_RETRIES',
+    'LTI_OUTCOME_RETRY_BACKOFF', 'LTI_OUTCOME_TIMEOUT'
 ]
 
 env_set_overridables = [
@@ -16,6 +16,7 @@ from flask_sqlalchemy import SQLAlchemy
 
 from .configuration import config
 from .impersonation import Impersonation
+from .cache import Cache
 
 # initialize database
 db = SQLAlchemy(session_options={
@@ -41,6 +42,9 @@ celery = Celery(
 # initialize Flask-Mail
 mail = Mail()
 
+# initialize shared cache
+cache = Cache()
+
 # create custom namespace for signals
 event = Namespace()
 
@@ -0,0 +1,48 @@
+"""
+    Helpers shared by the manager commands processing many assignments or courses
+"""
+import multiprocessing
+import os
+
+from compair.core import db
+
+
+def read_checkpoint(checkpoint):
+    """
+    Returns the set of ids recorded in the checkpoint file (empty if there is no checkpoint)
+    """
+    if not checkpoint or not os.path.exists(checkpoint):
+        return set()
+    with open(checkpoint) as checkpoint_file:
+        return set(int(line) for line in checkpoint_file if line.strip())
+
+
+def write_checkpoint(checkpoint, id):
+    # one line per id as soon as it is done so an interrupted run loses at most the ids in progress
+    if checkpoint:
+        with open(checkpoint, 'a') as checkpoint_file:
+            checkpoint_file.write(str(id) + "\n")
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+
+
+def run_all(function, arguments, processes):
+    """
+    Yields function(argument) for every argument, in order with a single process or
+    in completion order with a pool of processes
+    """
+    if processes <= 1:
+        for argument in arguments:
+            yield function(argument)
+        return
+
+    # worker processes are forked with the app context and must open their own database connections
+    db.session.remove()
+    db.engine.dispose()
+    with multiprocessing.Pool(processes, initializer=_init_worker) as pool:
+        for result in pool.imap_unordered(function, arguments):
+            yield result
+
+
+def _init_worker():
+    db.engine.dispose()
@@ -1,35 +1,212 @@
 """
     Recalculate Grades
 """
+import os
+import signal
+import time
+import traceback
 
+from flask import current_app
 from flask_script import Manager
-from compair.models import Course, Assignment
+
+from compair.core import db
+from compair.models import Course, Assignment, AssignmentGrade, CourseGrade
+from .batch import read_checkpoint, write_checkpoint, run_all
 
 manager = Manager(usage="Generate Grades")
 
+# course grades closer than this are consistent (floating point rounding of the incremental updates)
+GRADE_TOLERANCE = 0.000001
+
+class CourseTimeout(Exception):
+    pass
+
+@manager.option('-c', '--course_id', '--course', dest='course_id', help='Specify a Course ID to generate grades for.')
+@manager.option('-a', '--all', dest='all', action='store_true', default=False, help='Generate grades for all courses.')
+@manager.option('-p', '--processes', dest='processes', type=int, default=1,
+    help='Number of courses generated at the same time (0 for the number of CPUs).')
+@manager.option('--dry-run', dest='dry_run', action='store_true', default=False,
+    help='Calculate and compare the new grades without saving them.')
+@manager.option('--checkpoint', dest='checkpoint', default=None,
+    help='File recording the generated courses. Courses already in the file are skipped (to resume).')
+@manager.option('--timeout', dest='timeout', type=int, default=None,
+    help='Seconds after which a course is abandoned (reported as failed and not checkpointed). '
+        'Assignment grades are committed one assignment at a time, so the assignments generated before '
+        'the timeout keep their new grades until the course is generated again.')
+def generate(course_id, all, processes, dry_run, checkpoint, timeout):
+    course_ids = _get_course_ids(course_id, all)
+    if course_ids == None:
+        return
+
+    completed_course_ids = read_checkpoint(checkpoint)
+    if completed_course_ids:
+        print("Skipping {} course(s) already generated in {}.".format(
+            len([course_id for course_id in course_ids if course_id in completed_course_ids]), checkpoint))
+        course_ids = [course_id for course_id in course_ids if course_id not in completed_course_ids]
+
+    if len(course_ids) == 0:
+        print("No courses to generate grades for.")
+        return
+
+    processes = min(processes or os.cpu_count() or 1, len(course_ids))
+    print("{} grades of {} course(s) with {} process(es)...".format(
+        'Comparing' if dry_run else 'Generating', len(course_ids), processes))
+
+    start = time.time()
+    failed_course_ids = []
+    number_of_students = 0
+    arguments = [(course_id, dry_run, timeout) for course_id in course_ids]
+    # results are (course id, seconds, number of students, summary, error) in completion order
+    for (index, result) in enumerate(run_all(_generate, arguments, processes), start=1):
+        (course_id, elapsed, students, summary, error) = result
+        prefix = "[{}/{}] Course {} ({:.2f}s)".format(index, len(course_ids), course_id, elapsed)
+        if error:
+            failed_course_ids.append(course_id)
+            print(prefix + " failed: " + error)
+            continue
+
+        number_of_students += students
+        print(prefix + ": " + summary)
+        if not dry_run:
+            write_checkpoint(checkpoint, course_id)
+
+    elapsed = time.time() - start
+    print("Done in {:.2f}s. {} course(s) {}, {} failed.".format(elapsed,
+        len(course_ids) - len(failed_course_ids), 'compared' if dry_run else 'generated', len(failed_course_ids)))
+    if elapsed > 0:
+        print("Throughput: {:.2f} course(s)/s, {:.1f} student(s)/s.".format(
+            (len(course_ids) - len(failed_course_ids)) / elapsed, number_of_students / elapsed))
+    if failed_course_ids:
+        print("Failed course IDs: " + ", ".join(str(course_id) for course_id in failed_course_ids))
+
+
 @manager.command
-def generate(course_id=None, all=False):
-    courses = []
+def check(course_id=None, all=False, fix=False):
+    """
+    Compare the stored (incrementally updated) course grades with fully recalculated ones
+    """
+    course_ids = _get_course_ids(course_id, all)
+    if course_ids == None:
+        return
+
+    inconsistent_courses = 0
+    for course_id in course_ids:
+        course = Course.query.get(course_id)
+        calculated_grades = CourseGrade.get_calculated_grades(course)
+        stored_grades = dict(CourseGrade.query \
+            .with_entities(CourseGrade.user_id, CourseGrade.grade) \
+            .filter_by(course_id=course.id) \
+            .all())
+
+        missing = [user_id for user_id in calculated_grades.keys() if user_id not in stored_grades]
+        mismatched = [user_id for user_id, grade in calculated_grades.items()
+            if user_id in stored_grades and abs(stored_grades[user_id] - grade) > GRADE_TOLERANCE]
+
+        if len(missing) == 0 and len(mismatched) == 0:
+            continue
+
+        inconsistent_courses += 1
+        print("Course {} ({}): {} mismatched, {} missing course grade(s)".format(
+            course.id, course.name, len(mismatched), len(missing)))
+        for user_id in mismatched:
+            print("--- User {}: stored {:.6f}, calculated {:.6f}".format(
+                user_id, stored_grades[user_id], calculated_grades[user_id]))
+
+        if fix:
+            print("--- Recalculating course grades")
+            course.calculate_grades()
+
+    print("Done. {} of {} course(s) inconsistent.".format(inconsistent_courses, len(course_ids)))
+
+
+def _get_course_ids(course_id, all):
+    """
+    Returns the ids of the active courses selected (None if nothing was selected)
+    """
     if course_id != None:
         course = Course.query.get(course_id)
         if course and course.active:
-            courses = [course]
-        else:
-            print("No course found with that ID")
-            return
+            return [course.id]
+        print("No course found with that ID")
+        return None
     elif all:
-        courses = Course.query.all()
-    else:
-        print("Please enter a course_id or use the all flag")
-        return
+        return [course.id for course in Course.query \
+            .with_entities(Course.id) \
+            .filter_by(active=True) \
+            .order_by(Course.id) \
+            .all()]
+
+    print("Please enter a course_id or use the all flag")
+    return None
+
+
+def _raise_timeout(signum, frame):
+    raise CourseTimeout()
 
-    for course in courses:
-        if course.active:
-            print("Generating grades for course: " + course.name)
-            for assignment in course.assignments:
-                if assignment.active:
-                    print("--- Generating grades for assignment: " + assignment.name)
-                    assignment.calculate_grades()
+
+def _generate(argument):
+    (course_id, dry_run, timeout) = argument
+    start = time.time()
+    if timeout:
+        previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.alarm(timeout)
+    try:
+        course = Course.query.get(course_id)
+        assignments = [assignment for assignment in course.assignments if assignment.active]
+        if dry_run:
+            (students, summary) = _compare_grades(course, assignments)
+        else:
+            for assignment in assignments:
+                assignment.calculate_grades()
             course.calculate_grades()
-            print("")
-    print("Done.")
\ No newline at end of file
+            students = CourseGrade.query.filter_by(course_id=course.id).count()
+            summary = "{} assignment(s), {} student(s)".format(len(assignments), students)
+        return (course_id, time.time() - start, students, summary, None)
+    except CourseTimeout:
+        db.session.rollback()
+        return (course_id, time.time() - start, 0, None, "timed out after {}s".format(timeout))
+    except Exception as error:
+        db.session.rollback()
+        current_app.logger.error(traceback.format_exc())
+        return (course_id, time.time() - start, 0, None, repr(error))
+    finally:
+        if timeout:
+            signal.alarm(0)
+            signal.signal(signal.SIGALRM, previous_handler)
+        db.session.remove()
+
+
+def _compare_grades(course, assignments):
+    """
+    Summarizes the differences between the current grades of the course and the generated ones
+    """
+    assignment_grades = {}
+    assignment_changes = [0, 0]
+    for assignment in assignments:
+        assignment_grades[assignment.id] = AssignmentGrade.get_calculated_grades(assignment)
+        current_grades = dict(AssignmentGrade.query \
+            .with_entities(AssignmentGrade.user_id, AssignmentGrade.grade) \
+            .filter_by(assignment_id=assignment.id) \
+            .all())
+        _count_changes(assignment_changes, current_grades, assignment_grades[assignment.id])
+
+    course_grades = CourseGrade.get_calculated_grades(course, assignment_grades)
+    current_grades = dict(CourseGrade.query \
+        .with_entities(CourseGrade.user_id, CourseGrade.grade) \
+        .filter_by(course_id=course.id) \
+        .all())
+    course_changes = [0, 0]
+    _count_changes(course_changes, current_grades, course_grades)
+
+    return (len(course_grades), "{} assignment grade(s) changed, {} new; {} course grade(s) changed, {} new".format(
+        assignment_changes[0], assignment_changes[1], course_changes[0], course_changes[1]))
+
+
+def _count_changes(changes, current_grades, grades):
+    # changes is [changed, new]
+    for user_id, grade in grades.items():
+        current_grade = current_grades.get(user_id)
+        if current_grade == None:
+            changes[1] += 1
+        elif abs(current_grade - grade) > GRADE_TOLERANCE:
+            changes[0] += 1
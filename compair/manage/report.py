@@ -2,9 +2,9 @@
     Report Generator
 """
 import unicodecsv as csv
-import elo
 from compair.algorithms import ScoredObject
 from compair.algorithms.score import calculate_score_1vs1
+from compair.algorithms.score.elo_rating.environment import EloEnvironment
 import numbers
 from werkzeug.utils import secure_filename
 
@@ -174,8 +174,8 @@ def create(assignment_id):
         # overall
         answer1_score_before = scores['overall'].get(answer1_id, ScoredObject(
             key=answer1_id,
-            score=elo.INITIAL,
-            variable1=elo.INITIAL,
+            score=EloEnvironment.INITIAL,
+            variable1=EloEnvironment.INITIAL,
             variable2=None,
             rounds=0,
             wins=0,
@@ -184,8 +184,8 @@ def create(assignment_id):
         ))
         answer2_score_before = scores['overall'].get(answer2_id, ScoredObject(
             key=answer2_id,
-            score=elo.INITIAL,
-            variable1=elo.INITIAL,
+            score=EloEnvironment.INITIAL,
+            variable1=EloEnvironment.INITIAL,
             variable2=None,
             rounds=0,
             wins=0,
@@ -236,8 +236,8 @@ def create(assignment_id):
 
             answer1_score_before = scores[criterion.id].get(answer1_id, ScoredObject(
                 key=answer1_id,
-                score=elo.INITIAL,
-                variable1=elo.INITIAL,
+                score=EloEnvironment.INITIAL,
+                variable1=EloEnvironment.INITIAL,
                 variable2=None,
                 rounds=0,
                 wins=0,
@@ -246,8 +246,8 @@ def create(assignment_id):
             ))
             answer2_score_before = scores[criterion.id].get(answer2_id, ScoredObject(
                 key=answer2_id,
-                score=elo.INITIAL,
-                variable1=elo.INITIAL,
+                score=EloEnvironment.INITIAL,
+                variable1=EloEnvironment.INITIAL,
                 variable2=None,
                 rounds=0,
                 wins=0,
@@ -295,8 +295,8 @@ def create(assignment_id):
             for answer in answers:
                 score = scores['overall'].get(answer.id, ScoredObject(
                     key=answer2_id,
-                    score=elo.INITIAL,
-                    variable1=elo.INITIAL,
+                    score=EloEnvironment.INITIAL,
+                    variable1=EloEnvironment.INITIAL,
                     variable2=None,
                     rounds=0,
                     wins=0,
@@ -314,8 +314,8 @@ def create(assignment_id):
                     criterion = next(criterion for criterion in criteria if criterion.id == comparison_criterion.criterion_id)
                     criterion_score = scores[criterion.id].get(answer.id, ScoredObject(
                         key=answer2_id,
-                        score=elo.INITIAL,
-                        variable1=elo.INITIAL,
+                        score=EloEnvironment.INITIAL,
+                        variable1=EloEnvironment.INITIAL,
                         variable2=None,
                         rounds=0,
                         wins=0,
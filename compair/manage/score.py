@@ -1,26 +1,205 @@
 """
     Recalculate Scores
 """
+import os
+import time
+import traceback
+import unicodecsv as csv
 
+from flask import current_app
 from flask_script import Manager, prompt_bool
-from compair.models import Comparison, Assignment
+from sqlalchemy import and_
+
+from compair.core import db
+from compair.models import Comparison, Assignment, Course, Answer, AnswerScore, AnswerCriterionScore, \
+    AnswerScoreHistory
+from .batch import read_checkpoint, write_checkpoint, run_all
 
 
 manager = Manager(usage="Recalculate Assignment Answer Scores")
 
 
-@manager.option('-a', '--assignment', dest='assignment_id', help='Specify a Assignment ID to generate report from.')
-def recalculate(assignment_id):
-    if not assignment_id:
-        raise RuntimeError("Assignment with ID {} is not found.".format(assignment_id))
+@manager.option('-a', '--assignment', dest='assignment_id', help='Specify a Assignment ID to recalculate.')
+@manager.option('-c', '--course', dest='course_id', help='Recalculate all assignments of a course.')
+@manager.option('--year', dest='year', type=int, help='Recalculate all assignments of courses in a year (requires --term).')
+@manager.option('--term', dest='term', help='Recalculate all assignments of courses in a term (requires --year).')
+@manager.option('--all', dest='all', action='store_true', default=False, help='Recalculate all assignments.')
+@manager.option('-p', '--processes', dest='processes', type=int, default=None,
+    help='Number of assignments recalculated at the same time (defaults to the number of CPUs).')
+@manager.option('--dry-run', dest='dry_run', action='store_true', default=False,
+    help='Calculate and compare the new scores without saving them.')
+@manager.option('--checkpoint', dest='checkpoint', default=None,
+    help='File recording the recalculated assignments. Assignments already in the file are skipped (to resume).')
+@manager.option('-y', '--yes', dest='yes', action='store_true', default=False, help='Do not ask for confirmation.')
+def recalculate(assignment_id, course_id, year, term, all, processes, dry_run, checkpoint, yes):
+    assignment_ids = _get_assignment_ids(assignment_id, course_id, year, term, all)
+
+    completed_assignment_ids = read_checkpoint(checkpoint)
+    if completed_assignment_ids:
+        print("Skipping {} assignment(s) already recalculated in {}.".format(
+            len([assignment_id for assignment_id in assignment_ids if assignment_id in completed_assignment_ids]),
+            checkpoint))
+        assignment_ids = [assignment_id for assignment_id in assignment_ids if assignment_id not in completed_assignment_ids]
+
+    if len(assignment_ids) == 0:
+        print("No assignments to recalculate.")
+        return
+
+    if not dry_run and not yes and not prompt_bool("""All current answer scores and answer criterion scores of {} assignment(s) will be overwritten.
+Final scores may differ slightly due to floating point rounding (especially if recalculating on different systems).
+Are you sure?""".format(len(assignment_ids))):
+        return
+
+    processes = min(processes or os.cpu_count() or 1, len(assignment_ids))
+    print("{} scores of {} assignment(s) with {} process(es)...".format(
+        'Comparing' if dry_run else 'Recalculating', len(assignment_ids), processes))
 
-    assignment = Assignment.query.filter_by(id=assignment_id).first()
+    start = time.time()
+    failed_assignment_ids = []
+    arguments = [(assignment_id, dry_run) for assignment_id in assignment_ids]
+    # results are (assignment id, seconds, summary, error) in completion order
+    for (index, result) in enumerate(run_all(_recalculate, arguments, processes), start=1):
+        (assignment_id, elapsed, summary, error) = result
+        prefix = "[{}/{}] Assignment {} ({:.2f}s)".format(index, len(assignment_ids), assignment_id, elapsed)
+        if error:
+            failed_assignment_ids.append(assignment_id)
+            print(prefix + " failed: " + error)
+            continue
+
+        print(prefix + ": " + summary)
+        # a dry run doesn't save anything, the assignments still need recalculating
+        if not dry_run:
+            write_checkpoint(checkpoint, assignment_id)
+
+    print("Done in {:.2f}s. {} assignment(s) {}, {} failed.".format(
+        time.time() - start, len(assignment_ids) - len(failed_assignment_ids),
+        'compared' if dry_run else 'recalculated', len(failed_assignment_ids)))
+    if failed_assignment_ids:
+        print("Failed assignment IDs: " + ", ".join(str(assignment_id) for assignment_id in failed_assignment_ids))
+
+
+@manager.option('-a', '--assignment', dest='assignment_id', help='Specify a Assignment ID.')
+@manager.option('-n', '--comparisons', dest='comparison_count', type=int, default=None,
+    help='Number of completed comparisons to rebuild the ranking at (defaults to the latest scores).')
+@manager.option('-o', '--output', dest='output', default=None, help='Write the ranking to this csv file.')
+def history(assignment_id, comparison_count, output):
+    """
+    Rebuild the ranking of an assignment's answers from the score history
+    """
+    assignment = Assignment.query.filter_by(id=assignment_id).first() if assignment_id else None
     if not assignment:
         raise RuntimeError("Assignment with ID {} is not found.".format(assignment_id))
 
-    if prompt_bool("""All current answer scores and answer criterion scores will be overwritten.
-Final scores may differ slightly due to floating point rounding (especially if recalculating on different systems).
-Are you sure?"""):
-        print ('Recalculating scores...')
-        Comparison.calculate_scores(assignment.id)
-        print ('Recalculate scores successful.')
+    latest_comparison_count = AnswerScoreHistory.get_comparison_count(assignment.id)
+    if latest_comparison_count == None:
+        print("No score history for assignment {}.".format(assignment.id))
+        return
+
+    ranking = AnswerScoreHistory.get_ranking(assignment.id, comparison_count)
+    print("Ranking of {} answer(s) after {} of {} comparison(s)".format(len(ranking),
+        comparison_count if comparison_count != None else latest_comparison_count, latest_comparison_count))
+
+    header = ['Rank', 'Answer Id', 'Answer UUID', 'Score', 'Rounds']
+    answer_uuids = dict(Answer.query \
+        .with_entities(Answer.id, Answer.uuid) \
+        .filter(Answer.assignment_id == assignment.id) \
+        .all())
+    rows = [
+        [rank, answer_id, answer_uuids.get(answer_id), score, rounds]
+        for (answer_id, score, rounds, rank) in ranking
+    ]
+
+    if output:
+        with open(output, 'wb') as csvfile:
+            out = csv.writer(csvfile)
+            out.writerow(header)
+            out.writerows(rows)
+        print("Ranking written to " + output)
+    else:
+        print("{:>6} {:>10} {:>24} {:>14} {:>8}".format(*header))
+        for row in rows:
+            print("{:>6} {:>10} {:>24} {:>14.6f} {:>8}".format(*row))
+
+
+def _get_assignment_ids(assignment_id, course_id, year, term, all):
+    if assignment_id:
+        assignment = Assignment.query.filter_by(id=assignment_id).first()
+        if not assignment:
+            raise RuntimeError("Assignment with ID {} is not found.".format(assignment_id))
+        return [assignment.id]
+
+    query = Assignment.query \
+        .with_entities(Assignment.id) \
+        .join(Course, Course.id == Assignment.course_id) \
+        .filter(and_(
+            Assignment.active == True,
+            Course.active == True
+        )) \
+        .order_by(Assignment.id)
+
+    if course_id:
+        course = Course.query.filter_by(id=course_id).first()
+        if not course:
+            raise RuntimeError("Course with ID {} is not found.".format(course_id))
+        query = query.filter(Course.id == course.id)
+    elif year and term:
+        query = query.filter(and_(
+            Course.year == year,
+            Course.term == term
+        ))
+    elif not all:
+        raise RuntimeError("Please specify an assignment, a course, a year and term, or use the all flag.")
+
+    return [assignment.id for assignment in query.all()]
+
+
+def _recalculate(argument):
+    (assignment_id, dry_run) = argument
+    start = time.time()
+    try:
+        if dry_run:
+            summary = _compare_scores(assignment_id, Comparison.calculate_scores(assignment_id, dry_run=True))
+        else:
+            results = Comparison.calculate_scores(assignment_id)
+            summary = "{} answer score(s) recalculated".format(len(results[None]))
+        return (assignment_id, time.time() - start, summary, None)
+    except Exception as error:
+        db.session.rollback()
+        current_app.logger.error(traceback.format_exc())
+        return (assignment_id, time.time() - start, None, repr(error))
+    finally:
+        db.session.remove()
+
+
+def _compare_scores(assignment_id, results):
+    """
+    Summarizes the differences between the current scores and the recalculated ones
+    """
+    current_scores = {}
+    for (answer_id, score) in AnswerScore.query \
+            .with_entities(AnswerScore.answer_id, AnswerScore.score) \
+            .filter_by(assignment_id=assignment_id) \
+            .all():
+        current_scores[(None, answer_id)] = score
+    for (answer_id, criterion_id, score) in AnswerCriterionScore.query \
+            .with_entities(AnswerCriterionScore.answer_id, AnswerCriterionScore.criterion_id, AnswerCriterionScore.score) \
+            .filter_by(assignment_id=assignment_id) \
+            .all():
+        current_scores[(criterion_id, answer_id)] = score
+
+    changed = 0
+    added = 0
+    max_difference = 0.0
+    for criterion_id, scores in results.items():
+        for answer_id, result in scores.items():
+            current_score = current_scores.get((criterion_id, answer_id))
+            if current_score == None:
+                added += 1
+                continue
+            difference = abs(result.score - current_score)
+            # floating point rounding isn't a change
+            if difference > 0.00001:
+                changed += 1
+            max_difference = max(max_difference, difference)
+
+    return "{} score(s) changed, {} new, max difference {:.6f}".format(changed, added, max_difference)
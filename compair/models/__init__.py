@@ -24,6 +24,7 @@ from .file import File
 from .group import Group
 from .answer_score import AnswerScore
 from .answer_criterion_score import AnswerCriterionScore
+from .answer_score_history import AnswerScoreHistory
 from .user import User
 from .user_course import UserCourse
 from .third_party_user import ThirdPartyUser
@@ -33,10 +34,16 @@ from .learning_records import CaliperLog, XAPILog
 
 # LTI models
 from .lti_models import LTIConsumer, LTIContext, LTIMembership, \
-    LTIResourceLink, LTIUser, LTIUserResourceLink, LTINonce, LTIOutcome
+    LTIResourceLink, LTIUser, LTIUserResourceLink, LTINonce, LTIOutcome, LTIOutcomeDispatcher
 
 from .kaltura_models import KalturaMedia
 
+# pairing data cache
+from .pairing_snapshot import PairingSnapshot
+from .comparison_pair_queue import ComparisonPairQueue
+from .score_update_queue import ScoreUpdateQueue
+from .grade_update_queue import GradeUpdateQueue
+
 from compair.core import db
 convention = {
     "ix": 'ix_%(column_0_label)s',
@@ -1,13 +1,15 @@
 # sqlalchemy
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.orm import column_property
-from sqlalchemy import func, select, and_, or_
-from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import get_history
+from sqlalchemy import func, and_, event
 from sqlalchemy_enum34 import EnumType
 
 from compair.algorithms import ScoredObject
+from compair.algorithms.opponent_stats import dump_opponent_stats, load_opponent_stats
 
 from . import *
+from .answer_score import normalize_score, _add_pending_changes, _update_score_bounds
 
 from compair.core import db
 
@@ -48,6 +50,10 @@ class AnswerCriterionScore(DefaultTableMixin, WriteTrackingMixin):
     wins = db.Column(db.Integer, default=0, nullable=False)
     loses = db.Column(db.Integer, default=0, nullable=False)
     opponents = db.Column(db.Integer, default=0, nullable=False)
+    # json of opponent answer id -> [wins, loses] (None if scored before the stats were stored)
+    _opponent_stats = db.Column(db.Text, nullable=True)
+    # the lowest and highest scores of the criterion are stored in the assignment criterion and
+    # updated when the transaction changing the scores commits (see update_score_bounds)
 
     # relationships
     # assignment via Assignment Model
@@ -57,6 +63,26 @@ class AnswerCriterionScore(DefaultTableMixin, WriteTrackingMixin):
     # hybrid and other functions
     criterion_uuid = association_proxy('criterion', 'uuid')
 
+    @property
+    def opponent_stats(self):
+        return load_opponent_stats(self._opponent_stats) if self._opponent_stats != None else None
+
+    @opponent_stats.setter
+    def opponent_stats(self, opponent_stats):
+        self._opponent_stats = dump_opponent_stats(opponent_stats) if opponent_stats != None else None
+
+    @property
+    def normalized_score(self):
+        """
+        Score scaled from the lowest (0) to the highest (100) score of the criterion in the
+        assignment (None if all of them are the same)
+        """
+        for assignment_criterion in self.assignment.assignment_criteria:
+            if assignment_criterion.criterion_id == self.criterion_id:
+                return normalize_score(self.score, assignment_criterion.lowest_score,
+                    assignment_criterion.highest_score)
+        return None
+
     def convert_to_scored_object(self):
         return ScoredObject(
             key=self.answer_id,
@@ -70,21 +96,71 @@ class AnswerCriterionScore(DefaultTableMixin, WriteTrackingMixin):
         )
 
     @classmethod
-    def __declare_last__(cls):
-        super(cls, cls).__declare_last__()
-
-        s_alias = cls.__table__.alias()
-        cls.normalized_score = column_property(
-            select([
-                (cls.score - func.min(s_alias.c.score)) / (func.max(s_alias.c.score) - func.min(s_alias.c.score)) * 100
-            ]).
-            where(and_(
-                s_alias.c.criterion_id == cls.criterion_id,
-                s_alias.c.assignment_id == cls.assignment_id,
-            ))
-        )
+    def update_score_bounds(cls, assignment_id, criterion_id=None, changed_scores=None, session=None):
+        """
+        Updates the lowest and highest scores of the assignment's criteria (only criterion_id if given)
+        when a changed score (previous or new value) reaches one of them.
+        Every score is checked if changed_scores is None
+        """
+        session = session or db.session()
+        query = session.query(AssignmentCriterion.criterion_id,
+                AssignmentCriterion.lowest_score, AssignmentCriterion.highest_score) \
+            .filter(AssignmentCriterion.assignment_id == assignment_id)
+        if criterion_id != None:
+            query = query.filter(AssignmentCriterion.criterion_id == criterion_id)
+        current_bounds = dict((criterion_id, (lowest, highest)) for (criterion_id, lowest, highest) in query.all())
+
+        if changed_scores != None:
+            current_bounds = dict((criterion_id, (lowest, highest))
+                for (criterion_id, (lowest, highest)) in current_bounds.items()
+                if lowest == None or not all(lowest < score < highest for score in changed_scores))
+        if len(current_bounds) == 0:
+            return
+
+        bounds = dict((criterion_id, (lowest, highest)) for (criterion_id, lowest, highest) in session.query(
+                AnswerCriterionScore.criterion_id,
+                func.min(AnswerCriterionScore.score), func.max(AnswerCriterionScore.score)) \
+            .filter(and_(
+                AnswerCriterionScore.assignment_id == assignment_id,
+                AnswerCriterionScore.criterion_id.in_(current_bounds.keys())
+            )) \
+            .group_by(AnswerCriterionScore.criterion_id) \
+            .all())
+
+        for (criterion_id, current) in current_bounds.items():
+            new_bounds = bounds.get(criterion_id, (None, None))
+            if new_bounds != current:
+                _update_score_bounds(session, AssignmentCriterion,
+                    {'assignment_id': assignment_id, 'criterion_id': criterion_id}, new_bounds)
+
+    @classmethod
+    def update_relative_scores_on_commit(cls, session, assignment_id):
+        """
+        Updates the lowest and highest scores of the assignment's criteria before the session commits.
+        Needed for changes made without the orm (like bulk operations)
+        """
+        _add_pending_changes(session, 'answer_criterion_score_changes', (assignment_id, None), None)
 
     __table_args__ = (
         db.UniqueConstraint('answer_id', 'criterion_id', name='_unique_answer_and_criterion'),
         DefaultTableMixin.default_table_args
-    )
\ No newline at end of file
+    )
+
+# score bounds are updated right before commit (see answer_score)
+
+def _add_pending_score_changes(target, scores):
+    session = object_session(target)
+    if session != None:
+        _add_pending_changes(session, 'answer_criterion_score_changes',
+            (target.assignment_id, target.criterion_id), scores)
+
+@event.listens_for(AnswerCriterionScore, 'after_insert')
+@event.listens_for(AnswerCriterionScore, 'after_delete')
+def _answer_criterion_score_inserted_or_deleted(mapper, connection, target):
+    _add_pending_score_changes(target, [target.score])
+
+@event.listens_for(AnswerCriterionScore, 'after_update')
+def _answer_criterion_score_updated(mapper, connection, target):
+    history = get_history(target, 'score')
+    if history.has_changes():
+        _add_pending_score_changes(target, list(history.added) + list(history.deleted))
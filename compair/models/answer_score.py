@@ -1,15 +1,16 @@
 # sqlalchemy
-from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.orm import column_property
-from sqlalchemy import func, select, and_, or_, join
-from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history, set_committed_value
+from sqlalchemy import func, and_, event, bindparam
 from sqlalchemy_enum34 import EnumType
+from flask import current_app
 
 from compair.algorithms import ScoredObject
+from compair.algorithms.opponent_stats import dump_opponent_stats, load_opponent_stats
 
 from . import *
 
-from compair.core import db
+from compair.core import db, cache
 
 class AnswerScore(DefaultTableMixin, WriteTrackingMixin):
     __tablename__ = 'answer_score'
@@ -46,12 +47,35 @@ class AnswerScore(DefaultTableMixin, WriteTrackingMixin):
     wins = db.Column(db.Integer, default=0, nullable=False)
     loses = db.Column(db.Integer, default=0, nullable=False)
     opponents = db.Column(db.Integer, default=0, nullable=False)
+    # json of opponent answer id -> [wins, loses] (None if scored before the stats were stored)
+    _opponent_stats = db.Column(db.Text, nullable=True)
+    # rank among the scores of active answers in the assignment (None for inactive answers).
+    # Tied scores share the best rank (1, 2, 2, 4)
+    rank = db.Column(db.Integer, nullable=True)
+    # rank and the assignment's lowest and highest scores are updated when the transaction
+    # changing the scores commits (see update_relative_scores and update_score_bounds)
 
     # relationships
     # assignment via Assignment Model
     # answer via Answer Model
 
     # hybrid and other functions
+    @property
+    def opponent_stats(self):
+        return load_opponent_stats(self._opponent_stats) if self._opponent_stats != None else None
+
+    @opponent_stats.setter
+    def opponent_stats(self, opponent_stats):
+        self._opponent_stats = dump_opponent_stats(opponent_stats) if opponent_stats != None else None
+
+    @property
+    def normalized_score(self):
+        """
+        Score scaled from the lowest (0) to the highest (100) score of the active answers in the
+        assignment (None if all of them have the same score)
+        """
+        return self.assignment.normalize_score(self.score)
+
     def convert_to_scored_object(self):
         return ScoredObject(
             key=self.answer_id,
@@ -64,51 +88,329 @@ class AnswerScore(DefaultTableMixin, WriteTrackingMixin):
             opponents=self.opponents
         )
 
-    @hybrid_property
-    def rank(self):
-        scores = AnswerScore.get_assignment_scores(self.assignment_id)
-        for index, score in enumerate(scores):
-            if score.score == self.score:
-                return index + 1
-        return None
+    @classmethod
+    def lock_assignment(cls, assignment_id, session=None):
+        """
+        Locks the assignment row until the transaction ends so its scores are changed and ranked one
+        transaction at a time. Transactions changing scores lock the assignment before the score rows
+        """
+        session = session or db.session()
+        session.query(Assignment.id) \
+            .filter(Assignment.id == assignment_id) \
+            .with_for_update() \
+            .scalar()
 
-    # TODO: this should be cached
     @classmethod
-    def get_assignment_scores(cls, assignment_id):
-        return AnswerScore.query \
-            .with_entities(AnswerScore.score) \
-            .join("answer") \
+    def update_relative_scores(cls, assignment_id, changed_scores=None, session=None):
+        """
+        Re-ranks the assignment's scores between the lowest and highest changed score (previous and new
+        values, every score if None). Ranks above them don't change and ranks below them are shifted
+        by the number of scores added or removed from the ranking. Only the ranks that changed are updated.
+        The assignment must be locked (see lock_assignment)
+        """
+        session = session or db.session()
+        table = AnswerScore.__table__
+        ranks = {}
+        changes = []
+        shift = 0
+        if changed_scores == None or len(changed_scores) > 0:
+            # scores and ranks are read with locking reads so ranks committed by the previous refresh are seen
+            query = session.query(AnswerScore.id, AnswerScore.answer_id, AnswerScore.score, AnswerScore.rank) \
+                .filter(AnswerScore.assignment_id == assignment_id) \
+                .with_for_update(read=True)
+
+            position = 0
+            if changed_scores != None:
+                lowest = min(changed_scores)
+                highest = max(changed_scores)
+
+                # ranked scores above the window (tied scores share the rank of the first one)
+                above = query \
+                    .with_entities(AnswerScore.score, AnswerScore.rank) \
+                    .filter(and_(AnswerScore.score > highest, AnswerScore.rank != None)) \
+                    .order_by(AnswerScore.score.asc()) \
+                    .first()
+                if above != None:
+                    position = above.rank - 1 + query \
+                        .with_entities(func.count(AnswerScore.id)) \
+                        .filter(and_(AnswerScore.score == above.score, AnswerScore.rank != None)) \
+                        .scalar()
+                query = query.filter(and_(AnswerScore.score >= lowest, AnswerScore.score <= highest))
+
+            scores = query.order_by(AnswerScore.score.desc()).all()
+            inactive_answer_ids = set([answer_id for (answer_id, ) in session.query(Answer.id) \
+                .filter(and_(
+                    Answer.id.in_([answer_id for (_, answer_id, _, _) in scores]),
+                    Answer.active == False
+                )) \
+                .all()]) if len(scores) > 0 else set()
+
+            rank = None
+            previous_score = None
+            for (answer_score_id, answer_id, score, current_rank) in scores:
+                # scores of inactive answers aren't ranked
+                if answer_id in inactive_answer_ids:
+                    new_rank = None
+                else:
+                    position += 1
+                    if score != previous_score:
+                        rank = position
+                        previous_score = score
+                    new_rank = rank
+
+                if current_rank != new_rank:
+                    ranks[answer_score_id] = new_rank
+                    changes.append({
+                        'answer_score_id': answer_score_id,
+                        'answer_score_rank': new_rank
+                    })
+
+            if changed_scores != None:
+                # first ranked score below the window
+                below = session.query(AnswerScore.rank) \
+                    .filter(and_(
+                        AnswerScore.assignment_id == assignment_id,
+                        AnswerScore.score < lowest,
+                        AnswerScore.rank != None
+                    )) \
+                    .order_by(AnswerScore.score.desc()) \
+                    .with_for_update(read=True) \
+                    .first()
+                if below != None:
+                    shift = position + 1 - below.rank
+
+        if changes:
+            session.execute(
+                table.update() \
+                    .where(table.c.id == bindparam('answer_score_id')) \
+                    .values(rank=bindparam('answer_score_rank')),
+                changes
+            )
+
+        if shift != 0:
+            session.execute(
+                table.update() \
+                    .where(and_(
+                        table.c.assignment_id == assignment_id,
+                        table.c.score < lowest,
+                        table.c.rank != None
+                    )) \
+                    .values(rank=table.c.rank + shift)
+            )
+
+        # keep the loaded scores up to date
+        if changes or shift != 0:
+            for instance in session.identity_map.values():
+                if not isinstance(instance, AnswerScore) or instance.assignment_id != assignment_id:
+                    continue
+                if instance.id in ranks:
+                    set_committed_value(instance, 'rank', ranks[instance.id])
+                elif shift != 0 and instance.score < lowest and instance.rank != None:
+                    set_committed_value(instance, 'rank', instance.rank + shift)
+
+        if cls._rank_threshold_cache_enabled():
+            # cached after the commit so other processes can't read the threshold before the scores
+            rank_display_limit = session.query(Assignment.rank_display_limit) \
+                .filter(Assignment.id == assignment_id) \
+                .scalar()
+            session.info.setdefault('answer_score_rank_thresholds', {})[assignment_id] = \
+                [rank_display_limit, _query_score_for_rank(session, assignment_id, rank_display_limit)] \
+                if rank_display_limit else None
+
+    @classmethod
+    def update_score_bounds(cls, assignment_id, changed_scores=None, session=None):
+        """
+        Updates the assignment's lowest and highest scores of active answers when a changed score
+        (previous or new value) reaches one of them. Every score is checked if changed_scores is None
+        """
+        session = session or db.session()
+        (lowest, highest) = session.query(Assignment.lowest_score, Assignment.highest_score) \
+            .filter(Assignment.id == assignment_id) \
+            .one()
+        if changed_scores != None and lowest != None and \
+                all(lowest < score < highest for score in changed_scores):
+            return
+
+        bounds = session.query(func.min(AnswerScore.score), func.max(AnswerScore.score)) \
+            .join(Answer, Answer.id == AnswerScore.answer_id) \
             .filter(and_(
-                Answer.active == True,
-                AnswerScore.assignment_id == assignment_id
+                AnswerScore.assignment_id == assignment_id,
+                Answer.active == True
             )) \
-            .order_by(AnswerScore.score.desc()) \
-            .all()
+            .one()
+        if bounds != (lowest, highest):
+            _update_score_bounds(session, Assignment, {'id': assignment_id}, bounds)
+
+    @classmethod
+    def update_relative_scores_on_commit(cls, session, assignment_id):
+        """
+        Updates the ranks of the assignment's scores and its lowest and highest scores before the session commits.
+        Needed for changes made without the orm (like bulk operations)
+        """
+        _add_pending_changes(session, 'answer_score_changes', assignment_id, None)
+
+    @classmethod
+    def _rank_threshold_cache_enabled(cls):
+        return current_app.config.get('RANK_THRESHOLD_CACHE_ENABLED', False)
+
+    @classmethod
+    def _rank_threshold_cache_key(cls, assignment_id):
+        return "answer_score_rank_threshold:" + str(assignment_id)
 
     @classmethod
     def get_score_for_rank(cls, assignment_id, rank):
-        scores = AnswerScore.get_assignment_scores(assignment_id)
-        if len(scores) < rank:
-            return None
-        else:
-            return scores[rank-1].score
+        """
+        Returns the lowest score ranked at or above rank (None if less scores are ranked)
+
+        When RANK_THRESHOLD_CACHE_ENABLED is set, the score for the assignment's rank display limit
+        is kept in the shared cache and replaced whenever the assignment's scores are committed
+        """
+        if not cls._rank_threshold_cache_enabled():
+            return cls._get_score_for_rank(assignment_id, rank)
+
+        cache_key = cls._rank_threshold_cache_key(assignment_id)
+        threshold = cache.get(cache_key)
+        if threshold != None and threshold[0] == rank:
+            return threshold[1]
+
+        score = cls._get_score_for_rank(assignment_id, rank)
+        # never overwrite a threshold cached by a commit (it may be newer than this read)
+        if threshold == None:
+            cache.add(cache_key, [rank, score], current_app.config.get('RANK_THRESHOLD_CACHE_TIMEOUT'))
+        return score
 
     @classmethod
-    def __declare_last__(cls):
-        super(cls, cls).__declare_last__()
-
-        s_alias = cls.__table__.alias()
-        cls.normalized_score = column_property(
-            select([
-                (cls.score - func.min(s_alias.c.score)) / (func.max(s_alias.c.score) - func.min(s_alias.c.score)) * 100
-            ]).
-            select_from(join(Answer, s_alias, s_alias.c.answer_id == Answer.id)).
-            where(and_(
-                Answer.active == True,
-                s_alias.c.assignment_id == cls.assignment_id,
-            ))
-        )
+    def _get_score_for_rank(cls, assignment_id, rank):
+        return _query_score_for_rank(db.session(), assignment_id, rank)
 
     __table_args__ = (
         DefaultTableMixin.default_table_args
-    )
\ No newline at end of file
+    )
+
+def normalize_score(score, lowest, highest):
+    """
+    Returns the score scaled from lowest (0) to highest (100).
+    Returns None without bounds or if they are the same
+    """
+    if score == None or lowest == None or highest == lowest:
+        return None
+    return (score - lowest) / (highest - lowest) * 100
+
+def _update_score_bounds(session, model, keys, bounds):
+    """
+    Writes the lowest and highest scores (bounds) of the model row identified by keys (column -> value)
+    and keeps the loaded row up to date
+    """
+    (lowest, highest) = bounds
+    table = model.__table__
+    session.execute(
+        table.update() \
+            .where(and_(*[table.c[column] == value for (column, value) in keys.items()])) \
+            .values(lowest_score=lowest, highest_score=highest)
+    )
+
+    for instance in session.identity_map.values():
+        if isinstance(instance, model) and \
+                all(getattr(instance, column) == value for (column, value) in keys.items()):
+            set_committed_value(instance, 'lowest_score', lowest)
+            set_committed_value(instance, 'highest_score', highest)
+
+def _query_score_for_rank(session, assignment_id, rank):
+    """
+    returns the lowest score ranked at or above rank (None if less scores are ranked)
+    """
+    # ties can rank more than rank scores, but less only if there aren't enough scores
+    (score, count) = session.query(func.min(AnswerScore.score), func.count(AnswerScore.id)) \
+        .filter(and_(
+            AnswerScore.assignment_id == assignment_id,
+            AnswerScore.rank <= rank
+        )) \
+        .one()
+    return score if count >= rank else None
+
+# ranks and score bounds are updated right before commit (after the score and answer changes are flushed).
+# Changes are collected per key as the list of changed score values (previous and new) or None
+# when any score may have changed
+
+def _add_changes(changes, key, scores):
+    if scores == None:
+        changes[key] = None
+    elif changes.get(key, []) != None:
+        changes.setdefault(key, []).extend(score for score in scores if score != None)
+
+def _add_pending_changes(session, name, key, scores):
+    _add_changes(session.info.setdefault(name, {}), key, scores)
+
+def _add_pending_score_changes(target, scores):
+    session = object_session(target)
+    if session != None:
+        _add_pending_changes(session, 'answer_score_changes', target.assignment_id, scores)
+
+@event.listens_for(Session, 'before_commit')
+def _update_pending_relative_scores(session):
+    from . import AnswerCriterionScore
+
+    # flush first since score changes are only detected while flushing (commit would flush anyways)
+    session.flush()
+    changes = session.info.pop('answer_score_changes', {})
+    criterion_changes = session.info.pop('answer_criterion_score_changes', {})
+
+    # answers added or removed from the rankings change at their score
+    for (assignment_id, answer_ids) in session.info.pop('answer_score_answer_ids', {}).items():
+        scores = session.query(AnswerScore.score) \
+            .filter(AnswerScore.answer_id.in_(answer_ids)) \
+            .all()
+        _add_changes(changes, assignment_id, [score for (score, ) in scores])
+
+    for assignment_id in sorted(changes.keys()):
+        AnswerScore.lock_assignment(assignment_id, session)
+        AnswerScore.update_score_bounds(assignment_id, changes[assignment_id], session)
+        AnswerScore.update_relative_scores(assignment_id, changes[assignment_id], session)
+
+    # changes of all criteria in an assignment are keyed by (assignment_id, None)
+    for (assignment_id, criterion_id) in sorted(criterion_changes.keys(), key=lambda key: (key[0], key[1] or 0)):
+        AnswerCriterionScore.update_score_bounds(assignment_id, criterion_id,
+            criterion_changes[(assignment_id, criterion_id)], session)
+
+@event.listens_for(Session, 'after_commit')
+def _cache_pending_rank_thresholds(session):
+    thresholds = session.info.pop('answer_score_rank_thresholds', {})
+    for assignment_id, threshold in thresholds.items():
+        cache_key = AnswerScore._rank_threshold_cache_key(assignment_id)
+        if threshold != None:
+            cache.set(cache_key, threshold, current_app.config.get('RANK_THRESHOLD_CACHE_TIMEOUT'))
+        else:
+            cache.delete(cache_key)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_relative_scores(session):
+    session.info.pop('answer_score_changes', None)
+    session.info.pop('answer_score_answer_ids', None)
+    session.info.pop('answer_criterion_score_changes', None)
+    session.info.pop('answer_score_rank_thresholds', None)
+
+@event.listens_for(AnswerScore, 'after_insert')
+@event.listens_for(AnswerScore, 'after_delete')
+def _answer_score_inserted_or_deleted(mapper, connection, target):
+    _add_pending_score_changes(target, [target.score])
+
+@event.listens_for(AnswerScore, 'after_update')
+def _answer_score_updated(mapper, connection, target):
+    history = get_history(target, 'score')
+    if history.has_changes():
+        _add_pending_score_changes(target, list(history.added) + list(history.deleted))
+
+@event.listens_for(Answer, 'after_update')
+def _answer_active_updated(mapper, connection, target):
+    session = object_session(target)
+    if session != None and get_history(target, 'active').has_changes():
+        session.info.setdefault('answer_score_answer_ids', {}) \
+            .setdefault(target.assignment_id, set()).add(target.id)
+
+@event.listens_for(Assignment, 'after_update')
+def _assignment_rank_display_limit_updated(mapper, connection, target):
+    # recalculates the cached threshold for the new limit
+    session = object_session(target)
+    if session != None and AnswerScore._rank_threshold_cache_enabled() and \
+            get_history(target, 'rank_display_limit').has_changes():
+        _add_pending_changes(session, 'answer_score_changes', target.id, [])
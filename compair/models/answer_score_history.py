@@ -0,0 +1,115 @@
+# sqlalchemy
+from sqlalchemy import func
+
+from . import *
+
+from compair.core import db
+
+class AnswerScoreHistory(DefaultTableMixin):
+    """
+    Append-only snapshots of answer scores.
+
+    A row is added for both answers every time a comparison is scored (and for every score of a
+    full recalculation) so rankings can be rebuilt as of any number of completed comparisons
+    without replaying them. Rows only hold numbers so they stay small: every snapshot records how
+    many comparisons were scored into the assignment's scores, counted up in the order comparisons
+    are scored (which isn't their id order since students complete them in any order)
+    """
+    __tablename__ = 'answer_score_history'
+
+    # table columns
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id', ondelete="CASCADE"),
+        nullable=False)
+    answer_id = db.Column(db.Integer, db.ForeignKey('answer.id', ondelete="CASCADE"),
+        nullable=False)
+    # number of completed comparisons included in the score
+    comparison_count = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    rounds = db.Column(db.Integer, nullable=False)
+
+    # relationships
+
+    # hybrid and other functions
+    @classmethod
+    def record(cls, assignment_id, comparison_count, snapshots):
+        """
+        Appends the snapshots (answer_id, score, rounds) of the assignment's scores
+        as of comparison_count completed comparisons
+        """
+        snapshots = [snapshot for snapshot in snapshots if snapshot[1] != None]
+        if len(snapshots) == 0:
+            return
+
+        db.session.execute(cls.__table__.insert(), [{
+            'assignment_id': assignment_id,
+            'answer_id': answer_id,
+            'comparison_count': comparison_count,
+            'score': score,
+            'rounds': rounds or 0
+        } for (answer_id, score, rounds) in snapshots])
+
+    @classmethod
+    def get_comparison_count(cls, assignment_id):
+        """
+        Returns the number of completed comparisons included in the latest snapshots
+        (None if there are no snapshots)
+        """
+        return db.session.query(func.max(AnswerScoreHistory.comparison_count)) \
+            .filter(AnswerScoreHistory.assignment_id == assignment_id) \
+            .scalar()
+
+    @classmethod
+    def get_next_comparison_count(cls, assignment_id):
+        """
+        Returns the comparison count of the snapshots of a comparison scored now. The assignment must be
+        locked (see AnswerScore.lock_assignment) so simultaneously scored comparisons are counted one at a time
+        """
+        from . import Comparison
+
+        comparison_count = cls.get_comparison_count(assignment_id)
+        if comparison_count != None:
+            return comparison_count + 1
+
+        # first snapshots of an assignment scored before the history was kept
+        return Comparison.query \
+            .filter_by(assignment_id=assignment_id, completed=True) \
+            .count()
+
+    @classmethod
+    def get_ranking(cls, assignment_id, comparison_count=None):
+        """
+        Returns the ranking of the active answers as of the first comparison_count completed comparisons
+        (the latest snapshots if None) as a list of (answer_id, score, rounds, rank) by rank.
+        Answers without a snapshot yet aren't ranked. Tied scores share the best rank
+        """
+        # latest snapshot of every answer
+        latest = db.session.query(func.max(AnswerScoreHistory.id).label('id')) \
+            .filter(AnswerScoreHistory.assignment_id == assignment_id)
+        if comparison_count != None:
+            latest = latest.filter(AnswerScoreHistory.comparison_count <= comparison_count)
+        latest = latest \
+            .group_by(AnswerScoreHistory.answer_id) \
+            .subquery()
+
+        snapshots = db.session.query(AnswerScoreHistory.answer_id, AnswerScoreHistory.score,
+                AnswerScoreHistory.rounds) \
+            .join(latest, latest.c.id == AnswerScoreHistory.id) \
+            .join(Answer, Answer.id == AnswerScoreHistory.answer_id) \
+            .filter(Answer.active == True) \
+            .order_by(AnswerScoreHistory.score.desc(), AnswerScoreHistory.answer_id) \
+            .all()
+
+        ranking = []
+        rank = None
+        previous_score = None
+        for (position, (answer_id, score, rounds)) in enumerate(snapshots, start=1):
+            if score != previous_score:
+                rank = position
+                previous_score = score
+            ranking.append((answer_id, score, rounds, rank))
+        return ranking
+
+    __table_args__ = (
+        db.Index('ix_answer_score_history_assignment_id_comparison_count', 'assignment_id', 'comparison_count'),
+        DefaultTableMixin.default_table_args
+    )
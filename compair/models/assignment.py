@@ -41,7 +41,11 @@ class Assignment(DefaultTableMixin, UUIDMixin, ActiveMixin, WriteTrackingMixin):
     answer_grade_weight = db.Column(db.Integer, default=1, nullable=False)
     comparison_grade_weight = db.Column(db.Integer, default=1, nullable=False)
     self_evaluation_grade_weight = db.Column(db.Integer, default=1, nullable=False)
+    course_grade_weight = db.Column(db.Integer, default=1, nullable=False)
     peer_feedback_prompt = db.Column(db.Text)
+    # lowest and highest scores of the active answers (answer scores are normalized between them)
+    lowest_score = db.Column(db.Float, nullable=True)
+    highest_score = db.Column(db.Float, nullable=True)
 
     # relationships
     # user via User Model
@@ -114,6 +118,13 @@ class Assignment(DefaultTableMixin, UUIDMixin, ActiveMixin, WriteTrackingMixin):
             ) \
             .count()
 
+    def normalize_score(self, score):
+        """
+        Returns the answer score scaled from the lowest (0) to the highest (100) score of the active answers
+        """
+        from .answer_score import normalize_score
+        return normalize_score(score, self.lowest_score, self.highest_score)
+
     def clear_lti_links(self):
         for lti_resource_link in self.lti_resource_links.all():
             lti_resource_link.compair_assignment_id = None
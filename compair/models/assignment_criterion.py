@@ -17,6 +17,9 @@ class AssignmentCriterion(DefaultTableMixin, ActiveMixin, WriteTrackingMixin):
         nullable=False)
     position = db.Column(db.Integer)
     weight = db.Column(db.Integer, default=1, nullable=False)
+    # lowest and highest scores of the criterion (answer criterion scores are normalized between them)
+    lowest_score = db.Column(db.Float, nullable=True)
+    highest_score = db.Column(db.Float, nullable=True)
 
     # relationships
     # assignment many-to-many criterion with association assignment_criteria
@@ -5,7 +5,7 @@ import pytz
 # sqlalchemy
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import column_property
-from sqlalchemy import func, select, and_, or_
+from sqlalchemy import func, select, and_, or_, inspect
 from sqlalchemy.ext.hybrid import hybrid_property
 
 from . import *
@@ -55,21 +55,24 @@ class AssignmentGrade(DefaultTableMixin, WriteTrackingMixin):
 
     @classmethod
     def calculate_grade(cls, assignment, user):
-        from . import Answer, Comparison, CourseRole, \
-            AnswerComment, AnswerCommentType, LTIOutcome
-
-        user_is_student = False
-        group_id = None
-
-        for course_user in assignment.course.user_courses:
-            if course_user.user_id != user.id:
-                continue
-            user_is_student = course_user.course_role == CourseRole.student
-            group_id = course_user.group_id
-            break
+        """
+        Calculates the user's assignment grade and applies the change to their course grade
+        (see CourseGrade.update_assignment_grade) so the course grade doesn't need to be recalculated
+        """
+        from . import Answer, Comparison, UserCourse, CourseRole, \
+            AnswerComment, AnswerCommentType, LTIOutcome, CourseGrade
+
+        course_user = UserCourse.query \
+            .filter_by(
+                course_id=assignment.course_id,
+                user_id=user.id,
+                course_role=CourseRole.student
+            ) \
+            .one_or_none()
 
-        if not user_is_student:
+        if course_user == None:
             return
+        group_id = course_user.group_id
 
         user_answer_count = Answer.query \
             .filter_by(
@@ -120,23 +123,43 @@ class AssignmentGrade(DefaultTableMixin, WriteTrackingMixin):
         grade = _calculate_assignment_grade(assignment,
             answer_count, comparison_count, self_evaluation_count)
 
-        assignment_grade = AssignmentGrade.get_user_assignment_grade(assignment, user)
+        # lock the course grade before reading the assignment grade so simultaneous recalculations of the
+        # student's grade are applied one at a time, each against the assignment grade committed by the
+        # previous one (the locked grade is reloaded over any already in the session)
+        course_grade = CourseGrade.lock_user_course_grade(assignment.course_id, user.id)
+        assignment_grade = AssignmentGrade.query \
+            .filter_by(
+                user_id=user.id,
+                assignment_id=assignment.id
+            ) \
+            .populate_existing() \
+            .with_for_update() \
+            .one_or_none()
         if assignment_grade == None:
             assignment_grade = AssignmentGrade(
                 user_id=user.id,
                 assignment_id=assignment.id
             )
+            previous_grade = None
+        else:
+            previous_grade = assignment_grade.grade
+
+        if previous_grade != None and previous_grade == grade:
+            # release the locks
+            db.session.commit()
+            return
 
         assignment_grade.grade = grade
         db.session.add(assignment_grade)
+        CourseGrade.update_assignment_grade(assignment.course, course_grade, user.id, assignment, previous_grade, grade)
         db.session.commit()
 
         LTIOutcome.update_assignment_user_grade(assignment, user.id)
+        LTIOutcome.update_course_user_grade(assignment.course, user.id)
 
     @classmethod
     def calculate_group_grade(cls, assignment, group):
-        from . import Answer, Comparison, CourseRole, \
-            AnswerComment, AnswerCommentType, LTIOutcome
+        from . import CourseRole, LTIOutcome
 
         student_ids = [course_user.user_id
             for course_user in assignment.course.user_courses
@@ -147,139 +170,109 @@ class AssignmentGrade(DefaultTableMixin, WriteTrackingMixin):
         if len(student_ids) == 0:
             return
 
-        user_answer_counts = Answer.query \
-            .with_entities(
-                Answer.user_id,
-                func.count(Answer.user_id).label('answer_count')
-            ) \
-            .filter_by(
-                assignment_id=assignment.id,
-                active=True,
-                practice=False,
-                draft=False
-            ) \
-            .filter(
-                Answer.user_id.in_(student_ids)
-            ) \
-            .group_by(Answer.user_id) \
-            .all()
-
-        group_answer_counts = Answer.query \
-            .with_entities(
-                Answer.group_id,
-                func.count(Answer.group_id).label('answer_count')
-            ) \
-            .filter_by(
-                assignment_id=assignment.id,
-                active=True,
-                practice=False,
-                draft=False,
-                group_id=group.id
-            ) \
-            .group_by(Answer.group_id) \
-            .all()
-
-        comparison_counts = Comparison.query \
-            .with_entities(
-                Comparison.user_id,
-                func.count(Comparison.user_id).label('comparison_count')
-            ) \
-            .filter_by(
-                assignment_id=assignment.id,
-                completed=True
-            ) \
-            .filter(
-                Comparison.user_id.in_(student_ids)
-            ) \
-            .group_by(Comparison.user_id) \
-            .all()
-
-        self_evaluation_counts = AnswerComment.query \
-            .with_entities(
-                AnswerComment.user_id,
-                func.count(AnswerComment.user_id).label('self_evaluation_count')
-            ) \
-            .join("answer") \
-            .filter(and_(
-                AnswerComment.active == True,
-                AnswerComment.comment_type == AnswerCommentType.self_evaluation,
-                AnswerComment.draft == False,
-                Answer.assignment_id == assignment.id,
-                Answer.active == True,
-                Answer.practice == False,
-                Answer.draft == False,
-                AnswerComment.user_id.in_(student_ids)
-            )) \
-            .group_by(AnswerComment.user_id) \
-            .all()
-
-        assignment_grades = AssignmentGrade.get_assignment_grades(assignment)
-        new_assignment_grades = []
-        for student_id in student_ids:
-            user_answer_count = next((result.answer_count for result in user_answer_counts
-                if result.user_id == student_id
-            ), 0)
-
-            group_answer_count = next((result.answer_count for result in group_answer_counts
-                if result.group_id == group.id
-            ), 0)
-
-            answer_count = user_answer_count + group_answer_count
-
-            comparison_count = next((result.comparison_count for result in comparison_counts
-                if result.user_id == student_id
-            ), 0)
-
-            self_evaluation_count = next((result.self_evaluation_count for result in self_evaluation_counts
-                if result.user_id == student_id
-            ), 0)
-
-            grade = _calculate_assignment_grade(assignment,
-                answer_count, comparison_count, self_evaluation_count)
-
-            assignment_grade = next((assignment_grade for assignment_grade in assignment_grades
-                if assignment_grade.user_id == student_id
-            ), None)
-
-            if assignment_grade == None:
-                assignment_grade = AssignmentGrade(
-                    user_id=student_id,
-                    assignment_id=assignment.id
-                )
-                new_assignment_grades.append(assignment_grade)
-
-            assignment_grade.grade = grade
-
-        db.session.add_all(assignment_grades + new_assignment_grades)
+        student_groups = dict((student_id, group.id) for student_id in student_ids)
+        AssignmentGrade._calculate_students_grades(assignment, student_groups, restrict=True)
         db.session.commit()
 
         LTIOutcome.update_assignment_users_grades(assignment, student_ids)
 
     @classmethod
     def calculate_grades(cls, assignment):
-        from . import Answer, CourseRole, Comparison, \
-            AnswerComment, AnswerCommentType, LTIOutcome
+        from . import CourseRole, LTIOutcome
 
-        student_ids = []
-        group_ids = set()
-
-        user_groups = {}
+        student_groups = {}
         for course_user in assignment.course.user_courses:
             if course_user.course_role == CourseRole.student:
-                student_ids.append(course_user.user_id)
-                if course_user.group_id:
-                    group_ids.add(course_user.group_id)
-                    user_groups[course_user.user_id] = course_user.group_id
-        group_ids = list(group_ids)
+                student_groups[course_user.user_id] = course_user.group_id
 
         # skip if there aren't any students
-        if len(student_ids) == 0:
+        if len(student_groups) == 0:
             AssignmentGrade.query \
                 .filter_by(assignment_id=assignment.id) \
                 .delete()
             LTIOutcome.update_assignment_grades(assignment)
             return
 
+        AssignmentGrade._calculate_students_grades(assignment, student_groups)
+        db.session.commit()
+
+        LTIOutcome.update_assignment_grades(assignment)
+
+    @classmethod
+    def calculate_users_grades(cls, assignment, user_ids):
+        """
+        Calculates the grades of the users that are students of the assignment's course
+        """
+        from . import UserCourse, CourseRole, LTIOutcome
+
+        student_groups = dict(UserCourse.query \
+            .with_entities(UserCourse.user_id, UserCourse.group_id) \
+            .filter(and_(
+                UserCourse.course_id == assignment.course_id,
+                UserCourse.course_role == CourseRole.student,
+                UserCourse.user_id.in_(user_ids)
+            )) \
+            .all())
+
+        # skip if there aren't any students
+        if len(student_groups) == 0:
+            return
+
+        AssignmentGrade._calculate_students_grades(assignment, student_groups, restrict=True)
+        db.session.commit()
+
+        LTIOutcome.update_assignment_users_grades(assignment, list(student_groups.keys()))
+
+    @classmethod
+    def get_calculated_grades(cls, assignment):
+        """
+        Returns the grades of every student of the assignment's course (dictionary user id -> grade)
+        without saving them
+        """
+        from . import CourseRole
+
+        student_groups = {}
+        for course_user in assignment.course.user_courses:
+            if course_user.course_role == CourseRole.student:
+                student_groups[course_user.user_id] = course_user.group_id
+
+        if len(student_groups) == 0:
+            return {}
+
+        return AssignmentGrade._get_students_grades(assignment, student_groups)
+
+    @classmethod
+    def _calculate_students_grades(cls, assignment, student_groups, restrict=False):
+        """
+        Calculates and saves (without committing) the grades of the students (dictionary user id -> group id)
+        with one bulk update and one bulk insert (see _get_students_grades)
+        """
+        grades = AssignmentGrade._get_students_grades(assignment, student_groups, restrict)
+
+        current_grades = AssignmentGrade.query \
+            .with_entities(AssignmentGrade.user_id, AssignmentGrade.id, AssignmentGrade.grade) \
+            .filter_by(assignment_id=assignment.id)
+        if restrict:
+            current_grades = current_grades.filter(AssignmentGrade.user_id.in_(list(student_groups.keys())))
+        current_grades = dict((user_id, (assignment_grade_id, grade))
+            for (user_id, assignment_grade_id, grade) in current_grades.all())
+
+        _save_grades(AssignmentGrade, grades, current_grades,
+            lambda user_id: {'user_id': user_id, 'assignment_id': assignment.id})
+
+    @classmethod
+    def _get_students_grades(cls, assignment, student_groups, restrict=False):
+        """
+        Returns the grades of the students (dictionary user id -> group id) as a dictionary user id -> grade.
+        Every count is a single aggregate query indexed by user id (or group id).
+        Queries are limited to the students if restrict is set (for small sets of students),
+        otherwise they cover the whole assignment
+        """
+        from . import Answer, Comparison, ComparisonExample, AnswerComment, AnswerCommentType
+
+        student_ids = list(student_groups.keys())
+        group_ids = list(set(group_id for group_id in student_groups.values() if group_id))
+
         user_answer_counts = Answer.query \
             .with_entities(
                 Answer.user_id,
@@ -291,13 +284,14 @@ class AssignmentGrade(DefaultTableMixin, WriteTrackingMixin):
                 practice=False,
                 draft=False
             ) \
-            .filter(
-                Answer.user_id.in_(student_ids)
-            ) \
+            .filter(Answer.user_id != None)
+        if restrict:
+            user_answer_counts = user_answer_counts.filter(Answer.user_id.in_(student_ids))
+        user_answer_counts = dict(user_answer_counts \
             .group_by(Answer.user_id) \
-            .all()
+            .all())
 
-        group_answer_counts = []
+        group_answer_counts = {}
         if len(group_ids) > 0:
             group_answer_counts = Answer.query \
                 .with_entities(
@@ -310,11 +304,12 @@ class AssignmentGrade(DefaultTableMixin, WriteTrackingMixin):
                     practice=False,
                     draft=False
                 ) \
-                .filter(
-                    Answer.group_id.in_(group_ids)
-                ) \
+                .filter(Answer.group_id != None)
+            if restrict:
+                group_answer_counts = group_answer_counts.filter(Answer.group_id.in_(group_ids))
+            group_answer_counts = dict(group_answer_counts \
                 .group_by(Answer.group_id) \
-                .all()
+                .all())
 
         comparison_counts = Comparison.query \
             .with_entities(
@@ -324,12 +319,12 @@ class AssignmentGrade(DefaultTableMixin, WriteTrackingMixin):
             .filter_by(
                 assignment_id=assignment.id,
                 completed=True
-            ) \
-            .filter(
-                Comparison.user_id.in_(student_ids)
-            ) \
+            )
+        if restrict:
+            comparison_counts = comparison_counts.filter(Comparison.user_id.in_(student_ids))
+        comparison_counts = dict(comparison_counts \
             .group_by(Comparison.user_id) \
-            .all()
+            .all())
 
         self_evaluation_counts = AnswerComment.query \
             .with_entities(
@@ -344,60 +339,73 @@ class AssignmentGrade(DefaultTableMixin, WriteTrackingMixin):
                 Answer.assignment_id == assignment.id,
                 Answer.active == True,
                 Answer.practice == False,
-                Answer.draft == False,
-                AnswerComment.user_id.in_(student_ids)
-            )) \
+                Answer.draft == False
+            ))
+        if restrict:
+            self_evaluation_counts = self_evaluation_counts.filter(AnswerComment.user_id.in_(student_ids))
+        self_evaluation_counts = dict(self_evaluation_counts \
             .group_by(AnswerComment.user_id) \
-            .all()
+            .all())
 
-        assignment_grades = AssignmentGrade.get_assignment_grades(assignment)
-        new_assignment_grades = []
-        for student_id in student_ids:
-            user_answer_count = next((result.answer_count for result in user_answer_counts
-                if result.user_id == student_id
-            ), 0)
+        # counted directly so the other (expensive) deferred counts of the assignment aren't loaded
+        total_comparisons_required = assignment.number_of_comparisons + ComparisonExample.query \
+            .filter_by(
+                assignment_id=assignment.id,
+                active=True
+            ) \
+            .count()
 
-            group_id = user_groups.get(student_id)
-            group_answer_count = 0
+        grades = {}
+        for student_id, group_id in student_groups.items():
+            answer_count = user_answer_counts.get(student_id, 0)
             if group_id:
-                group_answer_count = next((result.answer_count for result in group_answer_counts
-                    if result.group_id == group_id
-                ), 0)
-
-            answer_count = user_answer_count + group_answer_count
-
-            comparison_count = next((result.comparison_count for result in comparison_counts
-                if result.user_id == student_id
-            ), 0)
-
-            self_evaluation_count = next((result.self_evaluation_count for result in self_evaluation_counts
-                if result.user_id == student_id
-            ), 0)
-
-            grade = _calculate_assignment_grade(assignment,
-                answer_count, comparison_count, self_evaluation_count)
-
-            assignment_grade = next((assignment_grade for assignment_grade in assignment_grades
-                if assignment_grade.user_id == student_id
-            ), None)
-
-            if assignment_grade == None:
-                assignment_grade = AssignmentGrade(
-                    user_id=student_id,
-                    assignment_id=assignment.id
-                )
-                new_assignment_grades.append(assignment_grade)
-
-            assignment_grade.grade = grade
-
-        db.session.add_all(assignment_grades + new_assignment_grades)
-        db.session.commit()
-
-        LTIOutcome.update_assignment_grades(assignment)
-
-def _calculate_assignment_grade(assignment, answer_count, comparison_count, self_evaulation_count):
+                answer_count += group_answer_counts.get(group_id, 0)
+
+            grades[student_id] = _calculate_assignment_grade(assignment, answer_count,
+                comparison_counts.get(student_id, 0), self_evaluation_counts.get(student_id, 0),
+                total_comparisons_required)
+
+        return grades
+
+def _save_grades(model, grades, current_grades, new_grade_values):
+    """
+    Saves the grades (dictionary user id -> grade) with one bulk update and one bulk insert.
+    Grades that didn't change aren't updated
+    :param current_grades: dictionary user id -> (id, grade) of the existing grade rows
+    :param new_grade_values: returns the identifying values of a new grade row for a user id
+    """
+    updates = []
+    inserts = []
+    for user_id, grade in grades.items():
+        (grade_id, current_grade) = current_grades.get(user_id, (None, None))
+        if grade_id != None:
+            if grade != current_grade:
+                values = model.bulk_write_tracking_values()
+                values.update({'id': grade_id, 'grade': grade})
+                updates.append(values)
+        else:
+            values = model.bulk_write_tracking_values(insert=True)
+            values.update(new_grade_values(user_id))
+            values['grade'] = grade
+            inserts.append(values)
+
+    db.session.bulk_update_mappings(model, updates)
+    db.session.bulk_insert_mappings(model, inserts)
+
+    # bulk updates skip the identity map and the session doesn't expire on commit
+    # so grades that are already loaded must be refreshed
+    mapper = inspect(model)
+    for values in updates:
+        grade = db.session.identity_map.get(mapper.identity_key_from_primary_key([values['id']]))
+        if grade != None:
+            db.session.expire(grade)
+
+def _calculate_assignment_grade(assignment, answer_count, comparison_count, self_evaulation_count,
+        total_comparisons_required=None):
     grade = 0.0
     total_grade_weight = 0.0
+    if total_comparisons_required == None:
+        total_comparisons_required = assignment.total_comparisons_required
 
     # calculate answer portion of grade
     answer_grade = 1.0 if answer_count >= 1 else 0.0
@@ -405,9 +413,9 @@ def _calculate_assignment_grade(assignment, answer_count, comparison_count, self
     total_grade_weight += float(assignment.answer_grade_weight)
 
     # calculate comparison portion of grade
-    if comparison_count > assignment.total_comparisons_required:
-        comparison_count = assignment.total_comparisons_required
-    comparison_grade = float(comparison_count) / float(assignment.total_comparisons_required) if assignment.number_of_comparisons > 0 else 1.0
+    if comparison_count > total_comparisons_required:
+        comparison_count = total_comparisons_required
+    comparison_grade = float(comparison_count) / float(total_comparisons_required) if assignment.number_of_comparisons > 0 else 1.0
     grade += comparison_grade * float(assignment.comparison_grade_weight)
     total_grade_weight += float(assignment.comparison_grade_weight)
 
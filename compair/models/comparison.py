@@ -6,11 +6,17 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from flask import current_app
 from sqlalchemy_enum34 import EnumType
 
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 from . import *
 from importlib import import_module
 
 from compair.core import db
 from compair.algorithms import ScoredObject, ComparisonPair, ComparisonWinner
+from compair.algorithms.opponent_stats import add_opponent_result, tally_opponent_stats, \
+    dump_opponent_stats
 from compair.algorithms.pair import generate_pair
 from compair.algorithms.score import calculate_score, calculate_score_1vs1
 
@@ -106,95 +112,33 @@ class Comparison(DefaultTableMixin, UUIDMixin, AttemptMixin, WriteTrackingMixin)
     @classmethod
     def _get_new_comparison_pair(cls, course_id, assignment_id, user_id, group_id,
                                 pairing_algorithm, comparisons):
-        from . import Assignment, UserCourse, CourseRole, Answer, AnswerScore, \
-            PairingAlgorithm, AnswerCriterionScore, AssignmentCriterion, Group
-
-        # exclude current user and those without a proper role.
-        # note that sys admin (not enrolled in the course and thus no course role) can create answers.
-        # they are considered eligible
-        ineligibles = UserCourse.query \
-            .with_entities(UserCourse.user_id) \
-            .filter(and_(
-                UserCourse.course_id == course_id,
-                UserCourse.course_role == CourseRole.dropped
-            )) \
-            .all()
+        from . import PairingAlgorithm, PairingSnapshot
 
-        ineligible_user_ids = [ineligible.user_id for ineligible in ineligibles]
-        ineligible_user_ids.append(user_id)
+        # answers, scores, rounds and criterion scores are shared by every user of the assignment
+        snapshot = PairingSnapshot.get(course_id, assignment_id)
 
-        query = Answer.query \
-            .with_entities(Answer, AnswerScore.score) \
-            .outerjoin(AnswerScore, AnswerScore.answer_id == Answer.id) \
-            .filter(and_(
-                or_(
-                    ~Answer.user_id.in_(ineligible_user_ids),
-                    Answer.user_id == None # don't filter out group answers
-                ),
-                Answer.assignment_id == assignment_id,
-                Answer.active == True,
-                Answer.practice == False,
-                Answer.draft == False,
-                Answer.comparable == True
-            ))
-
-        if group_id:
-            query = query.filter(or_(Answer.group_id != group_id, Answer.group_id == None))
-
-        answers_with_score = query.all()
-
-        scored_objects = []
-        for answer_with_score in answers_with_score:
-            scored_objects.append(ScoredObject(
-                key=answer_with_score.Answer.id,
-                score=answer_with_score.score,
-                rounds=answer_with_score.Answer.round,
-                variable1=None, variable2=None,
-                wins=None, loses=None, opponents=None
-            ))
+        # exclude current user's and group's answers
+        scored_objects = snapshot.scored_objects(exclude_user_id=user_id, exclude_group_id=group_id)
 
         comparison_pairs = [comparison.convert_to_comparison_pair() for comparison in comparisons]
 
         # adaptive min delta algo requires extra criterion specific parameters
         if pairing_algorithm == PairingAlgorithm.adaptive_min_delta:
-            # retrieve extra criterion score data
-            answer_criterion_scores = AnswerCriterionScore.query \
-                .with_entities(AnswerCriterionScore.answer_id,
-                    AnswerCriterionScore.criterion_id, AnswerCriterionScore.score) \
-                .join(Answer) \
-                .filter(and_(
-                    Answer.user_id.notin_(ineligible_user_ids),
-                    Answer.assignment_id == assignment_id,
-                    Answer.active == True,
-                    Answer.practice == False,
-                    Answer.draft == False
-                )) \
-                .all()
-
-            assignment_criterion_weights = AssignmentCriterion.query \
-                .with_entities(AssignmentCriterion.criterion_id, AssignmentCriterion.weight) \
-                .filter(and_(
-                    AssignmentCriterion.assignment_id == assignment_id,
-                    AssignmentCriterion.active == True
-                )) \
-                .all()
-
-            criterion_scores = {}
-            for criterion_score in answer_criterion_scores:
-                scores = criterion_scores.setdefault(criterion_score.answer_id, {})
-                scores[criterion_score.criterion_id] = criterion_score.score
-
-            criterion_weights = {}
-            for the_weight in assignment_criterion_weights:
-                criterion_weights[the_weight.criterion_id] = \
-                    the_weight.weight
-
             comparison_pair = generate_pair(
                 package_name=pairing_algorithm.value,
                 scored_objects=scored_objects,
                 comparison_pairs=comparison_pairs,
-                criterion_scores=criterion_scores,
-                criterion_weights=criterion_weights,
+                criterion_scores=snapshot.criterion_scores,
+                criterion_weights=snapshot.criterion_weights,
+                log=current_app.logger
+            )
+        # adaptive matching serves the round matchings shared by every user when they are cached
+        elif pairing_algorithm == PairingAlgorithm.adaptive_matching:
+            comparison_pair = generate_pair(
+                package_name=pairing_algorithm.value,
+                scored_objects=scored_objects,
+                comparison_pairs=comparison_pairs,
+                round_matchings=snapshot.round_matchings(),
                 log=current_app.logger
             )
         else:
@@ -210,7 +154,28 @@ class Comparison(DefaultTableMixin, UUIDMixin, AttemptMixin, WriteTrackingMixin)
     @classmethod
     def create_new_comparison(cls, assignment_id, user_id, skip_comparison_examples):
         from . import Assignment, ComparisonExample, ComparisonCriterion, \
-            UserCourse, CourseRole
+            UserCourse, CourseRole, User, PairingSnapshot, ComparisonPairQueue
+
+        # lock the user's row so simultaneous requests by the same user are handled one at a time
+        User.query \
+            .with_entities(User.id) \
+            .filter_by(id=user_id) \
+            .with_for_update() \
+            .first()
+
+        # another request may have created a comparison while waiting for the lock
+        # (locking read so the latest committed comparisons are seen)
+        incomplete_comparison = Comparison.query \
+            .filter_by(
+                user_id=user_id,
+                assignment_id=assignment_id,
+                completed=False
+            ) \
+            .with_for_update() \
+            .first()
+        if incomplete_comparison:
+            db.session.commit()
+            return incomplete_comparison
 
         # get all comparisons for the user
         comparisons = Comparison.query \
@@ -268,18 +233,25 @@ class Comparison(DefaultTableMixin, UUIDMixin, AttemptMixin, WriteTrackingMixin)
                     break
 
         if not is_comparison_example_set:
-            comparison_pair = Comparison._get_new_comparison_pair(assignment.course_id,
-                assignment_id, user_id, group_id, pairing_algorithm, comparisons)
+            comparison_pair = None
+            if ComparisonPairQueue.enabled() and ComparisonPairQueue.supports(pairing_algorithm):
+                comparison_pair = ComparisonPairQueue.pop(assignment, user_id, group_id, comparisons)
+
+            # fallback to the pairing algorithm if no queued pair is valid for the user
+            if comparison_pair == None:
+                comparison_pair = Comparison._get_new_comparison_pair(assignment.course_id,
+                    assignment_id, user_id, group_id, pairing_algorithm, comparisons)
             answer1 = Answer.query.get(comparison_pair.key1)
             answer2 = Answer.query.get(comparison_pair.key2)
             round_compared = min(answer1.round+1, answer2.round+1)
 
-            # update round counters
-            answers = [answer1, answer2]
-            for answer in answers:
-                answer._write_tracking_enabled = False
-                answer.round += 1
-                db.session.add(answer)
+            # update round counters atomically so concurrent requests don't lose increments
+            Answer.query \
+                .filter(Answer.id.in_([answer1.id, answer2.id])) \
+                .update({Answer.round: Answer.round + 1}, synchronize_session=False)
+            for answer in [answer1, answer2]:
+                db.session.expire(answer, ['round'])
+                PairingSnapshot.patch_round_on_commit(db.session(), assignment_id, answer.id)
 
         comparison = Comparison(
             assignment_id=assignment_id,
@@ -307,41 +279,29 @@ class Comparison(DefaultTableMixin, UUIDMixin, AttemptMixin, WriteTrackingMixin)
 
     @classmethod
     def update_scores_1vs1(cls, comparison):
-        from . import AnswerScore, AnswerCriterionScore, \
+        """
+        Updates the overall and criterion scores of the two compared answers.
+        Only the score rows of the two answers are read (and locked until the commit): the stored
+        counts and opponent stats are counted up with the new comparison. Previous comparisons are only queried for answers
+        scored before the opponent stats were stored
+        """
+        from . import AnswerScore, AnswerCriterionScore, AnswerScoreHistory, \
             ComparisonCriterion, ScoringAlgorithm
 
         assignment = comparison.assignment
         answer1_id = comparison.answer1_id
         answer2_id = comparison.answer2_id
 
-        # get all other comparisons for the answers not including the ones being calculated
-        other_comparisons = Comparison.query \
-            .options(load_only('winner', 'answer1_id', 'answer2_id')) \
-            .filter(and_(
-                Comparison.assignment_id == assignment.id,
-                Comparison.id != comparison.id,
-                or_(
-                    Comparison.answer1_id.in_([answer1_id, answer2_id]),
-                    Comparison.answer2_id.in_([answer1_id, answer2_id])
-                )
-            )) \
-            .all()
+        # lock the assignment first like every transaction changing its scores (see AnswerScore.lock_assignment)
+        AnswerScore.lock_assignment(assignment.id)
 
+        # lock the score rows so simultaneous comparisons of the same answers are counted one at a time
+        # (rows locked in id order to avoid deadlocks, locked values reloaded over any already in the session)
         scores = AnswerScore.query \
             .filter( AnswerScore.answer_id.in_([answer1_id, answer2_id]) ) \
-            .all()
-
-        # get all other criterion comparisons for the answers not including the ones being calculated
-        other_criterion_comparisons = ComparisonCriterion.query \
-            .join("comparison") \
-            .filter(and_(
-                Comparison.assignment_id == assignment.id,
-                Comparison.id != comparison.id,
-                or_(
-                    Comparison.answer1_id.in_([answer1_id, answer2_id]),
-                    Comparison.answer2_id.in_([answer1_id, answer2_id])
-                )
-            )) \
+            .order_by(AnswerScore.id) \
+            .populate_existing() \
+            .with_for_update() \
             .all()
 
         criteria_scores = AnswerCriterionScore.query \
@@ -349,9 +309,19 @@ class Comparison(DefaultTableMixin, UUIDMixin, AttemptMixin, WriteTrackingMixin)
                 AnswerCriterionScore.assignment_id == assignment.id,
                 AnswerCriterionScore.answer_id.in_([answer1_id, answer2_id])
             )) \
+            .order_by(AnswerCriterionScore.id) \
+            .populate_existing() \
+            .with_for_update() \
             .all()
 
-        #update answer criterion scores
+        score1 = next((score for score in scores if score.answer_id == answer1_id),
+            AnswerScore(assignment_id=assignment.id, answer_id=answer1_id)
+        )
+        score2 = next((score for score in scores if score.answer_id == answer2_id),
+            AnswerScore(assignment_id=assignment.id, answer_id=answer2_id)
+        )
+        updated_scores = [score1, score2]
+
         updated_criteria_scores = []
         for comparison_criterion in comparison.comparison_criteria:
             criterion_id = comparison_criterion.criterion_id
@@ -360,178 +330,309 @@ class Comparison(DefaultTableMixin, UUIDMixin, AttemptMixin, WriteTrackingMixin)
                 if criterion_score.answer_id == answer1_id and criterion_score.criterion_id == criterion_id),
                 AnswerCriterionScore(assignment_id=assignment.id, answer_id=answer1_id, criterion_id=criterion_id)
             )
-            updated_criteria_scores.append(criterion_score1)
-            key1_scored_object = criterion_score1.convert_to_scored_object()
-
             criterion_score2 = next((criterion_score for criterion_score in criteria_scores
                 if criterion_score.answer_id == answer2_id and criterion_score.criterion_id == criterion_id),
                 AnswerCriterionScore(assignment_id=assignment.id, answer_id=answer2_id, criterion_id=criterion_id)
             )
-            updated_criteria_scores.append(criterion_score2)
-            key2_scored_object = criterion_score2.convert_to_scored_object()
-
-            criterion_result_1, criterion_result_2 = calculate_score_1vs1(
-                package_name=assignment.scoring_algorithm.value,
-                key1_scored_object=key1_scored_object,
-                key2_scored_object=key2_scored_object,
-                winner=comparison_criterion.comparison_pair_winner(),
-                other_comparison_pairs=[
-                    cc.convert_to_comparison_pair() for cc in other_criterion_comparisons if cc.criterion_id == criterion_id
-                ],
-                log=current_app.logger
-            )
+            updated_criteria_scores.extend([criterion_score1, criterion_score2])
+
+        # scores stored before opponent stats were added need all previous comparisons once
+        recount = any(score.id != None and score.opponent_stats == None
+            for score in updated_scores + updated_criteria_scores)
+
+        other_comparisons = []
+        other_criterion_comparisons = []
+        if recount:
+            # get all other comparisons for the answers not including the ones being calculated
+            other_comparisons = Comparison.query \
+                .options(load_only('winner', 'answer1_id', 'answer2_id')) \
+                .filter(and_(
+                    Comparison.assignment_id == assignment.id,
+                    Comparison.id != comparison.id,
+                    Comparison.completed == True,
+                    or_(
+                        Comparison.answer1_id.in_([answer1_id, answer2_id]),
+                        Comparison.answer2_id.in_([answer1_id, answer2_id])
+                    )
+                )) \
+                .all()
 
-            for score, result in [(criterion_score1, criterion_result_1), (criterion_score2, criterion_result_2)]:
-                score.score = result.score
-                score.variable1 = result.variable1
-                score.variable2 = result.variable2
-                score.rounds = result.rounds
-                score.wins = result.wins
-                score.loses = result.loses
-                score.opponents = result.opponents
+            # get all other criterion comparisons for the answers not including the ones being calculated
+            other_criterion_comparisons = ComparisonCriterion.query \
+                .join("comparison") \
+                .filter(and_(
+                    Comparison.assignment_id == assignment.id,
+                    Comparison.id != comparison.id,
+                    Comparison.completed == True,
+                    or_(
+                        Comparison.answer1_id.in_([answer1_id, answer2_id]),
+                        Comparison.answer2_id.in_([answer1_id, answer2_id])
+                    )
+                )) \
+                .all()
 
-        updated_scores = []
-        score1 = next((score for score in scores if score.answer_id == answer1_id),
-            AnswerScore(assignment_id=assignment.id, answer_id=answer1_id)
-        )
-        updated_scores.append(score1)
-        key1_scored_object = score1.convert_to_scored_object()
-        score2 = next((score for score in scores if score.answer_id == answer2_id),
-            AnswerScore(assignment_id=assignment.id, answer_id=answer2_id)
-        )
-        updated_scores.append(score2)
-        key2_scored_object = score2.convert_to_scored_object()
-
-        result_1, result_2 = calculate_score_1vs1(
-            package_name=assignment.scoring_algorithm.value,
-            key1_scored_object=key1_scored_object,
-            key2_scored_object=key2_scored_object,
-            winner=comparison.comparison_pair_winner(),
-            other_comparison_pairs=[c.convert_to_comparison_pair() for c in other_comparisons],
-            log=current_app.logger
-        )
+        #update answer criterion scores
+        for index, comparison_criterion in enumerate(comparison.comparison_criteria):
+            criterion_id = comparison_criterion.criterion_id
+            criterion_score1 = updated_criteria_scores[index * 2]
+            criterion_score2 = updated_criteria_scores[index * 2 + 1]
 
-        for score, result in [(score1, result_1), (score2, result_2)]:
-            score.score = result.score
-            score.variable1 = result.variable1
-            score.variable2 = result.variable2
-            score.rounds = result.rounds
-            score.wins = result.wins
-            score.loses = result.loses
-            score.opponents = result.opponents
+            _update_scores_1vs1(assignment, criterion_score1, criterion_score2,
+                comparison_criterion.comparison_pair_winner(),
+                [cc.convert_to_comparison_pair() for cc in other_criterion_comparisons if cc.criterion_id == criterion_id],
+                recount)
+
+        _update_scores_1vs1(assignment, score1, score2,
+            comparison.comparison_pair_winner(),
+            [c.convert_to_comparison_pair() for c in other_comparisons],
+            recount)
 
         db.session.add_all(updated_criteria_scores)
         db.session.add_all(updated_scores)
+        AnswerScoreHistory.record(assignment.id, AnswerScoreHistory.get_next_comparison_count(assignment.id),
+            [(score.answer_id, score.score, score.rounds) for score in updated_scores])
         db.session.commit()
 
         return updated_scores
 
     @classmethod
-    def calculate_scores(cls, assignment_id):
-        from . import AnswerScore, AnswerCriterionScore, \
-            AssignmentCriterion, ScoringAlgorithm
-
-        assignment = Assignment.get(assignment_id)
+    def calculate_scores(cls, assignment_id, dry_run=False):
+        """
+        Recalculates all answer scores and answer criterion scores of the assignment.
+        Comparisons are streamed with one column only query and grouped by criterion in a single pass,
+        the overall and criteria scores are calculated in parallel processes for large assignments,
+        and the results are written with bulk updates and inserts (unless dry_run is set).
+        Returns the new scores (criterion id (None for the overall scores) -> answer id -> ScoredObject)
+        """
+        from . import AnswerScore, AnswerCriterionScore, AnswerScoreHistory, AssignmentCriterion, \
+            ComparisonCriterion, PairingSnapshot, WinningAnswer, Assignment
 
-        # get all comparisons for this assignment and only load the data we need
-        comparisons = Comparison.query \
-            .filter(Comparison.assignment_id == assignment_id) \
-            .all()
+        assignment = Assignment.query.get(assignment_id)
 
         assignment_criteria = AssignmentCriterion.query \
             .with_entities(AssignmentCriterion.criterion_id) \
             .filter_by(assignment_id=assignment_id, active=True) \
             .all()
 
-        comparison_criteria = []
-
-        comparison_pairs = []
-        answer_ids = set()
-        for comparison in comparisons:
-            answer_ids.add(comparison.answer1_id)
-            answer_ids.add(comparison.answer2_id)
-            comparison_criteria.extend(comparison.comparison_criteria)
-            comparison_pairs.append(comparison.convert_to_comparison_pair())
-
-        # calculate answer score
-
-        comparison_results = calculate_score(
-            package_name=assignment.scoring_algorithm.value,
-            comparison_pairs=comparison_pairs,
-            log=current_app.logger
-        )
-
-        scores = AnswerScore.query \
-            .filter(AnswerScore.answer_id.in_(answer_ids)) \
-            .all()
-        updated_answer_scores = update_answer_scores(scores, assignment_id, comparison_results)
-        db.session.add_all(updated_answer_scores)
-
-        # calculate answer criterion scores
-        criterion_comparison_results = {}
+        comparison_pair_winners = {
+            WinningAnswer.answer1: ComparisonWinner.key1,
+            WinningAnswer.answer2: ComparisonWinner.key2,
+            WinningAnswer.draw: ComparisonWinner.draw
+        }
 
+        # overall comparison pairs are stored under the None criterion
+        comparison_pairs = {None: []}
         for assignment_criterion in assignment_criteria:
-            comparison_pairs = []
-            for comparison_criterion in comparison_criteria:
-                if comparison_criterion.criterion_id != assignment_criterion.criterion_id:
-                    continue
+            comparison_pairs[assignment_criterion.criterion_id] = []
 
-                comparison_pairs.append(comparison_criterion.convert_to_comparison_pair())
+        # get all completed comparisons for this assignment and only load the data we need
+        # (like the incremental scoring, incomplete comparisons aren't counted in the rounds)
+        rows = db.session.query(Comparison.id, Comparison.answer1_id, Comparison.answer2_id,
+                Comparison.winner, ComparisonCriterion.criterion_id, ComparisonCriterion.winner) \
+            .outerjoin(ComparisonCriterion, ComparisonCriterion.comparison_id == Comparison.id) \
+            .filter(and_(
+                Comparison.assignment_id == assignment_id,
+                Comparison.completed == True
+            )) \
+            .order_by(Comparison.id) \
+            .yield_per(SCORE_RECALCULATION_BATCH_SIZE)
 
-            criterion_comparison_results[assignment_criterion.criterion_id] = calculate_score(
-                package_name=assignment.scoring_algorithm.value,
-                comparison_pairs=comparison_pairs,
-                log=current_app.logger
-            )
+        previous_comparison_id = None
+        for (comparison_id, answer1_id, answer2_id, winner, criterion_id, criterion_winner) in rows:
+            # rows of a comparison are consecutive (one per comparison criterion)
+            if comparison_id != previous_comparison_id:
+                previous_comparison_id = comparison_id
+                comparison_pairs[None].append(ComparisonPair(
+                    key1=answer1_id, key2=answer2_id, winner=comparison_pair_winners.get(winner)))
 
-        scores = AnswerCriterionScore.query \
-            .filter(AnswerCriterionScore.answer_id.in_(answer_ids)) \
-            .all()
-        updated_answer_criteria_scores = update_answer_criteria_scores(scores, assignment_id, criterion_comparison_results)
-        db.session.add_all(updated_answer_criteria_scores)
+            if criterion_id != None and criterion_id in comparison_pairs:
+                comparison_pairs[criterion_id].append(ComparisonPair(
+                    key1=answer1_id, key2=answer2_id, winner=comparison_pair_winners.get(criterion_winner)))
 
-        db.session.commit()
+        # packages fitting all of the scores at once start from the stored scores (warm start)
+        scored_objects = None
+        if assignment.scoring_algorithm in WARM_START_SCORING_ALGORITHMS:
+            scored_objects = _get_scored_objects(assignment_id, comparison_pairs.keys())
 
-def update_answer_scores(scores, assignment_id, comparison_results):
-    from . import AnswerScore
+        comparison_results = _calculate_scores(assignment.scoring_algorithm.value, comparison_pairs, scored_objects)
+        if dry_run:
+            return comparison_results
 
-    updated_scores = []
-    for answer_id, comparison_results in comparison_results.items():
-        score = next((score for score in scores
-            if score.answer_id == answer_id),
-            AnswerScore(assignment_id=assignment_id, answer_id=answer_id)
-        )
-        updated_scores.append(score)
+        AnswerScore.lock_assignment(assignment_id)
 
-        score.score = comparison_results.score
-        score.variable1 = comparison_results.variable1
-        score.variable2 = comparison_results.variable2
-        score.rounds = comparison_results.rounds
-        score.wins = comparison_results.wins
-        score.loses = comparison_results.loses
-        score.opponents = comparison_results.opponents
+        # calculate answer score
+        score_ids = dict(AnswerScore.query \
+            .with_entities(AnswerScore.answer_id, AnswerScore.id) \
+            .filter_by(assignment_id=assignment_id) \
+            .all())
+        (updates, inserts) = _score_mappings(
+            comparison_results[None], tally_opponent_stats(comparison_pairs[None]),
+            lambda answer_id: score_ids.get(answer_id),
+            lambda answer_id: {'assignment_id': assignment_id, 'answer_id': answer_id}
+        )
+        db.session.bulk_update_mappings(AnswerScore, updates)
+        db.session.bulk_insert_mappings(AnswerScore, inserts)
+        AnswerScoreHistory.record(assignment_id, len(comparison_pairs[None]),
+            [(answer_id, result.score, result.rounds) for (answer_id, result) in comparison_results[None].items()])
 
-    return updated_scores
+        # calculate answer criterion scores
+        criterion_score_ids = dict(((answer_id, criterion_id), score_id)
+            for (answer_id, criterion_id, score_id) in AnswerCriterionScore.query \
+                .with_entities(AnswerCriterionScore.answer_id, AnswerCriterionScore.criterion_id, AnswerCriterionScore.id) \
+                .filter_by(assignment_id=assignment_id) \
+                .all()
+        )
+        for assignment_criterion in assignment_criteria:
+            criterion_id = assignment_criterion.criterion_id
+            (updates, inserts) = _score_mappings(
+                comparison_results[criterion_id], tally_opponent_stats(comparison_pairs[criterion_id]),
+                lambda answer_id: criterion_score_ids.get((answer_id, criterion_id)),
+                lambda answer_id: {'assignment_id': assignment_id, 'answer_id': answer_id, 'criterion_id': criterion_id}
+            )
+            db.session.bulk_update_mappings(AnswerCriterionScore, updates)
+            db.session.bulk_insert_mappings(AnswerCriterionScore, inserts)
 
+        # bulk writes skip the orm events that patch the pairing snapshot and update the relative scores
+        PairingSnapshot.invalidate_on_commit(db.session(), assignment_id)
+        AnswerScore.update_relative_scores_on_commit(db.session(), assignment_id)
+        AnswerCriterionScore.update_relative_scores_on_commit(db.session(), assignment_id)
 
-def update_answer_criteria_scores(scores, assignment_id, criterion_comparison_results):
-    from . import AnswerCriterionScore
+        db.session.commit()
 
-    updated_scores = []
-    for criterion_id, criterion_comparison_result in criterion_comparison_results.items():
-        for answer_id, comparison_results in criterion_comparison_result.items():
-            score = next((score for score in scores
-                if score.answer_id == answer_id and score.criterion_id == criterion_id),
-                AnswerCriterionScore(assignment_id=assignment_id, answer_id=answer_id, criterion_id=criterion_id)
+        return comparison_results
+
+# number of comparison rows loaded at a time when recalculating scores
+SCORE_RECALCULATION_BATCH_SIZE = 1000
+
+# scoring algorithms whose calculate_score accepts the previous scored_objects
+WARM_START_SCORING_ALGORITHMS = [ScoringAlgorithm.bradley_terry]
+
+def _get_scored_objects(assignment_id, criterion_ids):
+    """
+    Returns the stored scores of the assignment as ScoredObjects (dictionary criterion id
+    (None for the overall scores) -> array of ScoredObject) with column only queries
+    """
+    from . import AnswerScore, AnswerCriterionScore
+
+    scored_objects = dict((criterion_id, []) for criterion_id in criterion_ids)
+
+    for (answer_id, score, variable1, variable2, rounds, wins, loses, opponents) in AnswerScore.query \
+            .with_entities(AnswerScore.answer_id, AnswerScore.score, AnswerScore.variable1, AnswerScore.variable2,
+                AnswerScore.rounds, AnswerScore.wins, AnswerScore.loses, AnswerScore.opponents) \
+            .filter_by(assignment_id=assignment_id) \
+            .all():
+        scored_objects[None].append(ScoredObject(key=answer_id, score=score, variable1=variable1,
+            variable2=variable2, rounds=rounds, wins=wins, loses=loses, opponents=opponents))
+
+    for (criterion_id, answer_id, score, variable1, variable2, rounds, wins, loses, opponents) in AnswerCriterionScore.query \
+            .with_entities(AnswerCriterionScore.criterion_id, AnswerCriterionScore.answer_id, AnswerCriterionScore.score,
+                AnswerCriterionScore.variable1, AnswerCriterionScore.variable2, AnswerCriterionScore.rounds,
+                AnswerCriterionScore.wins, AnswerCriterionScore.loses, AnswerCriterionScore.opponents) \
+            .filter_by(assignment_id=assignment_id) \
+            .all():
+        if criterion_id in scored_objects:
+            scored_objects[criterion_id].append(ScoredObject(key=answer_id, score=score, variable1=variable1,
+                variable2=variable2, rounds=rounds, wins=wins, loses=loses, opponents=opponents))
+
+    return scored_objects
+
+def _calculate_scores(package_name, comparison_pairs, scored_objects=None):
+    """
+    Calculates the scores of every set of comparison pairs
+    :param comparison_pairs: dictionary key -> array of comparison_pairs
+    :param scored_objects: dictionary key -> array of previous ScoredObjects (only for the packages
+        in WARM_START_SCORING_ALGORITHMS)
+    :return: dictionary key -> dictionary answer id -> ScoredObject
+    """
+    def arguments(key):
+        if scored_objects == None:
+            return {}
+        return {'scored_objects': scored_objects.get(key, [])}
+
+    processes = current_app.config.get('SCORE_RECALCULATION_PROCESSES') or os.cpu_count() or 1
+    processes = min(processes, len(comparison_pairs))
+    total_comparisons = sum(len(pairs) for pairs in comparison_pairs.values())
+
+    # daemonic processes (like celery workers) can't have child processes
+    if processes > 1 and not multiprocessing.current_process().daemon and \
+            total_comparisons >= current_app.config.get('SCORE_RECALCULATION_PARALLEL_MIN_COMPARISONS', 0):
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = dict(
+                (key, executor.submit(calculate_score, package_name=package_name, comparison_pairs=pairs,
+                    **arguments(key)))
+                for key, pairs in comparison_pairs.items()
             )
-            updated_scores.append(score)
-
-            score.score = comparison_results.score
-            score.variable1 = comparison_results.variable1
-            score.variable2 = comparison_results.variable2
-            score.rounds = comparison_results.rounds
-            score.wins = comparison_results.wins
-            score.loses = comparison_results.loses
-            score.opponents = comparison_results.opponents
-
-    return updated_scores
\ No newline at end of file
+            return dict((key, future.result()) for key, future in futures.items())
+
+    return dict(
+        (key, calculate_score(package_name=package_name, comparison_pairs=pairs, log=current_app.logger,
+            **arguments(key)))
+        for key, pairs in comparison_pairs.items()
+    )
+
+def _score_mappings(comparison_results, opponent_stats, get_score_id, new_score_values):
+    """
+    Returns (update mappings, insert mappings) of the scores for the bulk operations
+    :param get_score_id: returns the id of the existing score of an answer id (None if there isn't one)
+    :param new_score_values: returns the identifying values of a new score for an answer id
+    """
+    updates = []
+    inserts = []
+    for answer_id, result in comparison_results.items():
+        values = {
+            'score': result.score,
+            'variable1': result.variable1,
+            'variable2': result.variable2,
+            'rounds': result.rounds,
+            'wins': result.wins,
+            'loses': result.loses,
+            'opponents': result.opponents,
+            '_opponent_stats': dump_opponent_stats(opponent_stats.get(answer_id, {}))
+        }
+
+        score_id = get_score_id(answer_id)
+        if score_id != None:
+            values['id'] = score_id
+            updates.append(values)
+        else:
+            values.update(new_score_values(answer_id))
+            inserts.append(values)
+
+    return (updates, inserts)
+
+def _update_scores_1vs1(assignment, score1, score2, winner, other_comparison_pairs, recount):
+    answer1_id = score1.answer_id
+    answer2_id = score2.answer_id
+
+    if recount:
+        opponent_stats = tally_opponent_stats(other_comparison_pairs, [answer1_id, answer2_id])
+    else:
+        opponent_stats = {
+            answer1_id: score1.opponent_stats or {},
+            answer2_id: score2.opponent_stats or {}
+        }
+
+    result_1, result_2 = calculate_score_1vs1(
+        package_name=assignment.scoring_algorithm.value,
+        key1_scored_object=score1.convert_to_scored_object(),
+        key2_scored_object=score2.convert_to_scored_object(),
+        winner=winner,
+        other_comparison_pairs=other_comparison_pairs,
+        opponent_stats=None if recount else opponent_stats,
+        log=current_app.logger
+    )
+
+    key1_winner = winner == ComparisonWinner.key1
+    key2_winner = winner == ComparisonWinner.key2
+    for (score, result, opponent_id, did_win, did_lose) in [
+            (score1, result_1, answer2_id, key1_winner, key2_winner),
+            (score2, result_2, answer1_id, key2_winner, key1_winner)]:
+        score.score = result.score
+        score.variable1 = result.variable1
+        score.variable2 = result.variable2
+        score.rounds = result.rounds
+        score.wins = result.wins
+        score.loses = result.loses
+        score.opponents = result.opponents
+        score.opponent_stats = add_opponent_result(opponent_stats.get(score.answer_id, {}),
+            opponent_id, did_win, did_lose)
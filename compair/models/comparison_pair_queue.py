@@ -0,0 +1,173 @@
+import numpy
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import get_history
+from flask import current_app
+
+from compair.core import cache
+from compair.algorithms import ComparisonPair
+from compair.algorithms.pair import schedule_pairs
+from compair.algorithms.pair.adaptive_matching import generate_rounds
+
+from .custom_types import PairingAlgorithm
+from .assignment import Assignment
+from .pairing_snapshot import PairingSnapshot
+
+class ComparisonPairQueue(object):
+    """
+    Buffer of pre-generated comparison pairs per assignment.
+
+    When COMPARISON_PAIR_QUEUE_ENABLED is set, pairs are generated in bulk from the pairing
+    snapshot by a background task and new comparisons pop the first pair valid for the user
+    instead of running the pairing algorithm. Queued pairs are checked against the pairing snapshot:
+    pairs with answers that can no longer be compared are dropped when popped and pairs invalid
+    only for the current user are put back.
+
+    Requires PAIRING_SNAPSHOT_CACHE_ENABLED so popping pairs doesn't build the snapshot.
+    Only the pairing algorithms in QUEUE_PAIRING_ALGORITHMS are served from the queue. The others
+    pair answers with data the bulk scheduling doesn't use (criterion scores or rating uncertainty).
+    """
+    # maximum number of queued pairs checked per request before falling back to the pairing algorithm
+    MAX_CANDIDATES = 20
+    REFILL_LOCK_TIMEOUT = 60 # 1 minute
+    QUEUE_PAIRING_ALGORITHMS = [
+        None, # random
+        PairingAlgorithm.random,
+        PairingAlgorithm.adaptive,
+        PairingAlgorithm.adaptive_matching
+    ]
+
+    @classmethod
+    def enabled(cls):
+        return current_app.config.get('COMPARISON_PAIR_QUEUE_ENABLED', False)
+
+    @classmethod
+    def supports(cls, pairing_algorithm):
+        return pairing_algorithm in cls.QUEUE_PAIRING_ALGORITHMS
+
+    @classmethod
+    def _queue_size(cls):
+        return current_app.config.get('COMPARISON_PAIR_QUEUE_SIZE', 100)
+
+    @classmethod
+    def _queue_timeout(cls):
+        return current_app.config.get('COMPARISON_PAIR_QUEUE_TIMEOUT')
+
+    @classmethod
+    def _cache_key(cls, assignment_id):
+        return "comparison_pair_queue:" + str(assignment_id)
+
+    @classmethod
+    def _refill_cache_key(cls, assignment_id):
+        return "comparison_pair_queue_refill:" + str(assignment_id)
+
+    @classmethod
+    def length(cls, assignment_id):
+        return cache.llen(cls._cache_key(assignment_id))
+
+    @classmethod
+    def pop(cls, assignment, user_id, group_id, comparisons):
+        """
+        Returns the first queued pair that the user can compare (None if there isn't one)
+        param comparisons: all comparisons of the user for the assignment
+        """
+        key = cls._cache_key(assignment.id)
+
+        if cache.llen(key) < cls._queue_size() // 2:
+            cls.request_refill(assignment.id)
+
+        compared = set()
+        for comparison in comparisons:
+            compared.add((comparison.answer1_id, comparison.answer2_id))
+            compared.add((comparison.answer2_id, comparison.answer1_id))
+
+        comparison_pair = None
+        snapshot = None
+        skipped_pairs = []
+        for _ in range(cls.MAX_CANDIDATES):
+            pair = cache.lpop(key)
+            if pair == None:
+                break
+            (answer1_id, answer2_id) = pair
+
+            if (answer1_id, answer2_id) in compared:
+                skipped_pairs.append(pair)
+                continue
+
+            # answers that can be compared (and by whom) as cached for pairing (only once a pair is popped)
+            if snapshot == None:
+                snapshot = PairingSnapshot.get(assignment.course_id, assignment.id)
+            answers = snapshot.answers[numpy.isin(snapshot.answers['answer_id'], [answer1_id, answer2_id])]
+            if len(answers) != 2:
+                # answer was deleted or can't be compared anymore
+                continue
+
+            if numpy.any(answers['user_id'] == user_id) or \
+                    (group_id != None and numpy.any(answers['group_id'] == group_id)):
+                skipped_pairs.append(pair)
+                continue
+
+            comparison_pair = ComparisonPair(key1=answer1_id, key2=answer2_id, winner=None)
+            break
+
+        # pairs skipped for the current user are still valid for others
+        cache.rpush(key, *skipped_pairs, timeout=cls._queue_timeout())
+
+        return comparison_pair
+
+    @classmethod
+    def request_refill(cls, assignment_id):
+        """
+        Queues a background refill unless one is already pending for the assignment
+        """
+        if cache.add(cls._refill_cache_key(assignment_id), True, cls.REFILL_LOCK_TIMEOUT):
+            from compair.tasks import refill_comparison_pair_queue
+            refill_comparison_pair_queue.delay(assignment_id)
+
+    @classmethod
+    def refill(cls, assignment_id):
+        """
+        Fills the queue up to COMPARISON_PAIR_QUEUE_SIZE pairs. Returns the number of pairs added
+        """
+        try:
+            return cls._refill(assignment_id)
+        finally:
+            cache.delete(cls._refill_cache_key(assignment_id))
+
+    @classmethod
+    def _refill(cls, assignment_id):
+        assignment = Assignment.query.get(assignment_id)
+        if not assignment or not assignment.active or not cls.supports(assignment.pairing_algorithm):
+            return 0
+
+        number_of_pairs = cls._queue_size() - cls.length(assignment_id)
+        if number_of_pairs <= 0:
+            return 0
+
+        snapshot = PairingSnapshot.get(assignment.course_id, assignment.id)
+        scored_objects = snapshot.scored_objects()
+        if len(scored_objects) < 2:
+            return 0
+
+        if assignment.pairing_algorithm == PairingAlgorithm.adaptive_matching:
+            # serve whole rounds of disjoint pairs matched by score
+            comparison_pairs = generate_rounds(scored_objects, number_of_pairs,
+                log=current_app.logger)
+        else:
+            comparison_pairs = schedule_pairs(scored_objects, number_of_pairs,
+                by_score=assignment.pairing_algorithm not in [None, PairingAlgorithm.random])
+
+        cache.rpush(cls._cache_key(assignment_id),
+            *[[comparison_pair.key1, comparison_pair.key2] for comparison_pair in comparison_pairs],
+            timeout=cls._queue_timeout())
+
+        return len(comparison_pairs)
+
+    @classmethod
+    def clear(cls, assignment_id):
+        cache.delete(cls._cache_key(assignment_id))
+
+@event.listens_for(Assignment, 'after_update')
+def _assignment_updated(mapper, connection, target):
+    # queued pairs were scheduled for the previous pairing algorithm
+    if get_history(target, 'pairing_algorithm').has_changes() and ComparisonPairQueue.enabled():
+        ComparisonPairQueue.clear(target.id)
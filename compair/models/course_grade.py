@@ -11,6 +11,7 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from . import *
 
 from compair.core import db
+from .assignment_grade import _save_grades
 
 class CourseGrade(DefaultTableMixin, WriteTrackingMixin):
     __tablename__ = 'course_grade'
@@ -56,191 +57,272 @@ class CourseGrade(DefaultTableMixin, WriteTrackingMixin):
 
     @classmethod
     def calculate_grade(cls, course, user):
-        from . import AssignmentGrade, LTIOutcome, CourseRole
+        from . import UserCourse, LTIOutcome, CourseRole
 
-        user_is_student = False
-
-        for course_user in course.user_courses:
-            if course_user.user_id != user.id:
-                continue
-            user_is_student = course_user.course_role == CourseRole.student
-            break
-
-        assignment_ids = [assignment.id
-            for assignment in course.assignments
-            if assignment.active]
+        assignment_weights = _get_assignment_weights(course)
 
         # skip if there aren't any assignments
-        if len(assignment_ids) == 0:
+        if len(assignment_weights) == 0:
             CourseGrade.query \
-                .filter_by(course_id=course.id) \
-                .filter(CourseGrade.user_id.in_(student_ids)) \
+                .filter_by(
+                    course_id=course.id,
+                    user_id=user.id
+                ) \
                 .delete()
-            LTIOutcome.update_course_users_grade(course, student_ids)
+            LTIOutcome.update_course_user_grade(course, user.id)
             return
 
-        elif not user_is_student:
+        user_is_student = UserCourse.query \
+            .filter_by(
+                course_id=course.id,
+                user_id=user.id,
+                course_role=CourseRole.student
+            ) \
+            .count() > 0
+
+        if not user_is_student:
             return
 
-        # collect all of the students assignment grades
-        student_assignment_grades = {
-            # default grade of 0 in case assignment_grade record is missing
-            assignment_id: 0.0 for assignment_id in assignment_ids
-        }
+        CourseGrade._calculate_students_grades(course, [user.id], assignment_weights, restrict=True)
+        db.session.commit()
 
-        assignment_grades = AssignmentGrade.query \
-            .filter_by(user_id=user.id) \
-            .filter(AssignmentGrade.assignment_id.in_(assignment_ids)) \
-            .all()
-        for assignment_grade in assignment_grades:
-            student_assignment_grades[assignment_grade.assignment_id] = assignment_grade.grade
+        LTIOutcome.update_course_user_grade(course, user.id)
+
+    @classmethod
+    def lock_user_course_grade(cls, course_id, user_id):
+        """
+        Returns the student's course grade (None if they don't have one yet) locked until the transaction
+        ends so simultaneous assignment grade changes are applied one at a time. The locked grade is
+        reloaded over any already in the session
+        """
+        return CourseGrade.query \
+            .filter_by(
+                course_id=course_id,
+                user_id=user_id
+            ) \
+            .populate_existing() \
+            .with_for_update() \
+            .one_or_none()
 
-        grade = _calculate_course_grade(course, student_assignment_grades)
+    @classmethod
+    def update_assignment_grade(cls, course, course_grade, user_id, assignment, previous_grade, grade):
+        """
+        Applies the change of a student's assignment grade (previous_grade is None for a new assignment grade)
+        to their course grade without reading their other assignment grades. course_grade must have been
+        locked (see lock_user_course_grade) before previous_grade was read. Doesn't commit (the course grade
+        row stays locked until the caller commits).
+        The course grade is fully calculated if the student doesn't have one yet
+        """
+        assignment_weights = _get_assignment_weights(course)
+
+        # grades of inactive assignments don't count
+        if assignment.id not in assignment_weights:
+            return
 
-        course_grade = CourseGrade.get_user_course_grade(course, user)
         if course_grade == None:
-            course_grade = CourseGrade(
-                user_id=user.id,
-                course_id=course.id
-            )
-
-        course_grade.grade = grade
+            CourseGrade._calculate_students_grades(course, [user_id], assignment_weights, restrict=True)
+            return
 
+        course_grade.grade = _apply_assignment_grade_change(course_grade.grade, assignment_weights,
+            assignment.id, previous_grade, grade)
         db.session.add(course_grade)
-        db.session.commit()
-
-        LTIOutcome.update_course_user_grade(course, user.id)
 
     @classmethod
     def calculate_group_grade(cls, course, group):
-        from . import CourseRole, AssignmentGrade, LTIOutcome
+        from . import CourseRole, LTIOutcome
 
         student_ids = [course_user.user_id
             for course_user in course.user_courses
             if course_user.course_role == CourseRole.student and \
             course_user.group_id == group.id]
 
-        assignment_ids = [assignment.id
-            for assignment in course.assignments
-            if assignment.active]
+        assignment_weights = _get_assignment_weights(course)
 
         # skip if there aren't any assignments
         if len(student_ids) == 0:
             return
 
-        if len(assignment_ids) == 0:
+        if len(assignment_weights) == 0:
             CourseGrade.query \
                 .filter_by(course_id=course.id) \
                 .filter(CourseGrade.user_id.in_(student_ids)) \
-                .delete()
+                .delete(synchronize_session='fetch')
             LTIOutcome.update_course_users_grade(course, student_ids)
             return
 
-        # collect all of the students assignment grades
-        student_assignment_grades = {}
-        for student_id in student_ids:
-            student_assignment_grades[student_id] = {}
-            for assignment_id in assignment_ids:
-                student_assignment_grades[student_id][assignment_id] = 0.0
-
-        assignment_grades = AssignmentGrade.query \
-            .filter(AssignmentGrade.assignment_id.in_(assignment_ids)) \
-            .filter(AssignmentGrade.user_id.in_(student_ids)) \
-            .all()
-        for assignment_grade in assignment_grades:
-            student_assignment_grades[assignment_grade.user_id][assignment_grade.assignment_id] = assignment_grade.grade
-
-        course_grades = CourseGrade.query \
-            .filter(CourseGrade.user_id.in_(student_ids)) \
-            .all()
-        new_course_grades = []
-        for student_id in student_ids:
-            grade = _calculate_course_grade(course, student_assignment_grades[student_id])
-
-            course_grade = next((course_grade for course_grade in course_grades
-                if course_grade.user_id == student_id
-            ), None)
-
-            if course_grade == None:
-                course_grade = CourseGrade(
-                    user_id=student_id,
-                    course_id=course.id
-                )
-                new_course_grades.append(course_grade)
-
-            course_grade.grade = grade
-
-        db.session.add_all(course_grades + new_course_grades)
+        CourseGrade._calculate_students_grades(course, student_ids, assignment_weights, restrict=True)
         db.session.commit()
 
         LTIOutcome.update_course_users_grade(course, student_ids)
 
     @classmethod
     def calculate_grades(cls, course):
-        from . import CourseRole, AssignmentGrade, LTIOutcome
+        from . import CourseRole, LTIOutcome
 
         student_ids = [course_user.user_id
             for course_user in course.user_courses
             if course_user.course_role == CourseRole.student]
 
-        assignment_ids = [assignment.id
-            for assignment in course.assignments
-            if assignment.active]
+        assignment_weights = _get_assignment_weights(course)
 
         # skip if there aren't any assignments
-        if len(student_ids) == 0 or len(assignment_ids) == 0:
+        if len(student_ids) == 0 or len(assignment_weights) == 0:
             CourseGrade.query \
                 .filter_by(course_id=course.id) \
                 .delete()
             LTIOutcome.update_course_grades(course)
             return
 
-        # collect all of the students assignment grades
-        student_assignment_grades = {}
-        for student_id in student_ids:
-            student_assignment_grades[student_id] = {}
-            for assignment_id in assignment_ids:
-                student_assignment_grades[student_id][assignment_id] = 0.0
+        CourseGrade._calculate_students_grades(course, student_ids, assignment_weights)
+        db.session.commit()
 
-        assignment_grades = AssignmentGrade.query \
-            .filter(AssignmentGrade.assignment_id.in_(assignment_ids)) \
-            .filter(AssignmentGrade.user_id.in_(student_ids)) \
-            .all()
-        for assignment_grade in assignment_grades:
-            student_assignment_grades[assignment_grade.user_id][assignment_grade.assignment_id] = assignment_grade.grade
+        LTIOutcome.update_course_grades(course)
 
-        course_grades = CourseGrade.get_course_grades(course)
-        new_course_grades = []
-        for student_id in student_ids:
-            grade = _calculate_course_grade(course, student_assignment_grades[student_id])
+    @classmethod
+    def calculate_users_grades(cls, course, user_ids):
+        """
+        Calculates the course grades of the users that are students of the course
+        """
+        from . import UserCourse, CourseRole, LTIOutcome
+
+        student_ids = [user_id for (user_id, ) in UserCourse.query \
+            .with_entities(UserCourse.user_id) \
+            .filter(and_(
+                UserCourse.course_id == course.id,
+                UserCourse.course_role == CourseRole.student,
+                UserCourse.user_id.in_(user_ids)
+            )) \
+            .all()]
+
+        assignment_weights = _get_assignment_weights(course)
+
+        # skip if there aren't any students
+        if len(student_ids) == 0:
+            return
+
+        if len(assignment_weights) == 0:
+            CourseGrade.query \
+                .filter_by(course_id=course.id) \
+                .filter(CourseGrade.user_id.in_(student_ids)) \
+                .delete(synchronize_session='fetch')
+        else:
+            CourseGrade._calculate_students_grades(course, student_ids, assignment_weights, restrict=True)
+        db.session.commit()
 
-            course_grade = next((course_grade for course_grade in course_grades
-                if course_grade.user_id == student_id
-            ), None)
+        LTIOutcome.update_course_users_grade(course, student_ids)
+
+    @classmethod
+    def get_calculated_grades(cls, course, assignment_grades=None):
+        """
+        Returns the course grades of every student fully calculated from their assignment grades
+        (dictionary user id -> grade) without saving them.
+        assignment_grades (dictionary assignment id -> user id -> grade) replaces the saved assignment grades
+        """
+        from . import CourseRole
+
+        student_ids = [course_user.user_id
+            for course_user in course.user_courses
+            if course_user.course_role == CourseRole.student]
 
-            if course_grade == None:
-                course_grade = CourseGrade(
-                    user_id=student_id,
-                    course_id=course.id
-                )
-                new_course_grades.append(course_grade)
+        assignment_weights = _get_assignment_weights(course)
+        if len(student_ids) == 0 or len(assignment_weights) == 0:
+            return {}
 
-            course_grade.grade = grade
+        return CourseGrade._get_students_grades(course, student_ids, assignment_weights,
+            assignment_grades=assignment_grades)
 
-        db.session.add_all(course_grades + new_course_grades)
-        db.session.commit()
+    @classmethod
+    def _get_students_grades(cls, course, student_ids, assignment_weights, restrict=False, assignment_grades=None):
+        """
+        Returns the course grades of the students (dictionary user id -> grade) from their assignment grades
+        with a single query indexed by user id.
+        The query is limited to the students if restrict is set (for small sets of students),
+        otherwise it covers the whole course
+        """
+        from . import AssignmentGrade
 
-        LTIOutcome.update_course_grades(course)
+        assignment_ids = list(assignment_weights.keys())
 
-def _calculate_course_grade(course, assignment_grades):
+        # collect all of the students assignment grades
+        student_assignment_grades = {}
+        for student_id in student_ids:
+            # default grade of 0 in case assignment_grade record is missing
+            student_assignment_grades[student_id] = dict.fromkeys(assignment_ids, 0.0)
+
+        if assignment_grades != None:
+            saved_grades = [(user_id, assignment_id, grade)
+                for assignment_id, grades in assignment_grades.items()
+                for user_id, grade in grades.items()
+                if assignment_id in assignment_weights]
+        else:
+            saved_grades = AssignmentGrade.query \
+                .with_entities(AssignmentGrade.user_id, AssignmentGrade.assignment_id, AssignmentGrade.grade) \
+                .filter(AssignmentGrade.assignment_id.in_(assignment_ids))
+            if restrict:
+                saved_grades = saved_grades.filter(AssignmentGrade.user_id.in_(student_ids))
+            saved_grades = saved_grades.all()
+        for (user_id, assignment_id, grade) in saved_grades:
+            if user_id in student_assignment_grades:
+                student_assignment_grades[user_id][assignment_id] = grade
+
+        return dict((student_id, _calculate_course_grade(course, student_assignment_grades[student_id], assignment_weights))
+            for student_id in student_ids)
+
+    @classmethod
+    def _calculate_students_grades(cls, course, student_ids, assignment_weights, restrict=False):
+        """
+        Calculates and saves (without committing) the course grades of the students from their assignment grades
+        with one bulk update and one bulk insert (see _get_students_grades)
+        """
+        grades = CourseGrade._get_students_grades(course, student_ids, assignment_weights, restrict)
+
+        current_grades = CourseGrade.query \
+            .with_entities(CourseGrade.user_id, CourseGrade.id, CourseGrade.grade) \
+            .filter_by(course_id=course.id)
+        if restrict:
+            current_grades = current_grades.filter(CourseGrade.user_id.in_(student_ids))
+        current_grades = dict((user_id, (course_grade_id, grade))
+            for (user_id, course_grade_id, grade) in current_grades.all())
+
+        _save_grades(CourseGrade, grades, current_grades,
+            lambda user_id: {'user_id': user_id, 'course_id': course.id})
+
+def _get_assignment_weights(course):
+    """
+    Returns the weights of the course's active assignments in the course grade (dictionary assignment id -> weight)
+    """
+    from . import Assignment
+
+    return dict(Assignment.query \
+        .with_entities(Assignment.id, Assignment.course_grade_weight) \
+        .filter_by(
+            course_id=course.id,
+            active=True
+        ) \
+        .all())
+
+def _calculate_course_grade(course, assignment_grades, assignment_weights):
     grade = 0.0
     total_grade_weight = 0.0
 
-    # TODO: Assignments should have their own weights
-    # for now they all have equal weights
     for assignment_id, assignment_grade in assignment_grades.items():
-        grade += float(assignment_grade)
-        total_grade_weight += 1.0
+        assignment_weight = float(assignment_weights.get(assignment_id, 1))
+        grade += float(assignment_grade) * assignment_weight
+        total_grade_weight += assignment_weight
 
     # divide by total_grade_weight to get the final grade in range: [0.0, 1.0]
-    return grade / total_grade_weight if total_grade_weight > 0 else 0.0
\ No newline at end of file
+    return grade / total_grade_weight if total_grade_weight > 0 else 0.0
+
+def _apply_assignment_grade_change(course_grade, assignment_weights, assignment_id, previous_grade, grade):
+    """
+    Returns the course grade after the change of one assignment grade (missing assignment grades count as 0)
+    """
+    total_grade_weight = float(sum(assignment_weights.values()))
+    if total_grade_weight <= 0:
+        return 0.0
+
+    difference = float(grade) - float(previous_grade or 0.0)
+    course_grade += difference * float(assignment_weights[assignment_id]) / total_grade_weight
+
+    # floating point rounding can't push the grade out of range: [0.0, 1.0]
+    return min(max(course_grade, 0.0), 1.0)
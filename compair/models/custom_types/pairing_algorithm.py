@@ -4,3 +4,5 @@ class PairingAlgorithm(Enum):
     adaptive = "adaptive"
     random = "random"
     adaptive_min_delta = "adaptive_min_delta"
+    adaptive_matching = "adaptive_matching"
+    adaptive_uncertainty = "adaptive_uncertainty"
@@ -4,3 +4,4 @@ class ScoringAlgorithm(Enum):
     comparative_judgement = "comparative_judgement"
     elo = "elo_rating"
     true_skill = "true_skill_rating"
+    bradley_terry = "bradley_terry"
@@ -0,0 +1,169 @@
+from flask import current_app
+
+from compair.core import cache
+
+from .assignment import Assignment
+from .assignment_grade import AssignmentGrade
+from .course import Course
+from .course_grade import CourseGrade
+from .user_course import UserCourse
+from .custom_types import CourseRole
+
+class GradeUpdateQueue(object):
+    """
+    Queue of students whose grades need to be recalculated per course.
+
+    When GRADE_UPDATE_QUEUE_ENABLED is set, answers, comparisons and self-evaluations mark the
+    (assignment, student) grades as dirty instead of recalculating them during the request. A
+    background task per course waits GRADE_UPDATE_QUEUE_DELAY seconds and then recalculates
+    the assignment grades of every dirty student in one batch per assignment and their course
+    grades in one batch, so repeated triggers within the window are recalculated once.
+
+    The dirty students of a course and the dirty assignments of every student are kept in
+    separate lists.
+    """
+    PENDING_LOCK_TIMEOUT = 600 # 10 minutes
+
+    @classmethod
+    def enabled(cls):
+        return current_app.config.get('GRADE_UPDATE_QUEUE_ENABLED', False)
+
+    @classmethod
+    def _delay(cls):
+        return current_app.config.get('GRADE_UPDATE_QUEUE_DELAY', 10)
+
+    @classmethod
+    def _cache_key(cls, course_id):
+        return "grade_update_queue:" + str(course_id)
+
+    @classmethod
+    def _user_cache_key(cls, course_id, user_id):
+        return "grade_update_queue:" + str(course_id) + ":" + str(user_id)
+
+    @classmethod
+    def _pending_cache_key(cls, course_id):
+        return "grade_update_queue_pending:" + str(course_id)
+
+    @classmethod
+    def length(cls, course_id):
+        return cache.llen(cls._cache_key(course_id))
+
+    @classmethod
+    def push(cls, course_id, assignment_id, user_ids):
+        """
+        Marks the assignment and course grades of the users as dirty
+        """
+        if len(user_ids) == 0:
+            return
+
+        # assignments first so they are there once the worker takes the user
+        for user_id in user_ids:
+            cache.rpush(cls._user_cache_key(course_id, user_id), assignment_id)
+        cache.rpush(cls._cache_key(course_id), *user_ids)
+        cls.request_update(course_id)
+
+    @classmethod
+    def push_group(cls, course_id, assignment_id, group):
+        """
+        Marks the assignment and course grades of the students of the group as dirty
+        """
+        student_ids = [user_id for (user_id, ) in UserCourse.query \
+            .with_entities(UserCourse.user_id) \
+            .filter_by(
+                course_id=course_id,
+                group_id=group.id,
+                course_role=CourseRole.student
+            ) \
+            .all()]
+        cls.push(course_id, assignment_id, student_ids)
+
+    @classmethod
+    def request_update(cls, course_id):
+        """
+        Queues a delayed background grade update unless one is already pending for the course
+        """
+        if cache.add(cls._pending_cache_key(course_id), True, cls.PENDING_LOCK_TIMEOUT):
+            from compair.tasks import update_queued_grades
+            update_queued_grades.apply_async(args=(course_id, ), countdown=cls._delay())
+
+    @classmethod
+    def process(cls, course_id):
+        """
+        Recalculates the dirty grades of the course. Returns the number of students updated
+        """
+        try:
+            number_of_users = cls._process(course_id)
+        finally:
+            cache.delete(cls._pending_cache_key(course_id))
+
+        # students marked after the last batch was taken
+        if cls.length(course_id) > 0:
+            cls.request_update(course_id)
+
+        return number_of_users
+
+    @classmethod
+    def _process(cls, course_id):
+        number_of_users = 0
+        while True:
+            user_ids = cls._pop_all(cls._cache_key(course_id))
+            if len(user_ids) == 0:
+                return number_of_users
+
+            assignment_user_ids = {}
+            for user_id in user_ids:
+                for assignment_id in cls._pop_all(cls._user_cache_key(course_id, user_id)):
+                    assignment_user_ids.setdefault(assignment_id, []).append(user_id)
+            if len(assignment_user_ids) == 0:
+                continue
+
+            try:
+                cls._update(course_id, assignment_user_ids)
+            except Exception:
+                cls._requeue(course_id, assignment_user_ids)
+                raise
+
+            number_of_users += len(set(user_id
+                for assignment_users in assignment_user_ids.values()
+                for user_id in assignment_users))
+
+    @classmethod
+    def _update(cls, course_id, assignment_user_ids):
+        course = Course.query.get(course_id)
+        if not course or not course.active:
+            return
+
+        assignments = Assignment.query \
+            .filter(Assignment.id.in_(list(assignment_user_ids.keys()))) \
+            .all()
+        user_ids = set()
+        for assignment in assignments:
+            if assignment.active and assignment.course_id == course.id:
+                AssignmentGrade.calculate_users_grades(assignment, assignment_user_ids[assignment.id])
+            user_ids.update(assignment_user_ids[assignment.id])
+
+        if len(user_ids) > 0:
+            CourseGrade.calculate_users_grades(course, list(user_ids))
+
+    @classmethod
+    def _requeue(cls, course_id, assignment_user_ids):
+        # mark the grades as dirty again so that a retry recalculates them
+        user_ids = set()
+        for assignment_id, assignment_users in assignment_user_ids.items():
+            for user_id in assignment_users:
+                cache.rpush(cls._user_cache_key(course_id, user_id), assignment_id)
+            user_ids.update(assignment_users)
+        cache.rpush(cls._cache_key(course_id), *user_ids)
+
+    @classmethod
+    def _pop_all(cls, key):
+        values = []
+        popped = set()
+        while True:
+            value = cache.lpop(key)
+            if value == None:
+                return values
+            # repeated triggers are only recalculated once
+            if value not in popped:
+                popped.add(value)
+                values.append(value)
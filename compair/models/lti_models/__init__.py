@@ -9,7 +9,8 @@ from compair.models import SystemRole, CourseRole
 
 # exceptions
 from .exceptions import MembershipNoValidContextsException, \
-    MembershipInvalidRequestException, MembershipNoResultsException
+    MembershipInvalidRequestException, MembershipNoResultsException, \
+    OutcomeConsumerUnavailableException
 
 # models
 from .lti_consumer import LTIConsumer
@@ -19,4 +20,5 @@ from .lti_resource_link import LTIResourceLink
 from .lti_user import LTIUser
 from .lti_user_resource_link import LTIUserResourceLink
 from .lti_nonce import LTINonce
-from .lti_outcome import LTIOutcome
\ No newline at end of file
+from .lti_outcome import LTIOutcome
+from .lti_outcome_dispatcher import LTIOutcomeDispatcher
\ No newline at end of file
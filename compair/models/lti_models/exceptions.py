@@ -5,4 +5,12 @@ class MembershipInvalidRequestException(Exception):
     pass
 
 class MembershipNoResultsException(Exception):
-    pass
\ No newline at end of file
+    pass
+class OutcomeConsumerUnavailableException(Exception):
+    """
+    Outcomes that couldn't be posted after every retry (connection errors or busy responses)
+    """
+    def __init__(self, lis_result_sourcedids):
+        super(OutcomeConsumerUnavailableException, self).__init__(
+            "LTI consumer unavailable for {} outcome(s)".format(len(lis_result_sourcedids)))
+        self.lis_result_sourcedids = lis_result_sourcedids
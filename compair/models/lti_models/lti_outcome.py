@@ -3,7 +3,6 @@ from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy import func, select, and_, or_
 from sqlalchemy.ext.hybrid import hybrid_property
 from flask import current_app
-from lti.outcome_request import OutcomeRequest, REPLACE_REQUEST
 
 from . import *
 
@@ -244,29 +243,5 @@ class LTIOutcome(object):
         """
         grade must be in range: [0.0, 1.0]
         """
-
-        if not lti_consumer.lis_outcome_service_url:
-            current_app.logger.error("Failed grade update for lis_result_sourcedid: {} ... no lis_outcome_service_url".format(lis_result_sourcedid))
-            return False
-        elif not lis_result_sourcedid:
-            current_app.logger.error("Failed grade update ... no lis_result_sourcedid")
-            return False
-        elif grade < 0.0 or grade > 1.0:
-            current_app.logger.error("Failed grade update for lis_result_sourcedid: {} grade not in [0.0, 1.0]: {}".format(lis_result_sourcedid, grade))
-            return False
-
-        # build outcome request
-        request = OutcomeRequest({
-            "consumer_key": lti_consumer.oauth_consumer_key,
-            "consumer_secret": lti_consumer.oauth_consumer_secret,
-            "lis_outcome_service_url": lti_consumer.lis_outcome_service_url,
-            "lis_result_sourcedid": lis_result_sourcedid,
-        })
-        request.post_replace_result(grade)
-
-        if request.was_outcome_post_successful():
-            current_app.logger.debug("Successfully grade update for lis_result_sourcedid: {} with grade: {}".format(lis_result_sourcedid, grade))
-        else:
-            current_app.logger.error("Failed grade update for lis_result_sourcedid: {} with grade: {}".format(lis_result_sourcedid, grade))
-
-        return request.was_outcome_post_successful()
\ No newline at end of file
+        from . import LTIOutcomeDispatcher
+        return LTIOutcomeDispatcher(lti_consumer).post_replace_result(lis_result_sourcedid, grade)
\ No newline at end of file
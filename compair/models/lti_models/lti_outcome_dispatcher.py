@@ -0,0 +1,247 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import current_app
+from lti.outcome_request import OutcomeRequest, REPLACE_REQUEST
+from lti.outcome_response import OutcomeResponse
+from requests.adapters import HTTPAdapter
+from requests_oauthlib import OAuth1
+from requests_oauthlib.oauth1_auth import SIGNATURE_TYPE_AUTH_HEADER
+
+from .exceptions import OutcomeConsumerUnavailableException
+
+# responses worth retrying (the consumer is busy or temporarily unavailable)
+RETRY_STATUS_CODES = [429, 502, 503, 504]
+
+class RateLimiter(object):
+    """
+    Token bucket allowing rate requests per second (with bursts of up to rate requests).
+    Shared by the threads posting outcomes to the same consumer
+    """
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.tokens = self.rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class LTIOutcomeMetrics(object):
+    def __init__(self):
+        self.posted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.retries = 0
+        self.seconds = 0.0
+        # sourcedids of the outcomes that failed after every retry (included in failed)
+        self.unavailable = []
+        self.lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def add_unavailable(self, lis_result_sourcedid):
+        with self.lock:
+            self.unavailable.append(lis_result_sourcedid)
+
+    def as_dict(self):
+        return {
+            'posted': self.posted,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'retries': self.retries,
+            'seconds': self.seconds
+        }
+
+class LTIOutcomeDispatcher(object):
+    """
+    Posts the replace result outcomes of a consumer concurrently.
+
+    Up to LTI_OUTCOME_MAX_CONCURRENCY requests are in flight at once, each posting thread over its
+    own keep-alive session (requests sessions aren't thread safe), limited to LTI_OUTCOME_RATE_LIMIT
+    requests per second per consumer (shared by all dispatchers of the process). Connection errors
+    and busy responses are retried up to LTI_OUTCOME_MAX_RETRIES times with exponential backoff
+    starting at LTI_OUTCOME_RETRY_BACKOFF milliseconds. Outcomes the consumer rejects aren't retried.
+    """
+    _rate_limiters = {}
+    _rate_limiters_lock = threading.Lock()
+
+    def __init__(self, lti_consumer):
+        config = current_app.config
+        self.consumer_id = lti_consumer.id
+        self.consumer_key = lti_consumer.oauth_consumer_key
+        self.consumer_secret = lti_consumer.oauth_consumer_secret
+        self.lis_outcome_service_url = lti_consumer.lis_outcome_service_url
+        self.max_concurrency = max(config.get('LTI_OUTCOME_MAX_CONCURRENCY', 8), 1)
+        self.max_retries = config.get('LTI_OUTCOME_MAX_RETRIES', 3)
+        self.retry_backoff = config.get('LTI_OUTCOME_RETRY_BACKOFF', 500) / 1000.0
+        self.timeout = config.get('LTI_OUTCOME_TIMEOUT', 30)
+        self.rate_limiter = LTIOutcomeDispatcher._get_rate_limiter(self.consumer_id,
+            config.get('LTI_OUTCOME_RATE_LIMIT', 0))
+        self.logger = current_app.logger
+        self.metrics = LTIOutcomeMetrics()
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+
+    @classmethod
+    def _get_rate_limiter(cls, consumer_id, rate):
+        if not rate:
+            return None
+        with cls._rate_limiters_lock:
+            rate_limiter = cls._rate_limiters.get(consumer_id)
+            if rate_limiter == None or rate_limiter.rate != float(rate):
+                rate_limiter = RateLimiter(rate)
+                cls._rate_limiters[consumer_id] = rate_limiter
+            return rate_limiter
+
+    def dispatch(self, sourcedid_and_grades):
+        """
+        Posts the grades (list of (lis_result_sourcedid, grade)) and returns the metrics.
+        Grades are posted in no particular order. Raises OutcomeConsumerUnavailableException
+        with the outcomes that couldn't be posted after every retry (once all of them are done)
+        """
+        start = time.time()
+        if not self.lis_outcome_service_url:
+            self.logger.error("Failed grade update for lti_consumer: {} ... no lis_outcome_service_url".format(self.consumer_id))
+            self.metrics.increment('skipped', len(sourcedid_and_grades))
+            return self.metrics
+
+        try:
+            if self.max_concurrency == 1 or len(sourcedid_and_grades) <= 1:
+                for (lis_result_sourcedid, grade) in sourcedid_and_grades:
+                    self._post(lis_result_sourcedid, grade)
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(sourcedid_and_grades))) as executor:
+                    futures = [executor.submit(self._post, lis_result_sourcedid, grade)
+                        for (lis_result_sourcedid, grade) in sourcedid_and_grades]
+                    for future in futures:
+                        future.result()
+        finally:
+            self._close_sessions()
+
+        self.metrics.seconds = time.time() - start
+        self.logger.info("LTI Outcomes for lti_consumer: {} posted: {} succeeded: {} failed: {} skipped: {} retries: {} in {:.2f}s".format(
+            self.consumer_id, self.metrics.posted, self.metrics.succeeded, self.metrics.failed,
+            self.metrics.skipped, self.metrics.retries, self.metrics.seconds))
+
+        if len(self.metrics.unavailable) > 0:
+            raise OutcomeConsumerUnavailableException(self.metrics.unavailable)
+        return self.metrics
+
+    def post_replace_result(self, lis_result_sourcedid, grade):
+        """
+        Posts a single grade and returns if it was successful
+        """
+        if not self.lis_outcome_service_url:
+            self.logger.error("Failed grade update for lis_result_sourcedid: {} ... no lis_outcome_service_url".format(lis_result_sourcedid))
+            self.metrics.increment('skipped')
+            return False
+
+        try:
+            return self._post(lis_result_sourcedid, grade)
+        finally:
+            self._close_sessions()
+
+    def _session(self):
+        """
+        Returns the keep-alive session of the current thread
+        """
+        session = getattr(self._local, 'session', None)
+        if session == None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def _close_sessions(self):
+        with self._sessions_lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+        self._local = threading.local()
+
+    def _post(self, lis_result_sourcedid, grade):
+        """
+        grade must be in range: [0.0, 1.0]
+        """
+        if not lis_result_sourcedid:
+            self.logger.error("Failed grade update ... no lis_result_sourcedid")
+            self.metrics.increment('skipped')
+            return False
+        elif grade < 0.0 or grade > 1.0:
+            self.logger.error("Failed grade update for lis_result_sourcedid: {} grade not in [0.0, 1.0]: {}".format(lis_result_sourcedid, grade))
+            self.metrics.increment('skipped')
+            return False
+
+        request = OutcomeRequest({
+            "consumer_key": self.consumer_key,
+            "consumer_secret": self.consumer_secret,
+            "lis_outcome_service_url": self.lis_outcome_service_url,
+            "lis_result_sourcedid": lis_result_sourcedid,
+        })
+        request.operation = REPLACE_REQUEST
+        request.score = grade
+        data = request.generate_request_xml()
+
+        session = self._session()
+        successful = False
+        unavailable = True
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self.metrics.increment('retries')
+                time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+
+            self.metrics.increment('posted')
+            try:
+                # signed per attempt so every request has a fresh nonce and timestamp
+                response = session.post(self.lis_outcome_service_url, data=data,
+                    auth=OAuth1(self.consumer_key, self.consumer_secret,
+                        signature_type=SIGNATURE_TYPE_AUTH_HEADER, force_include_body=True),
+                    headers={'Content-type': 'application/xml'}, timeout=self.timeout)
+            except requests.exceptions.RequestException as error:
+                self.logger.warning("Error posting grade for lis_result_sourcedid: {} ... {}".format(lis_result_sourcedid, error))
+                continue
+
+            if response.status_code in RETRY_STATUS_CODES:
+                self.logger.warning("Consumer unavailable posting grade for lis_result_sourcedid: {} ... status: {}".format(
+                    lis_result_sourcedid, response.status_code))
+                continue
+
+            unavailable = False
+            try:
+                successful = OutcomeResponse.from_post_response(response, response.content).is_success()
+            except Exception:
+                successful = False
+            break
+
+        if successful:
+            self.logger.debug("Successfully grade update for lis_result_sourcedid: {} with grade: {}".format(lis_result_sourcedid, grade))
+            self.metrics.increment('succeeded')
+        else:
+            self.logger.error("Failed grade update for lis_result_sourcedid: {} with grade: {}".format(lis_result_sourcedid, grade))
+            self.metrics.increment('failed')
+            if unavailable:
+                self.metrics.add_unavailable(lis_result_sourcedid)
+        return successful
@@ -36,4 +36,21 @@ class WriteTrackingMixin(ModifyTrackingMixin, CreateTrackingMixin):
                     if current_user and current_user.is_authenticated:
                         target.modified_user_id = current_user.id
                     else:
-                        target.modified_user_id = None
\ No newline at end of file
+                        target.modified_user_id = None
+
+    @classmethod
+    def bulk_write_tracking_values(cls, insert=False):
+        """
+        Returns the write tracking values of a bulk insert/update mapping (bulk operations skip the orm events)
+        """
+        now = datetime.utcnow()
+        user_id = current_user.id if current_user and current_user.is_authenticated else None
+
+        values = {
+            'modified': now,
+            'modified_user_id': user_id
+        }
+        if insert:
+            values['created'] = now
+            values['created_user_id'] = user_id
+        return values
@@ -0,0 +1,427 @@
+import uuid
+
+import numpy
+from sqlalchemy import and_, or_, event
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy.orm.attributes import get_history
+from flask import current_app
+
+from compair.core import cache
+from compair.algorithms import ScoredObject
+from compair.algorithms.pair.adaptive_matching import match_round
+
+from .custom_types import CourseRole
+from .answer import Answer
+from .answer_score import AnswerScore
+from .answer_criterion_score import AnswerCriterionScore
+from .assignment_criterion import AssignmentCriterion
+from .user_course import UserCourse
+
+class PairingSnapshot(object):
+    """
+    Per-assignment data needed to generate comparison pairs.
+
+    answers is a compact array of (answer_id, score, variable1, variable2, round, user_id, group_id)
+    for every answer that can be compared (missing ids are stored as -1 and missing scores as NaN).
+    criterion_scores maps answer id to a dictionary of criterion id to score and
+    criterion_weights maps criterion id to weight.
+
+    When PAIRING_SNAPSHOT_CACHE_ENABLED is set, snapshots are kept in the shared cache.
+    Round and score changes are recorded as patches applied on top of the cached snapshot
+    while answer, assignment criteria and enrolment changes invalidate it.
+    Every build has a new version (the build generation). Patches are recorded for the current
+    generation only, so patches of an older build (already included in the database the new
+    snapshot is built from) are never applied to it, and data derived from a snapshot (like the
+    round matchings) is discarded with it.
+    """
+    ANSWER_DTYPE = numpy.dtype([
+        ('answer_id', 'i8'), ('score', 'f8'), ('variable1', 'f8'), ('variable2', 'f8'), ('round', 'i8'),
+        ('user_id', 'i8'), ('group_id', 'i8')
+    ])
+    NO_ID = -1
+
+    def __init__(self, assignment_id, answers, criterion_scores, criterion_weights, enrolment_version=None,
+            version=None):
+        self.assignment_id = assignment_id
+        self.answers = answers
+        self.criterion_scores = criterion_scores
+        self.criterion_weights = criterion_weights
+        self.enrolment_version = enrolment_version
+        self.version = version if version != None else uuid.uuid4().hex
+
+    @classmethod
+    def _cache_enabled(cls):
+        return current_app.config.get('PAIRING_SNAPSHOT_CACHE_ENABLED', False)
+
+    @classmethod
+    def _cache_timeout(cls):
+        return current_app.config.get('PAIRING_SNAPSHOT_TIMEOUT')
+
+    @classmethod
+    def _cache_key(cls, assignment_id, suffix=None):
+        key = "pairing_snapshot:" + str(assignment_id)
+        return key + ":" + suffix if suffix else key
+
+    @classmethod
+    def _patch_cache_key(cls, assignment_id, version, name):
+        return cls._cache_key(assignment_id, version + ":" + name)
+
+    @classmethod
+    def _version_cache_key(cls, assignment_id):
+        return cls._cache_key(assignment_id, 'version')
+
+    @classmethod
+    def _enrolment_cache_key(cls, course_id):
+        return "pairing_snapshot_enrolment:" + str(course_id)
+
+    @classmethod
+    def get(cls, course_id, assignment_id):
+        """
+        Returns the pairing snapshot for the assignment from the cache (building it if needed)
+        """
+        if not cls._cache_enabled():
+            return cls.build(course_id, assignment_id)
+
+        enrolment_version = cache.get(cls._enrolment_cache_key(course_id))
+        version = cache.get(cls._version_cache_key(assignment_id))
+        snapshot = cache.get(cls._cache_key(assignment_id))
+
+        # snapshots cached before a format change are rebuilt as well
+        # (as are snapshots of an older build stored by a concurrent rebuild)
+        if snapshot == None or snapshot.enrolment_version != enrolment_version or \
+                snapshot.answers.dtype != cls.ANSWER_DTYPE or getattr(snapshot, 'version', None) != version:
+            # start a new build generation before reading the database: changes committed from now on
+            # are patched onto the new snapshot while patches of the previous build are discarded
+            # (they are already included in the database)
+            new_version = uuid.uuid4().hex
+            cache.set(cls._version_cache_key(assignment_id), new_version, cls._cache_timeout())
+            if version != None:
+                cache.delete(*[cls._patch_cache_key(assignment_id, version, name)
+                    for name in ['rounds', 'scores', 'criterion_scores']])
+
+            snapshot = cls.build(course_id, assignment_id, enrolment_version, new_version)
+            cache.set(cls._cache_key(assignment_id), snapshot, cls._cache_timeout())
+        else:
+            snapshot._apply_patches(
+                cache.hgetall(cls._patch_cache_key(assignment_id, version, 'rounds')),
+                cache.hgetall(cls._patch_cache_key(assignment_id, version, 'scores')),
+                cache.hgetall(cls._patch_cache_key(assignment_id, version, 'criterion_scores'))
+            )
+
+        return snapshot
+
+    @classmethod
+    def build(cls, course_id, assignment_id, enrolment_version=None, version=None):
+        # exclude answers from those without a proper role.
+        # note that sys admin (not enrolled in the course and thus no course role) can create answers.
+        # they are considered eligible
+        ineligibles = UserCourse.query \
+            .with_entities(UserCourse.user_id) \
+            .filter(and_(
+                UserCourse.course_id == course_id,
+                UserCourse.course_role == CourseRole.dropped
+            )) \
+            .all()
+
+        ineligible_user_ids = [ineligible.user_id for ineligible in ineligibles]
+
+        query = Answer.query \
+            .with_entities(Answer.id, AnswerScore.score, AnswerScore.variable1, AnswerScore.variable2,
+                Answer.round, Answer.user_id, Answer.group_id) \
+            .outerjoin(AnswerScore, AnswerScore.answer_id == Answer.id) \
+            .filter(and_(
+                Answer.assignment_id == assignment_id,
+                Answer.active == True,
+                Answer.practice == False,
+                Answer.draft == False,
+                Answer.comparable == True
+            ))
+
+        if len(ineligible_user_ids) > 0:
+            query = query.filter(or_(
+                ~Answer.user_id.in_(ineligible_user_ids),
+                Answer.user_id == None # don't filter out group answers
+            ))
+
+        answers = numpy.array([
+            (
+                answer_id,
+                score if score != None else numpy.nan,
+                variable1 if variable1 != None else numpy.nan,
+                variable2 if variable2 != None else numpy.nan,
+                round,
+                user_id if user_id != None else cls.NO_ID,
+                group_id if group_id != None else cls.NO_ID
+            ) for (answer_id, score, variable1, variable2, round, user_id, group_id) in query.all()
+        ], dtype=cls.ANSWER_DTYPE)
+
+        answer_ids = set(answers['answer_id'].tolist())
+
+        answer_criterion_scores = AnswerCriterionScore.query \
+            .with_entities(AnswerCriterionScore.answer_id,
+                AnswerCriterionScore.criterion_id, AnswerCriterionScore.score) \
+            .filter(AnswerCriterionScore.assignment_id == assignment_id) \
+            .all()
+
+        criterion_scores = {}
+        for criterion_score in answer_criterion_scores:
+            if criterion_score.answer_id not in answer_ids:
+                continue
+            scores = criterion_scores.setdefault(criterion_score.answer_id, {})
+            scores[criterion_score.criterion_id] = criterion_score.score
+
+        assignment_criterion_weights = AssignmentCriterion.query \
+            .with_entities(AssignmentCriterion.criterion_id, AssignmentCriterion.weight) \
+            .filter(and_(
+                AssignmentCriterion.assignment_id == assignment_id,
+                AssignmentCriterion.active == True
+            )) \
+            .all()
+
+        criterion_weights = {}
+        for the_weight in assignment_criterion_weights:
+            criterion_weights[the_weight.criterion_id] = the_weight.weight
+
+        return PairingSnapshot(assignment_id, answers, criterion_scores, criterion_weights, enrolment_version,
+            version)
+
+    def _apply_patches(self, rounds, scores, criterion_scores):
+        if len(rounds) == 0 and len(scores) == 0 and len(criterion_scores) == 0:
+            return
+
+        answer_index = dict(zip(self.answers['answer_id'].tolist(), range(len(self.answers))))
+
+        for answer_id, amount in rounds.items():
+            index = answer_index.get(int(answer_id))
+            if index != None:
+                self.answers['round'][index] += amount
+
+        for answer_id, values in scores.items():
+            index = answer_index.get(int(answer_id))
+            if index != None:
+                for (field, value) in zip(['score', 'variable1', 'variable2'], values):
+                    self.answers[field][index] = value if value != None else numpy.nan
+
+        for field, score in criterion_scores.items():
+            answer_id, criterion_id = [int(value) for value in field.split(":")]
+            if answer_id in answer_index:
+                self.criterion_scores.setdefault(answer_id, {})[criterion_id] = score
+
+    def scored_objects(self, exclude_user_id=None, exclude_group_id=None, max_round=None):
+        """
+        Returns scored objects for all answers that can be compared by the user
+        (excluding their own answers and answers of their group, and answers above max_round)
+        """
+        answers = self.answers
+        if max_round != None:
+            answers = answers[answers['round'] <= max_round]
+        if exclude_user_id != None:
+            answers = answers[answers['user_id'] != exclude_user_id]
+        if exclude_group_id != None:
+            answers = answers[answers['group_id'] != exclude_group_id]
+
+        # NaN is a missing value
+        return [
+            ScoredObject(
+                key=answer_id,
+                score=score if score == score else None,
+                rounds=round,
+                variable1=variable1 if variable1 == variable1 else None,
+                variable2=variable2 if variable2 == variable2 else None,
+                wins=None, loses=None, opponents=None
+            ) for (answer_id, score, variable1, variable2, round) in zip(
+                answers['answer_id'].tolist(),
+                answers['score'].tolist(),
+                answers['variable1'].tolist(),
+                answers['variable2'].tolist(),
+                answers['round'].tolist()
+            )
+        ]
+
+    def round_matchings(self):
+        """
+        Returns the round matchings shared by every user for the adaptive_matching pairing algorithm
+        (None if snapshots aren't cached)
+        """
+        if not self._cache_enabled():
+            return None
+        return PairingRoundMatchings(self)
+
+    @classmethod
+    def invalidate(cls, assignment_id):
+        if cls._cache_enabled():
+            cache.delete(cls._cache_key(assignment_id))
+
+    @classmethod
+    def invalidate_enrolment(cls, course_id):
+        if cls._cache_enabled():
+            cache.set(cls._enrolment_cache_key(course_id), uuid.uuid4().hex)
+
+    @classmethod
+    def _current_version(cls, assignment_id):
+        """
+        Returns the build generation patches are recorded for (None if there is no cached snapshot to patch)
+        """
+        if not cls._cache_enabled():
+            return None
+        return cache.get(cls._version_cache_key(assignment_id))
+
+    @classmethod
+    def patch_round(cls, assignment_id, answer_id, amount=1):
+        version = cls._current_version(assignment_id)
+        if version != None:
+            cache.hincrby(cls._patch_cache_key(assignment_id, version, 'rounds'), answer_id, amount,
+                cls._cache_timeout())
+
+    @classmethod
+    def patch_round_on_commit(cls, session, assignment_id, answer_id, amount=1):
+        """
+        Patches the round after the session commits (for round updates that bypass the ORM)
+        """
+        _add_session_pending_change(session, ('round', assignment_id, answer_id, amount))
+
+    @classmethod
+    def invalidate_on_commit(cls, session, assignment_id):
+        """
+        Invalidates the snapshot after the session commits (for score updates that bypass the ORM)
+        """
+        _add_session_pending_change(session, ('invalidate', assignment_id))
+
+    @classmethod
+    def patch_score(cls, assignment_id, answer_id, score, variable1=None, variable2=None):
+        version = cls._current_version(assignment_id)
+        if version != None:
+            cache.hset(cls._patch_cache_key(assignment_id, version, 'scores'), answer_id,
+                [score, variable1, variable2], cls._cache_timeout())
+
+    @classmethod
+    def patch_criterion_score(cls, assignment_id, answer_id, criterion_id, score):
+        version = cls._current_version(assignment_id)
+        if version != None:
+            cache.hset(cls._patch_cache_key(assignment_id, version, 'criterion_scores'),
+                str(answer_id) + ":" + str(criterion_id), score, cls._cache_timeout())
+
+
+class PairingRoundMatchings(object):
+    """
+    Matchings by score of the snapshot's answers in every round (with the answers of the lower rounds),
+    calculated once and shared by every user through the cache. A matching is discarded with the
+    snapshot it was calculated from or when every matched answer has moved to a higher round
+    """
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def _cache_key(self, round):
+        return PairingSnapshot._cache_key(self.snapshot.assignment_id, 'matching:' + str(round))
+
+    def get(self, round, default=None):
+        cached = cache.get(self._cache_key(round))
+        if cached != None and cached[0] == self.snapshot.version:
+            return cached[1]
+
+        matching = match_round(self.snapshot.scored_objects(max_round=round), log=current_app.logger)
+        cache.set(self._cache_key(round), (self.snapshot.version, matching), PairingSnapshot._cache_timeout())
+        return matching
+
+    def pop(self, round, default=None):
+        cache.delete(self._cache_key(round))
+        return default
+
+# changes are collected while flushing and only applied to the cache after the
+# transaction commits so other processes can't rebuild a snapshot from stale data
+
+def _add_pending_change(target, change):
+    session = object_session(target)
+    if session != None:
+        _add_session_pending_change(session, change)
+
+def _add_session_pending_change(session, change):
+    session.info.setdefault('pairing_snapshot_changes', []).append(change)
+
+@event.listens_for(Session, 'after_commit')
+def _apply_pending_changes(session):
+    changes = session.info.pop('pairing_snapshot_changes', [])
+    if len(changes) == 0 or not PairingSnapshot._cache_enabled():
+        return
+
+    invalidated_assignment_ids = set([
+        change[1] for change in changes if change[0] == 'invalidate'
+    ])
+    for change in changes:
+        if change[0] == 'invalidate':
+            continue
+        elif change[0] == 'invalidate_enrolment':
+            PairingSnapshot.invalidate_enrolment(change[1])
+        elif change[1] in invalidated_assignment_ids:
+            # snapshot will be rebuilt anyways
+            continue
+        elif change[0] == 'round':
+            PairingSnapshot.patch_round(*change[1:])
+        elif change[0] == 'score':
+            PairingSnapshot.patch_score(*change[1:])
+        elif change[0] == 'criterion_score':
+            PairingSnapshot.patch_criterion_score(*change[1:])
+
+    for assignment_id in invalidated_assignment_ids:
+        PairingSnapshot.invalidate(assignment_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending_changes(session):
+    session.info.pop('pairing_snapshot_changes', None)
+
+# answer fields that change whether or by whom an answer can be compared
+ANSWER_PAIRING_ATTRIBUTES = ['assignment_id', 'user_id', 'group_id',
+    'active', 'practice', 'draft', 'comparable']
+
+@event.listens_for(Answer, 'after_insert')
+@event.listens_for(Answer, 'after_delete')
+def _answer_inserted_or_deleted(mapper, connection, target):
+    _add_pending_change(target, ('invalidate', target.assignment_id))
+
+@event.listens_for(Answer, 'after_update')
+def _answer_updated(mapper, connection, target):
+    for attribute in ANSWER_PAIRING_ATTRIBUTES:
+        history = get_history(target, attribute)
+        if history.has_changes():
+            _add_pending_change(target, ('invalidate', target.assignment_id))
+            if attribute == 'assignment_id' and history.deleted:
+                _add_pending_change(target, ('invalidate', history.deleted[0]))
+            return
+
+    history = get_history(target, 'round')
+    if history.has_changes():
+        if history.deleted and history.deleted[0] != None and history.added:
+            _add_pending_change(target, ('round', target.assignment_id, target.id,
+                history.added[0] - history.deleted[0]))
+        else:
+            _add_pending_change(target, ('invalidate', target.assignment_id))
+
+@event.listens_for(AnswerScore, 'after_insert')
+@event.listens_for(AnswerScore, 'after_update')
+def _answer_score_changed(mapper, connection, target):
+    _add_pending_change(target, ('score', target.assignment_id, target.answer_id,
+        target.score, target.variable1, target.variable2))
+
+@event.listens_for(AnswerCriterionScore, 'after_insert')
+@event.listens_for(AnswerCriterionScore, 'after_update')
+def _answer_criterion_score_changed(mapper, connection, target):
+    _add_pending_change(target, ('criterion_score', target.assignment_id, target.answer_id,
+        target.criterion_id, target.score))
+
+@event.listens_for(AnswerScore, 'after_delete')
+@event.listens_for(AnswerCriterionScore, 'after_delete')
+@event.listens_for(AssignmentCriterion, 'after_insert')
+@event.listens_for(AssignmentCriterion, 'after_update')
+@event.listens_for(AssignmentCriterion, 'after_delete')
+def _assignment_pairing_data_changed(mapper, connection, target):
+    _add_pending_change(target, ('invalidate', target.assignment_id))
+
+@event.listens_for(UserCourse, 'after_insert')
+@event.listens_for(UserCourse, 'after_delete')
+def _user_course_inserted_or_deleted(mapper, connection, target):
+    _add_pending_change(target, ('invalidate_enrolment', target.course_id))
+
+@event.listens_for(UserCourse, 'after_update')
+def _user_course_updated(mapper, connection, target):
+    if get_history(target, 'course_role').has_changes():
+        _add_pending_change(target, ('invalidate_enrolment', target.course_id))
@@ -0,0 +1,130 @@
+from flask import current_app
+
+from compair.core import cache
+
+from .assignment import Assignment
+from .comparison import Comparison
+
+class ScoreUpdateQueue(object):
+    """
+    Queue of completed comparisons waiting to be scored per assignment.
+
+    When SCORE_UPDATE_QUEUE_ENABLED is set, completed comparisons are queued and scored by a
+    background task instead of during the request. Only one task is pending per assignment so
+    comparisons are scored in the order they were submitted. Comparisons queued while a task is
+    pending are scored together by that task: one by one with incremental updates, or with one
+    full recalculation when more than SCORE_UPDATE_QUEUE_MAX_INCREMENTAL are waiting.
+    """
+    PENDING_LOCK_TIMEOUT = 600 # 10 minutes
+
+    @classmethod
+    def enabled(cls):
+        return current_app.config.get('SCORE_UPDATE_QUEUE_ENABLED', False)
+
+    @classmethod
+    def _max_incremental(cls):
+        return current_app.config.get('SCORE_UPDATE_QUEUE_MAX_INCREMENTAL', 50)
+
+    @classmethod
+    def _cache_key(cls, assignment_id):
+        return "score_update_queue:" + str(assignment_id)
+
+    @classmethod
+    def _pending_cache_key(cls, assignment_id):
+        return "score_update_queue_pending:" + str(assignment_id)
+
+    @classmethod
+    def _recalculate_cache_key(cls, assignment_id):
+        return "score_update_queue_recalculate:" + str(assignment_id)
+
+    @classmethod
+    def length(cls, assignment_id):
+        return cache.llen(cls._cache_key(assignment_id))
+
+    @classmethod
+    def push(cls, assignment_id, comparison_id):
+        """
+        Queues a completed comparison to be scored
+        """
+        cache.rpush(cls._cache_key(assignment_id), comparison_id)
+        cls.request_update(assignment_id)
+
+    @classmethod
+    def request_update(cls, assignment_id):
+        """
+        Queues a background score update unless one is already pending for the assignment
+        """
+        if cache.add(cls._pending_cache_key(assignment_id), True, cls.PENDING_LOCK_TIMEOUT):
+            from compair.tasks import update_assignment_scores
+            update_assignment_scores.delay(assignment_id)
+
+    @classmethod
+    def process(cls, assignment_id):
+        """
+        Scores all queued comparisons of the assignment. Returns the number of comparisons scored
+        """
+        try:
+            number_of_comparisons = cls._process(assignment_id)
+        finally:
+            cache.delete(cls._pending_cache_key(assignment_id))
+
+        # comparisons queued after the last batch was taken
+        if cls.length(assignment_id) > 0:
+            cls.request_update(assignment_id)
+
+        return number_of_comparisons
+
+    @classmethod
+    def _process(cls, assignment_id):
+        number_of_comparisons = 0
+        while True:
+            comparison_ids = cls._pop_all(assignment_id)
+            recalculate = cache.get(cls._recalculate_cache_key(assignment_id))
+            if not comparison_ids and not recalculate:
+                return number_of_comparisons
+
+            assignment = Assignment.query.get(assignment_id)
+            if not assignment or not assignment.active:
+                cache.delete(cls._recalculate_cache_key(assignment_id))
+                return number_of_comparisons
+
+            if recalculate or len(comparison_ids) > cls._max_incremental():
+                # the flag is kept until the recalculation succeeds so that a retry recalculates
+                cache.set(cls._recalculate_cache_key(assignment_id), True)
+                Comparison.calculate_scores(assignment_id)
+                cache.delete(cls._recalculate_cache_key(assignment_id))
+            else:
+                try:
+                    cls._update_scores_1vs1(comparison_ids)
+                except Exception:
+                    # the queued comparisons are gone, so recover with a full recalculation
+                    cache.set(cls._recalculate_cache_key(assignment_id), True)
+                    raise
+
+            number_of_comparisons += len(comparison_ids)
+
+    @classmethod
+    def _pop_all(cls, assignment_id):
+        key = cls._cache_key(assignment_id)
+        comparison_ids = []
+        while True:
+            comparison_id = cache.lpop(key)
+            if comparison_id == None:
+                return comparison_ids
+            # a resubmitted comparison is only scored once
+            if comparison_id not in comparison_ids:
+                comparison_ids.append(comparison_id)
+
+    @classmethod
+    def _update_scores_1vs1(cls, comparison_ids):
+        comparisons = Comparison.query \
+            .filter(Comparison.id.in_(comparison_ids)) \
+            .all()
+        comparisons = dict((comparison.id, comparison) for comparison in comparisons)
+
+        # in submission order
+        for comparison_id in comparison_ids:
+            comparison = comparisons.get(comparison_id)
+            if comparison and comparison.completed:
+                Comparison.update_scores_1vs1(comparison)
+
@@ -57,6 +57,58 @@ BROKER_TRANSPORT_OPTIONS = {
     'fanout_patterns': True
 }
 
+# shared cache, possible values 'local' (single process only), 'redis'
+CACHE_BACKEND = 'local'
+CACHE_REDIS_URL = None
+CACHE_KEY_PREFIX = 'compair:'
+
+# cache per-assignment pairing data between comparison requests
+# (use the redis cache backend when running multiple processes)
+PAIRING_SNAPSHOT_CACHE_ENABLED = False
+PAIRING_SNAPSHOT_TIMEOUT = 600 # 10 minutes
+
+# cache the lowest score shown to students when an assignment limits answers listed by rank
+# (use the redis cache backend when running multiple processes)
+RANK_THRESHOLD_CACHE_ENABLED = False
+RANK_THRESHOLD_CACHE_TIMEOUT = 3600 # 1 hour
+
+# serve new comparisons from a buffer of pairs pre-generated per assignment by a celery task
+# (requires PAIRING_SNAPSHOT_CACHE_ENABLED, and the redis cache backend and a celery worker unless
+# CELERY_ALWAYS_EAGER is set)
+COMPARISON_PAIR_QUEUE_ENABLED = False
+COMPARISON_PAIR_QUEUE_SIZE = 100
+COMPARISON_PAIR_QUEUE_TIMEOUT = 3600 # 1 hour
+
+# full score recalculations score the overall and criteria comparisons in parallel processes
+# (0 uses one process per cpu). Recalculations with fewer comparisons run in the current process
+SCORE_RECALCULATION_PROCESSES = 0
+SCORE_RECALCULATION_PARALLEL_MIN_COMPARISONS = 10000
+
+# score completed comparisons in a celery task per assignment instead of during the request.
+# Comparisons submitted while a task is pending are scored together by it (with a full
+# recalculation when more than SCORE_UPDATE_QUEUE_MAX_INCREMENTAL are waiting)
+# (requires the redis cache backend and a celery worker unless CELERY_ALWAYS_EAGER is set)
+SCORE_UPDATE_QUEUE_ENABLED = False
+SCORE_UPDATE_QUEUE_MAX_INCREMENTAL = 50
+
+# recalculate the grades of students after answers, comparisons and self-evaluations in a celery task
+# per course instead of during the request. The task waits GRADE_UPDATE_QUEUE_DELAY seconds so
+# students updated in the meantime are recalculated together (and only once)
+# (requires the redis cache backend and a celery worker unless CELERY_ALWAYS_EAGER is set)
+GRADE_UPDATE_QUEUE_ENABLED = False
+GRADE_UPDATE_QUEUE_DELAY = 10
+
+# LTI outcomes (grades) are posted to a consumer over keep-alive connections with up to
+# LTI_OUTCOME_MAX_CONCURRENCY requests at once and at most LTI_OUTCOME_RATE_LIMIT requests
+# per second per consumer (0 for no limit). Failed connections and busy responses are retried
+# LTI_OUTCOME_MAX_RETRIES times, waiting LTI_OUTCOME_RETRY_BACKOFF milliseconds (doubled every retry),
+# then the task is retried with the outcomes still unavailable
+LTI_OUTCOME_MAX_CONCURRENCY = 8
+LTI_OUTCOME_RATE_LIMIT = 20
+LTI_OUTCOME_MAX_RETRIES = 3
+LTI_OUTCOME_RETRY_BACKOFF = 500
+LTI_OUTCOME_TIMEOUT = 30 # seconds
+
 # xAPI & Learning Record Stores (LRS)
 XAPI_ENABLED = False
 CALIPER_ENABLED = False
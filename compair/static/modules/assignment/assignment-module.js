@@ -68,7 +68,9 @@ var _findEqualPartitionsRecursive = function(partition1, partition2) {
 module.constant('PairingAlgorithm', {
     adaptive: "adaptive",
     random: "random",
-    adaptive_min_delta: "adaptive_min_delta"
+    adaptive_min_delta: "adaptive_min_delta",
+    adaptive_matching: "adaptive_matching",
+    adaptive_uncertainty: "adaptive_uncertainty"
 });
 
 /***** Directives *****/
@@ -1499,6 +1501,7 @@ module.controller("AssignmentWriteController",
                 answer_grade_weight: 1,
                 comparison_grade_weight: 1,
                 self_evaluation_grade_weight: 1,
+                course_grade_weight: 1,
                 existingFile: false
             }
 
@@ -1573,6 +1576,7 @@ module.controller("AssignmentWriteController",
                 answer_grade_weight: originalAssignment.answer_grade_weight,
                 comparison_grade_weight: originalAssignment.comparison_grade_weight,
                 self_evaluation_grade_weight: originalAssignment.self_evaluation_grade_weight,
+                course_grade_weight: originalAssignment.course_grade_weight,
                 peer_feedback_prompt: originalAssignment.peer_feedback_prompt,
                 rank_display_limit: originalAssignment.rank_display_limit,
 
@@ -1,6 +1,9 @@
+from .comparison_pair_queue import refill_comparison_pair_queue
 from .demo import reset_demo
 from .emit_learning_record import emit_lrs_xapi_statement, emit_lrs_caliper_event
+from .grade_update_queue import update_queued_grades
 from .lti_membership import update_lti_course_membership
 from .lti_outcomes import update_lti_course_grades, update_lti_assignment_grades
+from .score_update_queue import update_assignment_scores
 from .send_mail import send_message, send_messages
 from .user_password import set_passwords
\ No newline at end of file
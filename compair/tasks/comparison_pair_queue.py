@@ -0,0 +1,9 @@
+from compair.core import celery
+from compair.models import ComparisonPairQueue
+from flask import current_app
+
+@celery.task(bind=True, autoretry_for=(Exception,),
+    ignore_result=True, store_errors_even_if_ignored=True)
+def refill_comparison_pair_queue(self, assignment_id):
+    number_of_pairs = ComparisonPairQueue.refill(assignment_id)
+    current_app.logger.debug("Added {} pairs to the comparison pair queue for assignment: {}".format(number_of_pairs, assignment_id))
@@ -0,0 +1,9 @@
+from compair.core import celery
+from compair.models import GradeUpdateQueue
+from flask import current_app
+
+@celery.task(bind=True, autoretry_for=(Exception,),
+    ignore_result=True, store_errors_even_if_ignored=True)
+def update_queued_grades(self, course_id):
+    number_of_users = GradeUpdateQueue.process(course_id)
+    current_app.logger.debug("Updated queued grades of {} users for course: {}".format(number_of_users, course_id))
@@ -1,7 +1,8 @@
 import requests
 
 from compair.core import celery, db
-from compair.models import LTIConsumer, LTIOutcome, CourseGrade, AssignmentGrade
+from compair.models import LTIConsumer, LTIOutcome, LTIOutcomeDispatcher, CourseGrade, AssignmentGrade
+from compair.models.lti_models import OutcomeConsumerUnavailableException
 from flask import current_app
 
 @celery.task(bind=True, autoretry_for=(Exception,),
@@ -10,15 +11,7 @@ def update_lti_course_grades(self, lti_consumer_id, sourcedid_and_grades):
     lti_consumer = LTIConsumer.query.get(lti_consumer_id)
     if lti_consumer:
         current_app.logger.info("Begin LTI Outcomes grade update for lti_consumer: {} named: {}".format(lti_consumer.id, lti_consumer.tool_consumer_instance_name))
-        for (lis_result_sourcedid, course_grade_id) in sourcedid_and_grades:
-            if course_grade_id:
-                course_grade = CourseGrade.query.get(course_grade_id)
-                grade = course_grade.grade if course_grade else 0.0
-
-                current_app.logger.debug("Posting grade for lis_result_sourcedid: {}".format(lis_result_sourcedid))
-
-                LTIOutcome.post_replace_result(lti_consumer, lis_result_sourcedid, grade)
-
+        _dispatch_grades(self, lti_consumer, CourseGrade, sourcedid_and_grades)
     else:
         current_app.logger.info("Failed LTI Outcomes grade update for lti_consumer with id: {}. record not found.".format(lti_consumer_id))
 
@@ -28,13 +21,31 @@ def update_lti_assignment_grades(self, lti_consumer_id, sourcedid_and_grades):
     lti_consumer = LTIConsumer.query.get(lti_consumer_id)
     if lti_consumer:
         current_app.logger.info("Begin LTI Outcomes grade update for lti_consumer: {} named: {}".format(lti_consumer.id, lti_consumer.tool_consumer_instance_name))
-        for (lis_result_sourcedid, assignment_grade_id) in sourcedid_and_grades:
-            if assignment_grade_id:
-                assignment_grade = AssignmentGrade.query.get(assignment_grade_id)
-                grade = assignment_grade.grade if assignment_grade else 0.0
-
-                current_app.logger.debug("Posting grade for lis_result_sourcedid: {}".format(lis_result_sourcedid))
-
-                LTIOutcome.post_replace_result(lti_consumer, lis_result_sourcedid, grade)
+        _dispatch_grades(self, lti_consumer, AssignmentGrade, sourcedid_and_grades)
     else:
-        current_app.logger.info("Failed LTI Outcomes grade update for lti_consumer with id: {}. record not found.".format(lti_consumer_id))
\ No newline at end of file
+        current_app.logger.info("Failed LTI Outcomes grade update for lti_consumer with id: {}. record not found.".format(lti_consumer_id))
+
+def _dispatch_grades(task, lti_consumer, model, sourcedid_and_grades):
+    # grades of every sourcedid in a single query (missing grades are posted as 0)
+    grade_ids = [grade_id for (lis_result_sourcedid, grade_id) in sourcedid_and_grades if grade_id]
+    if len(grade_ids) == 0:
+        return
+
+    grades = dict(model.query \
+        .with_entities(model.id, model.grade) \
+        .filter(model.id.in_(grade_ids)) \
+        .all())
+
+    try:
+        LTIOutcomeDispatcher(lti_consumer).dispatch([
+            (lis_result_sourcedid, grades.get(grade_id, 0.0))
+            for (lis_result_sourcedid, grade_id) in sourcedid_and_grades if grade_id
+        ])
+    except OutcomeConsumerUnavailableException as error:
+        # retry only the outcomes the consumer was unavailable for (grades are read again on retry).
+        # not raised since autoretry_for would catch the Retry and retry again with every outcome
+        unavailable = set(error.lis_result_sourcedids)
+        task.retry(exc=error, throw=False, args=(lti_consumer.id, [
+            (lis_result_sourcedid, grade_id)
+            for (lis_result_sourcedid, grade_id) in sourcedid_and_grades if lis_result_sourcedid in unavailable
+        ]))
@@ -0,0 +1,9 @@
+from compair.core import celery
+from compair.models import ScoreUpdateQueue
+from flask import current_app
+
+@celery.task(bind=True, autoretry_for=(Exception,),
+    ignore_result=True, store_errors_even_if_ignored=True)
+def update_assignment_scores(self, assignment_id):
+    number_of_comparisons = ScoreUpdateQueue.process(assignment_id)
+    current_app.logger.debug("Scored {} queued comparisons for assignment: {}".format(number_of_comparisons, assignment_id))
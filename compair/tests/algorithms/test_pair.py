@@ -1,6 +1,6 @@
 import unittest
 
-from compair.algorithms import ComparisonPair, ScoredObject
+from compair.algorithms import ComparisonPair, ScoredObject, UserComparedAllObjectsException
 from compair.algorithms.pair import generate_pair
 
 class TestPair(unittest.TestCase):
@@ -73,6 +73,24 @@ class TestPair(unittest.TestCase):
         self.assertEqual(max_key, 4)
         self.assertEqual(results.winner, None)
 
+        # test adaptive matching pair algorithm
+        self.package_name = "adaptive_matching"
+
+        results = generate_pair(
+            package_name=self.package_name,
+            scored_objects=self.scored_objects,
+            comparison_pairs=self.comparisons
+        )
+
+        self.assertIsInstance(results, ComparisonPair)
+        min_key = min([results.key1, results.key2])
+        max_key = max([results.key1, results.key2])
+
+        # round zero items should be selected
+        self.assertEqual(min_key, 3)
+        self.assertEqual(max_key, 4)
+        self.assertEqual(results.winner, None)
+
         # test random pair algorithm
         self.package_name = "random"
 
@@ -89,4 +107,44 @@ class TestPair(unittest.TestCase):
         # round zero items should be selected
         self.assertEqual(min_key, 3)
         self.assertEqual(max_key, 4)
-        self.assertEqual(results.winner, None)
\ No newline at end of file
+        self.assertEqual(results.winner, None)
+
+    def test_generate_pair_with_deleted_opponents(self):
+        # comparisons against soft deleted scored objects should not count
+        # against the remaining valid opponents
+        self.comparisons = [
+            ComparisonPair(1, 5, None),
+            ComparisonPair(1, 6, None),
+            ComparisonPair(1, 2, None),
+            ComparisonPair(3, 4, None)
+        ]
+
+        for package_name in ["random", "adaptive", "adaptive_matching", "adaptive_uncertainty"]:
+            results = generate_pair(
+                package_name=package_name,
+                scored_objects=list(self.scored_objects),
+                comparison_pairs=self.comparisons
+            )
+
+            self.assertIsInstance(results, ComparisonPair)
+            pair = set([results.key1, results.key2])
+            self.assertNotIn(pair, [set([1, 2]), set([3, 4])])
+            self.assertEqual(len(pair), 2)
+
+        # compared with all other remaining objects
+        self.comparisons = [
+            ComparisonPair(1, 2, None),
+            ComparisonPair(1, 3, None),
+            ComparisonPair(1, 4, None),
+            ComparisonPair(2, 3, None),
+            ComparisonPair(2, 4, None),
+            ComparisonPair(3, 4, None),
+            ComparisonPair(1, 5, None)
+        ]
+
+        with self.assertRaises(UserComparedAllObjectsException):
+            generate_pair(
+                package_name="random",
+                scored_objects=list(self.scored_objects),
+                comparison_pairs=self.comparisons
+            )
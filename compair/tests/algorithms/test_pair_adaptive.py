@@ -12,7 +12,8 @@ class TestPairAdaptive(unittest.TestCase):
         pass
 
     @mock.patch('random.shuffle')
-    def test_generate_pair(self, mock_shuffle):
+    @mock.patch.object(AdaptivePairGenerator, '_random_order', side_effect=iter)
+    def test_generate_pair(self, mock_random_order, mock_shuffle):
         # empty scored objects set
         scored_objects = []
         comparisons = []
@@ -304,4 +305,70 @@ class TestPairAdaptive(unittest.TestCase):
         # make sure all pairs are distinct
         self.assertEqual(
             len(comparisons),
-            len(set([tuple(sorted([c.key1, c.key2])) for c in comparisons])))
\ No newline at end of file
+            len(set([tuple(sorted([c.key1, c.key2])) for c in comparisons])))
+
+    def test_find_closest_by_score(self):
+        scored_objects = [
+            ScoredObject(
+                key=key, score=score, variable1=None, variable2=None,
+                rounds=0, wins=None, loses=None, opponents=None
+            ) for (key, score) in [(1, 1.0), (2, 0.25), (3, 0.75), (4, 0.125), (5, 0.25), (6, 0.5)]
+        ]
+        (sorted_scores, sorted_objects) = self.pair_algorithm._sort_by_score(scored_objects)
+        self.assertEqual(sorted_scores, [0.125, 0.25, 0.25, 0.5, 0.75, 1.0])
+
+        # empty lists
+        self.assertIsNone(self.pair_algorithm._find_closest_by_score([], [], 0.5))
+
+        # exact and nearest matches
+        result = self.pair_algorithm._find_closest_by_score(sorted_scores, sorted_objects, 0.5)
+        self.assertEqual(result.key, 6)
+        result = self.pair_algorithm._find_closest_by_score(sorted_scores, sorted_objects, 0.0)
+        self.assertEqual(result.key, 4)
+        result = self.pair_algorithm._find_closest_by_score(sorted_scores, sorted_objects, 1.5)
+        self.assertEqual(result.key, 1)
+
+        # tied scores are selected randomly
+        selected_keys = set()
+        for _ in range(100):
+            result = self.pair_algorithm._find_closest_by_score(sorted_scores, sorted_objects, 0.2)
+            selected_keys.add(result.key)
+        self.assertEqual(selected_keys, set([2, 5]))
+
+        # equal distance on both sides are selected randomly
+        selected_keys = set()
+        for _ in range(100):
+            result = self.pair_algorithm._find_closest_by_score(sorted_scores, sorted_objects, 0.875)
+            selected_keys.add(result.key)
+        self.assertEqual(selected_keys, set([1, 3]))
+
+        # excluded keys are skipped
+        result = self.pair_algorithm._find_closest_by_score(sorted_scores, sorted_objects, 0.5, set([6]))
+        self.assertIn(result.key, [2, 5, 3])
+        selected_keys = set()
+        for _ in range(100):
+            result = self.pair_algorithm._find_closest_by_score(sorted_scores, sorted_objects, 0.2, set([2, 6]))
+            selected_keys.add(result.key)
+        self.assertEqual(selected_keys, set([5]))
+        result = self.pair_algorithm._find_closest_by_score(sorted_scores, sorted_objects, 0.0, set([4, 2, 5]))
+        self.assertEqual(result.key, 6)
+        self.assertIsNone(self.pair_algorithm._find_closest_by_score(sorted_scores, sorted_objects, 0.5,
+            set([1, 2, 3, 4, 5, 6])))
+
+    def test_random_order(self):
+        keys = list(range(10))
+        orders = set()
+        for _ in range(200):
+            order = list(self.pair_algorithm._random_order(keys))
+            self.assertEqual(sorted(order), keys)
+            orders.add(tuple(order))
+        self.assertGreater(len(orders), 150)
+        # the list isn't modified
+        self.assertEqual(keys, list(range(10)))
+
+        # every object is as likely to be taken first
+        first_counts = dict((key, 0) for key in keys)
+        for _ in range(5000):
+            first_counts[next(self.pair_algorithm._random_order(keys))] += 1
+        for count in first_counts.values():
+            self.assertAlmostEqual(count, 500, delta=120)
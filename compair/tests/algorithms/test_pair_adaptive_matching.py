@@ -0,0 +1,128 @@
+import unittest
+import mock
+
+from compair.algorithms.pair.adaptive_matching.pair_generator import AdaptiveMatchingPairGenerator
+from compair.algorithms import ComparisonPair, ScoredObject, InsufficientObjectsForPairException, \
+    UserComparedAllObjectsException
+
+class TestPairAdaptiveMatching(unittest.TestCase):
+    pair_algorithm = AdaptiveMatchingPairGenerator()
+
+    def _scored_objects(self, scores, rounds=None):
+        return [
+            ScoredObject(
+                key=index+1, score=score, variable1=None, variable2=None,
+                rounds=rounds[index] if rounds else 0, wins=None, loses=None, opponents=None
+            ) for index, score in enumerate(scores)
+        ]
+
+    def _pair_keys(self, pairs):
+        return set([frozenset([pair.key1, pair.key2]) for pair in pairs])
+
+    @mock.patch('random.shuffle')
+    def test_generate_pair(self, mock_shuffle):
+        # not enough scored objects for comparison
+        with self.assertRaises(InsufficientObjectsForPairException):
+            self.pair_algorithm.generate_pair([], [])
+
+        with self.assertRaises(InsufficientObjectsForPairException):
+            self.pair_algorithm.generate_pair(self._scored_objects([0.5]), [])
+
+        # user compared all objects
+        scored_objects = self._scored_objects([0.5, 0.6])
+        comparisons = [ComparisonPair(1, 2, None)]
+        with self.assertRaises(UserComparedAllObjectsException):
+            self.pair_algorithm.generate_pair(scored_objects, comparisons)
+
+        # objects in the lowest round are paired by score
+        scored_objects = self._scored_objects([0.5, 0.9, 0.1, 0.55, None], [1, 0, 0, 1, 0])
+        results = self.pair_algorithm.generate_pair(scored_objects, [])
+        self.assertEqual(results, ComparisonPair(key1=5, key2=3, winner=None))
+
+        # higher rounds are used if the lowest round has no valid pair
+        # (uses only unused objects first)
+        scored_objects = self._scored_objects([0.5, 0.9, 0.1, 0.55], [1, 0, 0, 1])
+        comparisons = [ComparisonPair(2, 3, None), ComparisonPair(1, 4, None)]
+        results = self.pair_algorithm.generate_pair(scored_objects, comparisons)
+        self.assertEqual(results, ComparisonPair(key1=3, key2=1, winner=None))
+
+    @mock.patch('random.shuffle')
+    def test_generate_pair_round_matchings(self, mock_shuffle):
+        scored_objects = self._scored_objects([0.125, 0.25, 0.3125, 0.5, 0.9], [0, 0, 0, 0, 1])
+
+        # pairs are served from the shared round matching without matching the round again
+        round_matchings = {0: [(1, 3), (2, 4)]}
+        with mock.patch.object(self.pair_algorithm, '_match') as mock_match:
+            results = self.pair_algorithm.generate_pair(scored_objects, [], round_matchings)
+            self.assertEqual(results, ComparisonPair(key1=1, key2=3, winner=None))
+            mock_match.assert_not_called()
+
+        # pairs the user compared (or with objects they can't compare) are skipped
+        results = self.pair_algorithm.generate_pair(scored_objects, [ComparisonPair(3, 1, None)], round_matchings)
+        self.assertEqual(results, ComparisonPair(key1=2, key2=4, winner=None))
+        results = self.pair_algorithm.generate_pair(scored_objects[1:], [], round_matchings)
+        self.assertEqual(results, ComparisonPair(key1=2, key2=4, winner=None))
+
+        # rounds without a shared matching (or without a pair the user can compare) are matched for the user
+        results = self.pair_algorithm.generate_pair(scored_objects, [], {})
+        self.assertEqual(results, ComparisonPair(key1=1, key2=2, winner=None))
+        comparisons = [ComparisonPair(1, 3, None), ComparisonPair(2, 4, None)]
+        results = self.pair_algorithm.generate_pair(scored_objects, comparisons, round_matchings)
+        self.assertEqual(results, ComparisonPair(key1=1, key2=2, winner=None))
+        self.assertIn(0, round_matchings)
+
+        # matchings whose objects all moved to higher rounds are discarded
+        round_matchings = {0: [(1, 5)]}
+        results = self.pair_algorithm.generate_pair(scored_objects, [], round_matchings)
+        self.assertEqual(results, ComparisonPair(key1=1, key2=2, winner=None))
+        self.assertNotIn(0, round_matchings)
+
+        # the shared matching ignores the user's comparisons
+        self.pair_algorithm._setup_rounds([ComparisonPair(1, 2, None)], scored_objects)
+        self.assertEqual(self.pair_algorithm.match_round(scored_objects[:4]), [(1, 2), (3, 4)])
+
+    @mock.patch('random.shuffle')
+    def test_match(self, mock_shuffle):
+        # greedy pairing of the closest objects first would pair 2 & 3 then 1 & 4 (total distance 0.4375)
+        scored_objects = self._scored_objects([0.125, 0.25, 0.3125, 0.5])
+        self.pair_algorithm._setup_opponents([])
+        round_pairs = self.pair_algorithm._match(scored_objects)
+        self.assertEqual([(pair[0].key, pair[1].key) for pair in round_pairs], [(1, 2), (3, 4)])
+
+        # compared pairs are excluded
+        self.pair_algorithm._setup_opponents([ComparisonPair(1, 2, None)])
+        round_pairs = self.pair_algorithm._match(scored_objects)
+        self.assertEqual([(pair[0].key, pair[1].key) for pair in round_pairs], [(1, 3), (2, 4)])
+
+        # as many objects as possible are matched
+        self.pair_algorithm._setup_opponents([ComparisonPair(1, 2, None), ComparisonPair(1, 3, None)])
+        round_pairs = self.pair_algorithm._match(scored_objects)
+        self.assertEqual([(pair[0].key, pair[1].key) for pair in round_pairs], [(1, 4), (2, 3)])
+
+        # odd number of objects leaves one unmatched
+        scored_objects = self._scored_objects([0.125, 0.25, 0.3125, 0.5, 0.625])
+        self.pair_algorithm._setup_opponents([])
+        round_pairs = self.pair_algorithm._match(scored_objects)
+        self.assertEqual([(pair[0].key, pair[1].key) for pair in round_pairs], [(2, 3), (4, 5)])
+
+    def test_generate_rounds(self):
+        with self.assertRaises(InsufficientObjectsForPairException):
+            self.pair_algorithm.generate_rounds([], 10)
+
+        scored_objects = self._scored_objects([0.1, 0.2, 0.3, 0.4, 0.5, 0.6])
+
+        # first round pairs every object once
+        results = self.pair_algorithm.generate_rounds(scored_objects, 3)
+        self.assertEqual(self._pair_keys(results), set([
+            frozenset([1, 2]), frozenset([3, 4]), frozenset([5, 6])
+        ]))
+
+        # pairs are never repeated
+        results = self.pair_algorithm.generate_rounds(scored_objects, 100)
+        self.assertEqual(len(self._pair_keys(results)), len(results))
+        self.assertGreater(len(results), 6)
+
+        # previous comparisons are not repeated
+        comparisons = [ComparisonPair(1, 2, None)]
+        results = self.pair_algorithm.generate_rounds(scored_objects, 100, comparisons)
+        self.assertNotIn(frozenset([1, 2]), self._pair_keys(results))
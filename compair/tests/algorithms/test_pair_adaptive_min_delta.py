@@ -644,4 +644,30 @@ class TestPairMinDelta(unittest.TestCase):
         # make sure all pairs are distinct
         self.assertEqual(
             len(comparisons),
-            len(set([tuple(sorted([c.key1, c.key2])) for c in comparisons])))
\ No newline at end of file
+            len(set([tuple(sorted([c.key1, c.key2])) for c in comparisons])))
+
+    def test_criterion_score_deltas(self):
+        scored_objects = [
+            ScoredObject(
+                key=key, score=None, variable1=None, variable2=None,
+                rounds=0, wins=None, loses=None, opponents=None
+            ) for key in range(1, 5)
+        ]
+        criterion_scores = {
+            1: { 'c1': 10, 'c2': 20 },
+            2: { 'c1': 12, 'c2': None },
+            3: { 'c1': 10, 'c2': 25, 'c3': 100 }
+        }
+        criterion_weights = { 'c1': 0.5, 'c2': 2 }
+
+        self.pair_algorithm._setup_rounds([], scored_objects)
+        self.pair_algorithm._setup_criterion_scores(criterion_scores, criterion_weights)
+
+        deltas = self.pair_algorithm._criterion_score_deltas(1, scored_objects)
+        # missing criterion scores and None scores count as 0, unweighted criteria are ignored
+        self.assertEqual(list(deltas), [0, 41, 10, 45])
+
+        # caller data is not modified
+        self.assertEqual(criterion_scores[2], { 'c1': 12, 'c2': None })
+        self.assertNotIn(4, criterion_scores)
+        self.assertIsNone(scored_objects[0].score)
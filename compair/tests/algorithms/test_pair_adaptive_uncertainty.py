@@ -0,0 +1,112 @@
+import unittest
+import mock
+
+from compair.algorithms.pair.adaptive_uncertainty.pair_generator import AdaptiveUncertaintyPairGenerator
+from compair.algorithms.score.true_skill_rating.environment import TrueSkillEnvironment, cdf
+from compair.algorithms import ComparisonPair, ScoredObject, InsufficientObjectsForPairException, \
+    UserComparedAllObjectsException
+
+class TestPairAdaptiveUncertainty(unittest.TestCase):
+    pair_algorithm = AdaptiveUncertaintyPairGenerator()
+
+    def _scored_object(self, key, mu, sigma, rounds=0):
+        return ScoredObject(
+            key=key, score=None, variable1=mu, variable2=sigma,
+            rounds=rounds, wins=None, loses=None, opponents=None
+        )
+
+    @mock.patch('random.shuffle')
+    def test_generate_pair(self, mock_shuffle):
+        # not enough scored objects for comparison
+        with self.assertRaises(InsufficientObjectsForPairException):
+            self.pair_algorithm.generate_pair([], [])
+
+        with self.assertRaises(InsufficientObjectsForPairException):
+            self.pair_algorithm.generate_pair([self._scored_object(1, 25, 8)], [])
+
+        # user compared all objects
+        scored_objects = [self._scored_object(1, 25, 8), self._scored_object(2, 25, 8)]
+        comparisons = [ComparisonPair(1, 2, None)]
+        with self.assertRaises(UserComparedAllObjectsException):
+            self.pair_algorithm.generate_pair(scored_objects, comparisons)
+
+        # opponent with the closest rating is selected
+        scored_objects = [
+            self._scored_object(1, 25, 2),
+            self._scored_object(2, 10, 2),
+            self._scored_object(3, 24, 2),
+            self._scored_object(4, 35, 2)
+        ]
+        results = self.pair_algorithm.generate_pair(scored_objects, [])
+        self.assertEqual(results, ComparisonPair(key1=1, key2=3, winner=None))
+
+        # the most uncertain object is selected first. with equal means, a certain opponent
+        # reduces the total variance the most (it is a reliable reference for the uncertain rating)
+        scored_objects = [
+            self._scored_object(1, 25, 2),
+            self._scored_object(2, 25, 6),
+            self._scored_object(3, 25, 1),
+            self._scored_object(4, 25, 4)
+        ]
+        results = self.pair_algorithm.generate_pair(scored_objects, [])
+        self.assertEqual(results, ComparisonPair(key1=2, key2=3, winner=None))
+
+        # an uncertain opponent is selected over a certain one when its variance can be reduced more
+        # (the match quality alone would select the certain opponent)
+        scored_objects = [
+            self._scored_object(1, 25, 3, rounds=0),
+            self._scored_object(2, 25, 0.5, rounds=1),
+            self._scored_object(3, 25, 8, rounds=1)
+        ]
+        results = self.pair_algorithm.generate_pair(scored_objects, [])
+        self.assertEqual(results, ComparisonPair(key1=1, key2=3, winner=None))
+
+        # the most uncertain object is skipped if it has no valid opponent
+        scored_objects = [
+            self._scored_object(1, 25, 2),
+            self._scored_object(2, 25, 6),
+            self._scored_object(3, 25, 1)
+        ]
+        comparisons = [ComparisonPair(2, 1, None), ComparisonPair(2, 3, None)]
+        results = self.pair_algorithm.generate_pair(scored_objects, comparisons)
+        self.assertEqual(results, ComparisonPair(key1=1, key2=3, winner=None))
+
+        # opponent must be in the lowest round possible
+        scored_objects = [
+            self._scored_object(1, 25, 2, rounds=0),
+            self._scored_object(2, 10, 2, rounds=0),
+            self._scored_object(3, 24, 2, rounds=1),
+        ]
+        results = self.pair_algorithm.generate_pair(scored_objects, [])
+        self.assertEqual(results, ComparisonPair(key1=1, key2=2, winner=None))
+
+    def test_variance_reductions(self):
+        scored_object = self._scored_object(1, 27, 3)
+        opponents = [
+            self._scored_object(2, 20, 5),
+            self._scored_object(3, 30, 1),
+            self._scored_object(4, 60, 1),
+            # unrated objects use the default rating
+            self._scored_object(5, None, None)
+        ]
+
+        variance_reductions = self.pair_algorithm._variance_reductions(scored_object, opponents)
+
+        # expected reduction over both outcomes of the TrueSkill update (without draws or drift)
+        environment = TrueSkillEnvironment(tau=0, draw_probability=0)
+        for (opponent, variance_reduction) in zip(opponents, variance_reductions):
+            (mu1, sigma1) = environment.create_rating(scored_object.variable1, scored_object.variable2)
+            (mu2, sigma2) = environment.create_rating(opponent.variable1, opponent.variable2)
+            win_probability = cdf((mu1 - mu2) / (2 * environment.beta ** 2 + sigma1 ** 2 + sigma2 ** 2) ** 0.5)
+
+            (_, new_sigma1, _, new_sigma2) = environment.rate_1vs1(mu1, sigma1, mu2, sigma2)
+            win_reduction = sigma1 ** 2 - new_sigma1 ** 2 + sigma2 ** 2 - new_sigma2 ** 2
+            (_, new_sigma2, _, new_sigma1) = environment.rate_1vs1(mu2, sigma2, mu1, sigma1)
+            loss_reduction = sigma1 ** 2 - new_sigma1 ** 2 + sigma2 ** 2 - new_sigma2 ** 2
+
+            self.assertAlmostEqual(variance_reduction,
+                win_probability * win_reduction + (1 - win_probability) * loss_reduction, places=4)
+
+        # closer and more uncertain opponents reduce the variances more
+        self.assertGreater(variance_reductions[3], variance_reductions[0])
+        self.assertGreater(variance_reductions[1], variance_reductions[2])
@@ -0,0 +1,59 @@
+import unittest
+import mock
+
+from compair.algorithms.pair import schedule_pairs
+from compair.algorithms import ComparisonPair, ScoredObject, InsufficientObjectsForPairException
+
+class TestPairScheduler(unittest.TestCase):
+
+    def _scored_objects(self, scores, rounds=None):
+        return [
+            ScoredObject(
+                key=index+1, score=score, variable1=None, variable2=None,
+                rounds=rounds[index] if rounds else 0, wins=None, loses=None, opponents=None
+            ) for index, score in enumerate(scores)
+        ]
+
+    def test_schedule_pairs(self):
+        with self.assertRaises(InsufficientObjectsForPairException):
+            schedule_pairs(self._scored_objects([]), 10)
+
+        with self.assertRaises(InsufficientObjectsForPairException):
+            schedule_pairs(self._scored_objects([0.5]), 10)
+
+        # every possible pair is scheduled once at most
+        scored_objects = self._scored_objects([0.1, 0.2, 0.3, 0.4, 0.5])
+        for by_score in [True, False]:
+            results = schedule_pairs(scored_objects, 100, by_score)
+            self.assertEqual(len(results), 10)
+            pairs = set([frozenset([pair.key1, pair.key2]) for pair in results])
+            self.assertEqual(len(pairs), 10)
+
+        # limited by number_of_pairs
+        results = schedule_pairs(scored_objects, 3)
+        self.assertEqual(len(results), 3)
+
+    @mock.patch('random.shuffle')
+    def test_schedule_pairs_by_score(self, mock_shuffle):
+        scored_objects = self._scored_objects([0.8, 0.1, 0.75, 0.15, 0.5, 0.45])
+
+        # first pass matches closest neighbours
+        results = schedule_pairs(scored_objects, 3)
+        self.assertEqual(set([frozenset([pair.key1, pair.key2]) for pair in results]), set([
+            frozenset([2, 4]), frozenset([5, 6]), frozenset([1, 3])
+        ]))
+
+        # objects with the fewest rounds are scheduled first
+        scored_objects = self._scored_objects([0.8, 0.1, 0.75, 0.15, 0.5, 0.45], [3, 0, 3, 0, 1, 1])
+        results = schedule_pairs(scored_objects, 2)
+        self.assertEqual(results, [
+            ComparisonPair(key1=2, key2=4, winner=None),
+            ComparisonPair(key1=6, key2=5, winner=None)
+        ])
+
+        # second pass (in reverse order) matches the next closest unscheduled neighbour
+        results = schedule_pairs(scored_objects, 5)
+        self.assertEqual(results[3:], [
+            ComparisonPair(key1=1, key2=5, winner=None),
+            ComparisonPair(key1=3, key2=6, winner=None)
+        ])
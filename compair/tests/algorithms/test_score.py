@@ -1,6 +1,7 @@
 import unittest
 
-from compair.algorithms import ComparisonPair, ScoredObject, ComparisonWinner
+from compair.algorithms import ComparisonPair, ScoredObject, ComparisonWinner, OpponentStats
+from compair.algorithms.opponent_stats import tally_opponent_stats
 from compair.algorithms.score import calculate_score, calculate_score_1vs1
 
 class TestScore(unittest.TestCase):
@@ -246,4 +247,62 @@ class TestScore(unittest.TestCase):
         self.assertEqual(key3_results.rounds, 2)
         self.assertEqual(key3_results.opponents, 2)
         self.assertEqual(key3_results.wins, 0)
-        self.assertEqual(key3_results.loses, 2)
\ No newline at end of file
+        self.assertEqual(key3_results.loses, 2)
+    def test_calculate_score_1vs1_opponent_stats(self):
+        self.comparisons = [
+            ComparisonPair(key1=1,key2=2, winner=ComparisonWinner.key1),
+            ComparisonPair(key1=1,key2=3, winner=ComparisonWinner.key1),
+            ComparisonPair(key1=2,key2=3, winner=ComparisonWinner.key2),
+            ComparisonPair(key1=3,key2=2, winner=ComparisonWinner.draw),
+            ComparisonPair(key1=4,key2=3, winner=ComparisonWinner.key2)
+        ]
+        opponent_stats = tally_opponent_stats(self.comparisons)
+        self.assertEqual(opponent_stats[2], {1: OpponentStats(0, 1), 3: OpponentStats(0, 1)})
+        self.assertEqual(opponent_stats[3], {1: OpponentStats(0, 1), 2: OpponentStats(1, 0), 4: OpponentStats(1, 0)})
+
+        # counting up from the stored scores gives the same results as going over every previous comparison
+        for package_name in ["comparative_judgement", "elo_rating", "true_skill_rating", "bradley_terry"]:
+            results = calculate_score(
+                package_name=package_name,
+                comparison_pairs=self.comparisons
+            )
+
+            for winner in [ComparisonWinner.key1, ComparisonWinner.key2, ComparisonWinner.draw]:
+                expected_results = calculate_score_1vs1(
+                    package_name=package_name,
+                    key1_scored_object=results[2],
+                    key2_scored_object=results[3],
+                    winner=winner,
+                    other_comparison_pairs=self.comparisons
+                )
+                opponent_stats_results = calculate_score_1vs1(
+                    package_name=package_name,
+                    key1_scored_object=results[2],
+                    key2_scored_object=results[3],
+                    winner=winner,
+                    other_comparison_pairs=[],
+                    opponent_stats=opponent_stats
+                )
+
+                for (expected_result, result) in zip(expected_results, opponent_stats_results):
+                    self.assertAlmostEqual(result.score, expected_result.score)
+                    self.assertAlmostEqual(result.variable1, expected_result.variable1)
+                    self.assertEqual(result.variable2, expected_result.variable2)
+                    self.assertEqual(result.rounds, expected_result.rounds)
+                    self.assertEqual(result.opponents, expected_result.opponents)
+                    self.assertEqual(result.wins, expected_result.wins)
+                    self.assertEqual(result.loses, expected_result.loses)
+
+        # first comparison against a new opponent
+        key1_results, key2_results = calculate_score_1vs1(
+            package_name="comparative_judgement",
+            key1_scored_object=results[1],
+            key2_scored_object=results[4],
+            winner=ComparisonWinner.key1,
+            other_comparison_pairs=[],
+            opponent_stats=opponent_stats
+        )
+        self.assertEqual(key1_results.opponents, 3)
+        self.assertEqual(key1_results.wins, 3)
+        self.assertEqual(key2_results.opponents, 2)
+        self.assertEqual(key2_results.loses, 2)
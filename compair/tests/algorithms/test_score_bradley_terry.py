@@ -0,0 +1,173 @@
+import math
+import random
+import unittest
+
+import numpy
+
+from compair.algorithms.score.bradley_terry.score_algorithm import BradleyTerryScoreAlgorithm
+from compair.algorithms import ComparisonPair, ScoredObject, ComparisonWinner, InvalidWinnerException
+
+class TestScoreBradleyTerry(unittest.TestCase):
+    score_algorithm = BradleyTerryScoreAlgorithm()
+
+    def _log_posterior(self, comparisons, abilities):
+        log_posterior = -0.5 * self.score_algorithm.PRIOR_PRECISION * sum(
+            ability ** 2 for ability in abilities.values())
+        for comparison in comparisons:
+            probability = 1.0 / (1.0 + math.exp(abilities[comparison.key2] - abilities[comparison.key1]))
+            result = 1.0 if comparison.winner == ComparisonWinner.key1 else \
+                0.0 if comparison.winner == ComparisonWinner.key2 else 0.5
+            log_posterior += result * math.log(probability) + (1.0 - result) * math.log(1.0 - probability)
+        return log_posterior
+
+    def test_calculate_score(self):
+        # empty comparison set
+        results = self.score_algorithm.calculate_score([])
+        self.assertEqual(len(results.items()), 0)
+
+        # one comparison set with key 1 being the winner
+        comparisons = [
+            ComparisonPair(key1=1,key2=2,winner=ComparisonWinner.key1)
+        ]
+        results = self.score_algorithm.calculate_score(comparisons)
+
+        self.assertEqual(len(results.items()), 2)
+        self.assertIsInstance(results.get(1), ScoredObject)
+        self.assertIsInstance(results.get(1).score, float)
+        self.assertEqual(results.get(1).score, results.get(1).variable1)
+        self.assertIsInstance(results.get(1).variable2, float)
+        self.assertEqual(results.get(1).rounds, 1)
+        self.assertEqual(results.get(1).opponents, 1)
+        self.assertEqual(results.get(1).wins, 1)
+        self.assertEqual(results.get(1).loses, 0)
+
+        self.assertEqual(results.get(2).rounds, 1)
+        self.assertEqual(results.get(2).opponents, 1)
+        self.assertEqual(results.get(2).wins, 0)
+        self.assertEqual(results.get(2).loses, 1)
+
+        # abilities are symmetric around the prior mean
+        self.assertGreater(results.get(1).score, 0)
+        self.assertAlmostEqual(results.get(1).score, -results.get(2).score)
+
+        # incomplete comparisons and draws
+        comparisons = [
+            ComparisonPair(key1=1,key2=2,winner=ComparisonWinner.draw),
+            ComparisonPair(key1=1,key2=3,winner=None)
+        ]
+        results = self.score_algorithm.calculate_score(comparisons)
+
+        self.assertEqual(results.get(1).rounds, 2)
+        self.assertEqual(results.get(1).opponents, 1)
+        self.assertEqual(results.get(1).wins, 0)
+        self.assertEqual(results.get(1).loses, 0)
+        self.assertEqual(results.get(3).rounds, 1)
+        self.assertEqual(results.get(3).opponents, 0)
+        for key in [1, 2, 3]:
+            self.assertAlmostEqual(results.get(key).score, 0)
+
+        # unknown winner
+        with self.assertRaises(InvalidWinnerException):
+            self.score_algorithm.calculate_score([ComparisonPair(key1=1,key2=2,winner="unknown")])
+
+    def test_calculate_score_maximum(self):
+        generator = random.Random(1)
+        comparisons = []
+        for _ in range(200):
+            (key1, key2) = generator.sample(range(1, 21), 2)
+            winner = ComparisonWinner.key1 if generator.random() < key1 / float(key1 + key2) \
+                else ComparisonWinner.key2
+            comparisons.append(ComparisonPair(key1=key1, key2=key2, winner=winner))
+
+        results = self.score_algorithm.calculate_score(comparisons)
+        abilities = dict((key, result.variable1) for key, result in results.items())
+
+        # abilities are the maximum of the log posterior
+        log_posterior = self._log_posterior(comparisons, abilities)
+        for key in abilities.keys():
+            for delta in [-0.01, 0.01]:
+                moved_abilities = dict(abilities)
+                moved_abilities[key] += delta
+                self.assertLess(self._log_posterior(comparisons, moved_abilities), log_posterior)
+
+        # better keys (by construction) get higher abilities
+        keys = sorted(results.keys())
+        correlation = numpy.corrcoef(keys, [results[key].score for key in keys])[0, 1]
+        self.assertGreater(correlation, 0.8)
+
+        # standard errors shrink with more comparisons
+        more_results = self.score_algorithm.calculate_score(comparisons * 4)
+        for key in keys:
+            self.assertLess(more_results[key].variable2, results[key].variable2)
+
+        # diagonal standard errors of large assignments underestimate the full ones
+        original_max_keys = self.score_algorithm.MAX_KEYS_EXACT_STANDARD_ERROR
+        self.score_algorithm.MAX_KEYS_EXACT_STANDARD_ERROR = 0
+        try:
+            diagonal_results = self.score_algorithm.calculate_score(comparisons)
+        finally:
+            self.score_algorithm.MAX_KEYS_EXACT_STANDARD_ERROR = original_max_keys
+        for key in keys:
+            self.assertAlmostEqual(diagonal_results[key].score, results[key].score)
+            self.assertLessEqual(diagonal_results[key].variable2, results[key].variable2)
+
+        # warm start from previous results converges to the same abilities
+        warm_results = self.score_algorithm.calculate_score(comparisons, list(results.values()))
+        for key in keys:
+            self.assertAlmostEqual(warm_results[key].score, results[key].score)
+
+        far_scored_objects = [result._replace(variable1=100.0 * (-1) ** result.key) for result in results.values()]
+        warm_results = self.score_algorithm.calculate_score(comparisons, far_scored_objects)
+        for key in keys:
+            self.assertAlmostEqual(warm_results[key].score, results[key].score)
+
+    def test_calculate_score_1vs1(self):
+        key1_scored_object = ScoredObject(
+            key=1, score=None, variable1=None, variable2=None,
+            rounds=None, wins=None, loses=None, opponents=None
+        )
+        key2_scored_object = ScoredObject(
+            key=2, score=None, variable1=None, variable2=None,
+            rounds=None, wins=None, loses=None, opponents=None
+        )
+
+        # no winning key error raised
+        with self.assertRaises(InvalidWinnerException):
+            self.score_algorithm.calculate_score_1vs1(
+                key1_scored_object, key2_scored_object, None, [])
+
+        # one comparison and comparison set without winners
+        comparisons = [
+            ComparisonPair(key1=1,key2=2,winner=None),
+            ComparisonPair(key1=1,key2=3,winner=ComparisonWinner.key2)
+        ]
+        key1_results, key2_results = self.score_algorithm.calculate_score_1vs1(
+            key1_scored_object, key2_scored_object, ComparisonWinner.key1, comparisons)
+
+        self.assertIsInstance(key1_results.score, float)
+        self.assertIsInstance(key1_results.variable2, float)
+        self.assertEqual(key1_results.rounds, 3)
+        self.assertEqual(key1_results.opponents, 2)
+        self.assertEqual(key1_results.wins, 1)
+        self.assertEqual(key1_results.loses, 1)
+
+        self.assertEqual(key2_results.rounds, 2)
+        self.assertEqual(key2_results.opponents, 1)
+        self.assertEqual(key2_results.wins, 0)
+        self.assertEqual(key2_results.loses, 1)
+
+        self.assertGreater(key1_results.score, 0)
+        self.assertAlmostEqual(key1_results.score, -key2_results.score)
+        # information is gained from the comparison
+        prior_standard_error = 1.0 / math.sqrt(self.score_algorithm.PRIOR_PRECISION)
+        self.assertLess(key1_results.variable2, prior_standard_error)
+
+        # a win against a much stronger key moves the ability more than against a weaker one
+        strong_scored_object = key2_scored_object._replace(variable1=3.0, variable2=0.5)
+        weak_scored_object = key2_scored_object._replace(variable1=-3.0, variable2=0.5)
+        strong_results, _ = self.score_algorithm.calculate_score_1vs1(
+            key1_scored_object, strong_scored_object, ComparisonWinner.key1, [])
+        weak_results, _ = self.score_algorithm.calculate_score_1vs1(
+            key1_scored_object, weak_scored_object, ComparisonWinner.key1, [])
+        self.assertGreater(strong_results.score, weak_results.score)
+        self.assertGreater(weak_results.score, 0)
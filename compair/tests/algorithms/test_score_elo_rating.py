@@ -1,6 +1,11 @@
+import random
+import threading
 import unittest
 
+import elo
+
 from compair.algorithms.score.elo_rating.score_algorithm import EloAlgorithmWrapper
+from compair.algorithms.score.elo_rating.environment import EloEnvironment
 from compair.algorithms import ComparisonPair, ScoredObject, ComparisonWinner, InvalidWinnerException
 
 class TestScoreEloRating(unittest.TestCase):
@@ -534,4 +539,46 @@ class TestScoreEloRating(unittest.TestCase):
         self.assertEqual(key2_results_1.rounds, key2_results_2.rounds)
         self.assertEqual(key2_results_1.opponents, key2_results_2.opponents)
         self.assertEqual(key2_results_1.wins, key2_results_2.wins)
-        self.assertEqual(key2_results_1.loses, key2_results_2.loses)
\ No newline at end of file
+        self.assertEqual(key2_results_1.loses, key2_results_2.loses)
+
+    def test_environment(self):
+        # same results as the elo package
+        generator = random.Random(1)
+        environment = EloEnvironment()
+        reference = elo.Elo()
+        for _ in range(100):
+            (rating1, rating2) = (generator.uniform(800, 1600), generator.uniform(800, 1600))
+            for drawn in [False, True]:
+                self.assertEqual(
+                    environment.rate_1vs1(rating1, rating2, drawn=drawn),
+                    reference.rate_1vs1(rating1, rating2, drawn=drawn))
+
+        self.assertEqual(environment.create_rating(), elo.INITIAL)
+
+        # other environments don't change the default one
+        other_environment = EloEnvironment(k_factor=32, initial=1500)
+        self.assertEqual(other_environment.create_rating(), 1500)
+        self.assertEqual(EloAlgorithmWrapper.environment.create_rating(), 1200)
+
+    def test_calculate_score_threads(self):
+        generator = random.Random(1)
+        comparisons = []
+        for _ in range(200):
+            (key1, key2) = generator.sample(range(20), 2)
+            comparisons.append(ComparisonPair(key1=key1, key2=key2,
+                winner=generator.choice([ComparisonWinner.key1, ComparisonWinner.key2, ComparisonWinner.draw])))
+        expected_results = EloAlgorithmWrapper().calculate_score(comparisons)
+
+        results = []
+        def calculate():
+            for _ in range(10):
+                results.append(EloAlgorithmWrapper().calculate_score(comparisons))
+        threads = [threading.Thread(target=calculate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 40)
+        for result in results:
+            self.assertEqual(result, expected_results)
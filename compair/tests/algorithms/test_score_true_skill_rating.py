@@ -1,6 +1,10 @@
+import random
 import unittest
 
+import trueskill
+
 from compair.algorithms.score.true_skill_rating.score_algorithm import TrueSkillAlgorithmWrapper
+from compair.algorithms.score.true_skill_rating.environment import TrueSkillEnvironment
 from compair.algorithms import ComparisonPair, ScoredObject, ComparisonWinner, InvalidWinnerException
 
 class TestScoreTrueSkillRating(unittest.TestCase):
@@ -561,4 +565,27 @@ class TestScoreTrueSkillRating(unittest.TestCase):
         self.assertEqual(key2_results_1.rounds, key2_results_2.rounds)
         self.assertEqual(key2_results_1.opponents, key2_results_2.opponents)
         self.assertEqual(key2_results_1.wins, key2_results_2.wins)
-        self.assertEqual(key2_results_1.loses, key2_results_2.loses)
\ No newline at end of file
+        self.assertEqual(key2_results_1.loses, key2_results_2.loses)
+
+    def test_environment(self):
+        # same results as the trueskill package (up to floating point rounding)
+        generator = random.Random(1)
+        environment = TrueSkillEnvironment()
+        reference = trueskill.TrueSkill()
+        for _ in range(100):
+            (mu1, mu2) = (generator.uniform(0, 50), generator.uniform(0, 50))
+            (sigma1, sigma2) = (generator.uniform(1, 9), generator.uniform(1, 9))
+            for drawn in [False, True]:
+                (rating1, rating2) = reference.rate_1vs1(
+                    reference.create_rating(mu1, sigma1), reference.create_rating(mu2, sigma2), drawn=drawn)
+                results = environment.rate_1vs1(mu1, sigma1, mu2, sigma2, drawn=drawn)
+                for result, expected in zip(results, [rating1.mu, rating1.sigma, rating2.mu, rating2.sigma]):
+                    self.assertAlmostEqual(result, expected, places=10)
+                self.assertAlmostEqual(environment.expose(results[0], results[1]), reference.expose(rating1), places=10)
+
+        self.assertEqual(environment.create_rating(), (trueskill.MU, trueskill.SIGMA))
+        self.assertEqual(environment.create_rating(30), (30, trueskill.SIGMA))
+
+        # ratings too far apart can't be updated correctly
+        with self.assertRaises(FloatingPointError):
+            environment.rate_1vs1(0, 1, 1000, 1)
@@ -0,0 +1,107 @@
+import math
+import unittest
+
+import numpy
+
+from compair.algorithms.simulation import Judge, JudgeModel, CORRELATION_DTYPE, \
+    pearson, spearman, kendall, rank, run_repetition, simulate, summarize
+
+class TestSimulation(unittest.TestCase):
+
+    def test_judge(self):
+        random_state = numpy.random.default_rng(1234)
+        size = 20000
+        grades1 = random_state.normal(0.78, 0.1, size)
+        grades2 = random_state.normal(0.78, 0.1, size)
+        correct = grades1 > grades2
+
+        judge = Judge(JudgeModel.always_correct)
+        key1_wins = judge.decide(grades1, grades2, judge.draw(size, random_state))
+        self.assertTrue(numpy.array_equal(key1_wins, correct))
+
+        judge = Judge(JudgeModel.correct_with_error, 0.8)
+        key1_wins = judge.decide(grades1, grades2, judge.draw(size, random_state))
+        self.assertAlmostEqual(numpy.mean(key1_wins == correct), 0.8, delta=0.02)
+
+        judge = Judge(JudgeModel.guessing)
+        key1_wins = judge.decide(grades1, grades2, judge.draw(size, random_state))
+        self.assertAlmostEqual(numpy.mean(key1_wins), 0.5, delta=0.02)
+
+        # errors are more likely for closely matched answers
+        judge = Judge(JudgeModel.closely_matched_errors, 0.05)
+        key1_wins = judge.decide(grades1, grades2, judge.draw(size, random_state))
+        close = numpy.abs(grades1 - grades2) < 0.02
+        self.assertGreater(numpy.mean(key1_wins[close] != correct[close]), 0.3)
+        self.assertLess(numpy.mean(key1_wins[~close] != correct[~close]), 0.2)
+
+        # ties are guessed
+        judge = Judge(JudgeModel.always_correct)
+        key1_wins = judge.decide(numpy.ones(size), numpy.ones(size), judge.draw(size, random_state))
+        self.assertAlmostEqual(numpy.mean(key1_wins), 0.5, delta=0.02)
+
+        # single comparisons
+        self.assertTrue(judge.decide(0.8, 0.7, judge.draw(1, random_state)[0]))
+
+    def test_correlations(self):
+        values1 = [1.0, 2.0, 3.0, 4.0, 5.0]
+        values2 = [2.0, 1.0, 4.0, 3.0, 5.0]
+
+        self.assertEqual(list(rank([3.0, 1.0, 3.0, 2.0])), [3.5, 1.0, 3.5, 2.0])
+        self.assertAlmostEqual(pearson(values1, values2), 0.8)
+        self.assertAlmostEqual(spearman(values1, values2), 0.8)
+        # 8 concordant and 2 discordant pairs
+        self.assertAlmostEqual(kendall(values1, values2), 0.6)
+
+        # tau-b with ties
+        self.assertAlmostEqual(kendall([1.0, 1.0, 2.0], [1.0, 2.0, 3.0]), 2.0 / math.sqrt(2 * 3))
+
+        # monotonic transformations don't change rank correlations
+        self.assertAlmostEqual(spearman(values1, [value ** 3 for value in values1]), 1.0)
+        self.assertAlmostEqual(kendall(values1, [-value for value in values1]), -1.0)
+
+        # constant values
+        for correlation in [pearson, spearman, kendall]:
+            self.assertTrue(math.isnan(correlation(values1, [0.0] * 5)))
+
+    def test_run_repetition(self):
+        grades = numpy.random.default_rng(1).normal(0.78, 0.1, 20)
+        (correlations, scores) = run_repetition('random', 'elo_rating', Judge(JudgeModel.always_correct),
+            grades, number_of_students=20, comparisons_per_student=5, seed=1)
+
+        self.assertEqual(correlations.dtype, CORRELATION_DTYPE)
+        self.assertEqual(len(correlations), 10)
+        self.assertEqual(len(scores), 20)
+        # always correct judges rank the answers well
+        self.assertGreater(correlations['spearman'][-1], 0.5)
+        self.assertGreater(correlations['kendall'][-1], 0.3)
+
+        # same seed, same results
+        (other_correlations, other_scores) = run_repetition('random', 'elo_rating', Judge(JudgeModel.always_correct),
+            grades, number_of_students=20, comparisons_per_student=5, seed=1)
+        self.assertTrue(numpy.array_equal(scores, other_scores))
+
+        # no comparisons, no rounds
+        (correlations, scores) = run_repetition('random', 'elo_rating', Judge(JudgeModel.always_correct),
+            grades, number_of_students=20, comparisons_per_student=0, seed=1)
+        self.assertEqual(len(correlations), 0)
+        self.assertTrue(numpy.array_equal(scores, numpy.zeros(20)))
+
+    def test_simulate(self):
+        judge = Judge(JudgeModel.closely_matched_errors, 0.05)
+        for (pairing_package_name, scoring_package_name) in [('adaptive_min_delta', 'elo_rating'),
+                ('adaptive_uncertainty', 'true_skill_rating')]:
+            results = simulate(pairing_package_name, scoring_package_name, judge, repetitions=3,
+                number_of_answers=20, number_of_students=20, comparisons_per_student=3, processes=1, seed=1)
+            self.assertEqual(results.shape, (3, 6))
+
+            # results don't depend on the number of processes
+            parallel_results = simulate(pairing_package_name, scoring_package_name, judge, repetitions=3,
+                number_of_answers=20, number_of_students=20, comparisons_per_student=3, processes=2, seed=1)
+            for field in CORRELATION_DTYPE.names:
+                self.assertTrue(numpy.allclose(results[field], parallel_results[field], equal_nan=True))
+
+            summary = summarize(results)
+            self.assertEqual(set(summary.keys()), set(CORRELATION_DTYPE.names))
+            self.assertAlmostEqual(summary['spearman']['mean'], numpy.mean(results['spearman'][:, -1]))
+            self.assertLessEqual(summary['kendall']['min'], summary['kendall']['median'])
+            self.assertLessEqual(summary['kendall']['median'], summary['kendall']['max'])
@@ -8,7 +8,7 @@ from compair import db
 from data.fixtures import AnswerFactory, DefaultFixture
 from data.fixtures.test_data import TestFixture, LTITestData
 from compair.models import Answer, CourseGrade, AssignmentGrade, \
-    CourseRole, SystemRole, User
+    CourseRole, SystemRole, User, Comparison, WinningAnswer
 from compair.tests.test_compair import ComPAIRAPITestCase, ComPAIRAPIDemoTestCase
 
 
@@ -1249,6 +1249,61 @@ class AnswersAPITests(ComPAIRAPITestCase):
                 self.assert200(rv)
                 self.assertFalse(rv.json['top_answer'])
 
+    def test_get_score_history(self):
+        url = self.base_url + "/scores/history"
+
+        # test login required
+        rv = self.client.get(url)
+        self.assert401(rv)
+
+        # test unauthorized users
+        for user in [self.fixtures.unauthorized_instructor, self.fixtures.students[0]]:
+            with self.login(user.username):
+                rv = self.client.get(url)
+                self.assert403(rv)
+
+        with self.login(self.fixtures.instructor.username):
+            # no history yet
+            rv = self.client.get(url)
+            self.assert200(rv)
+            self.assertIsNone(rv.json['latest_comparisons'])
+            self.assertEqual(rv.json['objects'], [])
+
+        comparisons = []
+        for student in self.fixtures.students[:3]:
+            comparison = Comparison.create_new_comparison(self.assignment.id, student.id, True)
+            comparison.completed = True
+            comparison.winner = WinningAnswer.answer1
+            for comparison_criterion in comparison.comparison_criteria:
+                comparison_criterion.winner = WinningAnswer.answer1
+            db.session.commit()
+            Comparison.update_scores_1vs1(comparison)
+            comparisons.append(comparison)
+
+        with self.login(self.fixtures.instructor.username):
+            rv = self.client.get(url)
+            self.assert200(rv)
+            latest_comparisons = rv.json['latest_comparisons']
+            self.assertEqual(rv.json['comparisons'], latest_comparisons)
+            self.assertEqual([score['rank'] for score in rv.json['objects']],
+                sorted(score['rank'] for score in rv.json['objects']))
+
+            # ranking after the first comparison only has its answers
+            rv = self.client.get(url + "?comparisons=" + str(latest_comparisons - 2))
+            self.assert200(rv)
+            self.assertEqual(rv.json['comparisons'], latest_comparisons - 2)
+            answer_uuids = set([comparisons[0].answer1.uuid, comparisons[0].answer2.uuid])
+            self.assertEqual(set(score['answer_id'] for score in rv.json['objects']), answer_uuids)
+            self.assertEqual(rv.json['objects'][0]['answer_id'], comparisons[0].answer1.uuid)
+            self.assertEqual([score['rank'] for score in rv.json['objects']], [1, 2])
+
+            rv = self.client.get(url + "?comparisons=-1")
+            self.assert400(rv)
+
+        with self.login(self.fixtures.ta.username):
+            rv = self.client.get(url)
+            self.assert200(rv)
+
 class AnswerDemoAPITests(ComPAIRAPIDemoTestCase):
     def setUp(self):
         super(AnswerDemoAPITests, self).setUp()
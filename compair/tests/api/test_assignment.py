@@ -10,7 +10,7 @@ from data.fixtures.test_data import SimpleAssignmentTestData, ComparisonTestData
 from data.factories import AssignmentFactory
 from compair.models import Assignment, Comparison, PairingAlgorithm, \
     CourseGrade, AssignmentGrade, SystemRole, CourseRole, LTIOutcome, \
-    AnswerCommentType, WinningAnswer
+    AnswerCommentType, WinningAnswer, ScoringAlgorithm
 from compair.tests.test_compair import ComPAIRAPITestCase, ComPAIRAPIDemoTestCase
 from compair.core import db
 
@@ -455,6 +455,35 @@ class AssignmentAPITests(ComPAIRAPITestCase):
             self.assert200(rv)
             self._verify_assignment(assignment, rv.json)
 
+            # test uncertainty pairing switches to TrueSkill scoring
+            change_pairing_algorithm = expected.copy()
+            change_pairing_algorithm['pairing_algorithm'] = PairingAlgorithm.adaptive_uncertainty.value
+            rv = self.client.post(url, data=json.dumps(change_pairing_algorithm), content_type='application/json')
+            self.assert200(rv)
+            self.assertEqual(PairingAlgorithm.adaptive_uncertainty.value, rv.json['pairing_algorithm'])
+            self.assertEqual(ScoringAlgorithm.true_skill.value, rv.json['scoring_algorithm'])
+            self.assertEqual(ScoringAlgorithm.true_skill, assignment.scoring_algorithm)
+
+            # test uncertainty pairing with another scoring algorithm is rejected
+            change_pairing_algorithm['scoring_algorithm'] = ScoringAlgorithm.elo.value
+            rv = self.client.post(url, data=json.dumps(change_pairing_algorithm), content_type='application/json')
+            self.assert400(rv)
+            self.assertEqual("Assignment Not Saved", rv.json['title'])
+            self.assertEqual(ScoringAlgorithm.true_skill, assignment.scoring_algorithm)
+
+            # test invalid scoring algorithm
+            change_pairing_algorithm['scoring_algorithm'] = "invalid"
+            rv = self.client.post(url, data=json.dumps(change_pairing_algorithm), content_type='application/json')
+            self.assert400(rv)
+
+            change_pairing_algorithm['scoring_algorithm'] = ScoringAlgorithm.true_skill.value
+            rv = self.client.post(url, data=json.dumps(change_pairing_algorithm), content_type='application/json')
+            self.assert200(rv)
+
+            rv = self.client.post(url, data=json.dumps(expected), content_type='application/json')
+            self.assert200(rv)
+            self._verify_assignment(assignment, rv.json)
+
             # test edit by author add & remove criteria
             new_criterion = self.data.create_criterion(self.data.get_authorized_instructor())
             add_criteria = expected.copy()
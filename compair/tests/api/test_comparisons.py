@@ -11,7 +11,7 @@ from data.fixtures.test_data import ComparisonTestData, LTITestData
 from data.factories import AssignmentCriterionFactory
 from compair.models import Answer, Comparison, CourseGrade, AssignmentGrade, \
     WinningAnswer, SystemRole, AnswerScore, AnswerCriterionScore, \
-    AnswerComment, AnswerCommentType
+    AnswerComment, AnswerCommentType, ScoreUpdateQueue
 from compair.tests.test_compair import ComPAIRAPITestCase
 from compair.core import db
 
@@ -514,6 +514,30 @@ class ComparisonAPITests(ComPAIRAPITestCase):
                 found_comparison,
                 "Actual comparison received contains a comparison that was not sent.")
 
+    def test_submit_comparison_score_update_queue(self):
+        self.app.config['SCORE_UPDATE_QUEUE_ENABLED'] = True
+
+        comparison_submit = self._build_comparison_submit(self.assignment, WinningAnswer.answer1.value)
+        with self.login(self.data.get_authorized_student().username):
+            queued = False
+            while not queued:
+                rv = self.client.get(self.base_url)
+                self.assert200(rv)
+                comparison = Comparison.query.filter_by(uuid=rv.json['comparison']['id']).one()
+                # comparison examples aren't scored
+                queued = comparison.comparison_example_id == None
+
+                # completed comparisons are queued instead of scored during the request
+                with mock.patch.object(ScoreUpdateQueue, 'push') as mock_push, \
+                        mock.patch.object(Comparison, 'update_scores_1vs1') as mock_update_scores_1vs1:
+                    rv = self.client.post(self.base_url, data=json.dumps(comparison_submit), content_type='application/json')
+                    self.assert200(rv)
+                    if queued:
+                        mock_push.assert_called_once_with(self.assignment.id, comparison.id)
+                    else:
+                        mock_push.assert_not_called()
+                    mock_update_scores_1vs1.assert_not_called()
+
     @mock.patch('random.random')
     def _submit_all_possible_comparisons_for_user(self, assignment, user_id, mock_random):
         example_winner_ids = []
@@ -0,0 +1,152 @@
+import time
+import unittest
+import mock
+
+from compair.cache import Cache, LocalCacheBackend, RedisCacheBackend
+
+class LocalRedisClient:
+    """
+    Minimal in-memory stand-in for the redis client commands used by RedisCacheBackend
+    """
+    def __init__(self):
+        self.data = {}
+
+    def _encode(self, value):
+        return value if isinstance(value, bytes) else str(value).encode('utf-8')
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[self._encode(field)] = self._encode(value)
+
+    def hincrby(self, key, field, amount=1):
+        values = self.data.setdefault(key, {})
+        value = int(values.get(self._encode(field), b'0')) + amount
+        values[self._encode(field)] = self._encode(value)
+        return value
+
+    def rpush(self, key, *values):
+        items = self.data.setdefault(key, [])
+        items.extend([self._encode(value) for value in values])
+        return len(items)
+
+    def lpop(self, key):
+        items = self.data.get(key, [])
+        return items.pop(0) if len(items) > 0 else None
+
+    def llen(self, key):
+        return len(self.data.get(key, []))
+
+    def expire(self, key, timeout):
+        return True
+
+    def flushdb(self):
+        self.data = {}
+
+    def pipeline(self):
+        return LocalRedisPipeline(self)
+
+class LocalRedisPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def command(*args):
+            self.commands.append((name, args))
+        return command
+
+    def execute(self):
+        results = [getattr(self.client, name)(*args) for (name, args) in self.commands]
+        self.commands = []
+        return results
+
+class CacheTests(unittest.TestCase):
+    def _backends(self):
+        return [LocalCacheBackend(), RedisCacheBackend(LocalRedisClient())]
+
+    def test_get_set(self):
+        for backend in self._backends():
+            cache = Cache()
+            cache.backend = backend
+
+            self.assertIsNone(cache.get('missing'))
+
+            cache.set('key', {'a': [1, 2]})
+            self.assertEqual(cache.get('key'), {'a': [1, 2]})
+
+            # add only sets missing keys
+            self.assertFalse(cache.add('key', 'other'))
+            self.assertEqual(cache.get('key'), {'a': [1, 2]})
+            self.assertTrue(cache.add('key2', 'other'))
+            self.assertEqual(cache.get('key2'), 'other')
+
+            cache.delete('key', 'key2')
+            self.assertIsNone(cache.get('key'))
+            self.assertIsNone(cache.get('key2'))
+
+    def test_hash(self):
+        for backend in self._backends():
+            cache = Cache()
+            cache.backend = backend
+
+            self.assertEqual(cache.hgetall('hash'), {})
+
+            self.assertEqual(cache.hincrby('hash', 1), 1)
+            self.assertEqual(cache.hincrby('hash', 1, 2), 3)
+            cache.hset('hash', 2, 0.5)
+            cache.hset('hash', '3:4', None)
+
+            self.assertEqual(cache.hgetall('hash'), {'1': 3, '2': 0.5, '3:4': None})
+
+            cache.clear()
+            self.assertEqual(cache.hgetall('hash'), {})
+
+    def test_list(self):
+        for backend in self._backends():
+            cache = Cache()
+            cache.backend = backend
+
+            self.assertIsNone(cache.lpop('list'))
+            self.assertEqual(cache.llen('list'), 0)
+
+            self.assertEqual(cache.rpush('list', [1, 2], [3, 4]), 2)
+            self.assertEqual(cache.rpush('list'), 2)
+            self.assertEqual(cache.rpush('list', [5, 6], timeout=10), 3)
+            self.assertEqual(cache.llen('list'), 3)
+
+            self.assertEqual(cache.lpop('list'), [1, 2])
+            self.assertEqual(cache.lpop('list'), [3, 4])
+            self.assertEqual(cache.lpop('list'), [5, 6])
+            self.assertIsNone(cache.lpop('list'))
+
+    def test_local_timeout(self):
+        backend = LocalCacheBackend()
+        now = time.time()
+
+        with mock.patch('time.time', return_value=now):
+            backend.set('key', 'value', timeout=10)
+            backend.hincrby('hash', 'field', 1, timeout=10)
+
+        with mock.patch('time.time', return_value=now + 5):
+            self.assertEqual(backend.get('key'), 'value')
+            self.assertEqual(backend.hgetall('hash'), {'field': 1})
+
+        with mock.patch('time.time', return_value=now + 11):
+            self.assertIsNone(backend.get('key'))
+            self.assertEqual(backend.hgetall('hash'), {})
+            self.assertTrue(backend.add('key', 'new value'))
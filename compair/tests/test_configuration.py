@@ -2,6 +2,8 @@
 from __future__ import unicode_literals
 import unittest
 
+from compair import create_app
+
 
 class TestConfiguration(unittest.TestCase):
     def setUp(self):
@@ -9,3 +11,26 @@ class TestConfiguration(unittest.TestCase):
 
     def test_default(self):
         pass
+
+    def test_queues_require_shared_cache(self):
+        for setting in ['COMPARISON_PAIR_QUEUE_ENABLED', 'SCORE_UPDATE_QUEUE_ENABLED', 'GRADE_UPDATE_QUEUE_ENABLED']:
+            # queues in a local cache aren't seen by celery workers
+            with self.assertRaises(RuntimeError):
+                create_app(settings_override={
+                    'CACHE_BACKEND': 'local', 'CELERY_ALWAYS_EAGER': False,
+                    'PAIRING_SNAPSHOT_CACHE_ENABLED': True, setting: True
+                }, skip_endpoints=True, skip_assets=True)
+
+            # tasks executed locally share the local cache
+            create_app(settings_override={
+                'CACHE_BACKEND': 'local', 'CELERY_ALWAYS_EAGER': True,
+                'PAIRING_SNAPSHOT_CACHE_ENABLED': True, setting: True
+            }, skip_endpoints=True, skip_assets=True)
+
+    def test_pair_queue_requires_snapshot_cache(self):
+        # popped pairs are checked against the pairing snapshot
+        with self.assertRaises(RuntimeError):
+            create_app(settings_override={
+                'CACHE_BACKEND': 'local', 'CELERY_ALWAYS_EAGER': True,
+                'COMPARISON_PAIR_QUEUE_ENABLED': True, 'PAIRING_SNAPSHOT_CACHE_ENABLED': False
+            }, skip_endpoints=True, skip_assets=True)
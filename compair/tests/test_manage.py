@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+import io
+from contextlib import redirect_stdout
+
+from compair import db
+from compair.manage import grades
+from compair.models import CourseGrade
+from compair.tests.test_compair import ComPAIRTestCase
+from data.fixtures.test_data import TestFixture
+
+
+class TestGradesManager(ComPAIRTestCase):
+    def setUp(self):
+        super(TestGradesManager, self).setUp()
+        self.fixtures = TestFixture().add_course(num_students=5, num_assignments=2, with_comparisons=True)
+        self.course = self.fixtures.course
+        for assignment in self.fixtures.assignments:
+            assignment.calculate_grades()
+        self.course.calculate_grades()
+
+    def _check(self, fix=False):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            grades.check(course_id=self.course.id, fix=fix)
+        return output.getvalue()
+
+    def test_check(self):
+        output = self._check()
+        self.assertIn("Done. 0 of 1 course(s) inconsistent.", output)
+
+        # corrupted course grades are reported and only fixed with fix
+        student = self.fixtures.students[0]
+        course_grade = CourseGrade.get_user_course_grade(self.course, student)
+        calculated_grade = course_grade.grade
+        course_grade.grade = calculated_grade + 0.5
+        db.session.commit()
+
+        output = self._check()
+        self.assertIn("1 mismatched, 0 missing course grade(s)", output)
+        self.assertIn("User {}: stored {:.6f}, calculated {:.6f}".format(
+            student.id, calculated_grade + 0.5, calculated_grade), output)
+        self.assertIn("Done. 1 of 1 course(s) inconsistent.", output)
+        db.session.expire_all()
+        self.assertEqual(CourseGrade.get_user_course_grade(self.course, student).grade, calculated_grade + 0.5)
+
+        output = self._check(fix=True)
+        self.assertIn("Recalculating course grades", output)
+        db.session.expire_all()
+        self.assertAlmostEqual(CourseGrade.get_user_course_grade(self.course, student).grade, calculated_grade)
+        self.assertIn("Done. 0 of 1 course(s) inconsistent.", self._check())
@@ -4,15 +4,29 @@ import unittest
 import mock
 import base64
 import uuid
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lxml import etree
+from sqlalchemy import event as sqlalchemy_event
 
 from compair import db
-from compair.models import User, Comparison, AnswerScore, \
-    AnswerCriterionScore, LTIOutcome, SystemRole
-from compair.models.comparison import update_answer_scores, \
-    update_answer_criteria_scores
+from compair.core import cache
+from compair.models import User, Assignment, Comparison, AnswerScore, \
+    AnswerCriterionScore, LTIOutcome, SystemRole, PairingSnapshot, \
+    UserCourse, CourseRole, Answer, ComparisonPairQueue, PairingAlgorithm, \
+    ComparisonCriterion, WinningAnswer, ScoreUpdateQueue, AnswerScoreHistory, \
+    AssignmentGrade, CourseGrade, AnswerCommentType, GradeUpdateQueue, LTIOutcomeDispatcher, \
+    ScoringAlgorithm
+from compair.models.lti_models import OutcomeConsumerUnavailableException
+from compair import create_app
+from compair.tests import test_app_settings
 from compair.tests.test_compair import ComPAIRTestCase
-from compair.algorithms import ComparisonPair, ComparisonWinner
+from compair.algorithms import OpponentStats
 from compair.algorithms.score import calculate_score
+from data.factories import AnswerCommentFactory, AnswerScoreFactory, ComparisonFactory
 from data.fixtures.test_data import TestFixture, LTITestData
 
 class TestUsersModel(ComPAIRTestCase):
@@ -58,62 +72,748 @@ class TestUsersModel(ComPAIRTestCase):
         self.assertTrue(self.user.verify_password('123456'))
 
 
-class TestUtils(ComPAIRTestCase):
-    def test_update_answer_scores(self):
+class CacheTestCase(ComPAIRTestCase):
+    """
+    Starts and ends with an empty cache (for the cached pairing data and the queues)
+    """
+    def setUp(self):
+        super(CacheTestCase, self).setUp()
+        cache.clear()
 
-        comparison_results = calculate_score(comparison_pairs=[
-            ComparisonPair(key1=1,key2=2, winner=ComparisonWinner.key1)
-        ])
-        scores = update_answer_scores([], 1, comparison_results)
-        self.assertEqual(len(scores), 2)
+    def tearDown(self):
+        cache.clear()
+        super(CacheTestCase, self).tearDown()
+
+class TestComparisonScores(ComPAIRTestCase):
+    def setUp(self):
+        super(TestComparisonScores, self).setUp()
+        self.fixtures = TestFixture().add_course(num_students=6)
+        self.assignment = self.fixtures.assignment
+
+    def _score_stats(self, score):
+        return (score.rounds, score.wins, score.loses, score.opponents, score.opponent_stats)
+
+    def test_update_scores_1vs1(self):
+        # fixture scores don't have opponent stats yet so previous comparisons are recounted
+        comparison = self.fixtures.complete_comparison(self.assignment, self.fixtures.students[0])
+        scores = Comparison.update_scores_1vs1(comparison)
+        self.assertEqual(scores[0].opponent_stats, {comparison.answer2_id: OpponentStats(1, 0)})
+        self.assertEqual(scores[1].opponent_stats, {comparison.answer1_id: OpponentStats(0, 1)})
+        for criterion_score in AnswerCriterionScore.query \
+                .filter(AnswerCriterionScore.answer_id.in_([comparison.answer1_id, comparison.answer2_id])) \
+                .all():
+            self.assertIsNotNone(criterion_score.opponent_stats)
+
+        # scores with opponent stats are updated without querying previous comparisons
+        incremental_updates = 0
+        for student in self.fixtures.students[1:]:
+            with mock.patch.object(ComparisonCriterion, 'query') as mock_query:
+                comparison = self.fixtures.complete_comparison(self.assignment, student)
+                scores = [AnswerScore.query.filter_by(answer_id=answer_id).first()
+                    for answer_id in [comparison.answer1_id, comparison.answer2_id]]
+                recount = any(score and score.opponent_stats == None for score in scores)
+
+                Comparison.update_scores_1vs1(comparison)
+                if not recount:
+                    mock_query.join.assert_not_called()
+                    incremental_updates += 1
+        self.assertGreater(incremental_updates, 0)
+
+        # counts and opponent stats match a full recalculation
+        scores = AnswerScore.query \
+            .filter(AnswerScore.assignment_id == self.assignment.id, AnswerScore._opponent_stats != None) \
+            .all()
+        incremental_stats = dict((score.answer_id, self._score_stats(score)) for score in scores)
+        self.assertGreater(len(incremental_stats), 2)
+
+        Comparison.calculate_scores(self.assignment.id)
         for score in scores:
-            self.assertIsNone(score.id)
+            db.session.refresh(score)
+            self.assertEqual(self._score_stats(score), incremental_stats[score.answer_id])
 
-        score = AnswerScore(answer_id=1, id=2)
-        scores = update_answer_scores([score], 1, comparison_results)
-        self.assertEqual(len(scores), 2)
-        self.assertEqual(scores[0].id, 2)
-        self.assertIsNone(scores[1].id)
+    def test_incomplete_comparison_rounds(self):
+        for student in self.fixtures.students[:3]:
+            Comparison.update_scores_1vs1(self.fixtures.complete_comparison(self.assignment, student))
 
+        def score_stats():
+            db.session.expire_all()
+            return dict((score.answer_id, self._score_stats(score)) for score in AnswerScore.query \
+                .filter_by(assignment_id=self.assignment.id) \
+                .all())
 
-        comparison_results = calculate_score(comparison_pairs=[
-            ComparisonPair(key1=1,key2=2, winner=ComparisonWinner.key1),
-            ComparisonPair(key1=3,key2=4, winner=ComparisonWinner.key1)
-        ])
-        score = AnswerScore(answer_id=1, id=2)
-        scores = update_answer_scores([score], 1, comparison_results)
-        self.assertEqual(len(scores), 4)
+        # incomplete comparisons are counted by neither the full recalculation nor the incremental scoring
+        Comparison.calculate_scores(self.assignment.id)
+        stats = score_stats()
+        comparison = Comparison.create_new_comparison(self.assignment.id, self.fixtures.students[3].id, True)
+        Comparison.calculate_scores(self.assignment.id)
+        self.assertEqual(score_stats(), stats)
+
+        # so completing it counts it once either way
+        comparison.completed = True
+        comparison.winner = WinningAnswer.answer1
+        for comparison_criterion in comparison.comparison_criteria:
+            comparison_criterion.winner = WinningAnswer.answer1
+        db.session.commit()
+        Comparison.update_scores_1vs1(comparison)
+        incremental_stats = score_stats()
+        self.assertEqual(incremental_stats[comparison.answer1_id][0], (stats[comparison.answer1_id][0] or 0) + 1)
+        Comparison.calculate_scores(self.assignment.id)
+        self.assertEqual(score_stats(), incremental_stats)
 
-    def test_update_answer_criteria_scores(self):
+    def test_calculate_scores(self):
+        for student in self.fixtures.students:
+            self.fixtures.complete_comparison(self.assignment, student)
 
-        criterion_comparison_results = {
-            1: calculate_score(comparison_pairs=[
-               ComparisonPair(key1=1,key2=2, winner=ComparisonWinner.key1)
-            ])
-        }
-        scores = update_answer_criteria_scores([], 1, criterion_comparison_results)
-        self.assertEqual(len(scores), 2)
+        def expected_scores(criterion_id):
+            comparison_pairs = []
+            for comparison in Comparison.query.filter_by(assignment_id=self.assignment.id).all():
+                if criterion_id == None:
+                    comparison_pairs.append(comparison.convert_to_comparison_pair())
+                else:
+                    comparison_pairs.extend(comparison_criterion.convert_to_comparison_pair()
+                        for comparison_criterion in comparison.comparison_criteria
+                        if comparison_criterion.criterion_id == criterion_id)
+            return calculate_score(package_name=self.assignment.scoring_algorithm.value,
+                comparison_pairs=comparison_pairs)
+
+        def assert_scores(scores, expected):
+            # answers without comparisons keep their scores
+            scores = [score for score in scores if score.answer_id in expected]
+            self.assertEqual(len(scores), len(expected))
+            for score in scores:
+                result = expected[score.answer_id]
+                self.assertAlmostEqual(score.score, result.score)
+                self.assertEqual((score.rounds, score.wins, score.loses, score.opponents),
+                    (result.rounds, result.wins, result.loses, result.opponents))
+                self.assertIsNotNone(score.opponent_stats)
+
+        # dry runs return the new scores without writing them
+        old_scores = dict(db.session.query(AnswerScore.id, AnswerScore.score) \
+            .filter_by(assignment_id=self.assignment.id) \
+            .all())
+        results = Comparison.calculate_scores(self.assignment.id, dry_run=True)
+        self.assertEqual(set(results.keys()),
+            set([None] + [criterion.criterion_id for criterion in self.assignment.assignment_criteria if criterion.active]))
+        expected = expected_scores(None)
+        for answer_id, result in results[None].items():
+            self.assertAlmostEqual(result.score, expected[answer_id].score)
+        db.session.expire_all()
+        self.assertEqual(dict(db.session.query(AnswerScore.id, AnswerScore.score) \
+            .filter_by(assignment_id=self.assignment.id) \
+            .all()), old_scores)
+
+        # recalculate serially and in a process pool (existing scores are updated the second time)
+        for processes in [1, 2]:
+            self.app.config['SCORE_RECALCULATION_PROCESSES'] = processes
+            self.app.config['SCORE_RECALCULATION_PARALLEL_MIN_COMPARISONS'] = 0
+            Comparison.calculate_scores(self.assignment.id)
+            db.session.expire_all()
+
+            assert_scores(AnswerScore.query.filter_by(assignment_id=self.assignment.id).all(),
+                expected_scores(None))
+            for assignment_criterion in self.assignment.assignment_criteria:
+                criterion_id = assignment_criterion.criterion_id
+                assert_scores(AnswerCriterionScore.query \
+                        .filter_by(assignment_id=self.assignment.id, criterion_id=criterion_id) \
+                        .all(),
+                    expected_scores(criterion_id))
+
+    def test_calculate_scores_warm_start(self):
+        import compair.algorithms.score.bradley_terry as bradley_terry
+
+        self.assignment.scoring_algorithm = ScoringAlgorithm.bradley_terry
+        db.session.commit()
+        self.app.config['SCORE_RECALCULATION_PROCESSES'] = 1
+        for student in self.fixtures.students:
+            self.fixtures.complete_comparison(self.assignment, student)
+        Comparison.calculate_scores(self.assignment.id)
+        stored_abilities = dict(db.session.query(AnswerScore.answer_id, AnswerScore.variable1) \
+            .filter_by(assignment_id=self.assignment.id) \
+            .all())
+
+        # the fit starts from the stored overall and criterion scores
+        with mock.patch.object(bradley_terry, 'calculate_score', wraps=bradley_terry.calculate_score) as mock_calculate_score:
+            results = Comparison.calculate_scores(self.assignment.id, dry_run=True)
+
+        self.assertEqual(mock_calculate_score.call_count, len(results))
+        passed_abilities = [
+            dict((scored_object.key, scored_object.variable1) for scored_object in call[1]['scored_objects'])
+            for call in mock_calculate_score.call_args_list
+        ]
+        self.assertTrue(all(len(abilities) > 0 for abilities in passed_abilities))
+        self.assertIn(stored_abilities, passed_abilities)
+
+        # starting from the converged scores gives the same scores
+        for answer_id, result in results[None].items():
+            self.assertAlmostEqual(result.score, stored_abilities[answer_id], places=4)
+
+        # other packages aren't passed scored objects
+        self.assignment.scoring_algorithm = ScoringAlgorithm.elo
+        db.session.commit()
+        with mock.patch('compair.models.comparison.calculate_score', wraps=calculate_score) as mock_calculate_score:
+            Comparison.calculate_scores(self.assignment.id, dry_run=True)
+        for call in mock_calculate_score.call_args_list:
+            self.assertNotIn('scored_objects', call[1])
+
+class TestAnswerRelativeScores(ComPAIRTestCase):
+    def setUp(self):
+        super(TestAnswerRelativeScores, self).setUp()
+        self.fixtures = TestFixture().add_course(num_students=6)
+        self.assignment = self.fixtures.assignment
+
+    def _scores(self):
+        return AnswerScore.query \
+            .join(Answer, Answer.id == AnswerScore.answer_id) \
+            .filter(AnswerScore.assignment_id == self.assignment.id, Answer.active == True) \
+            .order_by(AnswerScore.score.desc()) \
+            .all()
+
+    def _ranks(self, scores):
+        return [score.rank for score in scores]
+
+    def test_ranks(self):
+        scores = self._scores()
+        self.assertEqual(self._ranks(scores), [1, 2, 3])
+        # removed answers aren't ranked
+        inactive_scores = AnswerScore.query \
+            .join(Answer, Answer.id == AnswerScore.answer_id) \
+            .filter(AnswerScore.assignment_id == self.assignment.id, Answer.active == False) \
+            .all()
+        self.assertGreater(len(inactive_scores), 0)
+        self.assertEqual(self._ranks(inactive_scores), [None] * len(inactive_scores))
+
+        # tied scores share the best rank
+        scores[1].score = scores[0].score
+        db.session.commit()
+        # loaded scores are updated without being reloaded
+        self.assertEqual(self._ranks(scores), [1, 1, 3])
+        db.session.expire_all()
+        self.assertEqual(self._ranks(self._scores()), [1, 1, 3])
+
+        self.assertEqual(AnswerScore.get_score_for_rank(self.assignment.id, 1), scores[0].score)
+        self.assertEqual(AnswerScore.get_score_for_rank(self.assignment.id, 2), scores[0].score)
+        self.assertEqual(AnswerScore.get_score_for_rank(self.assignment.id, 3), scores[2].score)
+        self.assertIsNone(AnswerScore.get_score_for_rank(self.assignment.id, 4))
+
+        # answers that are removed lose their rank
+        scores = self._scores()
+        scores[0].answer.active = False
+        db.session.commit()
+        self.assertEqual(self._ranks(scores), [None, 1, 2])
+
+        scores[0].answer.active = True
+        db.session.commit()
+        self.assertEqual(self._ranks(scores), [1, 1, 3])
+
+        # changes rolled back don't update ranks
+        scores[2].score = scores[0].score + 1
+        db.session.flush()
+        db.session.rollback()
+        db.session.expire_all()
+        self.assertEqual(self._ranks(self._scores()), [1, 1, 3])
+
+        # full recalculations rank the new scores
+        for student in self.fixtures.students:
+            comparison = Comparison.create_new_comparison(self.assignment.id, student.id, True)
+            comparison.completed = True
+            comparison.winner = WinningAnswer.answer1
+            for comparison_criterion in comparison.comparison_criteria:
+                comparison_criterion.winner = WinningAnswer.answer1
+            db.session.commit()
+        Comparison.calculate_scores(self.assignment.id)
+        db.session.expire_all()
+        scores = self._scores()
+        expected_ranks = [1 + len([other for other in scores if other.score > score.score]) for score in scores]
+        self.assertEqual(self._ranks(scores), expected_ranks)
+
+    def test_ranks_window(self):
+        def expected_ranks(scores):
+            active_scores = [other.score for other in scores if other.answer.active]
+            return [1 + len([other for other in active_scores if other > score.score])
+                if score.answer.active else None for score in scores]
+
+        def assert_ranks():
+            db.session.expire_all()
+            scores = AnswerScore.query.filter_by(assignment_id=self.assignment.id).all()
+            self.assertEqual(self._ranks(scores), expected_ranks(scores))
+
+        student_answers = [answer for answer in self.fixtures.answers if answer.assignment_id == self.assignment.id]
+        self.assertGreater(len(student_answers), 5)
+        for (index, answer) in enumerate(student_answers):
+            answer.active = True
+            if answer.score == None:
+                AnswerScoreFactory(assignment=self.assignment, answer=answer)
+            answer.score.score = index
+        db.session.commit()
+        assert_ranks()
+
+        # scores above the changed scores keep their rank without being updated
+        scores = sorted([answer.score for answer in student_answers], key=lambda score: score.score)
+        session = db.session()
+        with mock.patch.object(session, 'execute', wraps=session.execute) as mocked_execute:
+            scores[0].score = scores[1].score + 0.5
+            db.session.commit()
+            updated_ids = set()
+            for call in mocked_execute.call_args_list:
+                if len(call[0]) > 1 and isinstance(call[0][1], list):
+                    updated_ids.update(change['answer_score_id'] for change in call[0][1])
+            self.assertEqual(updated_ids, set([scores[0].id, scores[1].id]))
+        assert_ranks()
+
+        # moving across, removing, adding back and tying scores
+        scores[1].score = scores[-1].score + 1
+        db.session.commit()
+        assert_ranks()
+
+        scores[2].answer.active = False
+        db.session.commit()
+        assert_ranks()
+
+        scores[2].answer.active = True
+        scores[3].score = scores[-2].score
+        db.session.commit()
+        assert_ranks()
+
+        scores[-1].score = -1
+        scores[-2].answer.active = False
+        db.session.commit()
+        assert_ranks()
+
+    def test_normalized_scores(self):
+        def assert_normalized_scores(scores, bound_scores):
+            lowest = min(score.score for score in bound_scores)
+            highest = max(score.score for score in bound_scores)
+            for score in scores:
+                self.assertAlmostEqual(score.normalized_score, (score.score - lowest) / (highest - lowest) * 100)
+
+        # normalized by the scores of active answers (including the scores of removed answers)
+        all_scores = AnswerScore.query.filter_by(assignment_id=self.assignment.id).all()
+        scores = self._scores()
+        assert_normalized_scores(all_scores, scores)
+        self.assertEqual(scores[0].normalized_score, 100)
+        self.assertEqual(scores[-1].normalized_score, 0)
+
+        scores[-1].score = scores[-1].score - 10
+        db.session.commit()
+        assert_normalized_scores(all_scores, scores)
+
+        # all the same score
         for score in scores:
-            self.assertIsNone(score.id)
-
-        score = AnswerCriterionScore(answer_id=1, criterion_id=1, id=2)
-        scores = update_answer_criteria_scores([score], 1, criterion_comparison_results)
-        self.assertEqual(len(scores), 2)
-        self.assertEqual(scores[0].id, 2)
-        self.assertIsNone(scores[1].id)
-
-
-        criterion_comparison_results = {
-            1: calculate_score(comparison_pairs=[
-                   ComparisonPair(key1=1,key2=2, winner=ComparisonWinner.key1)
-            ]),
-            2: calculate_score(comparison_pairs=[
-               ComparisonPair(key1=1,key2=2, winner=ComparisonWinner.key1)
-            ])
-        }
-        score = AnswerCriterionScore(answer_id=1, criterion_id=1, id=2)
-        scores = update_answer_criteria_scores([score], 1, criterion_comparison_results)
-        self.assertEqual(len(scores), 4)
+            score.score = 1
+        db.session.commit()
+        self.assertEqual([score.normalized_score for score in scores], [None] * len(scores))
+
+        # criterion scores are normalized by all scores of their criterion
+        criterion_scores = AnswerCriterionScore.query.filter_by(assignment_id=self.assignment.id).all()
+        criterion_ids = set(score.criterion_id for score in criterion_scores)
+        self.assertGreater(len(criterion_ids), 0)
+        criterion_scores[0].score = criterion_scores[0].score + 10
+        db.session.commit()
+        for criterion_id in criterion_ids:
+            scores = [score for score in criterion_scores if score.criterion_id == criterion_id]
+            assert_normalized_scores(scores, scores)
+
+        # bounds are only updated when a score reaches them
+        scores = self._scores()
+        for (index, score) in enumerate(scores):
+            score.score = index
+        db.session.commit()
+        self.assertEqual((self.assignment.lowest_score, self.assignment.highest_score), (0, len(scores) - 1))
+
+        criterion_score = criterion_scores[0]
+        criterion_scores = [score for score in criterion_scores if score.criterion_id == criterion_score.criterion_id]
+        criterion_score = sorted(criterion_scores, key=lambda score: score.score)[1]
+        with mock.patch('compair.models.answer_score._update_score_bounds') as mocked_update_score_bounds, \
+                mock.patch('compair.models.answer_criterion_score._update_score_bounds') as mocked_update_criterion_score_bounds:
+            scores[1].score = 0.5
+            criterion_score.score = (min(score.score for score in criterion_scores) + \
+                max(score.score for score in criterion_scores)) / 2
+            db.session.commit()
+            mocked_update_score_bounds.assert_not_called()
+            mocked_update_criterion_score_bounds.assert_not_called()
+
+            scores[1].score = -1
+            db.session.commit()
+            self.assertEqual(mocked_update_score_bounds.call_count, 1)
+            mocked_update_criterion_score_bounds.assert_not_called()
+
+class TestAnswerScoreRankThreshold(CacheTestCase):
+    def setUp(self):
+        super(TestAnswerScoreRankThreshold, self).setUp()
+        self.app.config['RANK_THRESHOLD_CACHE_ENABLED'] = True
+        self.fixtures = TestFixture().add_course(num_students=6)
+        self.assignment = self.fixtures.assignment
+
+    def _scores(self):
+        return AnswerScore.query \
+            .join(Answer, Answer.id == AnswerScore.answer_id) \
+            .filter(AnswerScore.assignment_id == self.assignment.id, Answer.active == True) \
+            .order_by(AnswerScore.score.desc()) \
+            .all()
+
+    def test_get_cached_score_for_rank(self):
+        with mock.patch.object(AnswerScore, '_get_score_for_rank', wraps=AnswerScore._get_score_for_rank) as mocked_get:
+            # the assignment's rank display limit is cached when the assignment or its scores change
+            self.assignment.rank_display_limit = 2
+            db.session.commit()
+            scores = self._scores()
+            self.assertEqual(AnswerScore.get_score_for_rank(self.assignment.id, 2), scores[1].score)
+            self.assertEqual(mocked_get.call_count, 0)
+
+            scores[1].score = scores[2].score - 1
+            db.session.commit()
+            self.assertEqual(AnswerScore.get_score_for_rank(self.assignment.id, 2), scores[2].score)
+            self.assertEqual(mocked_get.call_count, 0)
+
+            # ties and removed answers
+            scores = self._scores()
+            scores[0].score = scores[1].score
+            db.session.commit()
+            self.assertEqual(AnswerScore.get_score_for_rank(self.assignment.id, 2), scores[1].score)
+            scores[0].answer.active = False
+            db.session.commit()
+            self.assertEqual(AnswerScore.get_score_for_rank(self.assignment.id, 2), scores[2].score)
+            self.assertEqual(mocked_get.call_count, 0)
+
+            # not enough ranked scores
+            self.assignment.rank_display_limit = 3
+            db.session.commit()
+            self.assertIsNone(AnswerScore.get_score_for_rank(self.assignment.id, 3))
+            self.assertEqual(mocked_get.call_count, 0)
+
+            # other ranks aren't cached
+            self.assertEqual(AnswerScore.get_score_for_rank(self.assignment.id, 1), scores[1].score)
+            self.assertEqual(AnswerScore.get_score_for_rank(self.assignment.id, 1), scores[1].score)
+            self.assertEqual(mocked_get.call_count, 2)
+
+            # rolled back changes aren't cached
+            scores[1].score = scores[2].score - 1
+            db.session.flush()
+            db.session.rollback()
+            self.assertIsNone(AnswerScore.get_score_for_rank(self.assignment.id, 3))
+            self.assertEqual(mocked_get.call_count, 2)
+
+            # removing the limit clears the threshold
+            self.assignment.rank_display_limit = None
+            db.session.commit()
+            self.assertIsNone(cache.get(AnswerScore._rank_threshold_cache_key(self.assignment.id)))
+
+            # full recalculations update the cached threshold
+            self.assignment.rank_display_limit = 1
+            db.session.commit()
+            for student in self.fixtures.students:
+                comparison = Comparison.create_new_comparison(self.assignment.id, student.id, True)
+                comparison.completed = True
+                comparison.winner = WinningAnswer.answer1
+                for comparison_criterion in comparison.comparison_criteria:
+                    comparison_criterion.winner = WinningAnswer.answer1
+                db.session.commit()
+            Comparison.calculate_scores(self.assignment.id)
+            db.session.expire_all()
+            self.assertEqual(AnswerScore.get_score_for_rank(self.assignment.id, 1), self._scores()[0].score)
+            self.assertEqual(mocked_get.call_count, 2)
+
+class TestAnswerScoreHistory(ComPAIRTestCase):
+    def setUp(self):
+        super(TestAnswerScoreHistory, self).setUp()
+        self.fixtures = TestFixture().add_course(num_students=6)
+        self.assignment = self.fixtures.assignment
+
+    def _completed_comparison_count(self):
+        return Comparison.query.filter_by(assignment_id=self.assignment.id, completed=True).count()
+
+    def test_history(self):
+        self.assertIsNone(AnswerScoreHistory.get_comparison_count(self.assignment.id))
+        self.assertEqual(AnswerScoreHistory.get_ranking(self.assignment.id), [])
+
+        # every scored comparison appends the scores of both answers
+        rankings = {}
+        for student in self.fixtures.students:
+            comparison = self.fixtures.complete_comparison(self.assignment, student)
+            Comparison.update_scores_1vs1(comparison)
+
+            comparison_count = self._completed_comparison_count()
+            snapshots = AnswerScoreHistory.query \
+                .filter_by(assignment_id=self.assignment.id, comparison_count=comparison_count) \
+                .all()
+            self.assertEqual(set(snapshot.answer_id for snapshot in snapshots),
+                set([comparison.answer1_id, comparison.answer2_id]))
+            for snapshot in snapshots:
+                score = AnswerScore.query.filter_by(answer_id=snapshot.answer_id).one()
+                self.assertEqual((snapshot.score, snapshot.rounds), (score.score, score.rounds))
+
+            rankings[comparison_count] = AnswerScoreHistory.get_ranking(self.assignment.id)
+
+        self.assertEqual(AnswerScoreHistory.get_comparison_count(self.assignment.id), self._completed_comparison_count())
+
+        # rankings are rebuilt as of any comparison count
+        for comparison_count, ranking in rankings.items():
+            self.assertEqual(AnswerScoreHistory.get_ranking(self.assignment.id, comparison_count), ranking)
+            scores = [score for (answer_id, score, rounds, rank) in ranking]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+            self.assertEqual(ranking[0][3], 1)
+
+        # the latest ranking matches the current scores of the answers
+        latest = dict((answer_id, (score, rounds))
+            for (answer_id, score, rounds, rank) in AnswerScoreHistory.get_ranking(self.assignment.id))
+        for answer_id, (score, rounds) in latest.items():
+            answer_score = AnswerScore.query.filter_by(answer_id=answer_id).one()
+            self.assertEqual((answer_score.score, answer_score.rounds), (score, rounds))
+
+        # full recalculations append every score
+        Comparison.calculate_scores(self.assignment.id)
+        db.session.expire_all()
+        for (answer_id, score, rounds, rank) in AnswerScoreHistory.get_ranking(self.assignment.id):
+            answer_score = AnswerScore.query.filter_by(answer_id=answer_id).one()
+            self.assertEqual((answer_score.score, answer_score.rounds, answer_score.rank), (score, rounds, rank))
+
+        # removed answers aren't ranked
+        answer_id = latest.popitem()[0]
+        Answer.query.get(answer_id).active = False
+        db.session.commit()
+        self.assertNotIn(answer_id, [answer_id for (answer_id, score, rounds, rank)
+            in AnswerScoreHistory.get_ranking(self.assignment.id)])
+
+    def test_history_out_of_order(self):
+        # comparisons are counted in the order they are scored, not by id
+        comparisons = [Comparison.create_new_comparison(self.assignment.id, student.id, True)
+            for student in self.fixtures.students[:2]]
+        for comparison in reversed(comparisons):
+            comparison.completed = True
+            comparison.winner = WinningAnswer.answer1
+            for comparison_criterion in comparison.comparison_criteria:
+                comparison_criterion.winner = WinningAnswer.answer1
+            db.session.commit()
+            Comparison.update_scores_1vs1(comparison)
+            if comparison == comparisons[1]:
+                first_ranking = AnswerScoreHistory.get_ranking(self.assignment.id)
+
+        self.assertEqual(AnswerScoreHistory.get_comparison_count(self.assignment.id), 2)
+        self.assertEqual(AnswerScoreHistory.get_ranking(self.assignment.id, 1), first_ranking)
+        self.assertEqual(set(answer_id for (answer_id, score, rounds, rank) in first_ranking),
+            set([comparisons[1].answer1_id, comparisons[1].answer2_id]))
+
+class TestGrades(ComPAIRTestCase):
+    def setUp(self):
+        super(TestGrades, self).setUp()
+        self.fixtures = TestFixture().add_course(num_students=10, num_groups=5, num_assignments=2,
+            num_group_assignments=1, with_comparisons=True)
+        self.course = self.fixtures.course
+
+        # self-evaluations of half of the students
+        assignment = self.fixtures.assignment
+        assignment.enable_self_evaluation = True
+        for student in self.fixtures.students[:5]:
+            answer = next(answer for answer in self.fixtures.answers
+                if answer.user_id == student.id and answer.assignment_id == assignment.id)
+            AnswerCommentFactory(user=student, answer=answer, comment_type=AnswerCommentType.self_evaluation)
+        db.session.commit()
+        assignment.calculate_grades()
+        self.course.calculate_grades()
+
+    def _assignment_grades(self, assignment):
+        return dict((assignment_grade.user_id, assignment_grade)
+            for assignment_grade in AssignmentGrade.get_assignment_grades(assignment))
+
+    def _course_grades(self):
+        return dict((course_grade.user_id, course_grade)
+            for course_grade in CourseGrade.get_course_grades(self.course))
+
+    def test_calculate_grades(self):
+        student_ids = set(student.id for student in self.fixtures.students)
+        course_grades = dict((user_id, course_grade.grade) for user_id, course_grade in self._course_grades().items())
+
+        # bulk grades match the grades calculated one student at a time
+        for assignment in self.fixtures.assignments:
+            grades = dict((user_id, assignment_grade.grade)
+                for user_id, assignment_grade in self._assignment_grades(assignment).items())
+            self.assertEqual(set(grades.keys()), student_ids)
+
+            AssignmentGrade.query.filter_by(assignment_id=assignment.id).delete()
+            db.session.commit()
+            for student in self.fixtures.students:
+                assignment.calculate_grade(student)
+            self.assertEqual(dict((user_id, assignment_grade.grade)
+                for user_id, assignment_grade in self._assignment_grades(assignment).items()), grades)
+
+        grades = course_grades
+        self.assertEqual(set(grades.keys()), student_ids)
+        CourseGrade.query.filter_by(course_id=self.course.id).delete()
+        db.session.commit()
+        for student in self.fixtures.students:
+            self.course.calculate_grade(student)
+        self.assertEqual(dict((user_id, course_grade.grade)
+            for user_id, course_grade in self._course_grades().items()), grades)
+
+        # group grades only touch the students of the group
+        group = self.fixtures.groups[0]
+        group_student_ids = set(user_course.user_id for user_course in self.course.user_courses
+            if user_course.group_id == group.id and user_course.course_role == CourseRole.student)
+        assignment = self.fixtures.assignments[-1]
+        AssignmentGrade.query.filter_by(assignment_id=assignment.id).delete()
+        db.session.commit()
+        assignment.calculate_group_grade(group)
+        self.assertEqual(set(self._assignment_grades(assignment).keys()), group_student_ids)
+
+        # unchanged grades aren't rewritten
+        assignment = self.fixtures.assignment
+        previous = dict((user_id, (assignment_grade.grade, assignment_grade.modified))
+            for user_id, assignment_grade in self._assignment_grades(assignment).items())
+        assignment.self_evaluation_grade_weight += 1
+        db.session.commit()
+        assignment.calculate_grades()
+        db.session.expire_all()
+        changed = 0
+        for user_id, assignment_grade in self._assignment_grades(assignment).items():
+            (grade, modified) = previous[user_id]
+            if assignment_grade.grade == grade:
+                self.assertEqual(assignment_grade.modified, modified)
+            else:
+                self.assertGreaterEqual(assignment_grade.modified, modified)
+                changed += 1
+        self.assertEqual(changed, 5)
+
+    def test_incremental_course_grades(self):
+        assignment = self.fixtures.assignment
+        other_assignment = self.fixtures.assignments[-1]
+        assignment.course_grade_weight = 3
+        db.session.commit()
+        self.course.calculate_grades()
+
+        # course grades are weighted by assignment
+        assignment_grades = self._assignment_grades(assignment)
+        other_assignment_grades = dict((user_id, assignment_grade.grade)
+            for user_id, assignment_grade in self._assignment_grades(other_assignment).items())
+        total_weight = float(sum(course_assignment.course_grade_weight
+            for course_assignment in self.fixtures.assignments))
+        for user_id, course_grade in self._course_grades().items():
+            grade = sum(self._assignment_grades(course_assignment)[user_id].grade * course_assignment.course_grade_weight
+                for course_assignment in self.fixtures.assignments) / total_weight
+            self.assertAlmostEqual(course_grade.grade, grade)
+
+        # a single assignment grade change updates the course grade by its weighted difference
+        student = self.fixtures.students[6]
+        previous_assignment_grade = assignment_grades[student.id].grade
+        previous_course_grade = self._course_grades()[student.id].grade
+        answer = next(answer for answer in self.fixtures.answers
+            if answer.user_id == student.id and answer.assignment_id == assignment.id)
+        AnswerCommentFactory(user=student, answer=answer, comment_type=AnswerCommentType.self_evaluation)
+        db.session.commit()
+        assignment.calculate_grade(student)
+
+        assignment_grade = self._assignment_grades(assignment)[student.id].grade
+        self.assertGreater(assignment_grade, previous_assignment_grade)
+        self.assertAlmostEqual(self._course_grades()[student.id].grade,
+            previous_course_grade + (assignment_grade - previous_assignment_grade) * 3 / total_weight)
+
+        # incremental course grades match the fully calculated ones
+        for student in self.fixtures.students[5:]:
+            answer = next(answer for answer in self.fixtures.answers
+                if answer.user_id == student.id and answer.assignment_id == assignment.id)
+            AnswerCommentFactory(user=student, answer=answer, comment_type=AnswerCommentType.self_evaluation)
+            db.session.commit()
+            assignment.calculate_grade(student)
+        calculated_grades = CourseGrade.get_calculated_grades(self.course)
+        course_grades = self._course_grades()
+        self.assertEqual(set(course_grades.keys()), set(calculated_grades.keys()))
+        for user_id, grade in calculated_grades.items():
+            self.assertAlmostEqual(course_grades[user_id].grade, grade)
+
+        # the grades of the other assignments aren't touched
+        self.assertEqual(dict((user_id, assignment_grade.grade)
+            for user_id, assignment_grade in self._assignment_grades(other_assignment).items()), other_assignment_grades)
+
+        # students without a course grade get a full calculation
+        student = self.fixtures.students[0]
+        CourseGrade.query.filter_by(course_id=self.course.id, user_id=student.id).delete()
+        AssignmentGrade.query.filter_by(assignment_id=other_assignment.id, user_id=student.id).delete()
+        db.session.commit()
+        other_assignment.calculate_grade(student)
+        self.assertAlmostEqual(self._course_grades()[student.id].grade, calculated_grades[student.id])
+
+        # courses without assignments don't have course grades
+        for course_assignment in self.fixtures.assignments:
+            course_assignment.active = False
+        db.session.commit()
+        self.course.calculate_grade(student)
+        self.assertNotIn(student.id, self._course_grades())
+        self.assertEqual(CourseGrade.get_calculated_grades(self.course), {})
+
+class StubLTIOutcomeService(object):
+    """
+    Local LTI outcome service recording the replace results it receives.
+    Sourcedids in unavailable are answered with a 503 that many times,
+    sourcedids in rejected are answered with a failure
+    """
+    namespace = '{http://www.imsglobal.org/services/ltiv1p1/xsd/imsoms_v1p0}'
+
+    def __init__(self):
+        self.results = {}
+        self.connections = set()
+        self.unavailable = {}
+        self.rejected = set()
+        self.lock = threading.Lock()
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                root = etree.fromstring(self.rfile.read(int(self.headers['Content-Length'])))
+                sourcedid = root.find('.//' + service.namespace + 'sourcedId').text
+                score = float(root.find('.//' + service.namespace + 'textString').text)
+                code_major = service.record(self.client_address, self.headers.get('Authorization'), sourcedid, score)
+                if code_major == None:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                content = ("""<?xml version="1.0" encoding="UTF-8"?>
+                <imsx_POXEnvelopeResponse xmlns="http://www.imsglobal.org/services/ltiv1p1/xsd/imsoms_v1p0">
+                <imsx_POXHeader><imsx_POXResponseHeaderInfo>
+                    <imsx_version>V1.0</imsx_version>
+                    <imsx_messageIdentifier>1</imsx_messageIdentifier>
+                    <imsx_statusInfo>
+                        <imsx_codeMajor>{}</imsx_codeMajor>
+                        <imsx_severity>status</imsx_severity>
+                        <imsx_description></imsx_description>
+                        <imsx_messageRefIdentifier>1</imsx_messageRefIdentifier>
+                        <imsx_operationRefIdentifier>replaceResult</imsx_operationRefIdentifier>
+                    </imsx_statusInfo>
+                </imsx_POXResponseHeaderInfo></imsx_POXHeader>
+                <imsx_POXBody><replaceResultResponse/></imsx_POXBody>
+                </imsx_POXEnvelopeResponse>""").format(code_major).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/xml')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}/outcomes'.format(self.server.server_address[1])
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def record(self, client_address, authorization, sourcedid, score):
+        with self.lock:
+            self.connections.add(client_address)
+            if not authorization or not authorization.startswith('OAuth'):
+                return 'failure'
+            if self.unavailable.get(sourcedid, 0) > 0:
+                self.unavailable[sourcedid] -= 1
+                return None
+            if sourcedid in self.rejected:
+                return 'failure'
+            self.results[sourcedid] = score
+            return 'success'
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
 
 class TestLTIOutcome(ComPAIRTestCase):
 
@@ -127,42 +827,17 @@ class TestLTIOutcome(ComPAIRTestCase):
         self.lis_result_sourcedid = "SomeUniqueSourcedId"
         self.grade = 0.8
 
-    def mocked_requests_post(*args, **kwargs):
-        class MockResponse:
-            def __init__(self, content, status_code):
-                self.content = content
-                self.status_code = status_code
-
-        content = """<imsx_POXEnvelopeResponse xmlns = "http://www.imsglobal.org/services/ltiv1p1/xsd/imsoms_v1p0">
-        <imsx_POXHeader>
-            <imsx_POXResponseHeaderInfo>
-            <imsx_version>V1.0</imsx_version>
-            <imsx_messageIdentifier>4560</imsx_messageIdentifier>
-            <imsx_statusInfo>
-                <imsx_codeMajor>success</imsx_codeMajor>
-                <imsx_severity>status</imsx_severity>
-                <imsx_description>Score for {lis_result_sourcedid} is now {grade}</imsx_description>
-                <imsx_messageRefIdentifier>999999123</imsx_messageRefIdentifier>
-                <imsx_operationRefIdentifier>replaceResult</imsx_operationRefIdentifier>
-            </imsx_statusInfo>
-            </imsx_POXResponseHeaderInfo>
-        </imsx_POXHeader>
-        <imsx_POXBody>
-            <replaceResultResponse/>
-        </imsx_POXBody>
-        </imsx_POXEnvelopeResponse>
-        """.format(lis_result_sourcedid="SomeUniqueSourcedId", grade=0.8)
-
-        return MockResponse(content, 200)
-
-    @mock.patch('requests.post', mock.Mock(side_effect = mocked_requests_post))
     def test_post_replace_result(self):
+        service = StubLTIOutcomeService()
+        self.addCleanup(service.shutdown)
+        self.app.config['LTI_OUTCOME_RETRY_BACKOFF'] = 1
+
         # no lis_outcome_service_url
         result = LTIOutcome.post_replace_result(self.lti_consumer, self.lis_result_sourcedid, self.grade)
         self.assertFalse(result)
 
         # add lis_outcome_service_url
-        self.lti_consumer.lis_outcome_service_url = self.lis_outcome_service_url
+        self.lti_consumer.lis_outcome_service_url = service.url
         db.session.commit()
 
         # no lis_result_sourcedid
@@ -179,4 +854,625 @@ class TestLTIOutcome(ComPAIRTestCase):
 
         # success
         result = LTIOutcome.post_replace_result(self.lti_consumer, self.lis_result_sourcedid, self.grade)
-        self.assertTrue(result)
\ No newline at end of file
+        self.assertTrue(result)
+        self.assertEqual(service.results, {self.lis_result_sourcedid: self.grade})
+
+        # rejected
+        service.rejected = set([self.lis_result_sourcedid])
+        result = LTIOutcome.post_replace_result(self.lti_consumer, self.lis_result_sourcedid, 0.5)
+        self.assertFalse(result)
+
+    def test_dispatcher(self):
+        service = StubLTIOutcomeService()
+        self.addCleanup(service.shutdown)
+        self.app.config['LTI_OUTCOME_MAX_CONCURRENCY'] = 4
+        self.app.config['LTI_OUTCOME_RATE_LIMIT'] = 0
+        self.app.config['LTI_OUTCOME_RETRY_BACKOFF'] = 1
+
+        # no lis_outcome_service_url
+        metrics = LTIOutcomeDispatcher(self.lti_consumer).dispatch([(self.lis_result_sourcedid, self.grade)])
+        self.assertEqual((metrics.posted, metrics.skipped), (0, 1))
+
+        self.lti_consumer.lis_outcome_service_url = service.url
+        db.session.commit()
+
+        # invalid outcomes are skipped, the others posted concurrently over keep-alive connections
+        grades = [("sourcedid{}".format(index), index / 40.0) for index in range(40)]
+        metrics = LTIOutcomeDispatcher(self.lti_consumer).dispatch(grades + [("", 0.5), ("invalid", 1.5)])
+        self.assertEqual(service.results, dict(grades))
+        self.assertEqual((metrics.posted, metrics.succeeded, metrics.failed, metrics.skipped, metrics.retries),
+            (40, 40, 0, 2, 0))
+        self.assertLessEqual(len(service.connections), 4)
+
+        # busy responses are retried, rejected outcomes aren't
+        # outcomes still unavailable after every retry are raised once the others are posted
+        service.unavailable = {"sourcedid0": 2, "sourcedid1": 10}
+        service.rejected = set(["sourcedid2"])
+        dispatcher = LTIOutcomeDispatcher(self.lti_consumer)
+        with self.assertRaises(OutcomeConsumerUnavailableException) as context:
+            dispatcher.dispatch([("sourcedid0", 0.1), ("sourcedid1", 0.2), ("sourcedid2", 0.3)])
+        self.assertEqual(context.exception.lis_result_sourcedids, ["sourcedid1"])
+        metrics = dispatcher.metrics
+        self.assertEqual(service.results["sourcedid0"], 0.1)
+        self.assertEqual(service.results["sourcedid1"], 1 / 40.0)
+        self.assertEqual((metrics.succeeded, metrics.failed, metrics.retries), (1, 2, 5))
+        self.assertEqual(metrics.as_dict()['posted'], 8)
+
+        # rate limited per consumer
+        service.unavailable = {}
+        service.rejected = set()
+        self.app.config['LTI_OUTCOME_RATE_LIMIT'] = 100
+        start = time.time()
+        metrics = LTIOutcomeDispatcher(self.lti_consumer).dispatch(grades * 3)
+        self.assertEqual(metrics.succeeded, 120)
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+        # grades of the tasks are loaded in one query (missing grades are posted as 0)
+        from compair.tasks import update_lti_course_grades
+        course_grades = CourseGrade.get_course_grades(self.fixtures.course)
+        course_grades[0].grade = 0.25
+        db.session.commit()
+        service.results = {}
+        sourcedid_and_grades = [("course{}".format(course_grade.user_id), course_grade.id)
+            for course_grade in course_grades]
+        update_lti_course_grades(self.lti_consumer.id, sourcedid_and_grades + [("missing", -1), ("none", None)])
+        self.assertEqual(service.results, dict(
+            [("course{}".format(course_grade.user_id), course_grade.grade) for course_grade in course_grades] +
+            [("missing", 0.0)]
+        ))
+        self.assertEqual(service.results["course{}".format(course_grades[0].user_id)], 0.25)
+
+        # the task is retried with only the outcomes the consumer was unavailable for
+        self.app.config['LTI_OUTCOME_MAX_RETRIES'] = 1
+        unavailable_sourcedid = "course{}".format(course_grades[1].user_id)
+        service.results = {}
+        service.unavailable = {unavailable_sourcedid: 2}
+        with mock.patch.object(update_lti_course_grades, 'retry', wraps=update_lti_course_grades.retry) as mocked_retry:
+            update_lti_course_grades.apply(args=(self.lti_consumer.id, sourcedid_and_grades))
+            self.assertEqual(mocked_retry.call_count, 1)
+            self.assertEqual(mocked_retry.call_args[1]['args'],
+                (self.lti_consumer.id, [(unavailable_sourcedid, course_grades[1].id)]))
+        self.assertEqual(service.results[unavailable_sourcedid], course_grades[1].grade)
+        self.assertEqual(len(service.results), len(course_grades))
+
+class TestPairingSnapshot(CacheTestCase):
+
+    def setUp(self):
+        super(TestPairingSnapshot, self).setUp()
+        self.app.config['PAIRING_SNAPSHOT_CACHE_ENABLED'] = True
+        self.fixtures = TestFixture().add_course(num_students=10, num_groups=2)
+        self.course = self.fixtures.course
+        self.assignment = self.fixtures.assignment
+
+    def _snapshot_answers(self, snapshot):
+        return {
+            scored_object.key: scored_object
+            for scored_object in snapshot.scored_objects()
+        }
+
+    def test_build(self):
+        snapshot = PairingSnapshot.build(self.course.id, self.assignment.id)
+        answers = self._snapshot_answers(snapshot)
+
+        # only comparable answers are included (no drafts, dropped students or removed answers)
+        comparable_answers = [answer for answer in self.fixtures.answers
+            if answer.assignment_id == self.assignment.id and answer.active and \
+                answer.comparable and not answer.draft and not answer.practice]
+        self.assertEqual(set(answers.keys()), set([answer.id for answer in comparable_answers]))
+        for answer in self.fixtures.dropped_answers:
+            self.assertNotIn(answer.id, answers)
+
+        for answer in comparable_answers:
+            self.assertEqual(answers[answer.id].rounds, answer.round)
+            self.assertEqual(answers[answer.id].score, answer.score.score if answer.score else None)
+
+        # user and group answers are excluded
+        student = self.fixtures.students[0]
+        scored_objects = snapshot.scored_objects(exclude_user_id=student.id)
+        self.assertNotIn(student.id, [
+            answer.user_id for answer in comparable_answers
+            if answer.id in [scored_object.key for scored_object in scored_objects]
+        ])
+
+        for criterion in self.assignment.criteria:
+            self.assertIn(criterion.id, snapshot.criterion_weights)
+
+    def test_get_cached_snapshot(self):
+        with mock.patch.object(PairingSnapshot, 'build', wraps=PairingSnapshot.build) as mocked_build:
+            snapshot = PairingSnapshot.get(self.course.id, self.assignment.id)
+            self.assertEqual(mocked_build.call_count, 1)
+
+            # cached
+            cached_snapshot = PairingSnapshot.get(self.course.id, self.assignment.id)
+            self.assertEqual(mocked_build.call_count, 1)
+            self.assertEqual(self._snapshot_answers(snapshot), self._snapshot_answers(cached_snapshot))
+
+            # rounds and scores are patched
+            answer = self.fixtures.answers[0]
+            answer.round += 2
+            if answer.score:
+                answer.score.score = 123.0
+            db.session.commit()
+
+            cached_snapshot = PairingSnapshot.get(self.course.id, self.assignment.id)
+            self.assertEqual(mocked_build.call_count, 1)
+            answers = self._snapshot_answers(cached_snapshot)
+            self.assertEqual(answers[answer.id].rounds, answer.round)
+            if answer.score:
+                self.assertEqual(answers[answer.id].score, 123.0)
+
+            # comparisons update rounds without rebuilding
+            student = self.fixtures.students[0]
+            comparison = Comparison.create_new_comparison(self.assignment.id, student.id, True)
+
+            answers = self._snapshot_answers(PairingSnapshot.get(self.course.id, self.assignment.id))
+            self.assertEqual(mocked_build.call_count, 1)
+            self.assertEqual(answers[comparison.answer1_id].rounds, comparison.answer1.round)
+            self.assertEqual(answers[comparison.answer2_id].rounds, comparison.answer2.round)
+
+            # changes that are rolled back are ignored
+            answer.active = False
+            db.session.flush()
+            db.session.rollback()
+            PairingSnapshot.get(self.course.id, self.assignment.id)
+            self.assertEqual(mocked_build.call_count, 1)
+
+            # removing an answer invalidates the snapshot
+            answer = self.fixtures.answers[1]
+            answer.active = False
+            db.session.commit()
+
+            answers = self._snapshot_answers(PairingSnapshot.get(self.course.id, self.assignment.id))
+            self.assertEqual(mocked_build.call_count, 2)
+            self.assertNotIn(answer.id, answers)
+
+            # dropping a student invalidates the snapshot
+            answer = self.fixtures.answers[2]
+            user_course = UserCourse.query \
+                .filter_by(user_id=answer.user_id, course_id=self.course.id) \
+                .one()
+            user_course.course_role = CourseRole.dropped
+            db.session.commit()
+
+            answers = self._snapshot_answers(PairingSnapshot.get(self.course.id, self.assignment.id))
+            self.assertEqual(mocked_build.call_count, 3)
+            self.assertNotIn(answer.id, answers)
+
+    def test_get_discards_older_patches(self):
+        with mock.patch.object(PairingSnapshot, 'build', wraps=PairingSnapshot.build) as mocked_build:
+            old_snapshot = PairingSnapshot.get(self.course.id, self.assignment.id)
+            answer = self.fixtures.answers[0]
+            rounds = self._snapshot_answers(old_snapshot)[answer.id].rounds
+
+            # a rebuild starts a new generation
+            PairingSnapshot.invalidate(self.assignment.id)
+            snapshot = PairingSnapshot.get(self.course.id, self.assignment.id)
+            self.assertEqual(mocked_build.call_count, 2)
+            self.assertNotEqual(snapshot.version, old_snapshot.version)
+
+            # late patches of the previous generation are already in the database and aren't applied
+            cache.hincrby(PairingSnapshot._patch_cache_key(self.assignment.id, old_snapshot.version, 'rounds'),
+                answer.id, 5)
+            answers = self._snapshot_answers(PairingSnapshot.get(self.course.id, self.assignment.id))
+            self.assertEqual(answers[answer.id].rounds, rounds)
+
+            # patches of the current generation are
+            PairingSnapshot.patch_round(self.assignment.id, answer.id, 2)
+            answers = self._snapshot_answers(PairingSnapshot.get(self.course.id, self.assignment.id))
+            self.assertEqual(answers[answer.id].rounds, rounds + 2)
+            self.assertEqual(mocked_build.call_count, 2)
+
+            # a snapshot of an older generation stored by a concurrent rebuild is rebuilt
+            cache.set(PairingSnapshot._cache_key(self.assignment.id), old_snapshot)
+            snapshot = PairingSnapshot.get(self.course.id, self.assignment.id)
+            self.assertEqual(mocked_build.call_count, 3)
+            self.assertEqual(self._snapshot_answers(snapshot)[answer.id].rounds, rounds)
+
+    def test_round_matchings(self):
+        import compair.models.pairing_snapshot as pairing_snapshot
+
+        self.assignment.pairing_algorithm = PairingAlgorithm.adaptive_matching
+        db.session.commit()
+
+        with mock.patch.object(pairing_snapshot, 'match_round', wraps=pairing_snapshot.match_round) as mock_match_round:
+            snapshot = PairingSnapshot.get(self.course.id, self.assignment.id)
+            round = min(scored_object.rounds for scored_object in snapshot.scored_objects())
+            matching = snapshot.round_matchings().get(round)
+            self.assertEqual(mock_match_round.call_count, 1)
+            self.assertGreater(len(matching), 0)
+            round_answer_ids = [scored_object.key for scored_object in snapshot.scored_objects(max_round=round)]
+            for (answer1_id, answer2_id) in matching:
+                self.assertIn(answer1_id, round_answer_ids)
+                self.assertIn(answer2_id, round_answer_ids)
+
+            # shared by every user of the snapshot (including the patched ones)
+            for student in self.fixtures.students[:3]:
+                Comparison.create_new_comparison(self.assignment.id, student.id, True)
+            self.assertEqual(PairingSnapshot.get(self.course.id, self.assignment.id).round_matchings().get(round), matching)
+            self.assertEqual(mock_match_round.call_count, 1)
+
+            # discarded with the snapshot
+            answer = self.fixtures.answers[0]
+            answer.active = False
+            db.session.commit()
+            snapshot = PairingSnapshot.get(self.course.id, self.assignment.id)
+            snapshot.round_matchings().get(round)
+            self.assertEqual(mock_match_round.call_count, 2)
+
+        # not shared without cached snapshots
+        self.app.config['PAIRING_SNAPSHOT_CACHE_ENABLED'] = False
+        self.assertIsNone(PairingSnapshot.get(self.course.id, self.assignment.id).round_matchings())
+
+    def test_get_without_cache(self):
+        self.app.config['PAIRING_SNAPSHOT_CACHE_ENABLED'] = False
+
+        with mock.patch.object(PairingSnapshot, 'build', wraps=PairingSnapshot.build) as mocked_build:
+            PairingSnapshot.get(self.course.id, self.assignment.id)
+            PairingSnapshot.get(self.course.id, self.assignment.id)
+            self.assertEqual(mocked_build.call_count, 2)
+
+class TestComparisonPairQueue(CacheTestCase):
+
+    def setUp(self):
+        super(TestComparisonPairQueue, self).setUp()
+        self.app.config['PAIRING_SNAPSHOT_CACHE_ENABLED'] = True
+        self.app.config['COMPARISON_PAIR_QUEUE_ENABLED'] = True
+        self.app.config['COMPARISON_PAIR_QUEUE_SIZE'] = 10
+        self.fixtures = TestFixture().add_course(num_students=10, num_groups=2)
+        self.course = self.fixtures.course
+        self.assignment = self.fixtures.assignment
+        self.assignment.pairing_algorithm = PairingAlgorithm.adaptive
+        db.session.commit()
+
+    def test_refill(self):
+        self.assertEqual(ComparisonPairQueue.refill(self.assignment.id), 10)
+        self.assertEqual(ComparisonPairQueue.length(self.assignment.id), 10)
+
+        # already full
+        self.assertEqual(ComparisonPairQueue.refill(self.assignment.id), 0)
+
+        # only comparable answers are queued
+        comparable_answer_ids = set([scored_object.key for scored_object in
+            PairingSnapshot.build(self.course.id, self.assignment.id).scored_objects()])
+        for _ in range(10):
+            comparison_pair = ComparisonPairQueue.pop(self.assignment, None, None, [])
+            self.assertIn(comparison_pair.key1, comparable_answer_ids)
+            self.assertIn(comparison_pair.key2, comparable_answer_ids)
+
+    def test_refill_adaptive_matching(self):
+        self.assignment.pairing_algorithm = PairingAlgorithm.adaptive_matching
+        db.session.commit()
+
+        # queue is filled with rounds of disjoint pairs
+        answer_count = len(PairingSnapshot.build(self.course.id, self.assignment.id).scored_objects())
+        self.assertEqual(ComparisonPairQueue.refill(self.assignment.id), 10)
+
+        with mock.patch.object(ComparisonPairQueue, 'request_refill'):
+            first_round_keys = []
+            for _ in range(answer_count // 2):
+                comparison_pair = ComparisonPairQueue.pop(self.assignment, None, None, [])
+                first_round_keys += [comparison_pair.key1, comparison_pair.key2]
+            self.assertEqual(len(set(first_round_keys)), len(first_round_keys))
+
+    def test_pop(self):
+        ComparisonPairQueue.refill(self.assignment.id)
+        student = self.fixtures.students[0]
+
+        # comparisons are created from the queue
+        with mock.patch.object(Comparison, '_get_new_comparison_pair') as mocked_get_new_comparison_pair:
+            comparison = Comparison.create_new_comparison(self.assignment.id, student.id, True)
+            mocked_get_new_comparison_pair.assert_not_called()
+        answer_user_ids = [comparison.answer1.user_id, comparison.answer2.user_id]
+        self.assertNotIn(student.id, answer_user_ids)
+
+        # pairs already compared or with the user's own answer are put back for others
+        student_answer = next(answer for answer in self.fixtures.answers
+            if answer.user_id == student.id and answer.assignment_id == self.assignment.id)
+        ComparisonPairQueue.clear(self.assignment.id)
+        cache.rpush(ComparisonPairQueue._cache_key(self.assignment.id),
+            [comparison.answer1_id, comparison.answer2_id],
+            [student_answer.id, comparison.answer1_id])
+
+        with mock.patch.object(ComparisonPairQueue, 'request_refill'):
+            self.assertIsNone(ComparisonPairQueue.pop(self.assignment, student.id, None, [comparison]))
+            self.assertEqual(ComparisonPairQueue.length(self.assignment.id), 2)
+
+            # pairs with answers that can't be compared anymore are dropped
+            comparison.answer1.active = False
+            db.session.commit()
+
+            self.assertIsNone(ComparisonPairQueue.pop(self.assignment, None, None, []))
+            self.assertEqual(ComparisonPairQueue.length(self.assignment.id), 0)
+
+            # the snapshot is only fetched once a pair is popped
+            with mock.patch.object(PairingSnapshot, 'get') as mocked_get:
+                self.assertIsNone(ComparisonPairQueue.pop(self.assignment, student.id, None, []))
+                mocked_get.assert_not_called()
+
+    def test_unsupported_pairing_algorithm(self):
+        # criterion score deltas aren't used to generate the queued pairs
+        self.assignment.pairing_algorithm = PairingAlgorithm.adaptive_min_delta
+        db.session.commit()
+
+        self.assertEqual(ComparisonPairQueue.refill(self.assignment.id), 0)
+        self.assertEqual(ComparisonPairQueue.length(self.assignment.id), 0)
+
+        student = self.fixtures.students[0]
+        with mock.patch.object(ComparisonPairQueue, 'pop') as mocked_pop:
+            comparison = Comparison.create_new_comparison(self.assignment.id, student.id, True)
+            mocked_pop.assert_not_called()
+        self.assertIsNotNone(comparison)
+
+    def test_pop_refills_queue(self):
+        self.assertEqual(ComparisonPairQueue.length(self.assignment.id), 0)
+
+        # refill task runs immediately with CELERY_ALWAYS_EAGER
+        comparison_pair = ComparisonPairQueue.pop(self.assignment, None, None, [])
+        self.assertIsNotNone(comparison_pair)
+        self.assertEqual(ComparisonPairQueue.length(self.assignment.id), 9)
+
+class TestScoreUpdateQueue(CacheTestCase):
+
+    def setUp(self):
+        super(TestScoreUpdateQueue, self).setUp()
+        self.app.config['SCORE_UPDATE_QUEUE_ENABLED'] = True
+        self.fixtures = TestFixture().add_course(num_students=6)
+        self.assignment = self.fixtures.assignment
+
+    def test_process(self):
+        # comparisons queued while an update is pending are scored together
+        with mock.patch.object(ScoreUpdateQueue, 'request_update') as mock_request_update:
+            comparisons = [self.fixtures.complete_comparison(self.assignment, student) for student in self.fixtures.students[:3]]
+            for comparison in comparisons + [comparisons[0]]:
+                ScoreUpdateQueue.push(self.assignment.id, comparison.id)
+            self.assertEqual(mock_request_update.call_count, 4)
+        self.assertEqual(ScoreUpdateQueue.length(self.assignment.id), 4)
+
+        with mock.patch.object(Comparison, 'update_scores_1vs1') as mock_update_scores_1vs1:
+            self.assertEqual(ScoreUpdateQueue.process(self.assignment.id), 3)
+            # in submission order and resubmissions only once
+            self.assertEqual([call[0][0].id for call in mock_update_scores_1vs1.call_args_list],
+                [comparison.id for comparison in comparisons])
+        self.assertEqual(ScoreUpdateQueue.length(self.assignment.id), 0)
+        self.assertEqual(ScoreUpdateQueue.process(self.assignment.id), 0)
+
+        # too many queued comparisons are scored with one full recalculation
+        self.app.config['SCORE_UPDATE_QUEUE_MAX_INCREMENTAL'] = 2
+        with mock.patch.object(ScoreUpdateQueue, 'request_update'):
+            for comparison in comparisons:
+                ScoreUpdateQueue.push(self.assignment.id, comparison.id)
+        with mock.patch.object(Comparison, 'update_scores_1vs1') as mock_update_scores_1vs1, \
+                mock.patch.object(Comparison, 'calculate_scores') as mock_calculate_scores:
+            self.assertEqual(ScoreUpdateQueue.process(self.assignment.id), 3)
+            mock_update_scores_1vs1.assert_not_called()
+            mock_calculate_scores.assert_called_once_with(self.assignment.id)
+
+        # failed incremental updates are recovered with a full recalculation
+        with mock.patch.object(ScoreUpdateQueue, 'request_update'):
+            ScoreUpdateQueue.push(self.assignment.id, comparisons[0].id)
+        with mock.patch.object(Comparison, 'update_scores_1vs1', side_effect=Exception):
+            with self.assertRaises(Exception):
+                ScoreUpdateQueue.process(self.assignment.id)
+        with mock.patch.object(Comparison, 'calculate_scores') as mock_calculate_scores:
+            self.assertEqual(ScoreUpdateQueue.process(self.assignment.id), 0)
+            mock_calculate_scores.assert_called_once_with(self.assignment.id)
+
+    def test_push_scores_comparison(self):
+        # update task runs immediately with CELERY_ALWAYS_EAGER
+        comparison = self.fixtures.complete_comparison(self.assignment, self.fixtures.students[0])
+        ScoreUpdateQueue.push(self.assignment.id, comparison.id)
+        self.assertEqual(ScoreUpdateQueue.length(self.assignment.id), 0)
+
+        score = AnswerScore.query.filter_by(answer_id=comparison.answer1_id).one()
+        self.assertEqual(score.opponent_stats, {comparison.answer2_id: OpponentStats(1, 0)})
+
+class TestGradeUpdateQueue(CacheTestCase):
+
+    def setUp(self):
+        super(TestGradeUpdateQueue, self).setUp()
+        self.app.config['GRADE_UPDATE_QUEUE_ENABLED'] = True
+        self.fixtures = TestFixture().add_course(num_students=6, num_assignments=2)
+        self.course = self.fixtures.course
+        self.assignment = self.fixtures.assignment
+        self.students = self.fixtures.students
+
+    def _grades(self, user):
+        return (AssignmentGrade.get_user_assignment_grade(self.assignment, user).grade,
+            CourseGrade.get_user_course_grade(self.course, user).grade)
+
+    def test_process(self):
+        previous_grades = self._grades(self.students[0])
+
+        # repeated triggers while an update is pending are recalculated together and only once
+        with mock.patch.object(GradeUpdateQueue, 'request_update') as mock_request_update:
+            for student in self.students[:3]:
+                self.fixtures.complete_comparison(self.assignment, student)
+            for student in self.students[:3] + [self.students[0]]:
+                GradeUpdateQueue.push(self.course.id, self.assignment.id, [student.id])
+            self.assertEqual(mock_request_update.call_count, 4)
+        self.assertEqual(GradeUpdateQueue.length(self.course.id), 4)
+        self.assertEqual(self._grades(self.students[0]), previous_grades)
+
+        with mock.patch.object(AssignmentGrade, 'calculate_users_grades',
+                    wraps=AssignmentGrade.calculate_users_grades) as mock_assignment_grades, \
+                mock.patch.object(CourseGrade, 'calculate_users_grades',
+                    wraps=CourseGrade.calculate_users_grades) as mock_course_grades:
+            self.assertEqual(GradeUpdateQueue.process(self.course.id), 3)
+            self.assertEqual(mock_assignment_grades.call_count, 1)
+            self.assertEqual(sorted(mock_assignment_grades.call_args[0][1]),
+                sorted(student.id for student in self.students[:3]))
+            self.assertEqual(mock_course_grades.call_count, 1)
+        self.assertEqual(GradeUpdateQueue.length(self.course.id), 0)
+        self.assertEqual(GradeUpdateQueue.process(self.course.id), 0)
+
+        # same grades as a recalculation of the whole course
+        grades = dict((student.id, self._grades(student)) for student in self.students)
+        self.assertGreater(grades[self.students[0].id][0], previous_grades[0])
+        self.assignment.calculate_grades()
+        self.course.calculate_grades()
+        for student in self.students:
+            self.assertEqual(self._grades(student), grades[student.id])
+
+        # failed updates are marked as dirty again
+        with mock.patch.object(GradeUpdateQueue, 'request_update'):
+            GradeUpdateQueue.push(self.course.id, self.assignment.id, [self.students[0].id])
+        with mock.patch.object(AssignmentGrade, 'calculate_users_grades', side_effect=Exception):
+            with self.assertRaises(Exception):
+                GradeUpdateQueue.process(self.course.id)
+        self.assertEqual(GradeUpdateQueue.process(self.course.id), 1)
+
+    def test_push_updates_grades(self):
+        # update task runs immediately with CELERY_ALWAYS_EAGER
+        student = self.students[0]
+        previous_grades = self._grades(student)
+        self.fixtures.complete_comparison(self.assignment, student)
+        GradeUpdateQueue.push(self.course.id, self.assignment.id, [student.id])
+        self.assertEqual(GradeUpdateQueue.length(self.course.id), 0)
+        self.assertGreater(self._grades(student)[0], previous_grades[0])
+
+        # only students are graded
+        GradeUpdateQueue.push(self.course.id, self.assignment.id, [self.fixtures.instructor.id])
+        self.assertIsNone(AssignmentGrade.get_user_assignment_grade(self.assignment, self.fixtures.instructor))
+
+class DatabaseFileTestCase(ComPAIRTestCase):
+    """
+    Uses a sqlite database file for tests running multiple threads (each with their own connection)
+    since in-memory databases are not shared between connections
+    """
+    def create_app(self):
+        (handle, self.database_file) = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+
+        settings = dict(test_app_settings)
+        settings['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.database_file
+        settings['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60, 'check_same_thread': False}}
+        return create_app(settings_override=settings)
+
+    def tearDown(self):
+        super(DatabaseFileTestCase, self).tearDown()
+        os.remove(self.database_file)
+
+class TestComparisonConcurrency(DatabaseFileTestCase):
+    """
+    Comparisons created from multiple threads
+    """
+    NUMBER_OF_THREADS = 8
+    COMPARISONS_PER_THREAD = 5
+
+    def setUp(self):
+        super(TestComparisonConcurrency, self).setUp()
+        self.fixtures = TestFixture().add_course(num_students=self.NUMBER_OF_THREADS * 2)
+        self.assignment = self.fixtures.assignment
+
+    def _compare(self, user_id, errors):
+        try:
+            with self.app.app_context():
+                for _ in range(self.COMPARISONS_PER_THREAD):
+                    comparison = Comparison.create_new_comparison(self.assignment.id, user_id, True)
+                    comparison.completed = True
+                    db.session.commit()
+                db.session.remove()
+        except Exception as error:
+            errors.append(error)
+
+    def _run_threads(self, user_ids):
+        errors = []
+        threads = [threading.Thread(target=self._compare, args=(user_id, errors)) for user_id in user_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_concurrent_round_counters(self):
+        students = self.fixtures.students[:self.NUMBER_OF_THREADS]
+        self._run_threads([student.id for student in students])
+
+        db.session.expire_all()
+        comparison_count = Comparison.query \
+            .filter_by(assignment_id=self.assignment.id) \
+            .count()
+        self.assertEqual(comparison_count, self.NUMBER_OF_THREADS * self.COMPARISONS_PER_THREAD)
+
+        # every comparison increments the round of both of its answers
+        total_rounds = sum([answer.round for answer in Answer.query \
+            .filter_by(assignment_id=self.assignment.id) \
+            .all()])
+        self.assertEqual(total_rounds, comparison_count * 2)
+
+    def test_existing_incomplete_comparison(self):
+        # requests that were waiting on the user lock return the comparison created before them
+        # (the row lock itself is a no-op on sqlite)
+        student = self.fixtures.students[0]
+        comparison = Comparison.create_new_comparison(self.assignment.id, student.id, True)
+        same_comparison = Comparison.create_new_comparison(self.assignment.id, student.id, True)
+        self.assertEqual(comparison.id, same_comparison.id)
+
+        comparison_count = Comparison.query \
+            .filter_by(assignment_id=self.assignment.id, user_id=student.id) \
+            .count()
+        self.assertEqual(comparison_count, 1)
+
+class TestGradeConcurrency(DatabaseFileTestCase):
+    """
+    Grades of the same student recalculated from multiple threads. Row locks are a no-op on sqlite so
+    locking reads take the database write lock instead (until the transaction ends)
+    """
+    NUMBER_OF_THREADS = 8
+
+    def setUp(self):
+        super(TestGradeConcurrency, self).setUp()
+        self.fixtures = TestFixture().add_course(num_students=4, num_assignments=2)
+        self.course = self.fixtures.course
+        self.assignment = self.fixtures.assignment
+        self.student = self.fixtures.students[0]
+
+        # every comparison completed changes the student's assignment grade
+        self.assignment.number_of_comparisons = self.NUMBER_OF_THREADS
+        answers = [answer for answer in self.fixtures.answers
+            if answer.assignment_id == self.assignment.id and answer.user_id != self.student.id]
+        self.comparisons = [ComparisonFactory(assignment=self.assignment, user=self.student,
+            answer1=answers[0], answer2=answers[1], completed=False) for _ in range(self.NUMBER_OF_THREADS)]
+        db.session.commit()
+        self.course.calculate_grades()
+
+        sqlalchemy_event.listen(db.engine, 'before_cursor_execute', self._lock_database)
+
+    def tearDown(self):
+        sqlalchemy_event.remove(db.engine, 'before_cursor_execute', self._lock_database)
+        super(TestGradeConcurrency, self).tearDown()
+
+    @staticmethod
+    def _lock_database(connection, cursor, statement, parameters, context, executemany):
+        if context != None and context.compiled != None and \
+                getattr(context.compiled.statement, '_for_update_arg', None) != None and \
+                not connection.connection.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+
+    def _complete_and_grade(self, comparison_id, errors):
+        try:
+            with self.app.app_context():
+                Comparison.query \
+                    .filter_by(id=comparison_id) \
+                    .update({'completed': True})
+                db.session.commit()
+                assignment = Assignment.query.get(self.assignment.id)
+                AssignmentGrade.calculate_grade(assignment, User.query.get(self.student.id))
+                db.session.remove()
+        except Exception as error:
+            errors.append(error)
+
+    def test_concurrent_assignment_grades(self):
+        errors = []
+        threads = [threading.Thread(target=self._complete_and_grade, args=(comparison.id, errors))
+            for comparison in self.comparisons]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        # every change was applied against the assignment grade committed by the previous one
+        db.session.expire_all()
+        course_grade = CourseGrade.get_user_course_grade(self.course, self.student)
+        self.assertAlmostEqual(course_grade.grade, CourseGrade.get_calculated_grades(self.course)[self.student.id])
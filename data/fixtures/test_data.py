@@ -937,6 +937,19 @@ class TestFixture:
 
         return self
 
+    def complete_comparison(self, assignment, user):
+        """
+        Creates a new comparison for the user and completes it with answer1 winning every criterion
+        """
+        comparison = Comparison.create_new_comparison(assignment.id, user.id, True)
+        comparison.completed = True
+        comparison.winner = WinningAnswer.answer1
+        for comparison_criterion in comparison.comparison_criteria:
+            comparison_criterion.winner = WinningAnswer.answer1
+        db.session.commit()
+        self.comparisons.append(comparison)
+        return comparison
+
     def add_answer(self, assignment, user, draft=False):
         answer = AnswerFactory(
             assignment=assignment,
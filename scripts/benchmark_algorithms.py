@@ -0,0 +1,468 @@
+"""
+ Script will benchmark the pairing, scoring and grade algorithms over synthetic assignments
+
+ Times for every combination of number of answers and number of comparisons:
+ - generate_pair for every pairing package (scored objects of the assignment with the
+   comparisons of one user that has already compared USER_COMPARISONS pairs)
+ - calculate_score for every scoring package (full recalculation over all comparisons)
+ - calculate_score_1vs1 for every scoring package (one new comparison with the previous
+   comparisons and the stored opponent stats of the two answers)
+
+ Times for every number of --students (in a fresh --database with a course of NUMBER_OF_ASSIGNMENTS
+ assignments where students have answered, completed some of the required comparisons and,
+ for half of the assignments, self-evaluated):
+ - calculate_grades of every assignment and of the course (grade rows are inserted)
+ - recalculate_grades after a change of the grade weights of every assignment (grade rows are updated)
+ The package of the grade benchmarks is the database backend and their number of sql statements
+ is written to the json output. Both the time per student and the number of statements should
+ stay about the same as the number of students grows.
+
+ Peak memory of every benchmark is measured with tracemalloc in a separate run so that
+ tracing doesn't affect the timings. Benchmarks of a package are skipped for larger
+ assignments once a run takes longer than --max-seconds.
+
+ Usage:
+ - python -m scripts.benchmark_algorithms --output results.json
+ - python -m scripts.benchmark_algorithms --baseline results.json --output new_results.json
+ - python -m scripts.benchmark_algorithms --pairing adaptive --scoring --students
+   (adaptive pairing requests only)
+ - python -m scripts.benchmark_algorithms --pairing --scoring --students 100 1000 5000 --database sqlite:////tmp/grades.db
+   (grade calculations only)
+
+ Outputs:
+ - table of the results on stdout
+ - with --output: json file with the settings and results of the run
+ - with --baseline: ratio of every result against the same result of a previous run.
+   exits with status 1 if any result is slower than the baseline by more than --threshold
+
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import sys
+import timeit
+import tracemalloc
+
+from sqlalchemy import event
+
+from compair import create_app
+from compair.core import db
+from compair.algorithms import ComparisonPair, ScoredObject, ComparisonWinner
+from compair.algorithms.opponent_stats import tally_opponent_stats
+from compair.algorithms.pair import generate_pair
+from compair.algorithms.score import calculate_score, calculate_score_1vs1
+from compair.models import PairingAlgorithm, ScoringAlgorithm, User, Course, UserCourse, Assignment, \
+    Answer, Comparison, AnswerComment, SystemRole, CourseRole, AnswerCommentType, WinningAnswer, \
+    AssignmentGrade, CourseGrade
+
+NUMBER_OF_ANSWERS = [50, 200, 1000, 5000, 20000]
+NUMBER_OF_COMPARISONS = [0, 1000, 10000, 50000, 200000]
+NUMBER_OF_STUDENTS = [100, 200, 400, 800, 1600]
+NUMBER_OF_ASSIGNMENTS = 5
+STUDENT_COMPARISONS = 3
+DATABASE = 'sqlite://'
+REPETITIONS = 5
+MAX_SECONDS = 30
+THRESHOLD = 0.2
+USER_COMPARISONS = 10
+SEED = 1234
+
+pairing_packages = [pairing_algorithm.value for pairing_algorithm in PairingAlgorithm]
+scoring_packages = [scoring_algorithm.value for scoring_algorithm in ScoringAlgorithm]
+
+class SyntheticAssignment(object):
+    """
+    Answers with a normally distributed actual grade compared by always picking the answer with
+    the highest actual grade (with some noise). Scores, variables and rounds of the scored objects
+    are set up as the scoring algorithms would have stored them
+    """
+    def __init__(self, number_of_answers, number_of_comparisons, seed=SEED):
+        generator = random.Random(seed)
+        keys = list(range(1, number_of_answers + 1))
+        grades = dict((key, generator.gauss(0.75, 0.1)) for key in keys)
+
+        self.comparison_pairs = []
+        rounds = dict((key, 0) for key in keys)
+        wins = dict((key, 0) for key in keys)
+        for _ in range(number_of_comparisons):
+            (key1, key2) = generator.sample(keys, 2)
+            if grades[key1] + generator.gauss(0, 0.05) > grades[key2] + generator.gauss(0, 0.05):
+                winner = ComparisonWinner.key1
+                wins[key1] += 1
+            else:
+                winner = ComparisonWinner.key2
+                wins[key2] += 1
+            rounds[key1] += 1
+            rounds[key2] += 1
+            self.comparison_pairs.append(ComparisonPair(key1=key1, key2=key2, winner=winner))
+
+        self.scored_objects = [ScoredObject(
+            key=key,
+            score=grades[key] if rounds[key] > 0 else None,
+            variable1=25.0 + (grades[key] - 0.75) * 40 if rounds[key] > 0 else None,
+            variable2=max(8.333 - rounds[key] * 0.5, 1.0) if rounds[key] > 0 else None,
+            rounds=rounds[key], wins=wins[key], loses=rounds[key] - wins[key], opponents=rounds[key]
+        ) for key in keys]
+
+        # comparisons already completed by the current user
+        self.user_comparison_pairs = [
+            ComparisonPair(key1=key1, key2=key2, winner=ComparisonWinner.key1)
+            for (key1, key2) in [generator.sample(keys, 2) for _ in range(USER_COMPARISONS)]
+        ]
+
+        # new comparison for calculate_score_1vs1
+        (key1, key2) = generator.sample(keys, 2)
+        self.new_comparison_pair = ComparisonPair(key1=key1, key2=key2, winner=ComparisonWinner.key1)
+        self.other_comparison_pairs = [
+            comparison_pair for comparison_pair in self.comparison_pairs
+            if comparison_pair.key1 in (key1, key2) or comparison_pair.key2 in (key1, key2)
+        ]
+        # as stored with the scores of the two answers
+        opponent_stats = tally_opponent_stats(self.other_comparison_pairs, keys=[key1, key2])
+        self.opponent_stats = dict((key, opponent_stats.get(key, {})) for key in (key1, key2))
+
+    def scored_object(self, key):
+        return self.scored_objects[key - 1]
+
+def pair_benchmark(package_name, assignment):
+    # the pairing algorithms shuffle the scored objects in place
+    return lambda: generate_pair(
+        package_name=package_name,
+        scored_objects=list(assignment.scored_objects),
+        comparison_pairs=assignment.user_comparison_pairs
+    )
+
+def score_benchmark(package_name, assignment):
+    return lambda: calculate_score(
+        package_name=package_name,
+        comparison_pairs=assignment.comparison_pairs
+    )
+
+def score_1vs1_benchmark(package_name, assignment):
+    comparison_pair = assignment.new_comparison_pair
+    return lambda: calculate_score_1vs1(
+        package_name=package_name,
+        key1_scored_object=assignment.scored_object(comparison_pair.key1),
+        key2_scored_object=assignment.scored_object(comparison_pair.key2),
+        winner=comparison_pair.winner,
+        other_comparison_pairs=assignment.other_comparison_pairs,
+        opponent_stats=assignment.opponent_stats
+    )
+
+def benchmarks(pairing_packages, scoring_packages):
+    for package_name in pairing_packages:
+        yield ("generate_pair", package_name, pair_benchmark)
+    for package_name in scoring_packages:
+        yield ("calculate_score", package_name, score_benchmark)
+        yield ("calculate_score_1vs1", package_name, score_1vs1_benchmark)
+
+def measure(function, repetitions, setup=None):
+    """
+    Returns (mean seconds, min seconds, peak memory bytes) of function.
+    setup is called (untimed) before every call of function
+    """
+    setup = setup or (lambda: None)
+
+    # warm up so that package imports aren't timed
+    setup()
+    function()
+    times = []
+    for _ in range(repetitions):
+        setup()
+        times.append(timeit.timeit(function, number=1))
+
+    setup()
+    tracemalloc.start()
+    try:
+        function()
+        (_, peak_memory) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return (sum(times) / len(times), min(times), peak_memory)
+
+class SyntheticCourse(object):
+    """
+    Course of number_of_students students with number_of_assignments assignments in the app's database.
+    Rows are inserted in bulk since the orm would take longer than the benchmark itself
+    """
+    def __init__(self, number_of_students, number_of_assignments, seed=SEED):
+        generator = random.Random(seed)
+        instructor = User(username='instructor', displayname='instructor', system_role=SystemRole.instructor)
+        self.course = Course(name='Benchmark Course', year=2020, term='Winter')
+        db.session.add_all([instructor, self.course])
+        db.session.commit()
+        db.session.add(UserCourse(user_id=instructor.id, course_id=self.course.id, course_role=CourseRole.instructor))
+
+        db.session.bulk_insert_mappings(User, [{
+            'username': 'student{}'.format(index),
+            'displayname': 'student{}'.format(index),
+            'system_role': SystemRole.student
+        } for index in range(number_of_students)])
+        student_ids = [user_id for (user_id, ) in User.query \
+            .with_entities(User.id) \
+            .filter(User.system_role == SystemRole.student) \
+            .all()]
+        db.session.bulk_insert_mappings(UserCourse, [{
+            'user_id': student_id,
+            'course_id': self.course.id,
+            'course_role': CourseRole.student
+        } for student_id in student_ids])
+
+        self.number_of_answers = 0
+        self.number_of_comparisons = 0
+        for index in range(number_of_assignments):
+            assignment = Assignment(user_id=instructor.id, course_id=self.course.id,
+                name='Assignment {}'.format(index), number_of_comparisons=STUDENT_COMPARISONS,
+                answer_start=datetime.datetime.utcnow() - datetime.timedelta(days=7),
+                enable_self_evaluation=(index % 2 == 0))
+            db.session.add(assignment)
+            db.session.flush()
+
+            # most students answered
+            db.session.bulk_insert_mappings(Answer, [{
+                'assignment_id': assignment.id,
+                'user_id': student_id,
+                'content': 'answer'
+            } for student_id in student_ids if generator.random() < 0.95])
+            answer_ids = dict((user_id, answer_id) for (user_id, answer_id) in Answer.query \
+                .with_entities(Answer.user_id, Answer.id) \
+                .filter(Answer.assignment_id == assignment.id) \
+                .all())
+            other_answer_ids = list(answer_ids.values())
+
+            comparisons = []
+            for student_id in student_ids:
+                for _ in range(generator.randint(0, assignment.total_comparisons_required)):
+                    (answer1_id, answer2_id) = generator.sample(other_answer_ids, 2)
+                    comparisons.append({
+                        'assignment_id': assignment.id,
+                        'user_id': student_id,
+                        'answer1_id': answer1_id,
+                        'answer2_id': answer2_id,
+                        'winner': WinningAnswer.answer1,
+                        'completed': True
+                    })
+            db.session.bulk_insert_mappings(Comparison, comparisons)
+            self.number_of_answers += len(answer_ids)
+            self.number_of_comparisons += len(comparisons)
+
+            if assignment.enable_self_evaluation:
+                db.session.bulk_insert_mappings(AnswerComment, [{
+                    'answer_id': answer_id,
+                    'user_id': user_id,
+                    'comment_type': AnswerCommentType.self_evaluation,
+                    'content': 'self-evaluation'
+                } for (user_id, answer_id) in answer_ids.items() if generator.random() < 0.5])
+
+        db.session.commit()
+
+    def calculate_grades(self):
+        for assignment in self.course.assignments:
+            assignment.calculate_grades()
+        self.course.calculate_grades()
+
+    def clear_grades(self):
+        AssignmentGrade.query.delete()
+        CourseGrade.query.delete()
+        db.session.commit()
+
+    def change_grade_weights(self):
+        for assignment in self.course.assignments:
+            assignment.comparison_grade_weight = 1 if assignment.comparison_grade_weight > 1 else 2
+        db.session.commit()
+
+class StatementCounter(object):
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+def run_grades(args):
+    results = []
+    for number_of_students in sorted(args.students):
+        app = create_app(settings_override={
+            'SQLALCHEMY_DATABASE_URI': args.database,
+            'SQLALCHEMY_ECHO': False,
+            'CELERY_ALWAYS_EAGER': True,
+            'XAPI_ENABLED': False,
+            'CALIPER_ENABLED': False
+        }, skip_endpoints=True, skip_assets=True)
+
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            course = SyntheticCourse(number_of_students, NUMBER_OF_ASSIGNMENTS, args.seed)
+            statement_counter = StatementCounter(db.engine)
+
+            for (benchmark, setup) in [
+                    ("calculate_grades", course.clear_grades),
+                    ("recalculate_grades", course.change_grade_weights)]:
+                (mean_time, min_time, peak_memory) = measure(course.calculate_grades, args.repetitions, setup)
+
+                # statements of a single run
+                setup()
+                statement_counter.count = 0
+                course.calculate_grades()
+
+                result = {
+                    'benchmark': benchmark,
+                    'package': db.engine.dialect.name,
+                    'answers': course.number_of_answers,
+                    'comparisons': course.number_of_comparisons,
+                    'students': number_of_students,
+                    'statements': statement_counter.count,
+                    'mean_ms': mean_time * 1000,
+                    'min_ms': min_time * 1000,
+                    'peak_memory_kb': peak_memory / 1024.0
+                }
+                results.append(result)
+                print_result(result)
+
+            db.session.remove()
+            db.drop_all()
+
+    return results
+
+def result_key(result):
+    return (result['benchmark'], result['package'], result['answers'], result['comparisons'])
+
+def run(args):
+    results = []
+    if not args.pairing and not args.scoring:
+        return results
+    # benchmarks that took longer than max seconds for a given size
+    too_slow = {}
+
+    for number_of_answers in args.answers:
+        for number_of_comparisons in args.comparisons:
+            assignment = SyntheticAssignment(number_of_answers, number_of_comparisons, args.seed)
+
+            for (benchmark, package_name, setup) in benchmarks(args.pairing, args.scoring):
+                # scaling curves only grow from here on so skip the larger runs
+                slow_size = too_slow.get((benchmark, package_name))
+                if slow_size and number_of_answers >= slow_size[0] and number_of_comparisons >= slow_size[1]:
+                    continue
+                # full score calculations need comparisons
+                if benchmark != "generate_pair" and number_of_comparisons == 0:
+                    continue
+
+                random.seed(args.seed)
+                (mean_time, min_time, peak_memory) = measure(setup(package_name, assignment), args.repetitions)
+                result = {
+                    'benchmark': benchmark,
+                    'package': package_name,
+                    'answers': number_of_answers,
+                    'comparisons': number_of_comparisons,
+                    'mean_ms': mean_time * 1000,
+                    'min_ms': min_time * 1000,
+                    'peak_memory_kb': peak_memory / 1024.0
+                }
+                results.append(result)
+                print_result(result)
+
+                if mean_time > args.max_seconds:
+                    too_slow[(benchmark, package_name)] = (number_of_answers, number_of_comparisons)
+
+    return results
+
+def print_header():
+    print("{:<22} {:<22} {:>8} {:>12} {:>12} {:>12} {:>12}".format(
+        "benchmark", "package", "answers", "comparisons", "mean (ms)", "min (ms)", "memory (kb)"))
+    sys.stdout.flush()
+
+def print_result(result):
+    print("{:<22} {:<22} {:>8} {:>12} {:>12.3f} {:>12.3f} {:>12.1f}".format(
+        result['benchmark'], result['package'], result['answers'], result['comparisons'],
+        result['mean_ms'], result['min_ms'], result['peak_memory_kb']))
+    sys.stdout.flush()
+
+def compare(results, baseline_results, threshold):
+    """
+    Prints the min time and peak memory ratio of every result against the baseline.
+    Returns the results slower than the baseline by more than threshold
+    """
+    baseline = dict((result_key(result), result) for result in baseline_results)
+    regressions = []
+
+    print("")
+    print("{:<22} {:<22} {:>8} {:>12} {:>12} {:>12}".format(
+        "benchmark", "package", "answers", "comparisons", "time ratio", "memory ratio"))
+    for result in results:
+        baseline_result = baseline.get(result_key(result))
+        if not baseline_result:
+            continue
+
+        # min time is the least affected by noise from other processes
+        time_ratio = result['min_ms'] / baseline_result['min_ms'] if baseline_result['min_ms'] else 1.0
+        memory_ratio = result['peak_memory_kb'] / baseline_result['peak_memory_kb'] \
+            if baseline_result['peak_memory_kb'] else 1.0
+        regressed = time_ratio > 1.0 + threshold
+        if regressed:
+            regressions.append(result)
+
+        print("{:<22} {:<22} {:>8} {:>12} {:>12.2f} {:>12.2f}{}".format(
+            result['benchmark'], result['package'], result['answers'], result['comparisons'],
+            time_ratio, memory_ratio, " <- slower" if regressed else ""))
+
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pairing and scoring algorithms")
+    parser.add_argument('--answers', type=int, nargs='+', default=NUMBER_OF_ANSWERS,
+        help="number of answers of the synthetic assignments")
+    parser.add_argument('--comparisons', type=int, nargs='+', default=NUMBER_OF_COMPARISONS,
+        help="number of comparisons of the synthetic assignments")
+    parser.add_argument('--pairing', nargs='*', default=pairing_packages, choices=pairing_packages,
+        help="pairing packages to benchmark")
+    parser.add_argument('--scoring', nargs='*', default=scoring_packages, choices=scoring_packages,
+        help="scoring packages to benchmark")
+    parser.add_argument('--repetitions', type=int, default=REPETITIONS,
+        help="number of timed runs of every benchmark")
+    parser.add_argument('--max-seconds', type=float, default=MAX_SECONDS,
+        help="skip larger assignments for a benchmark once a run takes longer than this")
+    parser.add_argument('--students', type=int, nargs='*', default=NUMBER_OF_STUDENTS,
+        help="number of students of the synthetic courses of the grade benchmarks")
+    parser.add_argument('--database', default=DATABASE,
+        help="sqlalchemy database uri of the grade benchmarks (the database is dropped!)")
+    parser.add_argument('--seed', type=int, default=SEED,
+        help="random seed of the synthetic assignments")
+    parser.add_argument('--output', help="write the results to this json file")
+    parser.add_argument('--baseline', help="compare the results to a json file written by --output")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+        help="allowed slowdown against the baseline (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print_header()
+    results = run(args) + run_grades(args)
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'repetitions': args.repetitions,
+                'seed': args.seed,
+                'results': results
+            }, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline_results = json.load(baseline_file)['results']
+        regressions = compare(results, baseline_results, args.threshold)
+        if regressions:
+            print("\n{} benchmark(s) slower than the baseline by more than {:.0%}".format(
+                len(regressions), args.threshold))
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -38,7 +38,7 @@ class WinnerSelector(Enum):
     closely_matched_errors = "closely_matched_errors"
 
 scoring_algorithms = [ScoringAlgorithm.true_skill, ScoringAlgorithm.elo] #ScoringAlgorithm.comparative_judgement
-pairing_algorithms = [PairingAlgorithm.adaptive_min_delta] #PairingAlgorithm.adaptive, PairingAlgorithm.random
+pairing_algorithms = [PairingAlgorithm.adaptive_min_delta, PairingAlgorithm.adaptive_uncertainty] #PairingAlgorithm.adaptive, PairingAlgorithm.random
 winner_selectors = [
     (WinnerSelector.always_correct, 1.0, "100% Correct"),
     (WinnerSelector.correct_with_error, 0.9, "90% Correct"),
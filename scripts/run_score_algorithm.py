@@ -37,7 +37,8 @@ with open(CURRENT_FOLDER+'/input.csv', 'rU') as csvfile:
 packages = [
     ScoringAlgorithm.comparative_judgement.value,
     ScoringAlgorithm.elo.value,
-    ScoringAlgorithm.true_skill.value
+    ScoringAlgorithm.true_skill.value,
+    ScoringAlgorithm.bradley_terry.value
 ]
 for package_name in packages:
     results = calculate_score(